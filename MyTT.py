@@ -1,4 +1,7 @@
 # 代码地址 https://github.com/mpquant/MyTT
+import functools
+import math
+
 import numpy as np
 import pandas as pd
 
@@ -621,4 +624,65 @@ def TDX_SAR(High, Low, iAFStep=2, iAFLimit=20):
                 # 修正反转后的SAR值（取前两日低点的最小值）
                 SarX[i] = min(Low[i], Low[i - 1])
 
-    return SarX
\ No newline at end of file
+    return SarX
+
+
+# ------------------ 精度保持：float32 输入得到 float32 输出 --------------------------------------------
+# pandas 的 rolling/ewm 内部总是以 float64 计算并返回 float64。紧凑精度模式（data.precision = "float32"）下
+# 行情数据为 float32，为避免指标结果被悄悄放大回 float64，这里把所有指标函数包装为：
+# 只要任一输入为 float32，就把 float64 结果转换回 float32；float64 输入的行为与原来完全一致。
+# 对价差做大小比较并累计的指标（DMI 的 HD>LD、MFI 的 TYP>REF(TYP)、ASI 的 AA/BB/CC 比较）在价格相等时
+# 比较结果取决于舍入噪声，TAN 在接近极点处会放大输入的舍入误差。这几个函数先把 float32 价格还原为 float64：
+# 与某个三位小数价格的 float32 表示完全相同的元素取该价格的 float64 值（未复权的交易所价格都是如此），
+# 其余元素直接转换，使结果与 float64 一致；其他函数直接以 float32 输入计算。
+# 复权价格等非整数位小数的数据无法还原，这类指标有精确要求时请使用默认的 float64 精度。
+
+PRICE_DECIMALS = 3
+_RESTORE_FUNCS = ('DMI', 'MFI', 'ASI', 'TAN')
+
+
+def _to_float64(arg):
+    if isinstance(arg, pd.Series) and arg.dtype == np.float32:
+        return pd.Series(_to_float64(arg.to_numpy()), index=arg.index, name=arg.name)
+    if not isinstance(arg, np.ndarray) or arg.dtype != np.float32:
+        return arg
+    widened = arg.astype(np.float64)
+    decimal = np.round(widened, PRICE_DECIMALS)
+    return np.where(decimal.astype(np.float32) == arg, decimal, widened)
+
+
+def _float32_input(args) -> bool:
+    for arg in args:
+        if getattr(arg, 'dtype', None) == np.float32:
+            return True
+    return False
+
+
+def _to_float32(result):
+    if isinstance(result, tuple):
+        return tuple(_to_float32(r) for r in result)
+    if isinstance(result, np.ndarray) and result.dtype == np.float64:
+        return result.astype(np.float32)
+    if isinstance(result, pd.Series) and result.dtype == np.float64:
+        return result.astype(np.float32)
+    if isinstance(result, np.float64):
+        return np.float32(result)
+    return result
+
+
+def _preserve_dtype(func, restore: bool = False):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not (_float32_input(args) or _float32_input(kwargs.values())):
+            return func(*args, **kwargs)
+        if restore:
+            args = [_to_float64(arg) for arg in args]
+            kwargs = {key: _to_float64(value) for key, value in kwargs.items()}
+        return _to_float32(func(*args, **kwargs))
+    return wrapper
+
+
+for _name, _func in list(globals().items()):
+    if _name.isupper() and callable(_func) and getattr(_func, '__module__', None) == __name__:
+        globals()[_name] = _preserve_dtype(_func, _name in _RESTORE_FUNCS)
+del _name, _func
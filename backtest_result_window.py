@@ -23,6 +23,7 @@ import numpy as np
 import sys
 import time
 from khQTTools import KhQuTools
+from khMetrics import get_rolling_metrics, annualized_volatility, beta as calculate_beta
 from xtquant import xtdata
 
 # 设置matplotlib的字体和其他参数
@@ -2287,12 +2288,8 @@ class BacktestResultWindow(QMainWindow):
             if len(strategy_returns) < 10:
                 return 0.0, 0.0
             
-            # 计算协方差和方差
-            covariance = np.cov(strategy_returns, benchmark_returns)[0, 1]
-            benchmark_variance = np.var(benchmark_returns)
-            
-            # 计算贝塔
-            beta = covariance / benchmark_variance if benchmark_variance != 0 else 0.0
+            # 计算贝塔（协方差/基准方差）
+            beta = calculate_beta(strategy_returns.values, benchmark_returns.values)
             
 
             alpha = 0
@@ -2497,6 +2494,32 @@ class BacktestResultWindow(QMainWindow):
             print(traceback.format_exc())
             return 0.0, 0, 0, 0.0, 0.0
 
+    def _get_volatility_days(self, default_days):
+        """获取回测区间的交易日天数（按回测目录缓存），获取失败时返回 default_days"""
+        cache = getattr(self, '_volatility_days_cache', None)
+        if cache is not None and cache[0] == self.backtest_dir:
+            return cache[1] if cache[1] > 0 else default_days
+        
+        n = 0
+        daily_stats_path = os.path.join(self.backtest_dir, "daily_stats.csv")
+        if os.path.exists(daily_stats_path):
+            daily_stats_df = pd.read_csv(daily_stats_path, encoding='utf-8-sig', usecols=lambda c: c == 'date')
+            if len(daily_stats_df) > 0 and 'date' in daily_stats_df.columns:
+                # 获取起止日期
+                first_date = pd.to_datetime(daily_stats_df['date'].iloc[0]).strftime('%Y-%m-%d')
+                last_date = pd.to_datetime(daily_stats_df['date'].iloc[-1]).strftime('%Y-%m-%d')
+                
+                # 获取交易日天数
+                tools = KhQuTools()
+                n = tools.get_trade_days_count(first_date, last_date)
+                
+                # 如果获取交易日天数失败，则使用实际数据点数量
+                if n <= 0:
+                    print(f"警告：无法获取交易日天数，使用收益率数据点数量 {default_days} 作为替代")
+        
+        self._volatility_days_cache = (self.backtest_dir, n)
+        return n if n > 0 else default_days
+
     def calculate_volatility(self, returns):
         """计算年化波动率，使用公式 σp = √(250/n·∑(rp - r̄p)²)
         
@@ -2519,41 +2542,11 @@ class BacktestResultWindow(QMainWindow):
             if len(returns) < 2:
                 return 0.0
             
-            # 从daily_stats获取起止日期
-            daily_stats_path = os.path.join(self.backtest_dir, "daily_stats.csv")
-            if os.path.exists(daily_stats_path):
-                daily_stats_df = pd.read_csv(daily_stats_path, encoding='utf-8-sig')
-                if len(daily_stats_df) > 0 and 'date' in daily_stats_df.columns:
-                    # 获取起止日期
-                    first_date = pd.to_datetime(daily_stats_df['date'].iloc[0]).strftime('%Y-%m-%d')
-                    last_date = pd.to_datetime(daily_stats_df['date'].iloc[-1]).strftime('%Y-%m-%d')
-                    
-                    # 获取交易日天数
-                    tools = KhQuTools()
-                    n = tools.get_trade_days_count(first_date, last_date)
-                    
-                    # 如果获取交易日天数失败，则使用实际数据点数量
-                    if n <= 0:
-                        n = len(returns)
-                        print(f"警告：无法获取交易日天数，使用收益率数据点数量 {n} 作为替代")
-                else:
-                    # 如果没有日期数据，使用数据点数量
-                    n = len(returns)
-            else:
-                # 如果没有daily_stats文件，使用数据点数量
-                n = len(returns)
-            
-            # 计算平均收益率
-            r_p_mean = returns.mean()
+            # 交易日天数只依赖回测目录，按目录缓存，避免夏普比率等指标重复读取文件和查询交易日历
+            n = self._get_volatility_days(len(returns))
             
             # 计算年化波动率 σp = √(250/n·∑(rp - r̄p)²)
-            volatility = np.sqrt((250/n) * np.sum((returns - r_p_mean)**2))
-            
-            # 检查结果是否为有效数值
-            if np.isnan(volatility) or np.isinf(volatility):
-                return 0.0
-            
-            return volatility
+            return annualized_volatility(returns.values, n)
         
         except Exception as e:
             print(f"计算年化波动率时出错: {str(e)}")
@@ -2767,49 +2760,22 @@ class BacktestResultWindow(QMainWindow):
             window_size_30 = min(30, len(returns))
             window_size_60 = min(60, len(returns))
             
-            if len(returns) >= window_size_30:
-                # 计算超额收益的年化值
-                rolling_excess_returns_30 = returns - self.risk_free_rate/252  # 使用从设置加载的无风险利率
-                rolling_return_30 = rolling_excess_returns_30.rolling(window=window_size_30).mean() * 252
-                rolling_std_30 = returns.rolling(window=window_size_30).std() * np.sqrt(252)
-                
-                # 添加除零保护
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    rolling_sharpe_30 = rolling_return_30 / rolling_std_30
-                
-                # 替换无效值
-                rolling_sharpe_30 = rolling_sharpe_30.replace([np.inf, -np.inf], np.nan)
-                rolling_sharpe_30 = rolling_sharpe_30.fillna(0)
-                
+            # 所有滚动指标由 khMetrics 一次计算，同一回测目录未变化时直接复用缓存
+            metrics = get_rolling_metrics(self.backtest_dir, daily_stats_df,
+                                          windows=(window_size_30, window_size_60),
+                                          risk_free_rate=self.risk_free_rate)
+            
+            if window_size_30 > 0:
                 # 绘制30日滚动夏普比率
-                valid_start_idx = window_size_30-1
-                # 确保索引不越界
-                valid_start_idx = min(valid_start_idx, len(dates)-1)
-                if valid_start_idx < len(dates):
-                    ax1.plot(dates[valid_start_idx:], rolling_sharpe_30[valid_start_idx:], 
-                           label='30日滚动夏普比率', color='#007acc', linewidth=1.5)
-            
-            if len(returns) >= window_size_60:
-                # 计算超额收益的年化值
-                rolling_excess_returns_60 = returns - self.risk_free_rate/252  # 使用从设置加载的无风险利率
-                rolling_return_60 = rolling_excess_returns_60.rolling(window=window_size_60).mean() * 252
-                rolling_std_60 = returns.rolling(window=window_size_60).std() * np.sqrt(252)
-                
-                # 添加除零保护
-                with np.errstate(divide='ignore', invalid='ignore'):
-                    rolling_sharpe_60 = rolling_return_60 / rolling_std_60
-                
-                # 替换无效值
-                rolling_sharpe_60 = rolling_sharpe_60.replace([np.inf, -np.inf], np.nan)
-                rolling_sharpe_60 = rolling_sharpe_60.fillna(0)
-                
+                valid_start_idx = min(window_size_30-1, len(dates)-1)
+                ax1.plot(dates[valid_start_idx:], metrics[f'sharpe_{window_size_30}'][valid_start_idx:], 
+                       label='30日滚动夏普比率', color='#007acc', linewidth=1.5)
+            
+            if window_size_60 > 0:
                 # 绘制60日滚动夏普比率
-                valid_start_idx = window_size_60-1
-                # 确保索引不越界
-                valid_start_idx = min(valid_start_idx, len(dates)-1)
-                if valid_start_idx < len(dates):
-                    ax1.plot(dates[valid_start_idx:], rolling_sharpe_60[valid_start_idx:], 
-                           label='60日滚动夏普比率', color='#ff9900', linewidth=1.5)
+                valid_start_idx = min(window_size_60-1, len(dates)-1)
+                ax1.plot(dates[valid_start_idx:], metrics[f'sharpe_{window_size_60}'][valid_start_idx:], 
+                       label='60日滚动夏普比率', color='#ff9900', linewidth=1.5)
             
             # 设置标题和标签
             ax1.set_title("滚动夏普比率", fontsize=12, fontweight='bold', color='#e8e8e8', pad=10)
@@ -2818,49 +2784,16 @@ class BacktestResultWindow(QMainWindow):
             # 添加图例
             ax1.legend(loc='upper left', fancybox=True, framealpha=0.7, fontsize=9)
             
-            # 计算30日滚动波动率和最大回撤
-            if len(returns) >= window_size_30:
-                rolling_vol_30 = returns.rolling(window=window_size_30).std() * np.sqrt(252) * 100  # 转为百分比
-                
-                # 计算滚动最大回撤
-                rolling_max_dd = pd.Series(index=dates)
-                for i in range(window_size_30, len(daily_stats_df)+1):
-                    window = daily_stats_df['total_asset'].iloc[i-window_size_30:i]
-                    cummax = window.cummax()
-                    
-                    # 添加除零保护
-                    with np.errstate(divide='ignore', invalid='ignore'):
-                        drawdown = (cummax - window) / cummax * 100
-                    
-                    # 替换无效值
-                    drawdown = drawdown.replace([np.inf, -np.inf], np.nan)
-                    drawdown = drawdown.fillna(0)
-                    
-                    if i-1 < len(rolling_max_dd):
-                        rolling_max_dd.iloc[i-1] = drawdown.max()
-                
-                # 绘制30日滚动波动率
-                valid_start_idx = window_size_30-1
-                # 确保索引不越界
-                valid_start_idx = min(valid_start_idx, len(dates)-1)
-                if valid_start_idx < len(dates) and valid_start_idx < len(rolling_vol_30):
-                    # 确保数据长度一致
-                    valid_length = min(len(dates[valid_start_idx:]), len(rolling_vol_30[valid_start_idx:]))
-                    plot_dates = dates[valid_start_idx:valid_start_idx+valid_length]
-                    plot_values = rolling_vol_30[valid_start_idx:valid_start_idx+valid_length]
-                    ax2.plot(plot_dates, plot_values, 
-                           label='30日滚动波动率(%)', color='#007acc', linewidth=1.5)
+            # 绘制30日滚动波动率和最大回撤
+            if window_size_30 > 0:
+                valid_start_idx = min(window_size_30-1, len(dates)-1)
+                ax2.plot(dates[valid_start_idx:], metrics[f'volatility_{window_size_30}'][valid_start_idx:], 
+                       label='30日滚动波动率(%)', color='#007acc', linewidth=1.5)
                 
-                # 绘制30日滚动最大回撤
-                # 确保不是空序列并且索引有效
-                if not rolling_max_dd.empty and valid_start_idx < len(rolling_max_dd):
-                    # 移除NaN值
-                    valid_dd = rolling_max_dd.dropna()
-                    if len(valid_dd) > 0:
-                        # 获取对应的日期
-                        valid_dates = dates[valid_dd.index.intersection(dates.index)]
-                        ax2.plot(valid_dates, valid_dd[valid_dates.index], 
-                               label='30日滚动最大回撤(%)', color='#ff4444', linewidth=1.5)
+                rolling_max_dd = metrics.get(f'max_drawdown_{window_size_30}')
+                if rolling_max_dd is not None:
+                    ax2.plot(dates[valid_start_idx:], rolling_max_dd[valid_start_idx:], 
+                           label='30日滚动最大回撤(%)', color='#ff4444', linewidth=1.5)
             
             # 设置标题和标签
             ax2.set_title("滚动风险指标", fontsize=12, fontweight='bold', color='#e8e8e8', pad=10)
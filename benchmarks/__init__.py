@@ -0,0 +1,11 @@
+# coding: utf-8
+"""
+KhQuant 性能基准测试包
+
+不依赖 MiniQMT 客户端，使用确定性的合成行情数据衡量指标库与回测框架的性能，
+用于量化每次优化的效果并防止性能回退。
+
+    python -m benchmarks.mytt_bench --length 5000 --width 20 --output mytt_report.json
+    python -m benchmarks.import_bench --check
+    python -m benchmarks.backtest_bench --output backtest_report.json
+"""
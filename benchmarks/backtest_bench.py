@@ -0,0 +1,245 @@
+# coding: utf-8
+"""
+回测框架端到端基准测试
+
+在合成行情上（benchmarks.fake_xtdata 注入为 xtquant.xtdata，不需要 MiniQMT 客户端）运行 KhQuantFramework，
+对每个场景（股票数 × 交易日数 × 触发方式）：
+    1. 计时整个回测（run_headless，含数据加载、逐 bar 回测与结果保存），重复 repeat 次取中位数
+    2. 开启 backtest.profile，读取 profile.json 中各阶段、逐 bar 阶段与策略回调的耗时
+    3. 记录成交笔数与期末总资产，引擎优化不应改变回测结果
+结果输出为 JSON 报告，可通过 --baseline 与历史报告对比，出现性能回退或结果变化时返回非零退出码。
+
+触发方式: 1d / 1m / 5m（K线触发）、tick（tick 触发，含5档盘口）、custom（自定义时间点，使用1分钟数据）
+
+用法:
+    python -m benchmarks.backtest_bench --output backtest_report.json
+    python -m benchmarks.backtest_bench --stocks 10 50 --days 60 --triggers 1d 1m --repeat 3
+    python -m benchmarks.backtest_bench --baseline backtest_report.json --tolerance 1.3
+    python -m benchmarks.backtest_bench --event-queue --baseline backtest_report.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import fake_xtdata  # noqa: E402
+
+STRATEGY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_strategy.py')
+DATA_END = '20241231'
+
+# 默认场景：(股票数, 交易日数, 触发方式)
+DEFAULT_SCENARIOS = [
+    (10, 250, '1d'),
+    (100, 250, '1d'),
+    (10, 20, '1m'),
+    (10, 60, '5m'),
+    (10, 60, 'custom'),
+    (5, 5, 'tick'),
+]
+
+TRIGGER_SETTINGS = {
+    '1d': ({'type': '1d'}, '1d'),
+    '1m': ({'type': '1m'}, '1m'),
+    '5m': ({'type': '5m'}, '5m'),
+    'tick': ({'type': 'tick'}, 'tick'),
+    'custom': ({'type': 'custom', 'custom_times': ['09:35:00', '10:30:00', '13:30:00', '14:55:00']}, '1m'),
+}
+KLINE_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'amount', 'preClose']
+TICK_FIELDS = ['lastPrice', 'open', 'high', 'low', 'lastClose', 'volume', 'amount',
+               'askPrice', 'bidPrice', 'askVol', 'bidVol']
+
+
+def scenario_config(stocks: List[str], start: str, end: str, trigger: str, event_queue: bool = False) -> Dict:
+    """场景的 .kh 配置"""
+    trigger_config, period = TRIGGER_SETTINGS[trigger]
+    return {
+        'system': {'userdata_path': ''},
+        'run_mode': 'backtest',
+        'account': {'account_id': 'bench', 'account_type': 'STOCK'},
+        'strategy_file': STRATEGY_FILE,
+        'backtest': {
+            'start_time': start,
+            'end_time': end,
+            'init_capital': 1000000.0,
+            'benchmark': 'sh.000300',
+            'trade_cost': {
+                'min_commission': 5.0,
+                'commission_rate': 0.0003,
+                'stamp_tax_rate': 0.001,
+                'flow_fee': 0.0,
+                'slippage': {'type': 'ratio', 'ratio': 0.001},
+            },
+            'trigger': trigger_config,
+            'profile': {'enabled': True},
+            'event_queue': {'enabled': event_queue},
+        },
+        'data': {
+            'kline_period': period,
+            'dividend_type': 'none',
+            'fields': TICK_FIELDS if period == 'tick' else KLINE_FIELDS,
+            'stock_list': stocks,
+        },
+        'market_callback': {'pre_market_enabled': False, 'post_market_enabled': False},
+        'risk': {'position_limit': 0.95, 'order_limit': 100000, 'loss_limit': 1.0},
+    }
+
+
+def run_scenario(market: fake_xtdata.SyntheticMarket, stock_count: int, days: int, trigger: str,
+                 repeat: int, workdir: str, event_queue: bool = False) -> Dict:
+    """运行一个场景 repeat 次，返回耗时与剖析结果"""
+    from khFrame import KhQuantFramework
+
+    stocks = market.stock_list[:stock_count]
+    window = market.days[-days:]
+    start, end = window[0].strftime('%Y%m%d'), window[-1].strftime('%Y%m%d')
+    period = TRIGGER_SETTINGS[trigger][1]
+    # 预先生成数据，计时只包含框架自身的耗时
+    market.prepare(stocks + ['000300.SH'], sorted({period, '1d'}), start, end)
+
+    name = f"{trigger}_{stock_count}x{days}"
+    config_path = os.path.join(workdir, f"{name}.kh")
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(scenario_config(stocks, start, end, trigger, event_queue), f, ensure_ascii=False, indent=2)
+
+    samples = []
+    framework = None
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for _ in range(repeat):
+            shutil.rmtree('backtest_results', ignore_errors=True)
+            framework = KhQuantFramework(config_path, STRATEGY_FILE, extra_strategies=[])
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                start_clock = time.perf_counter()
+                framework.run_headless()
+                samples.append(time.perf_counter() - start_clock)
+        result_dir = os.path.join('backtest_results', f"bench_strategy_{start}_{end}")
+        with open(os.path.join(result_dir, 'profile.json'), 'r', encoding='utf-8') as f:
+            profile = json.load(f)
+    finally:
+        os.chdir(cwd)
+
+    bars = profile['meta'].get('time_points', 0)
+    median = statistics.median(samples)
+    return {
+        'name': name,
+        'trigger': trigger,
+        'period': period,
+        'stocks': stock_count,
+        'days': days,
+        'start': start,
+        'end': end,
+        'bars': bars,
+        'median_s': median,
+        'min_s': min(samples),
+        'samples_s': samples,
+        'us_per_bar': median / bars * 1e6 if bars else None,
+        'us_per_stock_bar': median / (bars * stock_count) * 1e6 if bars else None,
+        'trades': len(framework.backtest_records.get('trades', [])),
+        'final_asset': float(framework.trade_mgr.assets.get('total_asset', 0.0)),
+        'stages': profile['stages'],
+        'phases': profile['phases'],
+        'callbacks': profile['callbacks'],
+        'data_calls': profile['data_calls'],
+    }
+
+
+def run(scenarios, repeat: int = 1, seed: int = 0, keep_dir: Optional[str] = None, event_queue: bool = False) -> Dict:
+    """执行全部场景并返回报告字典"""
+    max_stocks = max(stocks for stocks, _, _ in scenarios)
+    market = fake_xtdata.SyntheticMarket(fake_xtdata.default_codes(max_stocks), end=DATA_END, seed=seed)
+    uninstall = fake_xtdata.install(market)
+    workdir = keep_dir or tempfile.mkdtemp(prefix='kh_backtest_bench_')
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    try:
+        for stocks, days, trigger in scenarios:
+            print(f"场景 {trigger}: {stocks} 只股票 × {days} 个交易日 ...", flush=True)
+            result = run_scenario(market, stocks, days, trigger, repeat, workdir, event_queue)
+            results[result['name']] = result
+            print(f"  {result['bars']} 个时间点, 中位数 {result['median_s']:.3f} 秒, "
+                  f"{result['us_per_bar']:.1f} us/时间点, 成交 {result['trades']} 笔")
+    finally:
+        uninstall()
+        if keep_dir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {
+            'repeat': repeat,
+            'seed': seed,
+            'event_queue': event_queue,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'scenarios': results,
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """与基线报告对比，返回回退项描述（耗时超过基线 tolerance 倍，或成交笔数/期末资产发生变化）"""
+    problems = []
+    for name, entry in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if base.get('trades') != entry['trades'] or abs(base.get('final_asset', 0.0) - entry['final_asset']) > 1e-6:
+            problems.append(f"{name}: 回测结果变化（成交 {base.get('trades')} -> {entry['trades']}，"
+                            f"期末资产 {base.get('final_asset')} -> {entry['final_asset']}）")
+        before = base.get('median_s')
+        if before and entry['median_s'] > before * tolerance:
+            problems.append(f"{name}: {before:.3f} s -> {entry['median_s']:.3f} s")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='回测框架端到端基准测试（合成行情）')
+    parser.add_argument('--stocks', type=int, nargs='*', help='股票数量（可多个，与 --days/--triggers 组合）')
+    parser.add_argument('--days', type=int, nargs='*', help='交易日数量（可多个）')
+    parser.add_argument('--triggers', nargs='*', choices=sorted(TRIGGER_SETTINGS), help='触发方式（可多个）')
+    parser.add_argument('--repeat', type=int, default=1, help='每个场景的重复次数（取中位数）')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据随机种子')
+    parser.add_argument('--event-queue', action='store_true', help='使用事件调度回测（backtest.event_queue）')
+    parser.add_argument('--keep-dir', help='保留各场景配置与回测结果的目录（默认使用临时目录并在结束后删除）')
+    parser.add_argument('--output', default='backtest_bench_report.json', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='用于对比的历史 JSON 报告')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='允许的耗时增长倍数')
+    args = parser.parse_args(argv)
+
+    if args.stocks or args.days or args.triggers:
+        scenarios = [(stocks, days, trigger)
+                     for trigger in (args.triggers or ['1d'])
+                     for stocks in (args.stocks or [10])
+                     for days in (args.days or [60])]
+    else:
+        scenarios = DEFAULT_SCENARIOS
+
+    print(f"回测框架基准测试: {len(scenarios)} 个场景, 重复 {args.repeat} 次")
+    report = run(scenarios, args.repeat, args.seed, args.keep_dir, args.event_queue)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存: {args.output}")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare_with_baseline(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"回退: {problem}")
+        if problems:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,45 @@
+# coding: utf-8
+"""
+回测基准测试使用的策略
+
+逐 bar 维护每只股票最近 WINDOW 个价格，价格上穿均值时买入、下穿时卖出。
+只使用 khPrice/khHas/generate_signal 等常用接口，覆盖取数、下单与记账的完整路径，
+tick 数据没有 close 字段，此时使用 lastPrice。
+"""
+from collections import deque
+
+from khQuantImport import *
+
+WINDOW = 20
+
+_history = {}
+_price_field = 'close'
+
+
+def init(stocks, context):
+    global _price_field
+    _history.clear()
+    framework = context.get('__framework__')
+    period = framework.config.kline_period if framework is not None else '1d'
+    _price_field = 'lastPrice' if period == 'tick' else 'close'
+
+
+def khHandlebar(data):
+    signals = []
+    for code in khGet(data, 'stocks'):
+        price = khPrice(data, code, _price_field)
+        if price <= 0:
+            continue
+        history = _history.get(code)
+        if history is None:
+            history = _history[code] = deque(maxlen=WINDOW)
+        history.append(price)
+        if len(history) < WINDOW:
+            continue
+        mean = sum(history) / WINDOW
+        holding = khHas(data, code)
+        if price > mean * 1.002 and not holding and khGet(data, 'cash') > price * 1000:
+            signals.extend(generate_signal(data, code, price, 0.1, 'buy', '上穿均值'))
+        elif price < mean * 0.998 and holding:
+            signals.extend(generate_signal(data, code, price, 1.0, 'sell', '下穿均值'))
+    return signals
@@ -0,0 +1,405 @@
+# coding: utf-8
+"""
+基于合成行情的本地 xtdata 替身
+
+实现框架用到的 xtdata 接口（get_market_data_ex、get_market_data、get_local_data、download_history_data、
+download_history_data2、get_stock_list_in_sector 等），数据来自 benchmarks.synthetic 的确定性生成器，
+不需要 MiniQMT 客户端即可完整运行 KhQuantFramework 回测。
+
+只在基准测试进程内通过 install() 注入 sys.modules，不影响正常运行：
+    from benchmarks import fake_xtdata
+    fake_xtdata.install(fake_xtdata.SyntheticMarket(fake_xtdata.default_codes(50)))
+    from khFrame import KhQuantFramework  # 此后框架中的 xtdata 即为本模块
+
+环境中安装了 xtquant 时只替换 xtquant.xtdata，否则同时注入 xttrader/xttype/xtconstant 的最小替身。
+"""
+import datetime
+import importlib
+import importlib.util
+import sys
+import types
+import zlib
+from typing import Callable, Dict, List, Optional
+
+import holidays
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_minute_bars, make_ohlcv, make_ticks
+
+# 交易时段（距午夜的秒数）
+SESSIONS = ((9 * 3600 + 30 * 60, 11 * 3600 + 30 * 60), (13 * 3600, 15 * 3600))
+# 各日内周期的间隔秒数（K 线时间戳为 K 线结束时间，tick 为快照时间）
+PERIOD_SECONDS = {'1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, 'tick': 3}
+DEFAULT_INDEXES = ('000300.SH', '000905.SH', '000852.SH', '000001.SH', '399001.SZ', '399006.SZ')
+
+# xtconstant 中框架用到的常量（取值与 xtquant 一致）
+XTCONSTANT_VALUES = {
+    'SECURITY_ACCOUNT': 2,
+    'STOCK_BUY': 23,
+    'STOCK_SELL': 24,
+    'FIX_PRICE': 11,
+    'LATEST_PRICE': 5,
+    'DIRECTION_FLAG_LONG': 48,
+    'OFFSET_FLAG_OPEN': 48,
+    'OFFSET_FLAG_CLOSE': 49,
+    'ORDER_UNREPORTED': 48,
+    'ORDER_REPORTED': 50,
+    'ORDER_PART_CANCEL': 53,
+    'ORDER_CANCELED': 54,
+    'ORDER_PART_SUCC': 55,
+    'ORDER_SUCCEEDED': 56,
+    'ORDER_JUNK': 57,
+}
+
+
+def default_codes(count: int) -> List[str]:
+    """生成 count 个股票代码（沪市 600xxx 与深市 000xxx 交替）"""
+    codes = []
+    for i in range(count):
+        if i % 2 == 0:
+            codes.append(f"{600000 + i // 2:06d}.SH")
+        else:
+            codes.append(f"{1 + i // 2:06d}.SZ")
+    return codes
+
+
+def trading_days(start: str, end: str) -> List[datetime.date]:
+    """[start, end] 内的交易日（工作日且非法定节假日，与 khQTTools.is_trade_day 一致）"""
+    day = datetime.datetime.strptime(start, "%Y%m%d").date()
+    last = datetime.datetime.strptime(end, "%Y%m%d").date()
+    cn_holidays = holidays.China(years=range(day.year, last.year + 1))
+    days = []
+    while day <= last:
+        if day.weekday() < 5 and day not in cn_holidays:
+            days.append(day)
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def session_offsets(period: str) -> np.ndarray:
+    """日内周期每根 K 线（或每个 tick）距午夜的秒数"""
+    step = PERIOD_SECONDS[period]
+    offsets = []
+    for start, end in SESSIONS:
+        if period == 'tick':
+            offsets.append(np.arange(start, end, step))
+        else:
+            offsets.append(np.arange(start + step, end + 1, step))
+    return np.concatenate(offsets)
+
+
+def _bound_ms(text: str, end: bool = False) -> Optional[int]:
+    text = str(text or '')
+    if not text:
+        return None
+    if len(text) <= 8:
+        dt = datetime.datetime.strptime(text[:8], "%Y%m%d")
+        if end:
+            return int((dt + datetime.timedelta(days=1)).timestamp() * 1000) - 1
+        return int(dt.timestamp() * 1000)
+    dt = datetime.datetime.strptime(text[:14].ljust(14, '0'), "%Y%m%d%H%M%S")
+    return int(dt.timestamp() * 1000) + (999 if end else 0)
+
+
+class SyntheticMarket:
+    """合成行情数据源
+
+    每只股票的数据只由（代码, 种子）决定，日线一次生成整个日期区间，日内数据按交易日按需生成并缓存，
+    日线、分钟线与 tick 的价格相互一致（日内最后价格等于日线收盘价）。
+
+    Args:
+        stock_list: 股票池（get_stock_list_in_sector 返回的代码）
+        start / end: 数据覆盖的日期区间（YYYYMMDD）
+        seed: 随机种子
+        tick_depth: tick 数据的盘口档数，0 表示不生成盘口
+        indexes: 可作为基准的指数代码
+    """
+
+    def __init__(self, stock_list: Optional[List[str]] = None, start: str = "20230101", end: str = "20241231",
+                 seed: int = 0, tick_depth: int = 5, indexes=DEFAULT_INDEXES):
+        self.stock_list = list(stock_list or default_codes(50))
+        self.indexes = list(indexes)
+        self.seed = seed
+        self.tick_depth = tick_depth
+        self.days = trading_days(start, end)
+        self._day_ms = np.array([int(datetime.datetime.combine(day, datetime.time()).timestamp() * 1000)
+                                 for day in self.days], dtype=np.int64)
+        self._day_labels = np.array([day.strftime("%Y%m%d") for day in self.days])
+        self._offsets: Dict[str, np.ndarray] = {}
+        self._daily: Dict[str, Dict[str, np.ndarray]] = {}
+        self._frames: Dict[tuple, pd.DataFrame] = {}
+
+    def _code_seed(self, code: str) -> int:
+        return (zlib.crc32(code.encode('utf-8')) + self.seed * 1000003) % (2 ** 32)
+
+    def daily(self, code: str) -> Dict[str, np.ndarray]:
+        arrays = self._daily.get(code)
+        if arrays is None:
+            start_price = 5.0 + zlib.crc32(code.encode('utf-8')) % 50
+            if code in self.indexes:
+                start_price *= 100
+            arrays = self._daily[code] = make_ohlcv(len(self.days), self._code_seed(code), start_price)
+        return arrays
+
+    def _daily_frame(self, code: str) -> pd.DataFrame:
+        key = (code, '1d')
+        df = self._frames.get(key)
+        if df is None:
+            df = pd.DataFrame({'time': self._day_ms, **self.daily(code)})
+            df.index = pd.Index(self._day_labels.astype(object))
+            self._frames[key] = df
+        return df
+
+    def _intraday_frame(self, code: str, period: str, day: int) -> pd.DataFrame:
+        """某只股票某个交易日的日内数据（按交易日生成并缓存，tick 数据不必一次生成整个区间）"""
+        key = (code, period, day)
+        df = self._frames.get(key)
+        if df is not None:
+            return df
+        if period not in PERIOD_SECONDS:
+            raise ValueError(f"合成行情不支持的周期: {period}")
+        offsets = self._offsets.get(period)
+        if offsets is None:
+            offsets = self._offsets[period] = session_offsets(period)
+        daily = {name: values[day:day + 1] for name, values in self.daily(code).items()}
+        seed = (self._code_seed(code) + 7919 * (day + 1)) % (2 ** 32)
+        if period == 'tick':
+            arrays = make_ticks(daily, len(offsets), seed, self.tick_depth)
+        else:
+            arrays = make_minute_bars(daily, len(offsets), seed)
+        columns = {'time': self._day_ms[day] + offsets * 1000}
+        for name, values in arrays.items():
+            if values.ndim == 3:
+                # 盘口字段：每行为一个档位列表，与 xtdata 的 tick 数据格式一致
+                column = np.empty(values.shape[1], dtype=object)
+                column[:] = [list(row) for row in values[0]]
+                columns[name] = column
+            else:
+                columns[name] = values[0]
+        df = pd.DataFrame(columns)
+        labels = [f"{self._day_labels[day]}{o // 3600:02d}{o % 3600 // 60:02d}{o % 60:02d}" for o in offsets]
+        df.index = pd.Index(labels, dtype=object)
+        self._frames[key] = df
+        return df
+
+    def _day_range(self, period: str, start_ms: Optional[int], end_ms: Optional[int], count: int):
+        """覆盖 [start_ms, end_ms]（或结束时间之前 count 条）所需的交易日下标区间 [lo, hi)"""
+        hi = len(self.days) if end_ms is None else int(np.searchsorted(self._day_ms, end_ms, side='right'))
+        if start_ms is not None:
+            lo = max(int(np.searchsorted(self._day_ms, start_ms, side='right')) - 1, 0)
+        elif count is not None and count > 0:
+            per_day = len(self._offsets.get(period, session_offsets(period)))
+            lo = max(hi - (count + per_day - 1) // per_day - 1, 0)
+        else:
+            lo = 0
+        return lo, hi
+
+    def prepare(self, codes: List[str], periods: List[str], start: str = '', end: str = ''):
+        """预先生成 [start, end] 内的数据，使计时不包含数据生成的耗时"""
+        for code in codes:
+            for period in periods:
+                if period == '1d':
+                    self._daily_frame(code)
+                    continue
+                lo, hi = self._day_range(period, _bound_ms(start), _bound_ms(end, end=True), -1)
+                for day in range(lo, hi):
+                    self._intraday_frame(code, period, day)
+
+    def select(self, code: str, period: str, fields, start_time='', end_time='', count=-1) -> pd.DataFrame:
+        start_ms, end_ms = _bound_ms(start_time), _bound_ms(end_time, end=True)
+        if period == '1d':
+            df = self._daily_frame(code)
+        else:
+            lo, hi = self._day_range(period, start_ms, end_ms, count)
+            frames = [self._intraday_frame(code, period, day) for day in range(lo, hi)]
+            if not frames:
+                return pd.DataFrame(columns=[name for name in (fields or [])])
+            df = pd.concat(frames) if len(frames) > 1 else frames[0]
+        times = df['time'].to_numpy()
+        lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms, side='left'))
+        hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms, side='right'))
+        if count is not None and count > 0:
+            lo = max(lo, hi - count)
+        columns = [name for name in (fields or df.columns) if name in df.columns]
+        return df.iloc[lo:hi][columns].copy()
+
+
+_market: Optional[SyntheticMarket] = None
+call_counts: Dict[str, int] = {}
+
+
+def _count(name: str):
+    call_counts[name] = call_counts.get(name, 0) + 1
+
+
+def _current_market() -> SyntheticMarket:
+    global _market
+    if _market is None:
+        _market = SyntheticMarket()
+    return _market
+
+
+def get_market_data_ex(field_list=None, stock_list=None, period='1d', start_time='', end_time='', count=-1,
+                       dividend_type='none', fill_data=True):
+    _count('get_market_data_ex')
+    market = _current_market()
+    return {code: market.select(code, period, field_list, start_time, end_time, count) for code in stock_list or []}
+
+
+def get_local_data(field_list=None, stock_list=None, period='1d', start_time='', end_time='', count=-1,
+                   dividend_type='none', fill_data=True, data_dir=None):
+    _count('get_local_data')
+    market = _current_market()
+    return {code: market.select(code, period, field_list, start_time, end_time, count) for code in stock_list or []}
+
+
+def get_market_data(field_list=None, stock_list=None, period='1d', start_time='', end_time='', count=-1,
+                    dividend_type='none', fill_data=True):
+    """返回 {字段: DataFrame(行=股票, 列=时间)}"""
+    _count('get_market_data')
+    market = _current_market()
+    frames = {code: market.select(code, period, field_list, start_time, end_time, count) for code in stock_list or []}
+    result = {}
+    for field in field_list or []:
+        columns = {code: df[field] for code, df in frames.items() if field in df.columns}
+        result[field] = pd.DataFrame(columns).T if columns else pd.DataFrame()
+    return result
+
+
+def download_history_data(stock_code='', period='1d', start_time='', end_time='', incrementally=None):
+    _count('download_history_data')
+
+
+def download_history_data2(stock_list=None, period='1d', start_time='', end_time='', callback=None,
+                           incrementally=None):
+    _count('download_history_data2')
+    stock_list = list(stock_list or [])
+    if callback is not None:
+        for i, code in enumerate(stock_list, 1):
+            callback({'total': len(stock_list), 'finished': i, 'stockcode': code, 'message': ''})
+        if not stock_list:
+            callback({'total': 0, 'finished': 0, 'stockcode': '', 'message': ''})
+
+
+def download_sector_data():
+    _count('download_sector_data')
+
+
+def get_sector_list() -> List[str]:
+    _count('get_sector_list')
+    return ['沪深A股', '上证A股', '深证A股', '沪深指数']
+
+
+def get_stock_list_in_sector(sector_name: str) -> List[str]:
+    _count('get_stock_list_in_sector')
+    market = _current_market()
+    if sector_name == '沪深指数':
+        return list(market.indexes)
+    if sector_name == '上证A股':
+        return [code for code in market.stock_list if code.endswith('.SH')]
+    if sector_name == '深证A股':
+        return [code for code in market.stock_list if code.endswith('.SZ')]
+    return list(market.stock_list)
+
+
+def get_instrument_detail(stock_code: str, iscomplete: bool = False) -> Optional[Dict]:
+    _count('get_instrument_detail')
+    market = _current_market()
+    if stock_code not in market.stock_list and stock_code not in market.indexes:
+        return None
+    pre_close = float(market.daily(stock_code)['close'][-1])
+    return {
+        'ExchangeID': stock_code.split('.')[-1],
+        'InstrumentID': stock_code.split('.')[0],
+        'InstrumentName': f"合成{stock_code.split('.')[0]}",
+        'PreClose': pre_close,
+        'UpStopPrice': round(pre_close * 1.1, 2),
+        'DownStopPrice': round(pre_close * 0.9, 2),
+        'PriceTick': 0.01,
+        'VolumeMultiple': 1,
+        'OpenDate': '19900101',
+    }
+
+
+def get_trading_dates(market: str = 'SH', start_time: str = '', end_time: str = '', count: int = -1) -> List[int]:
+    _count('get_trading_dates')
+    data = _current_market()
+    times = data._day_ms
+    start_ms, end_ms = _bound_ms(start_time), _bound_ms(end_time, end=True)
+    selected = [int(t) for t in times if (start_ms is None or t >= start_ms) and (end_ms is None or t <= end_ms)]
+    return selected[-count:] if count and count > 0 else selected
+
+
+def _stub_modules() -> Dict[str, types.ModuleType]:
+    """没有安装 xtquant 时注入的 xttrader/xttype/xtconstant 最小替身"""
+    xttrader = types.ModuleType('xtquant.xttrader')
+
+    class XtQuantTraderCallback:
+        pass
+
+    class XtQuantTrader:
+        def __init__(self, *args, **kwargs):
+            raise RuntimeError("合成行情基准测试环境不支持实盘交易接口")
+
+    xttrader.XtQuantTraderCallback = XtQuantTraderCallback
+    xttrader.XtQuantTrader = XtQuantTrader
+
+    xttype = types.ModuleType('xtquant.xttype')
+
+    class StockAccount:
+        def __init__(self, account_id, account_type='STOCK'):
+            self.account_id = account_id
+            self.account_type = account_type
+
+    xttype.StockAccount = StockAccount
+
+    xtconstant = types.ModuleType('xtquant.xtconstant')
+    for name, value in XTCONSTANT_VALUES.items():
+        setattr(xtconstant, name, value)
+    return {'xtquant.xttrader': xttrader, 'xtquant.xttype': xttype, 'xtquant.xtconstant': xtconstant}
+
+
+def install(market: Optional[SyntheticMarket] = None) -> Callable[[], None]:
+    """把本模块注入为 xtquant.xtdata（并设置数据源），返回恢复原状的函数
+
+    已经导入的模块（如 khFrame、khQTTools）中的 xtdata 引用同样替换为本模块。
+    """
+    global _market
+    if market is not None:
+        _market = market
+    this = sys.modules[__name__]
+    saved = {name: sys.modules.get(name) for name in
+             ('xtquant', 'xtquant.xtdata', 'xtquant.xttrader', 'xtquant.xttype', 'xtquant.xtconstant')}
+    previous_xtdata = saved['xtquant.xtdata']
+
+    if saved['xtquant'] is None and importlib.util.find_spec('xtquant') is None:
+        package = types.ModuleType('xtquant')
+        package.__path__ = []
+        sys.modules['xtquant'] = package
+        for name, module in _stub_modules().items():
+            sys.modules[name] = module
+            setattr(package, name.split('.')[-1], module)
+    package = sys.modules.get('xtquant') or importlib.import_module('xtquant')
+    sys.modules['xtquant.xtdata'] = this
+    package.xtdata = this
+
+    patched = []
+    if previous_xtdata is not None:
+        for module in list(sys.modules.values()):
+            if module is not this and getattr(module, 'xtdata', None) is previous_xtdata:
+                module.xtdata = this
+                patched.append(module)
+
+    def uninstall():
+        for module in patched:
+            module.xtdata = previous_xtdata
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+        if saved['xtquant'] is not None and previous_xtdata is not None:
+            saved['xtquant'].xtdata = previous_xtdata
+
+    return uninstall
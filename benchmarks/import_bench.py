@@ -0,0 +1,164 @@
+# coding: utf-8
+"""
+khQuantImport 导入耗时基准测试
+
+策略文件以 from khQuantImport import * 开头，进程池参数扫描与子进程回测的每个工作进程都要重新导入一次。
+本脚本在全新的子进程中重复执行导入并计时（取中位数），同时：
+    1. 用 python -X importtime 统计耗时最多的顶层依赖
+    2. 检查 from khQuantImport import * 之后是否已加载 xtquant/khQTTools/MyTT 等本应延迟导入的模块
+    3. 检查 khQuantImport._LAZY_EXPORTS 是否覆盖了 khQTTools 与 MyTT 的全部公共符号（--check）
+结果输出为 JSON 报告，可通过 --baseline 与历史报告对比，导入耗时超过基线 tolerance 倍时返回非零退出码。
+
+用法:
+    python -m benchmarks.import_bench --repeat 10 --output import_report.json
+    python -m benchmarks.import_bench --baseline import_report.json --tolerance 1.3 --check
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 khQuantImport 后不应出现在 sys.modules 中的模块
+DEFERRED_MODULES = ('xtquant.xtdata', 'xtquant.xttrader', 'khQTTools', 'khTrade', 'MyTT', 'holidays', 'PyQt5')
+
+_TIMING_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+from khQuantImport import *
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed_s': elapsed,
+                  'loaded': [name for name in %r if name in sys.modules]}))
+"""
+
+
+def _run_python(args: List[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable] + args, cwd=ROOT, capture_output=True, text=True, check=True)
+
+
+def time_import(repeat: int) -> Dict:
+    """在 repeat 个全新子进程中计时 from khQuantImport import *"""
+    samples = []
+    loaded = []
+    for _ in range(repeat):
+        result = json.loads(_run_python(['-c', _TIMING_SNIPPET % (DEFERRED_MODULES,)]).stdout.strip().splitlines()[-1])
+        samples.append(result['elapsed_s'])
+        loaded = result['loaded']
+    return {
+        'median_s': statistics.median(samples),
+        'min_s': min(samples),
+        'samples_s': samples,
+        'eagerly_loaded': loaded,
+    }
+
+
+def top_imports(limit: int = 10) -> List[Dict]:
+    """python -X importtime 中累计耗时最多的顶层依赖"""
+    stderr = _run_python(['-X', 'importtime', '-c', 'import khQuantImport']).stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line.split('|', 2)
+        # 顶层依赖缩进为 2 个空格（khQuantImport 自身在第一层）
+        indent = len(name) - len(name.lstrip(' '))
+        if indent > 3:
+            continue
+        try:
+            entries.append({'module': name.strip(), 'cumulative_ms': int(cumulative) / 1000.0})
+        except ValueError:
+            continue
+    entries.sort(key=lambda entry: entry['cumulative_ms'], reverse=True)
+    return entries[:limit]
+
+
+def check_lazy_exports() -> Dict[str, List[str]]:
+    """对比 _LAZY_EXPORTS 与 khQTTools/MyTT 实际的公共符号，返回遗漏与多余的名字"""
+    snippet = (
+        "import json, khQuantImport, khQTTools, MyTT\n"
+        "public = set()\n"
+        "for module in (khQTTools, MyTT):\n"
+        "    public.update(n for n in dir(module) if not n.startswith('_'))\n"
+        "import importlib\n"
+        "unknown = [n for m, names in khQuantImport._LAZY_EXPORTS.items() if not m.startswith('xtquant')\n"
+        "           for n in names if not hasattr(importlib.import_module(m), n)]\n"
+        "print(json.dumps({'missing': sorted(public - set(khQuantImport.__all__)), 'unknown': sorted(unknown)}))\n"
+    )
+    return json.loads(_run_python(['-c', snippet]).stdout.strip().splitlines()[-1])
+
+
+def run(repeat: int = 5, check: bool = False) -> Dict:
+    """执行基准测试并返回报告字典"""
+    report = {
+        'meta': {'repeat': repeat, 'python': platform.python_version(), 'platform': platform.platform()},
+        'import': time_import(repeat),
+        'top_imports': top_imports(),
+    }
+    if check:
+        report['exports'] = check_lazy_exports()
+    return report
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """与基线报告对比，返回回退项描述（导入耗时超过基线 tolerance 倍，或新增了提前加载的模块）"""
+    problems = []
+    now = report['import']['median_s']
+    before = baseline.get('import', {}).get('median_s')
+    if before and now > before * tolerance:
+        problems.append(f"导入耗时: {before * 1000:.1f} ms -> {now * 1000:.1f} ms")
+    newly_loaded = set(report['import']['eagerly_loaded']) - set(baseline.get('import', {}).get('eagerly_loaded', []))
+    if newly_loaded:
+        problems.append(f"新增提前加载的模块: {', '.join(sorted(newly_loaded))}")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='khQuantImport 导入耗时基准测试')
+    parser.add_argument('--repeat', type=int, default=5, help='子进程导入次数（取中位数）')
+    parser.add_argument('--check', action='store_true', help='检查延迟导入名单是否覆盖 khQTTools/MyTT 的公共符号')
+    parser.add_argument('--output', default='import_bench_report.json', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='用于对比的历史 JSON 报告')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='允许的耗时增长倍数')
+    args = parser.parse_args(argv)
+
+    print(f"khQuantImport 导入基准测试: 重复 {args.repeat} 次")
+    report = run(args.repeat, args.check)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存: {args.output}")
+
+    timing = report['import']
+    print(f"导入耗时中位数: {timing['median_s'] * 1000:.1f} ms（最快 {timing['min_s'] * 1000:.1f} ms）")
+    for entry in report['top_imports']:
+        print(f"  {entry['module']:<24}{entry['cumulative_ms']:10.1f} ms")
+    if timing['eagerly_loaded']:
+        print(f"提前加载的模块: {', '.join(timing['eagerly_loaded'])}")
+
+    exit_code = 0
+    exports = report.get('exports')
+    if exports:
+        if exports['missing']:
+            print(f"未登记到 _LAZY_EXPORTS 的公共符号: {', '.join(exports['missing'])}")
+            exit_code = 1
+        if exports['unknown']:
+            print(f"_LAZY_EXPORTS 中已不存在的符号: {', '.join(exports['unknown'])}")
+            exit_code = 1
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare_with_baseline(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"回退: {problem}")
+        if problems:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,627 @@
+# coding: utf-8
+"""
+MyTT 指标正确性与吞吐量基准测试
+
+对 MyTT.py 中的每个函数：
+    1. 在合成 OHLCV 数据上计时（MyTT 原始 pandas 实现，以及 khExpr 惰性表达式路径）
+    2. 与独立的 numpy 参考实现比对数值结果
+    3. 扫描模块源码，报告被重复定义（后定义覆盖前定义）的函数，并验证两版结果是否一致
+    4. 检查 float32 紧凑精度模式下的结果误差是否在 FLOAT32_TOLERANCE 约定的容差内
+结果输出为 JSON 报告，可通过 --baseline 与历史报告对比，出现性能回退或数值不一致时返回非零退出码。
+
+用法:
+    python -m benchmarks.mytt_bench --length 5000 --width 20 --output mytt_report.json
+    python -m benchmarks.mytt_bench --baseline mytt_report.json --tolerance 1.3
+"""
+import argparse
+import ast
+import inspect
+import json
+import os
+import platform
+import sys
+import time
+import traceback
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import MyTT  # noqa: E402
+from benchmarks.synthetic import make_panel  # noqa: E402
+
+try:
+    import khExpr
+except ImportError:  # 惰性表达式层为可选组件
+    khExpr = None
+
+
+# 每个函数的调用方式：接收 {'CLOSE','HIGH','LOW','OPEN','VOL'} 命名空间（M 为指标模块），返回调用结果
+FUNCTION_CASES: Dict[str, Callable] = {
+    'RD': lambda M, d: M.RD(d.CLOSE),
+    'RET': lambda M, d: M.RET(d.CLOSE),
+    'ABS': lambda M, d: M.ABS(d.CLOSE - d.OPEN),
+    'LN': lambda M, d: M.LN(d.CLOSE),
+    'POW': lambda M, d: M.POW(d.CLOSE, 2),
+    'SQRT': lambda M, d: M.SQRT(d.CLOSE),
+    'SIN': lambda M, d: M.SIN(d.CLOSE),
+    'COS': lambda M, d: M.COS(d.CLOSE),
+    'TAN': lambda M, d: M.TAN(d.CLOSE),
+    'MAX': lambda M, d: M.MAX(d.OPEN, d.CLOSE),
+    'MIN': lambda M, d: M.MIN(d.OPEN, d.CLOSE),
+    'IF': lambda M, d: M.IF(d.CLOSE > d.OPEN, d.HIGH, d.LOW),
+    'REF': lambda M, d: M.REF(d.CLOSE, 1),
+    'DIFF': lambda M, d: M.DIFF(d.CLOSE, 1),
+    'STD': lambda M, d: M.STD(d.CLOSE, 20),
+    'SUM': lambda M, d: M.SUM(d.VOL, 20),
+    'CONST': lambda M, d: M.CONST(np.asarray(d.CLOSE)),
+    'HHV': lambda M, d: M.HHV(d.HIGH, 20),
+    'LLV': lambda M, d: M.LLV(d.LOW, 20),
+    'HHVBARS': lambda M, d: M.HHVBARS(d.HIGH, 20),
+    'LLVBARS': lambda M, d: M.LLVBARS(d.LOW, 20),
+    'MA': lambda M, d: M.MA(d.CLOSE, 20),
+    'EMA': lambda M, d: M.EMA(d.CLOSE, 12),
+    'SMA': lambda M, d: M.SMA(d.CLOSE, 9, 1),
+    'WMA': lambda M, d: M.WMA(d.CLOSE, 10),
+    'DMA': lambda M, d: M.DMA(d.CLOSE, 0.2),
+    'AVEDEV': lambda M, d: M.AVEDEV(d.CLOSE, 14),
+    'SLOPE': lambda M, d: M.SLOPE(d.CLOSE, 10),
+    'FORCAST': lambda M, d: M.FORCAST(d.CLOSE, 10),
+    'LAST': lambda M, d: M.LAST(d.CLOSE > d.OPEN, 5, 1),
+    'COUNT': lambda M, d: M.COUNT(d.CLOSE > d.OPEN, 5),
+    'EVERY': lambda M, d: M.EVERY(d.CLOSE > d.OPEN, 3),
+    'EXIST': lambda M, d: M.EXIST(d.CLOSE > d.OPEN, 3),
+    'FILTER': lambda M, d: M.FILTER(M.IF(d.CLOSE > d.OPEN, 1, 0), 3),
+    'BARSLAST': lambda M, d: M.BARSLAST(d.CLOSE > d.OPEN),
+    'BARSLASTCOUNT': lambda M, d: M.BARSLASTCOUNT(d.CLOSE > d.OPEN),
+    'BARSSINCEN': lambda M, d: M.BARSSINCEN(d.CLOSE > d.OPEN, 10),
+    'CROSS': lambda M, d: M.CROSS(M.MA(d.CLOSE, 5), M.MA(d.CLOSE, 10)),
+    'LONGCROSS': lambda M, d: M.LONGCROSS(M.MA(d.CLOSE, 5), M.MA(d.CLOSE, 10), 3),
+    'VALUEWHEN': lambda M, d: M.VALUEWHEN(d.CLOSE > d.OPEN, d.CLOSE),
+    'BETWEEN': lambda M, d: M.BETWEEN(d.CLOSE, d.LOW, d.HIGH),
+    'TOPRANGE': lambda M, d: M.TOPRANGE(d.HIGH),
+    'LOWRANGE': lambda M, d: M.LOWRANGE(d.LOW),
+    'MACD': lambda M, d: M.MACD(d.CLOSE),
+    'KDJ': lambda M, d: M.KDJ(d.CLOSE, d.HIGH, d.LOW),
+    'RSI': lambda M, d: M.RSI(d.CLOSE, 14),
+    'WR': lambda M, d: M.WR(d.CLOSE, d.HIGH, d.LOW),
+    'BIAS': lambda M, d: M.BIAS(d.CLOSE),
+    'BOLL': lambda M, d: M.BOLL(d.CLOSE),
+    'PSY': lambda M, d: M.PSY(d.CLOSE),
+    'CCI': lambda M, d: M.CCI(d.CLOSE, d.HIGH, d.LOW),
+    'ATR': lambda M, d: M.ATR(d.CLOSE, d.HIGH, d.LOW),
+    'BBI': lambda M, d: M.BBI(d.CLOSE),
+    'DMI': lambda M, d: M.DMI(d.CLOSE, d.HIGH, d.LOW),
+    'TAQ': lambda M, d: M.TAQ(d.HIGH, d.LOW, 20),
+    'KTN': lambda M, d: M.KTN(d.CLOSE, d.HIGH, d.LOW),
+    'TRIX': lambda M, d: M.TRIX(d.CLOSE),
+    'VR': lambda M, d: M.VR(d.CLOSE, d.VOL),
+    'CR': lambda M, d: M.CR(d.CLOSE, d.HIGH, d.LOW),
+    'EMV': lambda M, d: M.EMV(d.HIGH, d.LOW, d.VOL),
+    'DPO': lambda M, d: M.DPO(d.CLOSE),
+    'BRAR': lambda M, d: M.BRAR(d.OPEN, d.CLOSE, d.HIGH, d.LOW),
+    'DFMA': lambda M, d: M.DFMA(d.CLOSE),
+    'MTM': lambda M, d: M.MTM(d.CLOSE),
+    'MASS': lambda M, d: M.MASS(d.HIGH, d.LOW),
+    'ROC': lambda M, d: M.ROC(d.CLOSE),
+    'EXPMA': lambda M, d: M.EXPMA(d.CLOSE),
+    'OBV': lambda M, d: M.OBV(d.CLOSE, d.VOL),
+    'MFI': lambda M, d: M.MFI(d.CLOSE, d.HIGH, d.LOW, d.VOL),
+    'ASI': lambda M, d: M.ASI(d.OPEN, d.CLOSE, d.HIGH, d.LOW),
+    'XSII': lambda M, d: M.XSII(d.CLOSE, d.HIGH, d.LOW),
+    # DSMA 内部按位置切片相减，Series 输入会按索引对齐，需传入 ndarray
+    'DSMA': lambda M, d: M.DSMA(getattr(d.CLOSE, 'values', d.CLOSE), 20),
+    'SUMBARSFAST': lambda M, d: M.SUMBARSFAST(d.VOL, 100_000),
+    'SAR': lambda M, d: M.SAR(d.HIGH, d.LOW),
+    'TDX_SAR': lambda M, d: M.TDX_SAR(d.HIGH, d.LOW),
+}
+
+# 依赖逐元素下标访问或循环的函数，不能接收符号输入，惰性路径下跳过
+EXPR_UNSUPPORTED = {'RET', 'CONST', 'SAR', 'TDX_SAR', 'SUMBARSFAST'}
+
+
+# ------------------ numpy 参考实现（独立于 MyTT，用于数值比对） ------------------
+
+def _windows(S, N):
+    return np.lib.stride_tricks.sliding_window_view(np.asarray(S, dtype=np.float64), N)
+
+
+def _pad(values, N, length):
+    out = np.full(length, np.nan)
+    out[N - 1:] = values
+    return out
+
+
+def ref_MA(S, N):
+    return _pad(_windows(S, N).mean(axis=1), N, len(S))
+
+
+def ref_EWM(S, alpha):
+    S = np.asarray(S, dtype=np.float64)
+    out = np.empty(len(S))
+    out[0] = S[0]
+    for i in range(1, len(S)):
+        out[i] = alpha * S[i] + (1 - alpha) * out[i - 1]
+    return out
+
+
+def ref_EMA(S, N):
+    return ref_EWM(S, 2 / (N + 1))
+
+
+def ref_SMA(S, N, M=1):
+    return ref_EWM(S, M / N)
+
+
+def ref_STD(S, N):
+    return _pad(_windows(S, N).std(axis=1), N, len(S))
+
+
+def ref_SUM(S, N):
+    return _pad(_windows(S, N).sum(axis=1), N, len(S))
+
+
+def ref_HHV(S, N):
+    return _pad(_windows(S, N).max(axis=1), N, len(S))
+
+
+def ref_LLV(S, N):
+    return _pad(_windows(S, N).min(axis=1), N, len(S))
+
+
+def ref_HHVBARS(S, N):
+    return _pad(_windows(S, N)[:, ::-1].argmax(axis=1).astype(float), N, len(S))
+
+
+def ref_LLVBARS(S, N):
+    return _pad(_windows(S, N)[:, ::-1].argmin(axis=1).astype(float), N, len(S))
+
+
+def ref_REF(S, N=1):
+    S = np.asarray(S, dtype=np.float64)
+    out = np.full(len(S), np.nan)
+    out[N:] = S[:-N]
+    return out
+
+
+def ref_WMA(S, N):
+    weights = np.arange(1, N + 1, dtype=np.float64)
+    return _pad(_windows(S, N) @ weights / weights.sum(), N, len(S))
+
+
+def ref_AVEDEV(S, N):
+    w = _windows(S, N)
+    return _pad(np.abs(w - w.mean(axis=1, keepdims=True)).mean(axis=1), N, len(S))
+
+
+def ref_SLOPE(S, N):
+    x = np.arange(N, dtype=np.float64)
+    xc = x - x.mean()
+    return _pad(_windows(S, N) @ xc / (xc @ xc), N, len(S))
+
+
+def ref_CROSS(S1, S2):
+    above = np.asarray(S1) > np.asarray(S2)
+    return np.concatenate(([False], ~above[:-1] & above[1:]))
+
+
+def ref_BARSLAST(S):
+    out = np.zeros(len(S), dtype=int)
+    last = 0
+    for i, flag in enumerate(S):
+        last = 0 if flag else last + 1
+        out[i] = last
+    return out
+
+
+def ref_BARSLASTCOUNT(S):
+    out = np.zeros(len(S))
+    run = 0
+    for i, flag in enumerate(S):
+        run = run + 1 if flag else 0
+        out[i] = run
+    return out
+
+
+def ref_VALUEWHEN(S, X):
+    out = np.full(len(S), np.nan)
+    value = np.nan
+    for i in range(len(S)):
+        if S[i]:
+            value = X[i]
+        out[i] = value
+    return out
+
+
+def ref_MACD(CLOSE, SHORT=12, LONG=26, M=9):
+    dif = ref_EMA(CLOSE, SHORT) - ref_EMA(CLOSE, LONG)
+    dea = ref_EMA(dif, M)
+    return np.round(dif, 3), np.round(dea, 3), np.round((dif - dea) * 2, 3)
+
+
+def ref_KDJ(CLOSE, HIGH, LOW, N=9, M1=3, M2=3):
+    llv, hhv = ref_LLV(LOW, N), ref_HHV(HIGH, N)
+    rsv = (np.asarray(CLOSE) - llv) / (hhv - llv) * 100
+    # pandas ewm 遇到前导 NaN 时从第一个有效值开始递推
+    k = np.full(len(rsv), np.nan)
+    d = np.full(len(rsv), np.nan)
+    start = N - 1
+    k[start:] = ref_EMA(rsv[start:], M1 * 2 - 1)
+    d[start:] = ref_EMA(k[start:], M2 * 2 - 1)
+    return k, d, k * 3 - d * 2
+
+
+def ref_RSI(CLOSE, N=24):
+    dif = np.asarray(CLOSE, dtype=np.float64) - ref_REF(CLOSE, 1)
+    up = np.full(len(dif), np.nan)
+    down = np.full(len(dif), np.nan)
+    up[1:] = ref_SMA(np.maximum(dif[1:], 0), N)
+    down[1:] = ref_SMA(np.abs(dif[1:]), N)
+    return np.round(up / down * 100, 3)
+
+
+def ref_BOLL(CLOSE, N=20, P=2):
+    mid = ref_MA(CLOSE, N)
+    std = ref_STD(CLOSE, N)
+    return np.round(mid + std * P, 3), np.round(mid, 3), np.round(mid - std * P, 3)
+
+
+def ref_ATR(CLOSE, HIGH, LOW, N=20):
+    lc = ref_REF(CLOSE, 1)
+    tr = np.maximum(np.maximum(HIGH - LOW, np.abs(lc - HIGH)), np.abs(lc - LOW))
+    return ref_MA(tr, N)
+
+
+# 与 FUNCTION_CASES 对应的参考实现调用
+REFERENCE_CASES: Dict[str, Callable] = {
+    'REF': lambda d: ref_REF(d.CLOSE, 1),
+    'STD': lambda d: ref_STD(d.CLOSE, 20),
+    'SUM': lambda d: ref_SUM(d.VOL, 20),
+    'HHV': lambda d: ref_HHV(d.HIGH, 20),
+    'LLV': lambda d: ref_LLV(d.LOW, 20),
+    'HHVBARS': lambda d: ref_HHVBARS(d.HIGH, 20),
+    'LLVBARS': lambda d: ref_LLVBARS(d.LOW, 20),
+    'MA': lambda d: ref_MA(d.CLOSE, 20),
+    'EMA': lambda d: ref_EMA(d.CLOSE, 12),
+    'SMA': lambda d: ref_SMA(d.CLOSE, 9, 1),
+    'WMA': lambda d: ref_WMA(d.CLOSE, 10),
+    'DMA': lambda d: ref_EWM(d.CLOSE, 0.2),
+    'AVEDEV': lambda d: ref_AVEDEV(d.CLOSE, 14),
+    'SLOPE': lambda d: ref_SLOPE(d.CLOSE, 10),
+    # 均线取 MyTT 结果，只比对交叉判断本身（两条均线恰好相等时浮点误差会改变交叉位置）
+    'CROSS': lambda d: ref_CROSS(MyTT.MA(d.CLOSE, 5), MyTT.MA(d.CLOSE, 10)),
+    'BARSLAST': lambda d: ref_BARSLAST(d.CLOSE > d.OPEN),
+    'BARSLASTCOUNT': lambda d: ref_BARSLASTCOUNT(d.CLOSE > d.OPEN),
+    'VALUEWHEN': lambda d: ref_VALUEWHEN(d.CLOSE > d.OPEN, d.CLOSE),
+    'MACD': lambda d: ref_MACD(d.CLOSE),
+    'KDJ': lambda d: ref_KDJ(d.CLOSE, d.HIGH, d.LOW),
+    'RSI': lambda d: ref_RSI(d.CLOSE, 14),
+    'BOLL': lambda d: ref_BOLL(d.CLOSE),
+    'ATR': lambda d: ref_ATR(d.CLOSE, d.HIGH, d.LOW),
+}
+
+# 带 RD() 三位小数舍入的函数，舍入边界处允许 1e-3 的差异
+ROUNDED_OUTPUTS = {'MACD', 'RSI', 'BOLL'}
+
+# float32 紧凑精度模式（data.precision = "float32"）的容差约定：
+#   连续型输出：|f32 - f64| <= atol + rtol * |f64|，atol 取 RD() 的舍入粒度 1e-3
+#   含大小比较/取整的输出（交叉、条件分支、累计周期数）：比较的两个数值非常接近时 float32 舍入
+#   可能改变比较结果，因此只要求超出容差的点占比不超过 max_bad_fraction
+FLOAT32_TOLERANCE = {'rtol': 1e-3, 'atol': 1e-3, 'max_bad_fraction': 0.0}
+#   其余函数直接以 float32 输入计算，按上述容差检查；对价差做大小比较并累计的指标（DMI 的 HD>LD、
+#   MFI 的 TYP>REF(TYP)、ASI 的 AA/BB/CC 比较）以及在个别点放大输入误差的 TAN 由 MyTT 先把 float32 价格
+#   还原为三位小数的 float64 值再计算，与 float64 结果一致，同样按 max_bad_fraction = 0 检查
+#   CROSS/LONGCROSS 比较的是 float32 存储的均线、SUMBARSFAST 累计的是成交量，这些不是价格，无法还原，
+#   仍按 FLOAT32_DISCRETE_MAX_BAD_FRACTION 检查
+#   计数类函数（COUNT、BARSLASTCOUNT）输入为布尔序列，输出保持 float64，不检查类型
+FLOAT32_DISCRETE = {'CROSS', 'LONGCROSS', 'SUMBARSFAST'}
+FLOAT32_DISCRETE_MAX_BAD_FRACTION = 0.01
+FLOAT32_COUNT_OUTPUTS = {'COUNT', 'BARSLASTCOUNT'}
+
+
+class _Fields:
+    """把行情字典包装为 CLOSE/HIGH/... 属性访问"""
+
+    def __init__(self, CLOSE, HIGH, LOW, OPEN, VOL):
+        self.CLOSE = CLOSE
+        self.HIGH = HIGH
+        self.LOW = LOW
+        self.OPEN = OPEN
+        self.VOL = VOL
+
+
+def _series_fields(stock: Dict[str, np.ndarray]) -> _Fields:
+    """与策略中常见用法一致：字段为 pandas Series"""
+    return _Fields(pd.Series(stock['close']), pd.Series(stock['high']), pd.Series(stock['low']),
+                   pd.Series(stock['open']), pd.Series(stock['volume']))
+
+
+def _array_fields(stock: Dict[str, np.ndarray]) -> _Fields:
+    return _Fields(stock['close'], stock['high'], stock['low'], stock['open'], stock['volume'])
+
+
+def _as_tuple(result):
+    return result if isinstance(result, tuple) else (result,)
+
+
+def max_abs_diff(a, b) -> float:
+    """两组结果的最大绝对误差；NaN 位置不一致时返回 inf"""
+    a, b = _as_tuple(a), _as_tuple(b)
+    if len(a) != len(b):
+        return float('inf')
+    worst = 0.0
+    for x, y in zip(a, b):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.shape != y.shape:
+            return float('inf')
+        nx, ny = np.isnan(x), np.isnan(y)
+        if np.any(nx != ny):
+            return float('inf')
+        if np.all(nx):
+            continue
+        diff = np.abs(x[~nx] - y[~nx])
+        inf_mask = np.isinf(x[~nx]) | np.isinf(y[~nx])
+        if np.any(inf_mask):
+            if np.any(x[~nx][inf_mask] != y[~nx][inf_mask]):
+                return float('inf')
+            diff = diff[~inf_mask]
+        if diff.size:
+            worst = max(worst, float(diff.max()))
+    return worst
+
+
+def _time_call(fn: Callable, repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {'median_s': samples[len(samples) // 2], 'min_s': samples[0], 'max_s': samples[-1]}
+
+
+def find_duplicate_definitions(path: Optional[str] = None) -> List[Dict]:
+    """扫描模块源码，找出被重复定义的顶层函数（后定义会覆盖前定义）"""
+    path = path or inspect.getsourcefile(MyTT)
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    seen: Dict[str, List[int]] = {}
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            seen.setdefault(node.name, []).append(node.lineno)
+    return [{'name': name, 'lines': lines} for name, lines in seen.items() if len(lines) > 1]
+
+
+def load_shadowed_definition(name: str, path: Optional[str] = None) -> Optional[Callable]:
+    """编译并返回被覆盖的第一版函数定义，用于与生效版本比对"""
+    path = path or inspect.getsourcefile(MyTT)
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef) and node.name == name:
+            module = ast.Module(body=[node], type_ignores=[])
+            namespace = dict(vars(MyTT))
+            exec(compile(module, path, 'exec'), namespace)
+            return namespace[name]
+    return None
+
+
+def check_duplicates(panel: List[Dict[str, np.ndarray]]) -> List[Dict]:
+    """报告重复定义，并验证固定周期下两版实现结果一致"""
+    report = []
+    for item in find_duplicate_definitions():
+        entry = dict(item)
+        first = load_shadowed_definition(item['name'])
+        active = getattr(MyTT, item['name'])
+        field = 'high' if item['name'] == 'HHV' else 'low'
+        try:
+            worst = 0.0
+            for stock in panel:
+                worst = max(worst, max_abs_diff(first(stock[field], 20), active(stock[field], 20)))
+            entry['max_abs_diff'] = worst
+            entry['equivalent'] = worst == 0.0
+        except Exception as e:
+            entry['error'] = f"{type(e).__name__}: {e}"
+            entry['equivalent'] = False
+        report.append(entry)
+    return report
+
+
+def bench_function(name: str, panel: List[Dict[str, np.ndarray]], repeat: int) -> Dict:
+    """对单个函数计时并做数值比对"""
+    case = FUNCTION_CASES[name]
+    entry: Dict = {'status': 'ok'}
+    series_inputs = [_series_fields(stock) for stock in panel]
+    array_inputs = [_array_fields(stock) for stock in panel]
+
+    try:
+        results = [case(MyTT, d) for d in series_inputs]
+        entry['pandas'] = _time_call(lambda: [case(MyTT, d) for d in series_inputs], repeat)
+    except Exception as e:
+        entry['status'] = 'error'
+        entry['error'] = f"{type(e).__name__}: {e}"
+        entry['traceback'] = traceback.format_exc(limit=3)
+        return entry
+
+    if name in REFERENCE_CASES:
+        reference = REFERENCE_CASES[name]
+        worst = max(max_abs_diff(r, reference(d)) for r, d in zip(results, array_inputs))
+        tolerance = 1.001e-3 if name in ROUNDED_OUTPUTS else 1e-8
+        entry['reference'] = {'max_abs_diff': worst, 'tolerance': tolerance, 'ok': worst <= tolerance}
+        if worst > tolerance:
+            entry['status'] = 'mismatch'
+
+    if khExpr is not None and name not in EXPR_UNSUPPORTED:
+        symbols = _Fields(khExpr.CLOSE, khExpr.HIGH, khExpr.LOW, khExpr.OPEN, khExpr.VOL)
+
+        def run_expr():
+            graph = case(khExpr, symbols)
+            return [khExpr.evaluate(graph, stock) for stock in panel]
+
+        try:
+            expr_results = run_expr()
+            worst = max(max_abs_diff(r, e) for r, e in zip(results, expr_results))
+            entry['expr'] = _time_call(run_expr, repeat)
+            entry['expr']['max_abs_diff'] = worst
+            entry['expr']['ok'] = worst <= 1e-12
+            if worst > 1e-12:
+                entry['status'] = 'mismatch'
+        except Exception as e:
+            entry['expr'] = {'error': f"{type(e).__name__}: {e}"}
+    return entry
+
+
+def _float32_fields(stock: Dict[str, np.ndarray]) -> _Fields:
+    return _Fields(*(np.asarray(stock[k], dtype=np.float32) for k in ('close', 'high', 'low', 'open', 'volume')))
+
+
+def check_float32(panel: List[Dict[str, np.ndarray]]) -> Dict:
+    """float32 精度模式的容差检查：比较 float32 与 float64 输入的结果，并检查浮点输出保持 float32"""
+    report = {}
+    rtol, atol = FLOAT32_TOLERANCE['rtol'], FLOAT32_TOLERANCE['atol']
+    for name, case in FUNCTION_CASES.items():
+        entry = {'max_rel_err': 0.0, 'bad_fraction': 0.0, 'float32_preserved': True}
+        try:
+            for stock in panel:
+                full = _as_tuple(case(MyTT, _array_fields(stock)))
+                compact = _as_tuple(case(MyTT, _float32_fields(stock)))
+                for x, y in zip(full, compact):
+                    y = np.atleast_1d(np.asarray(y))
+                    if y.dtype == np.float64 and name not in FLOAT32_COUNT_OUTPUTS:
+                        entry['float32_preserved'] = False
+                    x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+                    y = y.astype(np.float64)
+                    both = np.isfinite(x) & np.isfinite(y)
+                    bad = np.isnan(x) != np.isnan(y)
+                    if both.any():
+                        err = np.abs(x[both] - y[both])
+                        entry['max_rel_err'] = max(entry['max_rel_err'],
+                                                   float(np.max(err / (np.abs(x[both]) + 1))))
+                        bad[both] |= err > atol + rtol * np.abs(x[both])
+                    if x.size:
+                        entry['bad_fraction'] = max(entry['bad_fraction'], float(bad.mean()))
+        except Exception as e:
+            entry = {'error': f"{type(e).__name__}: {e}", 'ok': False}
+            report[name] = entry
+            continue
+        allowed = FLOAT32_DISCRETE_MAX_BAD_FRACTION if name in FLOAT32_DISCRETE \
+            else FLOAT32_TOLERANCE['max_bad_fraction']
+        entry['ok'] = entry['float32_preserved'] and entry['bad_fraction'] <= allowed
+        report[name] = entry
+    return report
+
+
+def bench_combined(panel: List[Dict[str, np.ndarray]], repeat: int) -> Dict:
+    """模拟一个同时使用全部组合指标的策略：逐个调用 MyTT 与通过 khExpr 共享子表达式求值的总耗时"""
+    names = [n for n in FUNCTION_CASES if n not in EXPR_UNSUPPORTED and n != 'DSMA']
+    series_inputs = [_series_fields(stock) for stock in panel]
+    result = {'functions': len(names)}
+    result['pandas'] = _time_call(
+        lambda: [[FUNCTION_CASES[n](MyTT, d) for n in names] for d in series_inputs], repeat)
+    if khExpr is not None:
+        symbols = _Fields(khExpr.CLOSE, khExpr.HIGH, khExpr.LOW, khExpr.OPEN, khExpr.VOL)
+
+        def run_expr():
+            graph = {n: FUNCTION_CASES[n](khExpr, symbols) for n in names}
+            return [khExpr.evaluate(graph, stock) for stock in panel]
+
+        result['expr'] = _time_call(run_expr, repeat)
+        result['speedup'] = result['pandas']['median_s'] / max(result['expr']['median_s'], 1e-12)
+    return result
+
+
+def run(length: int = 2000, width: int = 5, repeat: int = 3, seed: int = 0,
+        functions: Optional[List[str]] = None, check_precision: bool = True) -> Dict:
+    """执行基准测试并返回报告字典"""
+    panel = make_panel(length, width, seed)
+    names = functions or list(FUNCTION_CASES)
+    report = {
+        'meta': {
+            'length': length, 'width': width, 'repeat': repeat, 'seed': seed,
+            'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+            'expr_available': khExpr is not None,
+        },
+        'duplicates': check_duplicates(panel),
+        'untested': sorted(name for name, obj in vars(MyTT).items()
+                           if name.isupper() and inspect.isfunction(obj) and name not in FUNCTION_CASES),
+        'functions': {},
+    }
+    for name in names:
+        print(f"  {name:<14}", end='', flush=True)
+        entry = bench_function(name, panel, repeat)
+        report['functions'][name] = entry
+        timing = entry.get('pandas', {}).get('median_s')
+        print(f"{entry['status']:<9}" + (f"{timing * 1000:10.2f} ms" if timing is not None else ''))
+    if functions is None:
+        report['combined'] = bench_combined(panel, repeat)
+    if check_precision:
+        report['float32'] = check_float32(panel)
+    return report
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """与基线报告对比，返回回退项描述（耗时超过基线 tolerance 倍，或原本正确的函数出现不一致/报错）"""
+    problems = []
+    for name, entry in report['functions'].items():
+        base = baseline.get('functions', {}).get(name)
+        if not base:
+            continue
+        if base.get('status') == 'ok' and entry.get('status') != 'ok':
+            problems.append(f"{name}: 状态由 ok 变为 {entry.get('status')}")
+        for path in ('pandas', 'expr'):
+            now = entry.get(path, {}).get('median_s')
+            before = base.get(path, {}).get('median_s')
+            if now is not None and before and now > before * tolerance:
+                problems.append(f"{name}[{path}]: {before * 1000:.2f} ms -> {now * 1000:.2f} ms")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='MyTT 指标正确性与吞吐量基准测试')
+    parser.add_argument('--length', type=int, default=2000, help='每只股票的K线数量')
+    parser.add_argument('--width', type=int, default=5, help='股票数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每个函数的重复计时次数（取中位数）')
+    parser.add_argument('--seed', type=int, default=0, help='合成数据随机种子')
+    parser.add_argument('--functions', nargs='*', help='只测试指定函数')
+    parser.add_argument('--output', default='mytt_bench_report.json', help='JSON 报告输出路径')
+    parser.add_argument('--baseline', help='用于对比的历史 JSON 报告')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='允许的耗时增长倍数')
+    args = parser.parse_args(argv)
+
+    print(f"MyTT 基准测试: {args.width} 只股票 × {args.length} 根K线, 重复 {args.repeat} 次")
+    report = run(args.length, args.width, args.repeat, args.seed, args.functions)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"报告已保存: {args.output}")
+
+    for item in report['duplicates']:
+        print(f"重复定义: {item['name']} 行 {item['lines']}，固定周期结果一致: {item.get('equivalent')}")
+    failed = [name for name, entry in report['functions'].items() if entry['status'] != 'ok']
+    if failed:
+        print(f"异常或不一致的函数: {', '.join(failed)}")
+    float32_failed = [name for name, entry in report.get('float32', {}).items() if not entry['ok']]
+    if float32_failed:
+        print(f"超出 float32 容差的函数: {', '.join(float32_failed)}")
+    if 'combined' in report and 'speedup' in report['combined']:
+        print(f"组合指标 khExpr 加速比: {report['combined']['speedup']:.2f}x")
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        problems = compare_with_baseline(report, baseline, args.tolerance)
+        for problem in problems:
+            print(f"回退: {problem}")
+        if problems:
+            exit_code = 1
+    if float32_failed:
+        exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+# coding: utf-8
+"""
+确定性合成行情数据生成器
+
+相同的种子与参数总是生成相同的数据，保证基准测试结果可复现、可对比。
+"""
+from typing import Dict, List
+
+import numpy as np
+
+
+def make_ohlcv(length: int = 2000, seed: int = 0, start_price: float = 10.0) -> Dict[str, np.ndarray]:
+    """生成单只股票的日线级 OHLCV 序列
+
+    价格为对数正态随机游走，high/low 包络 open/close，成交量为正整数（单位：手）。
+
+    Args:
+        length: K线数量
+        seed: 随机种子
+        start_price: 初始价格
+
+    Returns:
+        dict: {'open','high','low','close','volume','amount','preClose': ndarray}
+    """
+    rng = np.random.default_rng(seed)
+    log_ret = rng.normal(0.0002, 0.02, length)
+    close = start_price * np.exp(np.cumsum(log_ret))
+    pre_close = np.concatenate(([start_price], close[:-1]))
+    open_ = pre_close * (1 + rng.normal(0, 0.005, length))
+    spread = np.abs(rng.normal(0, 0.01, length)) * close
+    high = np.maximum(open_, close) + spread * rng.random(length)
+    low = np.minimum(open_, close) - spread * rng.random(length)
+    volume = rng.integers(1_000, 100_000, length).astype(np.float64)
+    amount = volume * 100 * (high + low + close) / 3
+    return {
+        'open': np.round(open_, 2),
+        'high': np.round(high, 2),
+        'low': np.round(low, 2),
+        'close': np.round(close, 2),
+        'volume': volume,
+        'amount': amount,
+        'preClose': np.round(pre_close, 2),
+    }
+
+
+def make_panel(length: int = 2000, width: int = 10, seed: int = 0) -> List[Dict[str, np.ndarray]]:
+    """生成 width 只股票、每只 length 根K线的合成行情
+
+    Returns:
+        list: 每只股票一个 make_ohlcv 字典
+    """
+    return [make_ohlcv(length, seed=seed + i, start_price=5.0 + (i % 50)) for i in range(width)]
+
+
+def make_intraday_path(daily: Dict[str, np.ndarray], bars_per_day: int, seed: int = 0):
+    """在日线 OHLCV 的基础上生成日内价格路径与成交量分布
+
+    每个交易日的路径为从开盘价到收盘价的布朗桥，并截断在当日最高/最低价之间，
+    因此日内最后一个价格等于日线收盘价，不同周期的数据相互一致。
+
+    Returns:
+        tuple: (prices, volumes)，均为 [交易日数, bars_per_day] 的二维数组
+    """
+    days = len(daily['close'])
+    rng = np.random.default_rng(seed)
+    walk = np.cumsum(rng.normal(0.0, 1.0, (days, bars_per_day)), axis=1)
+    frac = np.arange(1, bars_per_day + 1) / bars_per_day
+    bridge = walk - frac[None, :] * walk[:, -1:]
+    scale = (daily['high'] - daily['low'])[:, None] / (2 * np.sqrt(bars_per_day))
+    path = daily['open'][:, None] + (daily['close'] - daily['open'])[:, None] * frac[None, :] + bridge * scale
+    path = np.clip(path, daily['low'][:, None], daily['high'][:, None])
+    weights = rng.random((days, bars_per_day)) + 0.2
+    weights /= weights.sum(axis=1, keepdims=True)
+    volumes = np.floor(daily['volume'][:, None] * weights)
+    return np.round(path, 2), volumes
+
+
+def make_minute_bars(daily: Dict[str, np.ndarray], bars_per_day: int, seed: int = 0) -> Dict[str, np.ndarray]:
+    """生成分钟级 K 线（每个交易日 bars_per_day 根）
+
+    Returns:
+        dict: {'open','high','low','close','volume','amount','preClose': 二维数组 [交易日数, bars_per_day]}
+    """
+    close, volume = make_intraday_path(daily, bars_per_day, seed)
+    open_ = np.concatenate((daily['open'][:, None], close[:, :-1]), axis=1)
+    rng = np.random.default_rng(seed + 1)
+    wick = np.abs(rng.normal(0, 0.002, close.shape)) * close
+    high = np.minimum(np.maximum(open_, close) + wick, daily['high'][:, None])
+    low = np.maximum(np.minimum(open_, close) - wick, daily['low'][:, None])
+    pre_close = np.repeat(daily['preClose'][:, None], bars_per_day, axis=1)
+    return {
+        'open': np.round(open_, 2),
+        'high': np.round(high, 2),
+        'low': np.round(low, 2),
+        'close': close,
+        'volume': volume,
+        'amount': volume * 100 * close,
+        'preClose': pre_close,
+    }
+
+
+def make_ticks(daily: Dict[str, np.ndarray], ticks_per_day: int, seed: int = 0, depth: int = 5) -> Dict[str, np.ndarray]:
+    """生成 tick 快照（字段与 xtdata tick 数据一致，成交量/成交额为当日累计值）
+
+    Args:
+        depth: 盘口档数，为 0 时不生成 askPrice/bidPrice/askVol/bidVol
+
+    Returns:
+        dict: 二维数组 [交易日数, ticks_per_day]，盘口字段为三维数组 [交易日数, ticks_per_day, depth]
+    """
+    last, volume = make_intraday_path(daily, ticks_per_day, seed)
+    cum_volume = np.cumsum(volume, axis=1)
+    ticks = {
+        'lastPrice': last,
+        'open': np.repeat(daily['open'][:, None], ticks_per_day, axis=1),
+        'high': np.maximum.accumulate(last, axis=1),
+        'low': np.minimum.accumulate(last, axis=1),
+        'lastClose': np.repeat(daily['preClose'][:, None], ticks_per_day, axis=1),
+        'volume': cum_volume,
+        'amount': np.cumsum(volume * 100 * last, axis=1),
+    }
+    if depth > 0:
+        rng = np.random.default_rng(seed + 2)
+        levels = np.arange(1, depth + 1) * 0.01
+        ticks['askPrice'] = np.round(last[:, :, None] + levels, 2)
+        ticks['bidPrice'] = np.round(last[:, :, None] - levels, 2)
+        ticks['askVol'] = rng.integers(1, 500, last.shape + (depth,)).astype(np.float64)
+        ticks['bidVol'] = rng.integers(1, 500, last.shape + (depth,)).astype(np.float64)
+    return ticks
@@ -0,0 +1,78 @@
+# coding: utf-8
+"""
+回测断点续跑
+
+tick/1m 回测往往要运行数小时，中途停止、异常退出或关闭界面后，内存中的账户、持仓与回测记录全部丢失。
+启用断点后，回测在交易日切换时把全部可变状态写入一个压缩的二进制快照文件（只保留最新一份）：
+    - 各策略的资产、持仓簿、委托/成交账本、风控状态与已累计的回测记录
+    - 触发器状态，以及当前在时间轴 all_times 中的位置
+    - 策略可选实现 khSaveState()/khLoadState(state) 保存自身的全局状态
+再次运行同一回测时从最新快照恢复，直接从快照所在的时间点继续，不再重放之前的交易日。
+快照带有回测指纹（区间、股票池、数据周期、时间轴长度等），与当前回测不一致时忽略快照重新开始。
+"""
+import logging
+import os
+import pickle
+import zlib
+from typing import Any, Dict, Optional
+
+MAGIC = b"KHCK"
+FORMAT_VERSION = 1
+
+
+class KhCheckpointStore:
+    """断点快照的读写
+
+    配置（backtest.checkpoint）：
+        enabled: 是否启用，默认 False
+        interval_days: 每隔多少个交易日保存一次，默认 1
+        resume: 存在匹配的快照时是否续跑，默认 True
+        dir: 快照目录，默认 backtest_results/.checkpoints
+    """
+
+    def __init__(self, config):
+        settings = config.config_dict.get("backtest", {}).get("checkpoint", {}) or {}
+        self.enabled = bool(settings.get("enabled", False))
+        self.interval_days = max(int(settings.get("interval_days", 1) or 1), 1)
+        self.resume = bool(settings.get("resume", True))
+        self.directory = settings.get("dir") or os.path.join("backtest_results", ".checkpoints")
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.ckpt")
+
+    def save(self, name: str, fingerprint: Dict, state: Dict[str, Any]) -> int:
+        """写入快照（先写临时文件再替换，中途退出不会留下损坏的快照），返回文件字节数"""
+        os.makedirs(self.directory, exist_ok=True)
+        payload = pickle.dumps({"fingerprint": fingerprint, "state": state}, protocol=pickle.HIGHEST_PROTOCOL)
+        blob = MAGIC + bytes([FORMAT_VERSION]) + zlib.compress(payload, 1)
+        path = self.path(name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(blob)
+        os.replace(tmp_path, path)
+        return len(blob)
+
+    def load(self, name: str, fingerprint: Dict) -> Optional[Dict[str, Any]]:
+        """读取与当前回测指纹一致的快照，没有或不匹配时返回 None"""
+        path = self.path(name)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                blob = f.read()
+            if blob[:4] != MAGIC or blob[4] != FORMAT_VERSION:
+                logging.warning(f"断点快照格式不兼容，已忽略: {path}")
+                return None
+            content = pickle.loads(zlib.decompress(blob[5:]))
+        except Exception as e:
+            logging.warning(f"读取断点快照失败，已忽略: {path}: {e}")
+            return None
+        if content.get("fingerprint") != fingerprint:
+            logging.warning(f"断点快照与当前回测的配置或数据不一致，已忽略: {path}")
+            return None
+        return content["state"]
+
+    def remove(self, name: str):
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(path)
@@ -42,12 +42,16 @@ class KhConfig:
         self.kline_period = data_config.get("kline_period", "1d")
         # 优先从stock_list读取，如果没有则使用stock_pool（兼容性）
         self.stock_pool = data_config.get("stock_list", data_config.get("stock_pool", []))
+        # 数据精度："float64"（默认）或 "float32"（紧凑模式，价格字段转为float32以减少内存占用）
+        self.precision = data_config.get("precision", "float64")
         
         # 风控配置，设置默认值
         risk_config = self.config_dict.get("risk", {})
         self.position_limit = risk_config.get("position_limit", 0.95)
         self.order_limit = risk_config.get("order_limit", 100)
         self.loss_limit = risk_config.get("loss_limit", 0.1)
+        self.risk_enabled = risk_config.get("enabled", False)  # 是否启用交易前风控
+        self.single_limit = risk_config.get("single_limit", 1.0)  # 单票持仓占总资产比例上限
         
     @property
     def initial_cash(self):
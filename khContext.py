@@ -0,0 +1,100 @@
+# coding: utf-8
+"""
+紧凑的逐 bar 上下文
+
+回测主循环每个时间点都会把 data["__bar__"] 设为 KhBarContext。khQuantImport 中的
+khPrice/khGet/khHas 检测到该对象时直接按下标取值，不再为每次调用构造解析器、逐层探测类型：
+    - KhBarSchema: 回测开始时构建一次，保存各股票的数值字段矩阵（float64）与 字段 -> 列号 映射
+    - KhBarContext: 每个 bar 一个，只保存各股票当前所在行号与按键缓存的时间/股票池信息
+"""
+import math
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+_MISSING = object()
+
+
+class KhBarSchema:
+    """回测期间不变的行情数组与下标映射"""
+
+    __slots__ = ("codes", "code_index", "matrices", "field_index")
+
+    def __init__(self, historical_data: Dict[str, pd.DataFrame]):
+        self.codes: List[str] = list(historical_data.keys())
+        self.code_index: Dict[str, int] = {code: i for i, code in enumerate(self.codes)}
+        self.matrices: List[np.ndarray] = []
+        self.field_index: List[Dict[str, int]] = []
+        for code in self.codes:
+            df = historical_data[code]
+            numeric = [name for name in df.columns if pd.api.types.is_numeric_dtype(df[name].dtype)
+                       and not pd.api.types.is_bool_dtype(df[name].dtype)]
+            self.matrices.append(df[numeric].to_numpy(dtype=np.float64) if numeric else np.empty((len(df), 0)))
+            self.field_index.append({name: i for i, name in enumerate(numeric)})
+
+    def new_bar(self, positions=None, account: Optional[Dict] = None) -> "KhBarContext":
+        """为一个新的时间点创建上下文（各股票行号初始为 -1，即无数据）"""
+        return KhBarContext(self, np.full(len(self.codes), -1, dtype=np.int64), positions, account)
+
+
+class KhBarContext:
+    """单个时间点的紧凑上下文
+
+    Args:
+        schema: KhBarSchema
+        rows: 各股票在其行情矩阵中的当前行号，-1 表示该时间点没有数据
+        positions: 持仓（KhPositionBook 或持仓字典）
+        account: 资产字典
+    """
+
+    __slots__ = ("schema", "rows", "positions", "account", "_cache")
+
+    def __init__(self, schema: KhBarSchema, rows: np.ndarray, positions=None, account: Optional[Dict] = None):
+        self.schema = schema
+        self.rows = rows
+        self.positions = positions
+        self.account = account
+        self._cache: Dict[str, Any] = {}
+
+    def set_row(self, slot: int, row: int):
+        self.rows[slot] = row
+
+    def price(self, stock_code: str, field: str = "close"):
+        """按下标取价格
+
+        Returns:
+            float: 字段值（无数据时为 0.0，值为 NaN/inf 时返回 NaN 交由调用方处理）；
+            None: 股票或字段不在数值矩阵中，调用方应回退到通用解析
+        """
+        schema = self.schema
+        slot = schema.code_index.get(stock_code)
+        if slot is None:
+            return None
+        column = schema.field_index[slot].get(field)
+        if column is None:
+            return None
+        row = self.rows[slot]
+        if row < 0:
+            return 0.0
+        value = float(schema.matrices[slot][row, column])
+        return value if math.isfinite(value) else math.nan
+
+    def has_position(self, stock_code: str) -> bool:
+        """是否持有某股票（持仓数量 > 0）"""
+        positions = self.positions
+        if positions is None:
+            return False
+        volume_of = getattr(positions, "volume_of", None)
+        if volume_of is not None:
+            return volume_of(stock_code) > 0
+        position = positions.get(stock_code)
+        return position is not None and position.get("volume", 0) > 0
+
+    def cached(self, key: str, compute: Callable[[], Any]) -> Any:
+        """同一 bar 内不变的值（时间、股票池等）只计算一次"""
+        value = self._cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self._cache[key] = value
+        return value
@@ -0,0 +1,227 @@
+# coding: utf-8
+"""
+回测事件调度
+
+逐 bar 回测原先遍历时间轴上的每一个时间点：逐个调用触发器判断是否触发、按日期字符串比较检测换日来执行
+盘前/盘后回调，收盘估值则在 record_results 中再扫描时间轴判断当前是否为当天最后一个时间点。
+启用事件调度后（backtest.event_queue.enabled），这些都统一为带类型的事件，放入同一个按时间排序的最小堆：
+    - PRE_MARKET: 盘前回调，位于交易日第一个时间点之前
+    - BAR: 触发策略的时间点（K线/Tick/自定义时间点），由触发器的 trigger_mask 对整条时间轴一次性判定
+    - DAY_CLOSE: 收盘估值，交易日最后一个时间点之后记录每日统计
+    - POST_MARKET: 盘后回调
+没有触发、也没有事件订阅的时间点不产生任何事件，回测循环直接跳过。稀疏触发（如 1 秒数据每天只触发 2 次）时，
+逐 bar 的开销与事件数成正比，而不是与时间点数成正比。
+"""
+import datetime
+import heapq
+import itertools
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+# 事件类型，数值同时是同一交易日内的先后顺序
+PRE_MARKET = 0
+BAR = 1
+DAY_CLOSE = 2
+POST_MARKET = 3
+
+EVENT_NAMES = {
+    PRE_MARKET: "盘前回调",
+    BAR: "时间点",
+    DAY_CLOSE: "收盘估值",
+    POST_MARKET: "盘后回调",
+}
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def _utc_offset(seconds: int) -> int:
+    """本地时区在给定时刻相对 UTC 的偏移秒数（与 datetime.fromtimestamp 使用同一时区规则）"""
+    moment = datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).astimezone()
+    return int(moment.utcoffset().total_seconds())
+
+
+class KhTimeline:
+    """时间轴的向量化视图
+
+    时间戳可以是秒级或毫秒级（大于 1e10 视为毫秒），与回测循环中 datetime.fromtimestamp 的换算一致。
+    本地时区偏移按小时计算一次（夏令时切换都在整点），不需要对每个时间点调用 fromtimestamp。
+
+    Attributes:
+        times: 原始时间轴
+        seconds: 秒级时间戳
+        day: 各时间点所在的本地日期（自 1970-01-01 起的天数）
+        second_of_day: 各时间点的日内秒数
+        day_starts/day_ends: 每个交易日第一个/最后一个时间点的下标
+        dates: 每个交易日的日期字符串（YYYY-MM-DD）
+    """
+
+    def __init__(self, times):
+        self.times = times
+        raw = np.asarray(times, dtype=np.float64)
+        if raw.ndim != 1:
+            raise ValueError("时间轴必须是一维时间戳序列")
+        self.seconds = np.where(raw > 1e10, raw / 1000, raw)
+        whole = np.floor(self.seconds).astype(np.int64)
+        hours, inverse = np.unique(whole // 3600, return_inverse=True)
+        offsets = np.array([_utc_offset(int(hour) * 3600) for hour in hours], dtype=np.int64)
+        local = whole + offsets[inverse]
+        self.day = local // 86400
+        self.second_of_day = local % 86400
+        if len(local) and np.any(np.diff(local) < 0):
+            raise ValueError("时间轴未按时间排序")
+        if len(local):
+            self.day_starts = np.flatnonzero(np.r_[True, self.day[1:] != self.day[:-1]])
+            self.day_ends = np.r_[self.day_starts[1:] - 1, len(local) - 1]
+        else:
+            self.day_starts = np.empty(0, dtype=np.int64)
+            self.day_ends = np.empty(0, dtype=np.int64)
+        self.dates = [datetime.date.fromordinal(EPOCH_ORDINAL + int(day)).strftime("%Y-%m-%d")
+                      for day in self.day[self.day_starts]]
+
+    def __len__(self):
+        return len(self.seconds)
+
+    def first_of_day(self) -> np.ndarray:
+        """每个交易日第一个时间点为 True 的布尔数组"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.day_starts] = True
+        return mask
+
+
+class KhEvent:
+    """一个回测事件
+
+    Args:
+        kind: 事件类型（PRE_MARKET/BAR/DAY_CLOSE/POST_MARKET）
+        index: 事件对应的时间点在时间轴中的下标（盘前为当天第一个时间点，收盘估值与盘后为最后一个）
+        day: 所在交易日在 KhTimeline.dates 中的序号
+    """
+
+    __slots__ = ("kind", "index", "day")
+
+    def __init__(self, kind: int, index: int, day: int):
+        self.kind = kind
+        self.index = index
+        self.day = day
+
+    def __repr__(self):
+        return f"KhEvent({EVENT_NAMES.get(self.kind, self.kind)}, index={self.index}, day={self.day})"
+
+
+class KhEventQueue:
+    """按 (交易日, 事件类型, 时间点) 排序的最小堆
+
+    可以挂入多个已排序的事件源（迭代器），每个事件源在堆中只保留下一个事件，取出后再展开下一个，
+    堆的大小与事件源数量相当；也可以随时用 push 插入单个事件。
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _put(self, event: KhEvent, source: Optional[Iterator[KhEvent]]):
+        heapq.heappush(self._heap, (event.day, event.kind, event.index, next(self._seq), event, source))
+
+    def push(self, event: KhEvent):
+        self._put(event, None)
+
+    def add_source(self, events: Iterable[KhEvent]):
+        """挂入一个按时间排序的事件源"""
+        source = iter(events)
+        event = next(source, None)
+        if event is not None:
+            self._put(event, source)
+
+    def pop(self) -> KhEvent:
+        event, source = heapq.heappop(self._heap)[4:]
+        if source is not None:
+            following = next(source, None)
+            if following is not None:
+                self._put(following, source)
+        return event
+
+    def __iter__(self) -> Iterator[KhEvent]:
+        while self._heap:
+            yield self.pop()
+
+
+class KhEventScheduler:
+    """由时间轴与触发结果生成回测事件
+
+    Args:
+        timeline: KhTimeline
+        trigger_mask: 各时间点是否触发策略的布尔数组；为 None 时每个时间点都生成 BAR 事件
+        pre_market: 是否生成盘前回调事件
+        post_market: 是否生成盘后回调事件
+        day_close: 是否生成收盘估值事件
+        start_index: 从时间轴的该下标开始（断点续跑时为快照所在交易日的第一个时间点）
+    """
+
+    def __init__(self, timeline: KhTimeline, trigger_mask: Optional[np.ndarray] = None,
+                 pre_market: bool = False, post_market: bool = False, day_close: bool = True,
+                 start_index: int = 0):
+        self.timeline = timeline
+        # 触发器无法预先判断时每个时间点都生成 BAR 事件，由回测循环逐个调用 should_trigger
+        self.check_each_bar = trigger_mask is None
+        if trigger_mask is None:
+            bars = np.arange(start_index, len(timeline), dtype=np.int64)
+        else:
+            bars = np.flatnonzero(np.asarray(trigger_mask, dtype=bool)[start_index:]) + start_index
+        self.bar_indexes = bars
+        self.bar_days = np.searchsorted(timeline.day_starts, bars, side="right") - 1
+        first_day = int(np.searchsorted(timeline.day_ends, start_index, side="left"))
+        self.days = range(first_day, len(timeline.dates))
+        self.pre_market = pre_market
+        self.post_market = post_market
+        self.day_close = day_close
+        # 断点快照位于交易日的第一个时间点，续跑时当天盘前回调照常执行；从交易日中途开始时不再执行
+        pre_first = first_day
+        if first_day < len(timeline.dates) and timeline.day_starts[first_day] < start_index:
+            pre_first += 1
+        self.pre_days = range(pre_first, len(timeline.dates))
+
+    def __len__(self):
+        """事件总数"""
+        count = len(self.bar_indexes)
+        if self.pre_market:
+            count += len(self.pre_days)
+        if self.day_close:
+            count += len(self.days)
+        if self.post_market:
+            count += len(self.days)
+        return count
+
+    def _bar_events(self) -> Iterator[KhEvent]:
+        for index, day in zip(self.bar_indexes.tolist(), self.bar_days.tolist()):
+            yield KhEvent(BAR, index, day)
+
+    def _day_events(self, kind: int, days: range, bounds: np.ndarray) -> Iterator[KhEvent]:
+        for day in days:
+            yield KhEvent(kind, int(bounds[day]), day)
+
+    def queue(self) -> KhEventQueue:
+        """生成装好全部事件源的事件队列"""
+        queue = KhEventQueue()
+        queue.add_source(self._bar_events())
+        if self.pre_market:
+            queue.add_source(self._day_events(PRE_MARKET, self.pre_days, self.timeline.day_starts))
+        if self.day_close:
+            queue.add_source(self._day_events(DAY_CLOSE, self.days, self.timeline.day_ends))
+        if self.post_market:
+            queue.add_source(self._day_events(POST_MARKET, self.days, self.timeline.day_ends))
+        return queue
+
+    def summary(self) -> List[str]:
+        """各类事件数量的说明文字"""
+        parts = [f"{EVENT_NAMES[BAR]} {len(self.bar_indexes)}/{len(self.timeline)} 个"]
+        if self.pre_market:
+            parts.append(f"{EVENT_NAMES[PRE_MARKET]} {len(self.pre_days)} 个")
+        if self.day_close:
+            parts.append(f"{EVENT_NAMES[DAY_CLOSE]} {len(self.days)} 个")
+        if self.post_market:
+            parts.append(f"{EVENT_NAMES[POST_MARKET]} {len(self.days)} 个")
+        return parts
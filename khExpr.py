@@ -0,0 +1,346 @@
+# coding: utf-8
+"""
+MyTT 指标惰性表达式层
+
+将 CLOSE/HIGH/LOW 等行情字段变为符号节点，MyTT 函数在符号节点上调用时只构建表达式图（DAG），
+不做任何计算。结构相同的子表达式会被合并为同一个节点（如 KDJ 与 WR 共用的 HHV(HIGH, N)、
+BBI 中的多条 MA、多个指标里重复出现的 MA(CLOSE, 20)），求值时每个节点对同一份数据只计算一次。
+
+使用方式:
+    from khExpr import *
+
+    ma20 = MA(CLOSE, 20)
+    dif, dea, macd = MACD(CLOSE)
+    k, d, j = KDJ(CLOSE, HIGH, LOW)
+    wr, wr1 = WR(CLOSE, HIGH, LOW)
+
+    # df 为 khHistory 返回的单只股票 DataFrame（或 {字段名: 数组} 字典）
+    result = evaluate({'ma20': ma20, 'macd': macd, 'k': k, 'wr': wr}, df)
+
+传入普通数组/Series 时，本模块中的函数直接调用 MyTT 原实现，结果与 MyTT 完全一致，不做缓存。
+khQuantImport 导出的仍是 MyTT 原函数：立即求值的调用每次传入新数组，没有可靠的缓存键（按数组身份缓存在数组
+被修改或内存复用时会得到过期结果，按内容哈希的开销与计算本身相当），共享子表达式只对改写为符号形式、
+集中调用 evaluate 的代码生效。
+"""
+import inspect
+import itertools
+import operator
+import types
+import weakref
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+import MyTT as _mytt
+
+# 符号字段与数据列名的对应关系（与 khHistory / 框架数据列名一致）
+FIELD_COLUMNS = {
+    'OPEN': 'open',
+    'HIGH': 'high',
+    'LOW': 'low',
+    'CLOSE': 'close',
+    'VOL': 'volume',
+    'AMOUNT': 'amount',
+    'REF_CLOSE': 'preClose',
+}
+
+# 由基础算子组合而成的指标：在符号输入下按原函数体展开追踪，使其内部的 MA/EMA/HHV 等可与其他指标共享
+_TRACED_FUNCS = (
+    'COUNT', 'EVERY', 'EXIST', 'BETWEEN',
+    'MACD', 'KDJ', 'RSI', 'WR', 'BIAS', 'BOLL', 'PSY', 'CCI', 'ATR', 'BBI', 'DMI', 'TAQ',
+    'KTN', 'TRIX', 'VR', 'CR', 'EMV', 'DPO', 'BRAR', 'DFMA', 'MTM', 'MASS', 'ROC', 'EXPMA',
+    'OBV', 'MFI', 'ASI', 'XSII',
+)
+
+# 会原地修改输入数组的函数，求值时需传入副本以免污染缓存
+_MUTATING_FUNCS = ('FILTER',)
+
+_node_ids = itertools.count(1)
+_intern_table = weakref.WeakValueDictionary()
+
+
+def _arg_key(value):
+    """生成参数的结构键：节点用节点编号，标量用值，数组等对象按身份区分"""
+    if isinstance(value, Expr):
+        return value.nid
+    if isinstance(value, (bool, int, float, str, type(None), np.number, np.bool_)):
+        return ('c', type(value).__name__, value)
+    if isinstance(value, (tuple, list)):
+        return ('t', tuple(_arg_key(v) for v in value))
+    return ('o', id(value))
+
+
+def _make(op: str, args: tuple, func=None) -> 'Expr':
+    """创建（或复用）表达式节点，结构相同的节点只存在一份"""
+    key = (op, func.__name__ if func is not None else None, tuple(_arg_key(a) for a in args))
+    node = _intern_table.get(key)
+    if node is None:
+        node = Expr(op, args, func, key)
+        _intern_table[key] = node
+    return node
+
+
+class Expr:
+    """表达式图节点
+
+    op 为节点类型：'field' 表示行情字段，'fn' 表示 MyTT 函数调用，其余为运算符名称。
+    """
+
+    __slots__ = ('op', 'args', 'func', 'key', 'nid', '__weakref__')
+    # 让 numpy 数组与节点运算时回退到节点的反射运算符
+    __array_ufunc__ = None
+
+    def __init__(self, op: str, args: tuple, func, key):
+        self.op = op
+        self.args = args
+        self.func = func
+        self.key = key
+        self.nid = next(_node_ids)
+
+    def __repr__(self):
+        if self.op == 'field':
+            return self.args[0]
+        if self.op == 'fn':
+            return f"{self.func.__name__}({', '.join(repr(a) for a in self.args)})"
+        return f"{self.op}({', '.join(repr(a) for a in self.args)})"
+
+    # 节点按身份比较即可（结构相同的节点已合并为同一对象）
+    __hash__ = object.__hash__
+
+    def _binary(self, other, name):
+        return _make(name, (self, other))
+
+    def _rbinary(self, other, name):
+        return _make(name, (other, self))
+
+    def __add__(self, other): return self._binary(other, 'add')
+    def __radd__(self, other): return self._rbinary(other, 'add')
+    def __sub__(self, other): return self._binary(other, 'sub')
+    def __rsub__(self, other): return self._rbinary(other, 'sub')
+    def __mul__(self, other): return self._binary(other, 'mul')
+    def __rmul__(self, other): return self._rbinary(other, 'mul')
+    def __truediv__(self, other): return self._binary(other, 'truediv')
+    def __rtruediv__(self, other): return self._rbinary(other, 'truediv')
+    def __floordiv__(self, other): return self._binary(other, 'floordiv')
+    def __rfloordiv__(self, other): return self._rbinary(other, 'floordiv')
+    def __mod__(self, other): return self._binary(other, 'mod')
+    def __rmod__(self, other): return self._rbinary(other, 'mod')
+    def __pow__(self, other): return self._binary(other, 'pow')
+    def __rpow__(self, other): return self._rbinary(other, 'pow')
+    def __and__(self, other): return self._binary(other, 'and_')
+    def __rand__(self, other): return self._rbinary(other, 'and_')
+    def __or__(self, other): return self._binary(other, 'or_')
+    def __ror__(self, other): return self._rbinary(other, 'or_')
+    def __xor__(self, other): return self._binary(other, 'xor')
+    def __rxor__(self, other): return self._rbinary(other, 'xor')
+    def __lt__(self, other): return self._binary(other, 'lt')
+    def __le__(self, other): return self._binary(other, 'le')
+    def __gt__(self, other): return self._binary(other, 'gt')
+    def __ge__(self, other): return self._binary(other, 'ge')
+    def __eq__(self, other): return self._binary(other, 'eq')
+    def __ne__(self, other): return self._binary(other, 'ne')
+    def __neg__(self): return _make('neg', (self,))
+    def __pos__(self): return self
+    def __abs__(self): return _make('abs', (self,))
+    def __invert__(self): return _make('invert', (self,))
+    def __getitem__(self, item): return _make('getitem', (self, item))
+
+    def __bool__(self):
+        raise TypeError("表达式节点没有确定的真值，请使用 IF/&/| 构造条件，或先调用 evaluate 求值")
+
+
+_OPERATORS = {
+    'add': operator.add, 'sub': operator.sub, 'mul': operator.mul,
+    'truediv': operator.truediv, 'floordiv': operator.floordiv, 'mod': operator.mod,
+    'pow': operator.pow, 'and_': operator.and_, 'or_': operator.or_, 'xor': operator.xor,
+    'lt': operator.lt, 'le': operator.le, 'gt': operator.gt, 'ge': operator.ge,
+    'eq': operator.eq, 'ne': operator.ne, 'neg': operator.neg, 'abs': np.abs,
+    'invert': operator.invert, 'getitem': operator.getitem,
+}
+
+
+def field(name: str) -> Expr:
+    """创建行情字段符号，name 为数据列名（如 'close'、'volume'）"""
+    return _make('field', (name,))
+
+
+def _has_expr(args, kwargs) -> bool:
+    for a in args:
+        if isinstance(a, Expr):
+            return True
+    for a in kwargs.values():
+        if isinstance(a, Expr):
+            return True
+    return False
+
+
+def _bind_args(func, args, kwargs) -> tuple:
+    """把关键字参数按签名展开为位置参数，保证 MA(CLOSE, N=5) 与 MA(CLOSE, 5) 得到同一节点"""
+    if not kwargs:
+        return args
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    return tuple(bound.args)
+
+
+def _lift(func):
+    """把 MyTT 基础函数包装为：符号输入时构建节点，普通输入时直接计算"""
+    def wrapper(*args, **kwargs):
+        if _has_expr(args, kwargs):
+            return _make('fn', _bind_args(func, args, kwargs), func)
+        return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__qualname__ = func.__qualname__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _trace(func, namespace):
+    """复制组合指标函数，使其在惰性命名空间中查找 MA/EMA 等函数，从而展开为共享的子表达式"""
+    func = inspect.unwrap(func)
+    traced = types.FunctionType(func.__code__, namespace, func.__name__,
+                                func.__defaults__, func.__closure__)
+    traced.__kwdefaults__ = func.__kwdefaults__
+
+    def wrapper(*args, **kwargs):
+        if _has_expr(args, kwargs):
+            return traced(*args, **kwargs)
+        return func(*args, **kwargs)
+    wrapper.__name__ = func.__name__
+    wrapper.__qualname__ = func.__qualname__
+    wrapper.__doc__ = func.__doc__
+    wrapper.__wrapped__ = func
+    return wrapper
+
+
+def _build_namespace() -> Dict[str, Any]:
+    """构建惰性版 MyTT 函数命名空间"""
+    namespace = dict(vars(_mytt))
+    names = [name for name, obj in vars(_mytt).items()
+             if name.isupper() and inspect.isfunction(obj)]
+    for name in names:
+        if name not in _TRACED_FUNCS:
+            namespace[name] = _lift(getattr(_mytt, name))
+    for name in names:
+        if name in _TRACED_FUNCS:
+            namespace[name] = _trace(getattr(_mytt, name), namespace)
+    return namespace
+
+
+_LAZY_NAMESPACE = _build_namespace()
+INDICATOR_NAMES = sorted(name for name, obj in _LAZY_NAMESPACE.items()
+                         if name.isupper() and callable(obj))
+globals().update({name: _LAZY_NAMESPACE[name] for name in INDICATOR_NAMES})
+
+for _symbol, _column in FIELD_COLUMNS.items():
+    globals()[_symbol] = field(_column)
+del _symbol, _column
+
+
+class KhExprEvaluator:
+    """表达式求值器
+
+    对同一份数据（panel）的多次求值共享节点缓存：先求 MACD 再求 KDJ 时，已经算过的 EMA/HHV 等
+    不会重复计算。调用 bind() 切换到新数据时缓存自动清空。
+    dtype 为 None 时保持数据列原有类型（float32 数据得到 float32 结果），否则先转换为指定类型。
+    """
+
+    def __init__(self, panel=None, dtype=None):
+        self.dtype = dtype
+        self.panel = None
+        self._cache: Dict[int, Any] = {}
+        self._keepalive: Dict[int, Expr] = {}
+        self.hits = 0
+        self.misses = 0
+        if panel is not None:
+            self.bind(panel)
+
+    def bind(self, panel):
+        """绑定数据（DataFrame 或 {列名: 数组} 字典），数据对象变化时清空缓存"""
+        if panel is not self.panel:
+            self.panel = panel
+            self.clear()
+        return self
+
+    def clear(self):
+        """清空节点缓存"""
+        self._cache.clear()
+        self._keepalive.clear()
+
+    def evaluate(self, exprs):
+        """求值单个节点，或节点组成的 tuple/list/dict（保持原结构返回）"""
+        if self.panel is None:
+            raise ValueError("求值前需先通过 bind() 绑定数据")
+        if isinstance(exprs, dict):
+            return {name: self.evaluate(e) for name, e in exprs.items()}
+        if isinstance(exprs, (tuple, list)):
+            return type(exprs)(self.evaluate(e) for e in exprs)
+        if isinstance(exprs, Expr):
+            return self._eval(exprs)
+        return exprs
+
+    def _eval(self, node: Expr):
+        cached = self._cache.get(node.nid, _MISSING)
+        if cached is not _MISSING:
+            self.hits += 1
+            return cached
+
+        # 用显式栈做后序遍历，避免深层表达式触发递归上限
+        stack = [(node, False)]
+        while stack:
+            current, ready = stack.pop()
+            if current.nid in self._cache:
+                continue
+            if not ready:
+                stack.append((current, True))
+                for arg in current.args:
+                    if isinstance(arg, Expr) and arg.nid not in self._cache:
+                        stack.append((arg, False))
+                continue
+            self._cache[current.nid] = self._compute(current)
+            self._keepalive[current.nid] = current
+            self.misses += 1
+        return self._cache[node.nid]
+
+    def _value(self, arg):
+        if isinstance(arg, Expr):
+            return self._cache[arg.nid]
+        return arg
+
+    def _compute(self, node: Expr):
+        if node.op == 'field':
+            column = node.args[0]
+            try:
+                values = self.panel[column]
+            except KeyError:
+                raise KeyError(f"数据中缺少字段: {column}")
+            return np.asarray(values) if self.dtype is None else np.asarray(values, dtype=self.dtype)
+        args = [self._value(a) for a in node.args]
+        if node.op == 'fn':
+            if node.func.__name__ in _MUTATING_FUNCS:
+                args = [a.copy() if isinstance(a, np.ndarray) else a for a in args]
+            return node.func(*args)
+        return _OPERATORS[node.op](*args)
+
+
+_MISSING = object()
+
+
+def evaluate(exprs, panel, evaluator: Optional[KhExprEvaluator] = None):
+    """对数据求值表达式（单个节点或 tuple/list/dict 结构）
+
+    Args:
+        exprs: 表达式节点或其容器
+        panel: DataFrame 或 {列名: 数组} 字典
+        evaluator: 可选的求值器，传入时可在多次调用间复用同一份数据的缓存
+
+    Returns:
+        与 exprs 结构相同的 numpy 数组结果
+    """
+    if evaluator is None:
+        evaluator = KhExprEvaluator()
+    return evaluator.bind(panel).evaluate(exprs)
+
+
+__all__ = ['Expr', 'KhExprEvaluator', 'evaluate', 'field', 'FIELD_COLUMNS', 'INDICATOR_NAMES'] \
+    + list(FIELD_COLUMNS) + INDICATOR_NAMES
@@ -17,7 +17,17 @@ from xtquant import xtconstant
 
 from khTrade import KhTradeManager
 from khRisk import KhRiskManager
-from khQTTools import KhQuTools
+from khQTTools import KhQuTools, downcast_frame
+from khLedger import create_trade_record_table
+from khPosition import KhDailyPricePanel
+from khMetrics import KhBenchmarkSeries
+from khMatch import KhMatchingSimulator
+from khContext import KhBarSchema, KhBarContext
+from khCheckpoint import KhCheckpointStore
+from khResultCache import KhResultCache, data_fingerprint, file_digest, result_config
+from khProfiler import KhProfiler
+from khEvents import KhTimeline, KhEventScheduler, PRE_MARKET, BAR, DAY_CLOSE, POST_MARKET
+from khVector import KhVectorBacktest, panel_matrix
 from khConfig import KhConfig
 
 import numpy as np
@@ -55,6 +65,17 @@ class TriggerBase:
         """
         return False
         
+    def trigger_mask(self, timeline):
+        """对整条时间轴一次性判断各时间点是否触发（事件调度模式使用）
+        
+        Args:
+            timeline: khEvents.KhTimeline
+            
+        Returns:
+            np.ndarray 或 None: 布尔数组；返回 None 表示无法预先判断，需逐个时间点调用 should_trigger
+        """
+        return None
+        
     def get_data_period(self):
         """获取数据周期，用于数据加载
         
@@ -80,6 +101,9 @@ class TickTrigger(TriggerBase):
         # Tick触发方式下，每个Tick都触发
         return True
         
+    def trigger_mask(self, timeline):
+        return np.ones(len(timeline), dtype=bool)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -148,6 +172,16 @@ class KLineTrigger(TriggerBase):
             
         return False
         
+    def trigger_mask(self, timeline):
+        """与 should_trigger 相同的规则：1m/5m 在整分钟/整5分钟触发，1d 在每个交易日的第一个时间点触发"""
+        if self.period == "1m":
+            return timeline.second_of_day % 60 == 0
+        elif self.period == "5m":
+            return timeline.second_of_day % 300 == 0
+        elif self.period == "1d":
+            return timeline.first_of_day()
+        return np.zeros(len(timeline), dtype=bool)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -212,6 +246,12 @@ class CustomTimeTrigger(TriggerBase):
                 
         return False
         
+    def trigger_mask(self, timeline):
+        if not self.trigger_seconds:
+            return np.zeros(len(timeline), dtype=bool)
+        distance = np.abs(timeline.second_of_day[:, None] - np.asarray(self.trigger_seconds)[None, :])
+        return (distance < 5).any(axis=1)
+        
     def get_data_period(self):
         """获取数据周期
         
@@ -360,6 +400,32 @@ class MyTraderCallback(XtQuantTraderCallback):
         except Exception as e:
             self.gui.log_message(f"处理成交回报时出错: {str(e)}", "ERROR")
     
+    def on_batch_trade(self, batch):
+        """批量成交汇总推送（大规模调仓时每批只推送一次）"""
+        try:
+            buy_count = sum(1 for trade in batch.trades if trade.order_type == xtconstant.STOCK_BUY)
+            sell_count = len(batch.trades) - buy_count
+            batch_msg = (
+                f"批量成交 - "
+                f"成交: {len(batch.trades)}笔 (买入 {buy_count} / 卖出 {sell_count}) | "
+                f"成交金额: {sum(trade.traded_amount for trade in batch.trades):.2f} | "
+                f"交易成本: {batch.total_cost:.2f} | "
+                f"持仓变动: {len(batch.positions)}只 | "
+                f"可用资金: {batch.cash:.2f}"
+            )
+            self.gui.log_message(batch_msg, "TRADE")
+
+            if batch.errors:
+                reasons = {}
+                for error in batch.errors:
+                    reason = "资金不足" if error.error_id == -1 else "持仓不足" if error.error_id == -2 else "其他"
+                    reasons[reason] = reasons.get(reason, 0) + 1
+                detail = ", ".join(f"{reason} {count}笔" for reason, count in reasons.items())
+                self.gui.log_message(f"批量委托拒绝 - 共 {len(batch.errors)}笔 ({detail})", "ERROR")
+
+        except Exception as e:
+            self.gui.log_message(f"处理批量成交回报时出错: {str(e)}", "ERROR")
+
     def on_order_error(self, order_error):
         """委托错误回报推送"""
         try:
@@ -462,16 +528,41 @@ class MyTraderCallback(XtQuantTraderCallback):
             self.gui.log_message(f"处理资金变动时出错: {str(e)}", "ERROR")
             '''
 
+class KhStrategyLane:
+    """多策略回测中的一个策略通道：策略模块及其独立的账户、风控与回测记录
+
+    多个策略共享一次数据加载与同一条时间轴，每个时间点依次分派给各通道，
+    通道之间互不影响资金、持仓与委托。
+    """
+
+    def __init__(self, name: str, strategy_file: str, strategy_module, trade_mgr, risk_mgr):
+        self.name = name  # 策略名（用于回测结果目录名）
+        self.strategy_file = strategy_file
+        self.strategy_module = strategy_module
+        self.trade_mgr = trade_mgr
+        self.risk_mgr = risk_mgr
+        self.backtest_records = {}
+        # 该策略使用的行情 {股票代码: DataFrame}：没有 khPrecompute 指标列时与其它通道共用同一份，
+        # 有指标列时为并入了本策略指标列的副本，各策略互相看不到对方的指标列
+        self.historical_data = {}
+        self.bar_schema = None
+        # 逐 bar 循环中的日期状态（盘前/盘后回调按通道各自触发）
+        self.current_date = None
+        self.day_start_time = None
+        self.day_data = {}
+
+
 class KhQuantFramework:
     """量化交易框架主类"""
     
-    def __init__(self, config_path: str, strategy_file: str, trader_callback=None):
+    def __init__(self, config_path: str, strategy_file: str, trader_callback=None, extra_strategies=None):
         """初始化框架
         
         Args:
             config_path: 配置文件路径
             strategy_file: 策略文件路径
             trader_callback: 交易回调函数
+            extra_strategies: 与主策略同时回测的其它策略文件路径列表（可选，默认读取配置 backtest.extra_strategies）
         """
         self.config_path = config_path
         self.config = KhConfig(config_path)
@@ -485,7 +576,10 @@ class KhQuantFramework:
         self.tools = KhQuTools()  # 工具类
         self.backtest_records = {}  # 回测记录
         self.daily_price_cache = {}  # 日线价格缓存，用于存储所有股票的日线数据
-        self._cached_benchmark_close = {}  # 基准指数收盘价缓存
+        self.daily_price_panel = None  # 回测区间日线收盘价面板（日期 × 股票），回测开始时预加载
+        self.benchmark_series = None  # 基准指数日线收盘价（KhBenchmarkSeries），回测开始时一次加载
+        self.data_store = None  # 本地行情仓库（如滚动窗口回测的内存映射数据），设置后优先从中读取行情
+        self.profiler = KhProfiler(self.config)  # 性能剖析（backtest.profile），每次运行重新创建
         
         # 添加运行时间记录变量
         self.start_time = None  # 策略开始运行时间
@@ -534,6 +628,9 @@ class KhQuantFramework:
         # 初始化风控管理器
         self.risk_mgr = KhRiskManager(self.config)
         
+        # 多策略模式：其它策略与主策略共享数据加载和时间轴，各自使用独立的账户与结果目录
+        self.extra_lanes = self._create_extra_lanes(extra_strategies)
+        
     def load_strategy(self, strategy_file: str):
         """动态加载策略模块
         
@@ -548,6 +645,44 @@ class KhQuantFramework:
         spec.loader.exec_module(strategy_module)
         return strategy_module
         
+    def _create_extra_lanes(self, extra_strategies=None) -> List[KhStrategyLane]:
+        """加载其它策略，为每个策略创建独立的交易管理器与风控管理器"""
+        if extra_strategies is None:
+            extra_strategies = self.config.config_dict.get("backtest", {}).get("extra_strategies", []) or []
+        primary_file = self.config.config_dict.get("strategy_file", "")
+        used_names = {os.path.splitext(os.path.basename(primary_file))[0] if primary_file else "unknown"}
+        lanes = []
+        for strategy_file in extra_strategies:
+            name = os.path.splitext(os.path.basename(strategy_file))[0]
+            # 同名策略（如不同目录下的同名文件）追加序号，避免结果目录互相覆盖
+            base_name, suffix = name, 2
+            while name in used_names:
+                name = f"{base_name}_{suffix}"
+                suffix += 1
+            used_names.add(name)
+            lanes.append(KhStrategyLane(name, strategy_file, self.load_strategy(strategy_file),
+                                        KhTradeManager(self.config), KhRiskManager(self.config)))
+        if lanes:
+            print(f"多策略回测: 主策略之外另有 {len(lanes)} 个策略 {[lane.name for lane in lanes]}")
+        return lanes
+        
+    def _primary_lane(self) -> KhStrategyLane:
+        """把主策略及其账户包装为通道（与框架属性共享同一组对象）"""
+        strategy_file = self.config.config_dict.get("strategy_file", "")
+        lane = KhStrategyLane(
+            os.path.splitext(os.path.basename(strategy_file))[0] if strategy_file else "unknown",
+            strategy_file, self.strategy_module, self.trade_mgr, self.risk_mgr)
+        lane.backtest_records = self.backtest_records
+        return lane
+        
+    def _activate_lane(self, lane: KhStrategyLane):
+        """切换当前策略通道：record_results 等方法通过 self.trade_mgr/self.backtest_records 访问当前通道"""
+        self.strategy_module = lane.strategy_module
+        self.trade_mgr = lane.trade_mgr
+        self.risk_mgr = lane.risk_mgr
+        self.backtest_records = lane.backtest_records
+        self.profiler.lane = lane.name
+        
     def init_trader_and_account(self):
         """初始化交易接口和账户"""
         # 固定为回测模式，只进行虚拟账户初始化
@@ -574,11 +709,21 @@ class KhQuantFramework:
         # 更新配置字典中的基准指数代码
         self.config.config_dict["backtest"]["benchmark"] = self.benchmark
         
+        self._reset_account(self.trade_mgr, self.risk_mgr)
+        for lane in self.extra_lanes:
+            self._reset_account(lane.trade_mgr, lane.risk_mgr)
+        
+        print(f"虚拟账户初始化完成: {self.config.account_id}")
+        print(f"初始资产: {self.trade_mgr.assets}")
+        print(f"基准合约: {self.benchmark}")
+        
+    def _reset_account(self, trade_mgr, risk_mgr):
+        """把交易管理器的资产、持仓、委托与成交恢复为初始状态"""
         # 从回测配置中获取初始资金
         init_capital = self.config.config_dict["backtest"]["init_capital"]
         
         # 初始化资产字典
-        self.trade_mgr.assets = {
+        trade_mgr.assets = {
             "account_type": xtconstant.SECURITY_ACCOUNT,
             "account_id": self.config.account_id,
             "cash": init_capital,
@@ -589,17 +734,18 @@ class KhQuantFramework:
         }
         
         # 初始化持仓字典
-        self.trade_mgr.positions = {}  # 初始持仓为空
+        trade_mgr.positions.clear()  # 初始持仓为空
+        trade_mgr.positions.account_id = self.config.account_id
         
-        # 初始化委托字典
-        self.trade_mgr.orders = {}  # 初始委托为空
+        # 初始化风控状态，启用风控时由交易管理器在下单前逐个检查信号
+        risk_mgr.reset(init_capital)
+        trade_mgr.risk_mgr = risk_mgr if risk_mgr.enabled else None
         
-        # 初始化成交字典
-        self.trade_mgr.trades = {}  # 初始成交为空
+        # 初始化委托账本
+        trade_mgr.orders.clear()  # 初始委托为空
         
-        print(f"虚拟账户初始化完成: {self.config.account_id}")
-        print(f"初始资产: {self.trade_mgr.assets}")
-        print(f"基准合约: {self.benchmark}")
+        # 初始化成交账本
+        trade_mgr.trades.clear()  # 初始成交为空
         
     def create_callback(self) -> XtQuantTraderCallback:
         """创建交易回调对象"""
@@ -627,7 +773,8 @@ class KhQuantFramework:
         if self.trader_callback:
             self.trader_callback.gui.log_message(f"开始下载{len(stock_codes)}只股票的历史数据...", "INFO")
         
-        xtdata.download_history_data2(
+        self.profiler.call(
+            "xtdata.download_history_data2", xtdata.download_history_data2,
             stock_codes,
             period=self.config.kline_period,
             start_time=self.config.backtest_start,
@@ -812,6 +959,7 @@ class KhQuantFramework:
         """启动框架"""
         # 记录策略开始运行时间
         self.start_time = time.time()
+        self.profiler = KhProfiler(self.config)
         start_datetime = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
         if self.trader_callback:
@@ -823,13 +971,14 @@ class KhQuantFramework:
             init_start = time.time()
             self.init_trader_and_account() # 初始化交易接口和账户
             init_time = time.time() - init_start
+            self.profiler.add_stage("初始化账户", init_time)
             
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"交易接口初始化耗时: {init_time:.2f}秒", "INFO")
             
             # 初始化缓存
             self.daily_price_cache = {}
-            self._cached_benchmark_close = {}
+            self.benchmark_series = None
             
             # 直接从设置界面读取是否初始化数据的配置
             from PyQt5.QtCore import QSettings
@@ -845,6 +994,7 @@ class KhQuantFramework:
                     self.trader_callback.gui.log_message("开始初始化行情数据...", "INFO")
                 self.init_data() # 初始化行情数据
                 data_init_time = time.time() - data_init_start
+                self.profiler.add_stage("下载数据", data_init_time)
                 
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"数据初始化耗时: {data_init_time:.2f}秒", "INFO")
@@ -860,24 +1010,11 @@ class KhQuantFramework:
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"股票列表加载耗时: {stock_list_time:.2f}秒", "INFO")
             
-            # 准备初始化数据结构，包含时间、账户、持仓、股票池等信息
-            init_data = {
-                "__current_time__": {
-                    "timestamp": int(time.time()),
-                    "datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "date": datetime.datetime.now().strftime("%Y-%m-%d"),
-                    "time": datetime.datetime.now().strftime("%H:%M:%S")
-                },
-                "__account__": self.trade_mgr.assets,
-                "__positions__": self.trade_mgr.positions,
-                "__stock_list__": stock_codes,
-                "__framework__": self
-            }
-            
             # 调用策略初始化函数，并传递完整数据结构
             strategy_init_start = time.time()
-            self.strategy_module.init(stock_codes, init_data)
+            self._init_strategies(stock_codes)
             strategy_init_time = time.time() - strategy_init_start
+            self.profiler.add_stage("策略初始化", strategy_init_time)
             
             if self.trader_callback:
                 self.trader_callback.gui.log_message(f"策略初始化耗时: {strategy_init_time:.2f}秒", "INFO")
@@ -934,6 +1071,59 @@ class KhQuantFramework:
             
             self.stop()
 
+    def _init_strategies(self, stock_codes: List[str]):
+        """调用各策略的 init，传入时间、账户、持仓、股票池等信息"""
+        # 准备初始化数据结构，包含时间、账户、持仓、股票池等信息
+        init_data = {
+            "__current_time__": {
+                "timestamp": int(time.time()),
+                "datetime": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "date": datetime.datetime.now().strftime("%Y-%m-%d"),
+                "time": datetime.datetime.now().strftime("%H:%M:%S")
+            },
+            "__account__": self.trade_mgr.assets,
+            "__positions__": self.trade_mgr.positions,
+            "__stock_list__": stock_codes,
+            "__framework__": self
+        }
+        profiler = self.profiler
+        init_start = profiler.clock()
+        self.strategy_module.init(stock_codes, init_data)
+        profiler.record_callback("init", profiler.clock() - init_start, self._primary_lane().name)
+        for lane in self.extra_lanes:
+            lane_init_data = init_data.copy()
+            lane_init_data["__account__"] = lane.trade_mgr.assets
+            lane_init_data["__positions__"] = lane.trade_mgr.positions
+            init_start = profiler.clock()
+            lane.strategy_module.init(stock_codes, lane_init_data)
+            profiler.record_callback("init", profiler.clock() - init_start, lane.name)
+    
+    def run_headless(self, prepare=None):
+        """无界面运行回测：初始化虚拟账户、调用策略 init 后直接执行回测
+        
+        不读取界面设置、不下载数据，也不等待界面关闭，供滚动窗口回测等批量场景在工作进程中调用。
+        
+        Args:
+            prepare: 可选的回调 prepare(framework)，在策略 init 之后、回测开始之前调用
+        """
+        self.start_time = time.time()
+        self.profiler = KhProfiler(self.config)
+        try:
+            self.init_trader_and_account()
+            # 无界面时没有交易回调，委托/成交回报不再推送
+            self.trade_mgr.callback = self.trader_callback
+            self.daily_price_cache = {}
+            self.benchmark_series = None
+            self._init_strategies(self.get_stock_list())
+            if prepare is not None:
+                prepare(self)
+            self.is_running = True
+            self._run_backtest()
+        finally:
+            self.end_time = time.time()
+            self.total_runtime = self.end_time - self.start_time
+            self.is_running = False
+    
     def get_stock_list(self):
         """获取股票列表"""
         stock_codes = []
@@ -1081,21 +1271,205 @@ class KhQuantFramework:
             else:
                 print(f"周期一致性检查时出错: {str(e)}")
         
+    def _run_precompute(self, historical_data: Dict, period: str):
+        """调用策略的 khPrecompute(panel) 回调，在回测循环开始前一次性向量化计算指标列
+        
+        panel 为 {股票代码: DataFrame}，包含全部回测区间（以及 PRECOMPUTE_WARMUP 指定的预热K线）的行情。
+        策略返回 {股票代码: {列名: 数组}}（或 {股票代码: DataFrame}），数组长度与 panel 中对应 DataFrame 一致。
+        每一列整体后移一根K线后并入当前策略的行情：第 i 根K线上读到的值只使用了第 i-1 根及之前的数据，
+        因此在 khHandlebar 中通过 data[code][列名] 或 khPrice(data, code, 列名) 读取时不会产生未来函数。
+        
+        Args:
+            historical_data: 已加载的历史数据 {股票代码: DataFrame}（各策略共用，不会被修改）
+            period: 数据周期
+            
+        Returns:
+            Dict: 当前策略使用的行情；没有新增指标列时即为 historical_data 本身
+        """
+        precompute = getattr(self.strategy_module, 'khPrecompute', None)
+        if precompute is None or not historical_data:
+            return historical_data
+        
+        start = time.time()
+        panel, warmup_len = self._build_strategy_panel(historical_data, period)
+        
+        try:
+            callback_start = self.profiler.clock()
+            results = precompute(panel)
+            self.profiler.record_callback("khPrecompute", self.profiler.clock() - callback_start)
+        except Exception as e:
+            # 策略依赖预计算列，缺少这些列继续回测只会得到看似正常的错误结果，因此直接终止回测
+            raise RuntimeError(f"策略预计算 khPrecompute 执行失败: {str(e)}") from e
+        
+        added_columns = set()
+        lane_data = dict(historical_data)
+        for code, columns in (results or {}).items():
+            if code not in historical_data:
+                logging.warning(f"khPrecompute 返回了不在股票池中的代码: {code}")
+                continue
+            df = historical_data[code]
+            if isinstance(columns, pd.DataFrame):
+                columns = {name: columns[name] for name in columns.columns}
+            
+            new_columns = {}
+            expected_len = len(df) + warmup_len[code]
+            for name, values in columns.items():
+                if name in df.columns:
+                    logging.warning(f"khPrecompute 列 {name} 与行情字段重名，已忽略（{code}）")
+                    continue
+                values = np.asarray(values)
+                if values.ndim != 1 or len(values) != expected_len:
+                    logging.warning(
+                        f"khPrecompute 列 {name} 长度为 {len(values)}，与数据长度 {expected_len} 不一致，已忽略（{code}）")
+                    continue
+                # 后移一根K线，避免使用当前K线收盘后才能得到的数据
+                if values.dtype.kind != 'f':
+                    values = values.astype(np.float64)
+                shifted = np.empty_like(values)
+                shifted[0] = np.nan
+                shifted[1:] = values[:-1]
+                new_columns[name] = shifted[warmup_len[code]:]
+            
+            if new_columns:
+                lane_data[code] = df.assign(**new_columns)
+                added_columns.update(new_columns)
+        
+        message = (f"策略预计算完成: {len(added_columns)} 个指标列 {sorted(added_columns)}，"
+                   f"耗时 {time.time() - start:.2f} 秒")
+        logging.info(message)
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(message, "INFO")
+        return lane_data if added_columns else historical_data
+    
+    def _build_strategy_panel(self, historical_data: Dict, period: str):
+        """构造传给 khPrecompute/khSignals 的 panel：回测区间行情，前部拼接 PRECOMPUTE_WARMUP 根预热K线
+        
+        Returns:
+            tuple: (panel {股票代码: DataFrame}, {股票代码: 预热K线数})
+        """
+        warmup = int(getattr(self.strategy_module, 'PRECOMPUTE_WARMUP', 0) or 0)
+        if warmup > 0 and isinstance(self.trigger, CustomTimeTrigger):
+            # 自定义时间触发的数据已按触发时间点过滤，预热数据无法与之对齐
+            warmup = 0
+            if self.trader_callback:
+                self.trader_callback.gui.log_message("自定义时间触发模式下不加载预计算预热数据", "WARNING")
+        
+        panel = {}
+        warmup_len = {}
+        for code, df in historical_data.items():
+            extended = df
+            if warmup > 0 and 'time' in df.columns and len(df) > 0:
+                extended = self._load_precompute_warmup(code, df, period, warmup)
+            panel[code] = extended
+            warmup_len[code] = len(extended) - len(df)
+        return panel, warmup_len
+    
+    def _load_precompute_warmup(self, code: str, df: pd.DataFrame, period: str, warmup: int) -> pd.DataFrame:
+        """加载回测起点之前 warmup 根K线，拼接在 df 之前，用于指标预热"""
+        try:
+            first_ts = float(df['time'].iloc[0])
+            first_ts = first_ts / 1000 if first_ts > 1e10 else first_ts
+            end_time = datetime.datetime.fromtimestamp(first_ts - 1).strftime("%Y%m%d%H%M%S")
+            data = self._get_market_data_ex(
+                field_list=list(df.columns),
+                stock_list=[code],
+                period=period,
+                start_time='',
+                end_time=end_time,
+                count=warmup,
+                dividend_type=self.config.config_dict["data"].get("dividend_type", "none"),
+                fill_data=True
+            )
+            if not data or code not in data or len(data[code]) == 0:
+                return df
+            warm_df = data[code]
+            warm_df = warm_df[warm_df['time'] < df['time'].iloc[0]].tail(warmup)
+            if len(warm_df) == 0:
+                return df
+            warm_df = downcast_frame(warm_df, self.config.precision)
+            return pd.concat([warm_df[df.columns.intersection(warm_df.columns)], df])
+        except Exception as e:
+            logging.warning(f"加载{code}的预计算预热数据失败: {str(e)}")
+            return df
+    
+    def _market_field_list(self) -> List[str]:
+        """回测加载的行情字段（确保包含 time 与 close）"""
+        field_list = self.config.config_dict["data"]["fields"]
+        if "time" not in field_list:
+            field_list = ["time"] + field_list
+        if "close" not in field_list:
+            field_list.append("close")
+        return field_list
+    
+    def _resolve_load_period(self, data_period: str) -> str:
+        """由触发器的数据周期确定实际加载的数据周期（1s 触发按自定义时间点选择 1m 或 tick 数据）"""
+        period = data_period
+        if period == "1s":
+            # 对于自定义定时触发，检查时间点是否都是整分钟
+            if isinstance(self.trigger, CustomTimeTrigger):
+                # 检查所有触发时间点是否都是整分钟（秒数为0）
+                all_whole_minutes = True
+                for seconds in self.trigger.trigger_seconds:
+                    # 计算秒数部分
+                    seconds_part = seconds % 60
+                    if seconds_part != 0:
+                        all_whole_minutes = False
+                        break
+                
+                if all_whole_minutes:
+                    # 如果所有时间点都是整分钟，使用1m数据
+                    period = "1m"
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
+                else:
+                    # 如果有不是整分钟的时间点，使用tick数据
+                    period = "tick"
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
+            else:
+                # 默认使用tick数据
+                period = "tick"
+        return period
+    
+    def _get_market_data_ex(self, **kwargs):
+        """读取行情：设置了本地行情仓库（data_store，如滚动窗口回测的内存映射数据）时优先从中读取，
+        仓库中没有对应股票、周期或字段时再通过 xtdata 读取"""
+        if self.data_store is not None:
+            data = self.profiler.call("data_store.get_market_data_ex", self.data_store.get_market_data_ex, **kwargs)
+            if data:
+                return data
+        return self.profiler.call("xtdata.get_market_data_ex", xtdata.get_market_data_ex, **kwargs)
+    
+    def _new_backtest_records(self, trade_mgr) -> Dict:
+        """创建空的回测记录字典"""
+        return {
+            'trades': create_trade_record_table(trade_mgr.string_pool),  # 交易记录（列式存储）
+            'daily_stats': [],  # 每日统计数据
+            'benchmark_data': [],  # 基准指数数据
+            'start_time': self.config.backtest_start,
+            'end_time': self.config.backtest_end,
+            'init_capital': self.config.config_dict["backtest"]["init_capital"]
+        }
+        
     def _run_backtest(self):
         """回测模式"""
+        profiler = self.profiler
+        profile_dir = None
         try:
             # 检查数据周期和触发周期的一致性
             self._check_period_consistency()
             
             # 初始化回测记录字典
-            self.backtest_records = {
-                'trades': [],  # 交易记录
-                'daily_stats': [],  # 每日统计数据
-                'benchmark_data': [],  # 基准指数数据
-                'start_time': self.config.backtest_start,
-                'end_time': self.config.backtest_end,
-                'init_capital': self.config.config_dict["backtest"]["init_capital"]
-            }
+            self.backtest_records = self._new_backtest_records(self.trade_mgr)
+            
+            # 策略通道：主策略在前，其它策略依次在后，每个通道有独立的账户与回测记录
+            lanes = [self._primary_lane()]
+            for lane in self.extra_lanes:
+                lane.backtest_records = self._new_backtest_records(lane.trade_mgr)
+                lane.current_date = None
+                lane.day_start_time = None
+                lane.day_data = {}
+                lanes.append(lane)
             
             if self.trader_callback:
                 self.trader_callback.gui.log_message("开始回测...", "INFO")
@@ -1103,9 +1477,6 @@ class KhQuantFramework:
             # 获取股票列表
             stock_codes = self.get_stock_list()
 
-            # 单独处理基准指数数据
-            benchmark_code = self.config.config_dict["backtest"]["benchmark"]
-
             # 获取策略文件名（不含路径和扩展名）
             strategy_file = self.config.config_dict.get("strategy_file", "")
             strategy_name = os.path.splitext(os.path.basename(strategy_file))[0] if strategy_file else "unknown"
@@ -1122,144 +1493,44 @@ class KhQuantFramework:
             # 确保目录存在
             if not os.path.exists(backtest_dir):
                 os.makedirs(backtest_dir)
+            
+            # 性能剖析（可选）：结果保存到回测目录的 profile.json
+            profile_dir = backtest_dir
+            profiler.meta.update({
+                "strategies": [lane.strategy_file for lane in lanes],
+                "start_time": self.config.backtest_start,
+                "end_time": self.config.backtest_end,
+                "stocks": len(stock_codes),
+                "precision": self.config.precision,
+            })
+            profiler.start()
 
-            benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
-
-            if not os.path.exists(benchmark_file):
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"开始获取基准指数 {benchmark_code} 的每日数据", "INFO")
-                
-                try:
-                    # 先下载数据
-                    xtdata.download_history_data(
-                        stock_code=benchmark_code,
-                        period="1d",
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    benchmark_data = xtdata.get_market_data_ex(
-                        field_list=['time', 'close'],
-                        stock_list=[benchmark_code],
-                        period='1d',
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
-                    
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"获取到的数据结构: {benchmark_data.keys()}", 
-                            "INFO"
-                        )
-                        if benchmark_code in benchmark_data:
-                            self.trader_callback.gui.log_message(
-                                f"数据字段: {benchmark_data[benchmark_code].columns.tolist()}", 
-                                "INFO"
-                            )
-                    
-                    if benchmark_data and benchmark_code in benchmark_data:
-                        df = benchmark_data[benchmark_code]
-                        
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(
-                                f"基准数据形状: {df.shape}",
-                                "INFO"
-                            )
-                        
-                        # 确保有时间和收盘价列
-                        if 'time' in df.columns and 'close' in df.columns:
-                            # 转换时间戳为日期
-                            try:
-                                df['date'] = pd.to_datetime(df['time'], unit='ms')
-                            except:
-                                # 如果转换失败，尝试其他单位
-                                try:
-                                    df['date'] = pd.to_datetime(df['time'], unit='s')
-                                except:
-                                    try:
-                                        df['date'] = pd.to_datetime(df['time'])
-                                    except Exception as e:
-                                        if self.trader_callback:
-                                            self.trader_callback.gui.log_message(f"时间戳转换失败: {str(e)}", "ERROR")
-                            
-                            # 选择需要的列并保存
-                            if 'date' in df.columns:
-                                result_df = df[['date', 'close']].copy()
-                                
-                                if len(result_df) > 0:
-                                    # 确保保存目录存在
-                                    os.makedirs(os.path.dirname(benchmark_file), exist_ok=True)
-                                    result_df.to_csv(benchmark_file, index=False)
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"基准指数数据已保存到 {benchmark_file}, 共 {len(result_df)} 条记录",
-                                            "INFO"
-                                        )
-                                        
-                                    # 预先缓存所有基准指数数据，提高性能
-                                    for _, row in result_df.iterrows():
-                                        date_str = row['date'].strftime('%Y%m%d')
-                                        cache_key = f"benchmark_{date_str}_{benchmark_code}"
-                                        self._cached_benchmark_close[cache_key] = row['close']
-                                    
-                                    if self.trader_callback:
-                                        self.trader_callback.gui.log_message(
-                                            f"已预缓存 {len(self._cached_benchmark_close)} 条基准指数数据",
-                                            "INFO"
-                                        )
-                except Exception as e:
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"获取和保存基准指数数据失败: {str(e)}", "ERROR")
-                    logging.error(f"获取和保存基准指数数据失败: {str(e)}", exc_info=True)
+            # 一次性加载全部基准指数的日线收盘价，每日统计与结果输出共用
+            profiler.stage("加载基准")
+            self.benchmark_series = self._load_benchmark_series()
             
             # 获取数据周期
             data_period = self.trigger.get_data_period()
             
             # 一次性加载所有股票的历史数据
+            profiler.stage("加载行情")
             historical_data = {}
+            loaded_period = data_period
             for code in stock_codes:
                 if not self.is_running:
                     break
                     
                 # 确保field_list中包含time和close字段
-                field_list = self.config.config_dict["data"]["fields"]
-                if "time" not in field_list:
-                    field_list = ["time"] + field_list
-                if "close" not in field_list:
-                    field_list.append("close")
+                field_list = self._market_field_list()
                     
                 if self.trader_callback:
                     self.trader_callback.gui.log_message(f"加载{code}的历史数据...", "INFO")
                     
                 # 根据触发器的数据周期加载对应的历史数据
-                period = data_period
-                if period == "1s":
-                    # 对于自定义定时触发，检查时间点是否都是整分钟
-                    if isinstance(self.trigger, CustomTimeTrigger):
-                        # 检查所有触发时间点是否都是整分钟（秒数为0）
-                        all_whole_minutes = True
-                        for seconds in self.trigger.trigger_seconds:
-                            # 计算秒数部分
-                            seconds_part = seconds % 60
-                            if seconds_part != 0:
-                                all_whole_minutes = False
-                                break
-                        
-                        if all_whole_minutes:
-                            # 如果所有时间点都是整分钟，使用1m数据
-                            period = "1m"
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"所有自定义时间点都是整分钟，使用1分钟K线数据", "INFO")
-                        else:
-                            # 如果有不是整分钟的时间点，使用tick数据
-                            period = "tick"
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"存在非整分钟的自定义时间点，使用tick数据", "INFO")
-                    else:
-                        # 默认使用tick数据
-                        period = "tick"
+                period = self._resolve_load_period(data_period)
                 
-                data = xtdata.get_market_data_ex(
+                loaded_period = period
+                data = self._get_market_data_ex(
                     field_list=field_list,
                     stock_list=[code],
                     period=period,
@@ -1322,12 +1593,83 @@ class KhQuantFramework:
                         # 非自定义时间触发，直接存储DataFrame
                         historical_data[code] = data[code]
             
+            # 紧凑精度模式：价格等浮点字段转为float32，成交量等整数字段转为int32
+            if self.config.precision == "float32":
+                for code in list(historical_data.keys()):
+                    historical_data[code] = downcast_frame(historical_data[code], "float32")
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message("已启用float32紧凑精度模式", "INFO")
+            
+            profiler.meta["period"] = loaded_period
+            
+            # 回测结果缓存（可选）：策略、配置与数据都未变化时直接使用上一次的结果
+            profiler.stage("结果缓存")
+            result_cache = KhResultCache(self.config)
+            cache_key = None
+            if result_cache.enabled and self.is_running:
+                cache_start = time.time()
+                cache_key = result_cache.key([lane.strategy_file for lane in lanes], self.config.config_dict,
+                                             data_fingerprint(historical_data, self.benchmark_series))
+                result_dirs = [os.path.join("backtest_results", self._lane_dir_name(lane)) for lane in lanes]
+                cached_states = result_cache.restore(cache_key, result_dirs)
+                if cached_states is not None:
+                    # 装回缓存的回测记录与期末账户，run_headless 的调用方读到的结果与实际回测一致
+                    for lane, lane_state in zip(lanes, cached_states):
+                        self._apply_account_state(lane, lane_state)
+                    self._activate_lane(lanes[0])
+                    message = f"命中回测结果缓存 {cache_key[:12]}，跳过回测（耗时 {time.time() - cache_start:.2f} 秒）"
+                    logging.info(message)
+                    if self.trader_callback:
+                        self.trader_callback.gui.log_message(message, "INFO")
+                    self._notify_backtest_finished(backtest_dir)
+                    return
+            
+            # 策略预计算指标（可选的 khPrecompute 回调，多策略时各策略的指标列只并入各自的行情副本）
+            profiler.stage("预计算")
+            for lane in lanes:
+                lane.historical_data = historical_data
+            if self.is_running:
+                for lane in lanes:
+                    self._activate_lane(lane)
+                    lane.historical_data = self._run_precompute(historical_data, loaded_period)
+                self._activate_lane(lanes[0])
+            
+            # 撮合模拟（可选）：把行情转换为数组，下单时按盘口/成交量决定实际成交
+            profiler.stage("撮合准备")
+            matcher = KhMatchingSimulator(self.config)
+            if matcher.enabled and self.is_running:
+                matcher.load(historical_data, loaded_period)
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(
+                        f"已启用撮合模拟，参与率上限 {matcher.participation_rate:.0%}", "INFO")
+            for lane in lanes:
+                lane.trade_mgr.matcher = matcher if matcher.enabled else None
+            
             if not self.is_running:
                 if self.trader_callback:
                     self.trader_callback.gui.log_message("回测被中止", "WARNING")
                 return
+            
+            # 向量化策略（定义了 khSignals）：一次性得到目标持仓矩阵，不再逐 bar 调用策略
+            profiler.stage("向量化回测")
+            vector_lanes = [lane for lane in lanes if getattr(lane.strategy_module, 'khSignals', None) is not None]
+            for lane in vector_lanes:
+                self._activate_lane(lane)
+                self._run_vectorized_backtest(lane.historical_data, loaded_period)
+            self._activate_lane(lanes[0])
+            if len(vector_lanes) == len(lanes):
+                profiler.stage("保存结果")
+                self._finish_lanes(lanes, backtest_dir, backtest_dir_name)
+                if cache_key is not None:
+                    result_cache.store(cache_key, result_dirs, [self._account_state(lane) for lane in lanes])
+                return
+            # 其余策略逐 bar 回测
+            all_lanes = lanes
+            lanes = [lane for lane in lanes if lane not in vector_lanes]
+            self._activate_lane(lanes[0])
                     
             # 获取所有时间点
+            profiler.stage("构建时间轴")
             all_times = []
 
             # 对于自定义时间触发，使用不同的方式获取时间点
@@ -1426,6 +1768,7 @@ class KhQuantFramework:
             
             # 保存所有时间点到实例变量，供record_results使用
             self.all_times = all_times
+            profiler.meta["time_points"] = len(all_times)
             
             total_times = len(all_times)
             processed_times = 0
@@ -1458,8 +1801,8 @@ class KhQuantFramework:
                 self.time_field_cache = {}
                 self.time_idx_cache = {}
                 
-                # 创建基于当前时间点的数据引用
-                for code, df in historical_data.items():
+                # 创建基于当前时间点的数据引用（使用第一个策略的行情，其它策略的指标列在分派时替换）
+                for code, df in lanes[0].historical_data.items():
                     # 找到时间字段
                     for field in ['time', 'timestamp', 'date', 'datetime']:
                         if field in df.columns:
@@ -1478,10 +1821,34 @@ class KhQuantFramework:
                 if self.trader_callback:
                     self.trader_callback.gui.log_message("数据缓存构建完成", "INFO")
             
-            # 按时间顺序模拟
-            current_date = None
-            day_start_time = None
-            day_data = {}
+            # 为股票池分配持仓簿编号，并缓存收盘价列，每个时间点据此填充按编号排列的价格行，
+            # 持仓估值时直接对价格行做向量化计算
+            # 同时构建逐 bar 上下文的行情数组，khPrice/khGet/khHas 据此按下标直接取值
+            position_book = self.trade_mgr.positions
+            self._bar_schema = KhBarSchema(self.historical_data_ref)
+            self._close_columns = {}
+            for code, df in self.historical_data_ref.items():
+                close_values = df['close'].to_numpy(dtype=np.float64) if 'close' in df.columns else None
+                self._close_columns[code] = (position_book.stock_id(code), close_values,
+                                             self._bar_schema.code_index[code])
+            self._bar_prices = position_book.price_row()
+            
+            # 一次性预加载整个股票池、整个回测区间的日线收盘价/前收盘价，供每日收盘估值使用
+            self.daily_price_panel = self._preload_daily_price_panel(list(self.historical_data_ref.keys()))
+            
+            # 其它策略的持仓簿按相同顺序分配股票编号，各通道共用同一价格行与日线价格面板
+            # 行情与第一个策略不同（有各自的 khPrecompute 指标列）的策略使用各自的行情数组
+            lanes[0].bar_schema = self._bar_schema
+            for lane in lanes[1:]:
+                lane_book = lane.trade_mgr.positions
+                for code in position_book.codes:
+                    lane_book.stock_id(code)
+                if lane.historical_data is lanes[0].historical_data:
+                    lane.bar_schema = self._bar_schema
+                else:
+                    lane.bar_schema = KhBarSchema({code: lane.historical_data[code] for code in self.historical_data_ref})
+            
+            # 按时间顺序模拟（当前日期、当天数据等状态保存在各策略通道中）
             
             # 获取盘前盘后回调设置
             pre_market_enabled = self.config.config_dict.get("market_callback", {}).get("pre_market_enabled", False)
@@ -1534,362 +1901,148 @@ class KhQuantFramework:
                 "总时间": 0
             }
             
-            for current_time in all_times:
-                loop_start_time = time.time()
-                
-                if not self.is_running:
+            # 事件调度（可选）：触发时间点、盘前/盘后回调与收盘估值统一为事件，未触发的时间点直接跳过
+            timeline = None
+            if (self.config.config_dict.get("backtest", {}).get("event_queue", {}) or {}).get("enabled", False):
+                try:
+                    timeline = KhTimeline(all_times)
+                except (TypeError, ValueError) as e:
+                    logging.warning(f"时间轴无法用于事件调度，改为逐时间点回测: {str(e)}")
+            
+            # 断点续跑（可选）：从最新快照恢复账户与回测记录，从快照所在的时间点继续
+            checkpoint = KhCheckpointStore(self.config)
+            checkpoint_fingerprint = None
+            start_index = 0
+            if checkpoint.enabled:
+                checkpoint_fingerprint = self._checkpoint_fingerprint(lanes, stock_codes, loaded_period, all_times)
+                if timeline is not None:
+                    # 两种模式在交易日切换时的状态不同（事件调度已执行完前一日的盘后回调），快照不能混用
+                    checkpoint_fingerprint['scheduler'] = 'event'
+                state = checkpoint.load(backtest_dir_name, checkpoint_fingerprint) if checkpoint.resume else None
+                if state is not None:
+                    start_index = self._restore_checkpoint(state, lanes)
+                    processed_times = start_index
+                    message = f"从断点恢复回测: 跳过前 {start_index} 个时间点，从 {all_times[start_index]} 继续"
+                    logging.info(message)
                     if self.trader_callback:
-                        self.trader_callback.gui.log_message("回测被中止", "WARNING")
-                    break
+                        self.trader_callback.gui.log_message(message, "INFO")
+            checkpoint_date = None
+            days_since_checkpoint = 0
+            
+            scheduler = None
+            if timeline is not None:
+                scheduler = KhEventScheduler(
+                    timeline, self.trigger.trigger_mask(timeline),
+                    pre_market=pre_market_enabled and any(hasattr(lane.strategy_module, 'khPreMarket') for lane in lanes),
+                    post_market=post_market_enabled and any(hasattr(lane.strategy_module, 'khPostMarket') for lane in lanes),
+                    start_index=start_index)
+                profiler.meta["events"] = len(scheduler)
+                message = "事件调度: " + "，".join(scheduler.summary())
+                logging.info(message)
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(message, "INFO")
+            
+            profiler.stage("逐bar回测")
+            clock = profiler.clock
+            if scheduler is not None:
+                processed_times, total_times = self._run_event_loop(
+                    scheduler, lanes, stock_codes, time_stats, pre_market_time, post_market_time,
+                    checkpoint, checkpoint_fingerprint, backtest_dir_name)
+            else:
+                for index, current_time in enumerate(all_times[start_index:], start_index):
+                    loop_start_time = clock()
                     
-                processed_times += 1
-                # 根据计算的增量显示进度，但确保前几次都显示
-                should_show_progress = False
-                if processed_times <= 5:  # 前5次都显示
-                    should_show_progress = True
-                elif processed_times % progress_increment == 0:  # 按增量显示
-                    should_show_progress = True
-                elif processed_times == total_times:  # 最后一次也显示
-                    should_show_progress = True
-                
-                if should_show_progress and self.trader_callback:
-                    progress = (processed_times / total_times) * 100
-                    self.trader_callback.gui.log_message(f"回测进度: {progress:.2f}%", "INFO")
-                
-                # 进一步优化的构造数据代码
-                data_start_time = time.time()
-                
-                # 创建包含__current_time__的字典结构
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
+                    if not self.is_running:
+                        if self.trader_callback:
+                            self.trader_callback.gui.log_message("回测被中止", "WARNING")
+                        break
                         
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
-                # 创建当前时间点的数据视图
-                current_data = {"__current_time__": time_info}
-                
-                # 直接添加数据引用，而不是转换为字典
-                for code in self.historical_data_ref:
-                    if code in self.time_field_cache and code in self.time_idx_cache:
-                        time_field = self.time_field_cache[code]
-                        time_idx_map = self.time_idx_cache[code]
-                        df = self.historical_data_ref[code]
+                    processed_times += 1
+                    # 根据计算的增量显示进度，但确保前几次都显示
+                    should_show_progress = False
+                    if processed_times <= 5:  # 前5次都显示
+                        should_show_progress = True
+                    elif processed_times % progress_increment == 0:  # 按增量显示
+                        should_show_progress = True
+                    elif processed_times == total_times:  # 最后一次也显示
+                        should_show_progress = True
+                    
+                    if should_show_progress and self.trader_callback:
+                        progress = (processed_times / total_times) * 100
+                        self.trader_callback.gui.log_message(f"回测进度: {progress:.2f}%", "INFO")
+                    
+                    # 构造时间信息
+                    time_info_start = clock()
+                    time_info = self._make_time_info(current_time)
+                    time_stats["构造时间信息"] += clock() - time_info_start
+                    
+                    # 构造当前时间点的数据视图
+                    data_start_time = clock()
+                    current_data, bar_context = self._build_bar_data(current_time, time_info, lanes)
+                    time_stats["构造数据"] += clock() - data_start_time
+                    
+                    # 添加日志，显示第一个股票的数据示例
+                    if processed_times == 1:
+                        self._log_data_sample(current_data)
+                    
+                    # 交易日切换时保存断点快照（快照为处理本时间点之前的状态）
+                    if checkpoint.enabled and time_info["date"] != checkpoint_date:
+                        if checkpoint_date is not None:
+                            days_since_checkpoint += 1
+                            if days_since_checkpoint >= checkpoint.interval_days:
+                                self._save_checkpoint(checkpoint, backtest_dir_name, checkpoint_fingerprint, lanes, index)
+                                days_since_checkpoint = 0
+                        checkpoint_date = time_info["date"]
+                    
+                    # 依次分派给各策略：行情与时间信息共享，账户、持仓与逐 bar 上下文各策略独立
+                    triggered = None
+                    for lane in lanes:
+                        lane_data = self._lane_bar_data(lane, lanes, current_data, bar_context, stock_codes)
+                    
+                        # 检查是否是新的一天
+                        new_day_start = clock()
+                        if lane.current_date != time_info["date"]:
+                            # 如果有前一天的数据，执行盘后回调
+                            post_market_start = clock()
+                            if lane.current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
+                                self._run_post_market(lane, time_info, post_market_time, stock_codes)
+                            time_stats["盘后回调"] += clock() - post_market_start
+                        
+                            # 更新当前日期；风控的当日委托计数在盘前回调之前清零，盘前下单计入新的交易日
+                            lane.current_date = time_info["date"]
+                            lane.day_start_time = time_info["timestamp"]
+                            lane.day_data = lane_data
+                            lane.risk_mgr.on_new_day(lane.current_date)
                         
-                        # 尝试直接匹配当前时间
-                        if current_time in time_idx_map:
-                            idx = time_idx_map[current_time]
-                            # 直接存储行引用，而不是转换为字典
-                            current_data[code] = df.iloc[idx]
+                            # 检查是否需要执行盘前回调
+                            pre_market_start = clock()
+                            if pre_market_enabled and hasattr(self.strategy_module, 'khPreMarket'):
+                                self._run_pre_market(lane, lane_data, time_info, pre_market_time, stock_codes)
+                            time_stats["盘前回调"] += clock() - pre_market_start
                         else:
-                            # 尝试处理精度不一致问题
-                            matched = False
-                            idx = -1
-                            
-                            if isinstance(current_time, (int, float)):
-                                # 处理毫秒/秒的转换
-                                if current_time > 1e10:  # 毫秒级
-                                    sec_time = current_time // 1000
-                                    if sec_time in time_idx_map:
-                                        idx = time_idx_map[sec_time]
-                                        matched = True
-                                else:  # 秒级
-                                    ms_time = current_time * 1000
-                                    if ms_time in time_idx_map:
-                                        idx = time_idx_map[ms_time]
-                                        matched = True
-                            
-                            if matched:
-                                # 直接存储行引用
-                                current_data[code] = df.iloc[idx]
-                            else:
-                                # 没有匹配的数据，存储空Series
-                                current_data[code] = pd.Series({})
-                    else:
-                        # 没有时间字段的情况
-                        current_data[code] = pd.Series({})
-                
-                time_stats["构造数据"] += time.time() - data_start_time
-                
-                # 添加日志，显示第一个股票的数据示例
-                if processed_times == 1 and self.trader_callback and current_data:
-                    # 获取第一个股票代码
-                    first_stock = None
-                    for code in current_data:
-                        if code != "__current_time__":
-                            first_stock = code
-                            break
+                            # 更新当天的数据
+                            lane.day_data = lane_data
+                        time_stats["检查新日期"] += clock() - new_day_start
                     
-                    if first_stock:
-                        sample_data = current_data[first_stock]
-                        self.trader_callback.gui.log_message(f"数据样例 - 股票: {first_stock}, 字段: {list(sample_data.keys())}", "INFO")
-                        # 打印每个字段的值（最多显示5个字段）
-                        sample_str = ""
-                        count = 0
-                        for key, value in sample_data.items():
-                            if count < 5:
-                                sample_str += f"{key}: {value}, "
-                                count += 1
-                        if sample_str:
-                            self.trader_callback.gui.log_message(f"部分字段值: {sample_str[:-2]}", "INFO")
-                
-                # 构造时间信息
-                time_info_start = time.time()
-                try:
-                    timestamp = int(current_time)
-                    # 判断时间戳精度（秒级或毫秒级）
-                    if timestamp > 1e10:  # 毫秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp / 1000)
-                    else:  # 秒级时间戳
-                        dt = datetime.datetime.fromtimestamp(timestamp)
-                        
-                    time_info = {
-                        "timestamp": timestamp,
-                        "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
-                        "date": dt.strftime("%Y-%m-%d"),
-                        "time": dt.strftime("%H:%M:%S"),
-                        "raw_time": current_time
-                    }
-                except Exception as e:
-                    # 如果转换失败，使用原始时间戳
-                    time_info = {
-                        "timestamp": current_time,
-                        "datetime": str(current_time),
-                        "date": str(current_time),
-                        "time": str(current_time),
-                        "raw_time": current_time
-                    }
-                
-                # 添加当前时间信息到数据中
-                # 添加时间信息到数据中
-                current_data["__current_time__"] = time_info
-                time_stats["构造时间信息"] += time.time() - time_info_start
-                
-                # 添加账户和持仓信息到数据字典
-                account_data = {
-                    "__account__": self.trade_mgr.assets
-                }
-                # 添加持仓信息
-                positions_data = {
-                    "__positions__": self.trade_mgr.positions
-                }
-                # 添加股票池信息
-                stock_list_data = {
-                    "__stock_list__": stock_codes
-                }
-                # 合并所有信息
-                current_data.update(account_data)
-                current_data.update(positions_data)
-                current_data.update(stock_list_data)
-                
-                # 检查是否是新的一天
-                new_day_start = time.time()
-                if current_date != time_info["date"]:
-                    # 如果有前一天的数据，执行盘后回调
-                    post_market_start = time.time()
-                    if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
-                        # 执行盘后回调
-                        try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘后回调 - 日期: {current_date}", "INFO")
-                            
-                            # 设置时间信息为盘后时间
-                            post_time_info = time_info.copy()
-                            post_time_info["time"] = post_market_time
-                            post_time_info["datetime"] = f"{current_date} {post_market_time}"
-                            
-                            # 使用最后一个时间点的数据或创建一个完整的数据结构
-                            post_data = day_data.copy() if day_data else {}
-                            post_data["__current_time__"] = post_time_info
-                            
-                            # 添加账户和持仓信息到数据字典
-                            post_data["__account__"] = self.trade_mgr.assets
-                            post_data["__positions__"] = self.trade_mgr.positions
-                            post_data["__stock_list__"] = stock_codes
-                            
-                            # 添加框架实例到数据字典
-                            post_data["__framework__"] = self
-                            
-                            # 执行盘后回调
-                            post_signals = self.strategy_module.khPostMarket(post_data)
-                            
-                            # 处理盘后回调产生的信号
-                            if post_signals:
-                                for signal in post_signals:
-                                    if 'price' in signal:
-                                        signal['price'] = round(float(signal['price']), 2)
-                                    signal['timestamp'] = time_info["timestamp"]
-                                
-                                # 发送交易指令
-                                self.trade_mgr.process_signals(post_signals)
-                        except Exception as e:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘后回调时出错: {str(e)}", "ERROR")
-                    time_stats["盘后回调"] += time.time() - post_market_start
+                        # 使用触发器判断是否应该触发策略
+                        trigger_start = clock()
+                        # 触发器有状态（如K线触发记录上次触发日期），同一时间点只判断一次，结果各策略共用
+                        if triggered is None:
+                            triggered = self.trigger.should_trigger(current_time, lane_data)
+                        time_stats["触发器检查"] += clock() - trigger_start
+                        if not triggered:
+                            continue
                     
-                    # 更新当前日期
-                    current_date = time_info["date"]
-                    day_start_time = time_info["timestamp"]
-                    day_data = current_data
+                        self._handle_lane_bar(lane, lane_data, current_time, time_stats)
                     
-                    # 检查是否需要执行盘前回调
-                    pre_market_start = time.time()
-                    if pre_market_enabled and hasattr(self.strategy_module, 'khPreMarket'):
-                        # 执行盘前回调
-                        try:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘前回调 - 日期: {current_date}", "INFO")
-                            
-                            # 设置时间信息为盘前时间
-                            pre_time_info = time_info.copy()
-                            pre_time_info["time"] = pre_market_time
-                            pre_time_info["datetime"] = f"{current_date} {pre_market_time}"
-                            
-                            # 使用当前时间点的数据或创建一个完整的数据结构
-                            pre_data = current_data.copy()
-                            pre_data["__current_time__"] = pre_time_info
-                            
-                            # 确保包含账户和持仓信息
-                            pre_data["__account__"] = self.trade_mgr.assets
-                            pre_data["__positions__"] = self.trade_mgr.positions
-                            pre_data["__stock_list__"] = stock_codes
-                            
-                            # 添加框架实例到数据字典
-                            pre_data["__framework__"] = self
-                            
-                            # 执行盘前回调
-                            pre_signals = self.strategy_module.khPreMarket(pre_data)
-                            
-                            # 处理盘前回调产生的信号
-                            if pre_signals:
-                                for signal in pre_signals:
-                                    if 'price' in signal:
-                                        signal['price'] = round(float(signal['price']), 2)
-                                    signal['timestamp'] = time_info["timestamp"]
-                                
-                                # 发送交易指令
-                                self.trade_mgr.process_signals(pre_signals)
-                        except Exception as e:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"执行盘前回调时出错: {str(e)}", "ERROR")
-                    time_stats["盘前回调"] += time.time() - pre_market_start
-                else:
-                    # 更新当天的数据
-                    day_data = current_data
-                time_stats["检查新日期"] += time.time() - new_day_start
-                
-                # 使用触发器判断是否应该触发策略
-                trigger_start = time.time()
-                if not self.trigger.should_trigger(current_time, current_data):
-                    time_stats["触发器检查"] += time.time() - trigger_start
-                    continue
-                time_stats["触发器检查"] += time.time() - trigger_start
-                
-                # 风控检查
-                risk_start = time.time()
-                if not self.risk_mgr.check_risk(current_data):
-                    time_stats["风控检查"] += time.time() - risk_start
-                    continue
-                time_stats["风控检查"] += time.time() - risk_start
-                
-                # 检查是否是交易日
-                current_date_str = current_data.get("__current_time__", {}).get("date", "")
-                if current_date_str and not self.tools.is_trade_day(current_date_str):
-                    # 如果不是交易日，跳过策略调用
-                    continue
-                
-                # 添加框架实例到数据字典
-                current_data["__framework__"] = self
-                
-                # 检查股票数据是否为空
-                stock_data_empty = True
-                empty_stocks = []
-                for key, value in current_data.items():
-                    # 跳过框架内部字段
-                    if key.startswith("__"):
-                        continue
-                    # 检查股票数据是否为空
-                    if isinstance(value, pd.Series) and not value.empty:
-                        stock_data_empty = False
-                    elif isinstance(value, pd.Series) and value.empty:
-                        empty_stocks.append(key)
-                    elif not value:  # 处理其他空值情况
-                        empty_stocks.append(key)
-                
-                # 如果所有股票数据都为空，记录错误并跳过策略调用
-                if stock_data_empty:
-                    current_time_str = current_data.get("__current_time__", {}).get("datetime", str(current_time))
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"警告: 时间点 {current_time_str} 的所有股票数据为空，跳过策略调用", 
-                            "WARNING"
-                        )
-                        if empty_stocks:
-                            self.trader_callback.gui.log_message(
-                                f"空数据股票列表: {', '.join(empty_stocks[:10])}" + 
-                                (f" 等{len(empty_stocks)}只股票" if len(empty_stocks) > 10 else ""),
-                                "WARNING"
-                            )
-                    continue
-                
-                # 如果有部分股票数据为空，记录警告但继续执行
-                if empty_stocks:
-                    current_time_str = current_data.get("__current_time__", {}).get("datetime", str(current_time))
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"警告: 时间点 {current_time_str} 有 {len(empty_stocks)} 只股票数据为空: {', '.join(empty_stocks[:5])}" + 
-                            (f" 等" if len(empty_stocks) > 5 else ""),
-                            "WARNING"
-                        )
-                
-                # 调用策略处理
-                strategy_start = time.time()
-                signals = self.strategy_module.khHandlebar(current_data)
-                time_stats["策略处理"] += time.time() - strategy_start
-                
-                # 处理信号中的价格精度
-                signal_process_start = time.time()
-                if signals:
-                    for signal in signals:
-                        if 'price' in signal:
-                            # 确保价格保留到0.01
-                            signal['price'] = round(float(signal['price']), 2)
-                        # 添加当前回测时间戳
-                        signal['timestamp'] = current_time
-                time_stats["处理信号"] += time.time() - signal_process_start
-                
-                # 发送交易指令
-                trade_start = time.time()
-                if signals:
-                    self.trade_mgr.process_signals(signals)
-                time_stats["交易指令"] += time.time() - trade_start
-                
-                # 记录结果
-                record_start = time.time()
-                self.record_results(current_time, current_data, signals)
-                time_stats["记录结果"] += time.time() - record_start
-                
-                # 累计总时间
-                time_stats["总时间"] += time.time() - loop_start_time
+                    # 累计总时间
+                    time_stats["总时间"] += clock() - loop_start_time
+                    if profiler.enabled:
+                        profiler.end_bar(time_stats)
+            
+            # 全部时间点处理完成后删除断点快照（中途停止时保留，供下次续跑）
+            if checkpoint.enabled and processed_times == total_times:
+                checkpoint.remove(backtest_dir_name)
             
             # 输出时间统计信息
             if self.trader_callback:
@@ -1902,250 +2055,887 @@ class KhQuantFramework:
                             self.trader_callback.gui.log_message(f"{key}: {value:.4f}秒 ({percentage:.2f}%)", "INFO")
                     self.trader_callback.gui.log_message(f"总执行时间: {total_time:.4f}秒", "INFO")
             
-            # 处理最后一天的盘后回调
-            if current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
-                try:
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"执行最后一天的盘后回调 - 日期: {current_date}", "INFO")
+            # 处理最后一天的盘后回调（事件调度模式下已作为盘后回调事件执行）
+            profiler.stage("保存结果")
+            for lane in lanes if scheduler is None else []:
+                self._activate_lane(lane)
+                if lane.current_date is not None and post_market_enabled and hasattr(self.strategy_module, 'khPostMarket'):
+                    try:
+                        if self.trader_callback:
+                            self.trader_callback.gui.log_message(f"执行最后一天的盘后回调 - 日期: {lane.current_date}", "INFO")
                     
-                    # 设置时间信息为盘后时间
-                    time_info = (day_data.get("__current_time__", {}) if day_data else {}).copy()
-                    if not time_info:
-                        # 如果没有时间信息，创建一个默认的
-                        time_info = {
-                            "timestamp": int(time.time()),
-                            "date": current_date,
-                            "time": post_market_time,
-                            "datetime": f"{current_date} {post_market_time}"
-                        }
-                    else:
-                        time_info["time"] = post_market_time
-                        time_info["datetime"] = f"{current_date} {post_market_time}"
+                        # 设置时间信息为盘后时间
+                        time_info = (lane.day_data.get("__current_time__", {}) if lane.day_data else {}).copy()
+                        if not time_info:
+                            # 如果没有时间信息，创建一个默认的
+                            time_info = {
+                                "timestamp": int(time.time()),
+                                "date": lane.current_date,
+                                "time": post_market_time,
+                                "datetime": f"{lane.current_date} {post_market_time}"
+                            }
+                        else:
+                            time_info["time"] = post_market_time
+                            time_info["datetime"] = f"{lane.current_date} {post_market_time}"
                     
-                    # 使用最后一个时间点的数据或创建一个完整的数据结构
-                    post_data = day_data.copy() if day_data else {}
-                    post_data["__current_time__"] = time_info
+                        # 使用最后一个时间点的数据或创建一个完整的数据结构
+                        post_data = lane.day_data.copy() if lane.day_data else {}
+                        post_data["__current_time__"] = time_info
                     
-                    # 添加账户和持仓信息到数据字典
-                    post_data["__account__"] = self.trade_mgr.assets
-                    post_data["__positions__"] = self.trade_mgr.positions
-                    post_data["__stock_list__"] = self.get_stock_list()
+                        # 添加账户和持仓信息到数据字典
+                        post_data["__account__"] = self.trade_mgr.assets
+                        post_data["__positions__"] = self.trade_mgr.positions
+                        post_data["__stock_list__"] = self.get_stock_list()
                     
-                    # 添加框架实例到数据字典
-                    post_data["__framework__"] = self
+                        # 添加框架实例到数据字典
+                        post_data["__framework__"] = self
                     
-                    # 执行盘后回调
-                    post_signals = self.strategy_module.khPostMarket(post_data)
+                        # 执行盘后回调
+                        callback_start = clock()
+                        post_signals = self.strategy_module.khPostMarket(post_data)
+                        profiler.record_callback("khPostMarket", clock() - callback_start, lane.name)
                     
-                    # 处理盘后回调产生的信号
-                    if post_signals:
-                        for signal in post_signals:
-                            if 'price' in signal:
-                                signal['price'] = round(float(signal['price']), 2)
-                            signal['timestamp'] = time_info["timestamp"]
+                        # 处理盘后回调产生的信号
+                        if post_signals:
+                            for signal in post_signals:
+                                if 'price' in signal:
+                                    signal['price'] = round(float(signal['price']), 2)
+                                signal['timestamp'] = time_info["timestamp"]
                         
-                        # 发送交易指令
-                        self.trade_mgr.process_signals(post_signals)
-                except Exception as e:
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"执行最后一天的盘后回调时出错: {str(e)}", "ERROR")
-                
-            # 回测完成后发送信号
-            if self.trader_callback:
-                # 先停止策略并更新状态
-                self.is_running = False
-                self.trader_callback.gui.on_strategy_finished()
-                
-                # 显示100%进度
-                self.trader_callback.gui.log_message("回测进度: 100.00%", "INFO")
-                
-                # 然后再显示回测结果
-                self.trader_callback.gui.log_message("回测完成", "INFO")
-                QMetaObject.invokeMethod(
-                    self.trader_callback.gui, 
-                    "show_backtest_result", 
-                    Qt.QueuedConnection,
-                    Q_ARG(str, backtest_dir)
-                )
-                
-            # 在回测完成后保存回测记录
-            try:
-                # 获取策略文件名（不含路径和扩展名）
-                strategy_file = self.config.config_dict.get("strategy_file", "")
-                strategy_name = os.path.splitext(os.path.basename(strategy_file))[0] if strategy_file else "unknown"
-                
-                # 生成回测时间戳
-                timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-                
-                # 创建当前回测的子目录（包含策略名）
-                backtest_dir = os.path.join(
-                    "backtest_results",
-                    backtest_dir_name
-                )
-
-                # 如果目录已存在，先删除
-                if os.path.exists(backtest_dir):
-                    shutil.rmtree(backtest_dir)
-
-                # 创建新目录
-                os.makedirs(backtest_dir)
+                            # 发送交易指令
+                            self.trade_mgr.process_signals(post_signals)
+                    except Exception as e:
+                        if self.trader_callback:
+                            self.trader_callback.gui.log_message(f"执行最后一天的盘后回调时出错: {str(e)}", "ERROR")
+                
+            # 回测完成：通知界面并保存回测记录
+            completed = processed_times == total_times
+            self._finish_lanes(all_lanes, backtest_dir, backtest_dir_name)
+            # 完整运行的结果写入缓存（中途停止的不写入）
+            if cache_key is not None and completed:
+                result_cache.store(cache_key, result_dirs, [self._account_state(lane) for lane in all_lanes])
 
-                # 保存交易记录
-                trades_df = pd.DataFrame(self.backtest_records['trades'])
-                if len(trades_df) > 0:
-                    trades_df.to_csv(os.path.join(backtest_dir, "trades.csv"), index=False, encoding='utf-8-sig')
-                else:
-                    # 创建一个包含列名但没有数据的空DataFrame
-                    empty_trades_df = pd.DataFrame(columns=[
-                        'datetime', 'code', 'action', 'price', 'volume', 'amount',
-                        'commission', 'stamp_tax', 'transfer_fee', 'flow_fee',
-                        'total_asset', 'cash', 'market_value'
-                    ])
-                    empty_trades_df.to_csv(os.path.join(backtest_dir, "trades.csv"), index=False, encoding='utf-8-sig')
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message("回测期间没有产生交易记录", "WARNING")
+        except Exception as e:
+            error_msg = "回测运行异常: " + str(e)
+            logging.error(error_msg, exc_info=True)
+            # 调用错误回调函数
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(error_msg, "ERROR")
+                import traceback
+                self.trader_callback.gui.log_message(f"错误详情:\n{traceback.format_exc()}", "ERROR")
+            raise  # 重新抛出异常
+        finally:
+            profiler.stop()
+            if profile_dir is not None:
+                profile_path = profiler.save(profile_dir)
+                if profile_path:
+                    logging.info(f"性能剖析结果已保存到 {profile_path}")
 
-                # 保存每日统计数据
-                daily_stats_df = pd.DataFrame(self.backtest_records['daily_stats'])
-                if len(daily_stats_df) > 0:
-                    daily_stats_df.to_csv(os.path.join(backtest_dir, "daily_stats.csv"), index=False, encoding='utf-8-sig')
-                else:
-                    # 创建一个包含列名但没有数据的空DataFrame
-                    empty_stats_df = pd.DataFrame(columns=[
-                        'date', 'total_asset', 'cash', 'market_value', 
-                        'daily_return', 'benchmark_close', 'positions'
-                    ])
-                    empty_stats_df.to_csv(os.path.join(backtest_dir, "daily_stats.csv"), index=False, encoding='utf-8-sig')
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message("回测期间没有产生每日统计数据", "WARNING")
+    @staticmethod
+    def _make_time_info(current_time) -> Dict:
+        """把时间轴上的时间戳（秒级或毫秒级）转换为数据字典中的 __current_time__"""
+        try:
+            timestamp = int(current_time)
+            # 判断时间戳精度（秒级或毫秒级）
+            if timestamp > 1e10:  # 毫秒级时间戳
+                dt = datetime.datetime.fromtimestamp(timestamp / 1000)
+            else:  # 秒级时间戳
+                dt = datetime.datetime.fromtimestamp(timestamp)
                 
-                # 保存基准指数数据
-                benchmark_code = self.config.config_dict["backtest"]["benchmark"]
-                try:
-                    # 先下载数据确保可用
-                    xtdata.download_history_data(
-                        stock_code=benchmark_code,
-                        period="1d",
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
+            return {
+                "timestamp": timestamp,
+                "datetime": dt.strftime("%Y-%m-%d %H:%M:%S"),
+                "date": dt.strftime("%Y-%m-%d"),
+                "time": dt.strftime("%H:%M:%S"),
+                "raw_time": current_time
+            }
+        except Exception as e:
+            # 如果转换失败，使用原始时间戳
+            return {
+                "timestamp": current_time,
+                "datetime": str(current_time),
+                "date": str(current_time),
+                "time": str(current_time),
+                "raw_time": current_time
+            }
+    
+    def _build_bar_data(self, current_time, time_info: Dict, lanes: List[KhStrategyLane]):
+        """构造一个时间点的数据视图，同时按持仓簿编号填充价格行 self._bar_prices
+        
+        Returns:
+            tuple: (current_data, bar_context)，current_data 为 {股票代码: 行 Series}，含 __current_time__
+        """
+        # 创建包含__current_time__的字典结构
+        current_data = {"__current_time__": time_info}
+        
+        # 直接添加数据引用，而不是转换为字典
+        bar_prices = self._bar_prices
+        bar_prices.fill(np.nan)
+        bar_context = self._bar_schema.new_bar(lanes[0].trade_mgr.positions, lanes[0].trade_mgr.assets)
+        bar_rows = bar_context.rows
+        for code in self.historical_data_ref:
+            if code in self.time_field_cache and code in self.time_idx_cache:
+                time_idx_map = self.time_idx_cache[code]
+                df = self.historical_data_ref[code]
+                
+                # 尝试直接匹配当前时间
+                if current_time in time_idx_map:
+                    idx = time_idx_map[current_time]
+                    # 直接存储行引用，而不是转换为字典
+                    current_data[code] = df.iloc[idx]
+                    sid, close_values, slot = self._close_columns[code]
+                    bar_rows[slot] = idx
+                    if close_values is not None:
+                        bar_prices[sid] = close_values[idx]
+                else:
+                    # 尝试处理精度不一致问题
+                    matched = False
+                    idx = -1
                     
-                    benchmark_data = xtdata.get_market_data(
-                        field_list=['close'],
-                        stock_list=[benchmark_code],
-                        period='1d',
-                        start_time=self.config.backtest_start,
-                        end_time=self.config.backtest_end,
-                    )
+                    if isinstance(current_time, (int, float)):
+                        # 处理毫秒/秒的转换
+                        if current_time > 1e10:  # 毫秒级
+                            sec_time = current_time // 1000
+                            if sec_time in time_idx_map:
+                                idx = time_idx_map[sec_time]
+                                matched = True
+                        else:  # 秒级
+                            ms_time = current_time * 1000
+                            if ms_time in time_idx_map:
+                                idx = time_idx_map[ms_time]
+                                matched = True
                     
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(
-                            f"基准数据获取结果: {benchmark_data.keys()}", 
-                            "INFO"
-                        )
-
-                    if benchmark_data and 'close' in benchmark_data and len(benchmark_data['close']) > 0:
-                        closes = benchmark_data['close'].values[0]  # 获取收盘价数据
-                        if len(closes) > 0:
-                            # 直接从benchmark_data中获取日期数据
-                            # 获取交易日期索引
-                            if 'date' in benchmark_data:
-                                dates = benchmark_data['date'][0]  # 使用benchmark_data中的日期
-                            elif hasattr(benchmark_data, 'index') and benchmark_data.index is not None and not isinstance(benchmark_data.index, pd.RangeIndex):
-                                dates = benchmark_data.index  # 有些情况下日期可能在索引中
-                            elif hasattr(benchmark_data['close'], 'columns') and len(benchmark_data['close'].columns) > 0:
-                                # 从columns中获取日期（日期作为列名出现的情况）
-                                date_cols = [col for col in benchmark_data['close'].columns if str(col).isdigit()]
-                                if date_cols:
-                                    # 将列名转换为日期对象
-                                    dates = pd.to_datetime(date_cols, format='%Y%m%d')
-                                    # 确保closes的顺序与dates匹配
-                                    closes = np.array([benchmark_data['close'].iloc[0][col] for col in date_cols])
-                                else:
-                                    # 如果没有日期数据，才使用日期范围（不推荐）
-                                    self.trader_callback.gui.log_message(
-                                        "警告：基准数据中没有日期信息，将使用日期范围替代，可能不准确",
-                                        "WARNING"
-                                    )
-                                    dates = pd.date_range(
-                                        start=pd.to_datetime(self.config.backtest_start, format='%Y%m%d'),
-                                        end=pd.to_datetime(self.config.backtest_end, format='%Y%m%d'),
-                                        freq='B'  # 使用工作日频率
-                                    )
-                                
-                                # 创建包含日期和收盘价的DataFrame
-                                df = pd.DataFrame({
-                                    'date': dates,
-                                    'close': closes
-                                })
-                                
-                                # 保存到benchmark.csv
-                                benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
-                                df.to_csv(benchmark_file, index=False)
-                                
-                                if self.trader_callback:
-                                    self.trader_callback.gui.log_message(
-                                        f"基准指数数据已保存到 {benchmark_file}, 共 {len(df)} 条记录",
-                                        "INFO"
-                                    )
-                        else:
-                            if self.trader_callback:
-                                self.trader_callback.gui.log_message(f"基准指数 {benchmark_code} 收盘价数据为空", "WARNING")
+                    if matched:
+                        # 直接存储行引用
+                        current_data[code] = df.iloc[idx]
+                        sid, close_values, slot = self._close_columns[code]
+                        bar_rows[slot] = idx
+                        if close_values is not None:
+                            bar_prices[sid] = close_values[idx]
                     else:
-                        if self.trader_callback:
-                            self.trader_callback.gui.log_message(f"基准指数 {benchmark_code} 数据获取失败", "WARNING")
-                except Exception as e:
-                    if self.trader_callback:
-                        self.trader_callback.gui.log_message(f"获取基准指数数据时出错: {str(e)}", "ERROR")
-                    logging.error(f"获取基准指数数据时出错: {str(e)}", exc_info=True)
-                
-                # 保存回测配置信息
-                config_info = {
-                    'start_time': self.backtest_records['start_time'],
-                    'end_time': self.backtest_records['end_time'],
-                    'init_capital': self.backtest_records['init_capital'],
-                    'benchmark': self.config.config_dict["backtest"]["benchmark"],
-                    'strategy_file': self.config.config_dict.get("strategy_file", ""),  # 从配置字典中获取策略文件路径
-                    'actual_start_time': datetime.datetime.fromtimestamp(self.start_time).strftime("%Y-%m-%d %H:%M:%S") if self.start_time else "",
-                    'actual_end_time': datetime.datetime.fromtimestamp(self.end_time).strftime("%Y-%m-%d %H:%M:%S") if self.end_time else "",
-                    'total_runtime_seconds': self.total_runtime,
-                    'total_runtime_formatted': self._format_runtime(self.total_runtime)
-                }
-                pd.DataFrame([config_info]).to_csv(os.path.join(backtest_dir, "config.csv"), index=False, encoding='utf-8-sig')
-                
-                if self.trader_callback:
-                    self.trader_callback.gui.log_message(
-                        f"回测记录已保存到目录: {backtest_dir}", 
-                        "INFO"
-                    )
-                    # 记录回测总耗时
+                        # 没有匹配的数据，存储空Series
+                        current_data[code] = pd.Series({})
+            else:
+                # 没有时间字段的情况
+                current_data[code] = pd.Series({})
+        return current_data, bar_context
+    
+    def _log_data_sample(self, current_data: Dict):
+        """在界面日志中显示第一个股票的数据示例"""
+        if not self.trader_callback or not current_data:
+            return
+        # 获取第一个股票代码
+        first_stock = None
+        for code in current_data:
+            if code != "__current_time__":
+                first_stock = code
+                break
+        
+        if first_stock:
+            sample_data = current_data[first_stock]
+            self.trader_callback.gui.log_message(f"数据样例 - 股票: {first_stock}, 字段: {list(sample_data.keys())}", "INFO")
+            # 打印每个字段的值（最多显示5个字段）
+            sample_str = ""
+            count = 0
+            for key, value in sample_data.items():
+                if count < 5:
+                    sample_str += f"{key}: {value}, "
+                    count += 1
+            if sample_str:
+                self.trader_callback.gui.log_message(f"部分字段值: {sample_str[:-2]}", "INFO")
+    
+    def _lane_bar_data(self, lane: KhStrategyLane, lanes: List[KhStrategyLane], current_data: Dict,
+                       bar_context: KhBarContext, stock_codes) -> Dict:
+        """切换到策略通道并准备其数据字典：行情与时间信息共享，账户、持仓与逐 bar 上下文各策略独立"""
+        if len(lanes) == 1:
+            lane_data = current_data
+            lane_bar = bar_context
+        else:
+            self._activate_lane(lane)
+            lane_data = current_data.copy()
+            lane_bar = bar_context if lane is lanes[0] else KhBarContext(
+                lane.bar_schema, bar_context.rows, lane.trade_mgr.positions, lane.trade_mgr.assets)
+            if lane.bar_schema is not self._bar_schema:
+                # 该策略有自己的指标列：按相同行号从其行情中取行
+                rows = bar_context.rows
+                for code, slot in lane.bar_schema.code_index.items():
+                    if rows[slot] >= 0:
+                        lane_data[code] = lane.historical_data[code].iloc[rows[slot]]
+        
+        # 添加账户、持仓与股票池信息到数据字典
+        lane_data["__account__"] = self.trade_mgr.assets
+        lane_data["__positions__"] = self.trade_mgr.positions
+        lane_data["__stock_list__"] = stock_codes
+        # 逐 bar 紧凑上下文（供 khPrice/khGet/khHas 快速取值）
+        lane_data["__bar__"] = lane_bar
+        return lane_data
+    
+    def _run_post_market(self, lane: KhStrategyLane, time_info: Dict, post_market_time: str, stock_codes):
+        """执行策略通道的盘后回调：使用 lane.day_data（当天最后一个时间点的数据），时间改为盘后时间"""
+        profiler = self.profiler
+        try:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"执行盘后回调 - 日期: {lane.current_date}", "INFO")
+        
+            # 设置时间信息为盘后时间
+            post_time_info = time_info.copy()
+            post_time_info["time"] = post_market_time
+            post_time_info["datetime"] = f"{lane.current_date} {post_market_time}"
+        
+            # 使用最后一个时间点的数据或创建一个完整的数据结构
+            post_data = lane.day_data.copy() if lane.day_data else {}
+            post_data["__current_time__"] = post_time_info
+        
+            # 添加账户和持仓信息到数据字典
+            post_data["__account__"] = self.trade_mgr.assets
+            post_data["__positions__"] = self.trade_mgr.positions
+            post_data["__stock_list__"] = stock_codes
+        
+            # 添加框架实例到数据字典
+            post_data["__framework__"] = self
+        
+            # 执行盘后回调
+            callback_start = profiler.clock()
+            post_signals = self.strategy_module.khPostMarket(post_data)
+            profiler.record_callback("khPostMarket", profiler.clock() - callback_start, lane.name)
+        
+            # 处理盘后回调产生的信号
+            if post_signals:
+                for signal in post_signals:
+                    if 'price' in signal:
+                        signal['price'] = round(float(signal['price']), 2)
+                    signal['timestamp'] = time_info["timestamp"]
+            
+                # 发送交易指令
+                self.trade_mgr.process_signals(post_signals)
+        except Exception as e:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"执行盘后回调时出错: {str(e)}", "ERROR")
+    
+    def _run_pre_market(self, lane: KhStrategyLane, lane_data: Dict, time_info: Dict, pre_market_time: str, stock_codes):
+        """执行策略通道的盘前回调：使用当天第一个时间点的数据，时间改为盘前时间"""
+        profiler = self.profiler
+        try:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"执行盘前回调 - 日期: {lane.current_date}", "INFO")
+        
+            # 设置时间信息为盘前时间
+            pre_time_info = time_info.copy()
+            pre_time_info["time"] = pre_market_time
+            pre_time_info["datetime"] = f"{lane.current_date} {pre_market_time}"
+        
+            # 使用当前时间点的数据或创建一个完整的数据结构
+            pre_data = lane_data.copy()
+            pre_data["__current_time__"] = pre_time_info
+        
+            # 确保包含账户和持仓信息
+            pre_data["__account__"] = self.trade_mgr.assets
+            pre_data["__positions__"] = self.trade_mgr.positions
+            pre_data["__stock_list__"] = stock_codes
+        
+            # 添加框架实例到数据字典
+            pre_data["__framework__"] = self
+        
+            # 执行盘前回调
+            callback_start = profiler.clock()
+            pre_signals = self.strategy_module.khPreMarket(pre_data)
+            profiler.record_callback("khPreMarket", profiler.clock() - callback_start, lane.name)
+        
+            # 处理盘前回调产生的信号
+            if pre_signals:
+                for signal in pre_signals:
+                    if 'price' in signal:
+                        signal['price'] = round(float(signal['price']), 2)
+                    signal['timestamp'] = time_info["timestamp"]
+            
+                # 发送交易指令
+                self.trade_mgr.process_signals(pre_signals)
+        except Exception as e:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"执行盘前回调时出错: {str(e)}", "ERROR")
+    
+    def _handle_lane_bar(self, lane: KhStrategyLane, lane_data: Dict, current_time, time_stats: Dict,
+                         daily_stats: Optional[bool] = None):
+        """触发后的处理：风控检查、交易日与空数据检查，调用策略 khHandlebar，发送交易指令并记录结果
+        
+        Args:
+            daily_stats: 传给 record_results，None 表示由其自行判断是否为当天最后一个时间点
+        """
+        profiler = self.profiler
+        clock = profiler.clock
+        
+        # 风控检查
+        risk_start = clock()
+        if not self.risk_mgr.check_risk(lane_data):
+            time_stats["风控检查"] += clock() - risk_start
+            return
+        time_stats["风控检查"] += clock() - risk_start
+    
+        # 检查是否是交易日
+        current_date_str = lane_data.get("__current_time__", {}).get("date", "")
+        if current_date_str and not self.tools.is_trade_day(current_date_str):
+            # 如果不是交易日，跳过策略调用
+            return
+    
+        # 添加框架实例到数据字典
+        lane_data["__framework__"] = self
+    
+        # 检查股票数据是否为空
+        stock_data_empty = True
+        empty_stocks = []
+        for key, value in lane_data.items():
+            # 跳过框架内部字段
+            if key.startswith("__"):
+                continue
+            # 检查股票数据是否为空
+            if isinstance(value, pd.Series) and not value.empty:
+                stock_data_empty = False
+            elif isinstance(value, pd.Series) and value.empty:
+                empty_stocks.append(key)
+            elif not value:  # 处理其他空值情况
+                empty_stocks.append(key)
+    
+        # 如果所有股票数据都为空，记录错误并跳过策略调用
+        if stock_data_empty:
+            current_time_str = lane_data.get("__current_time__", {}).get("datetime", str(current_time))
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"警告: 时间点 {current_time_str} 的所有股票数据为空，跳过策略调用", 
+                    "WARNING"
+                )
+                if empty_stocks:
                     self.trader_callback.gui.log_message(
-                        f"回测总耗时: {self._format_runtime(self.total_runtime)}", 
-                        "INFO"
+                        f"空数据股票列表: {', '.join(empty_stocks[:10])}" + 
+                        (f" 等{len(empty_stocks)}只股票" if len(empty_stocks) > 10 else ""),
+                        "WARNING"
                     )
-                
-            except Exception as e:
+            return
+    
+        # 如果有部分股票数据为空，记录警告但继续执行
+        if empty_stocks:
+            current_time_str = lane_data.get("__current_time__", {}).get("datetime", str(current_time))
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"警告: 时间点 {current_time_str} 有 {len(empty_stocks)} 只股票数据为空: {', '.join(empty_stocks[:5])}" + 
+                    (f" 等" if len(empty_stocks) > 5 else ""),
+                    "WARNING"
+                )
+    
+        # 调用策略处理
+        strategy_start = clock()
+        signals = self.strategy_module.khHandlebar(lane_data)
+        strategy_elapsed = clock() - strategy_start
+        time_stats["策略处理"] += strategy_elapsed
+        profiler.record_callback("khHandlebar", strategy_elapsed, lane.name)
+    
+        # 处理信号中的价格精度
+        signal_process_start = clock()
+        if signals:
+            for signal in signals:
+                if 'price' in signal:
+                    # 确保价格保留到0.01
+                    signal['price'] = round(float(signal['price']), 2)
+                # 添加当前回测时间戳
+                signal['timestamp'] = current_time
+        time_stats["处理信号"] += clock() - signal_process_start
+    
+        # 发送交易指令
+        trade_start = clock()
+        if signals:
+            self.trade_mgr.process_signals(signals)
+        time_stats["交易指令"] += clock() - trade_start
+    
+        # 记录结果
+        record_start = clock()
+        self.record_results(current_time, lane_data, signals, daily_stats)
+        time_stats["记录结果"] += clock() - record_start
+    
+    def _run_event_loop(self, scheduler: KhEventScheduler, lanes: List[KhStrategyLane], stock_codes,
+                        time_stats: Dict, pre_market_time: str, post_market_time: str,
+                        checkpoint: KhCheckpointStore, checkpoint_fingerprint, backtest_dir_name):
+        """事件调度模式的回测循环：按顺序处理盘前回调、触发时间点、收盘估值与盘后回调事件
+        
+        只为事件所在的时间点构造数据，同一时间点的多个事件共用一份；未触发的时间点不做任何处理。
+        盘后回调在当天收盘估值之后、使用当天最后一个时间点的数据执行，与最后一个交易日的处理方式相同。
+        
+        Returns:
+            tuple: (已处理的事件数, 事件总数)
+        """
+        profiler = self.profiler
+        clock = profiler.clock
+        timeline = scheduler.timeline
+        all_times = timeline.times
+        total_events = len(scheduler)
+        processed_events = 0
+        progress_increment = max(1, int(total_events / 100)) if total_events > 100 else 1
+        
+        built_index = -1
+        current_data = bar_context = time_info = None
+        current_day = None
+        days_since_checkpoint = 0
+        for event in scheduler.queue():
+            loop_start_time = clock()
+            
+            if not self.is_running:
                 if self.trader_callback:
-                    self.trader_callback.gui.log_message(f"保存回测记录时出错: {str(e)}", "ERROR")
-                logging.error(f"保存回测记录时出错: {str(e)}", exc_info=True)
-                
+                    self.trader_callback.gui.log_message("回测被中止", "WARNING")
+                break
+            
+            processed_events += 1
+            if self.trader_callback and (processed_events <= 5 or processed_events % progress_increment == 0
+                                         or processed_events == total_events):
+                progress = (processed_events / total_events) * 100
+                self.trader_callback.gui.log_message(f"回测进度: {progress:.2f}%", "INFO")
+            
+            # 构造事件所在时间点的数据（同一时间点上的多个事件共用）
+            current_time = all_times[event.index]
+            if event.index != built_index:
+                time_info_start = clock()
+                time_info = self._make_time_info(current_time)
+                time_stats["构造时间信息"] += clock() - time_info_start
+                
+                data_start_time = clock()
+                current_data, bar_context = self._build_bar_data(current_time, time_info, lanes)
+                time_stats["构造数据"] += clock() - data_start_time
+                if built_index < 0:
+                    self._log_data_sample(current_data)
+                built_index = event.index
+            
+            # 交易日切换：保存断点快照（快照位于该交易日第一个时间点之前），更新各策略的当前日期并清零风控的当日委托计数
+            new_day_start = clock()
+            if event.day != current_day:
+                day_start_index = int(timeline.day_starts[event.day])
+                if checkpoint.enabled and current_day is not None:
+                    days_since_checkpoint += 1
+                    if days_since_checkpoint >= checkpoint.interval_days:
+                        self._save_checkpoint(checkpoint, backtest_dir_name, checkpoint_fingerprint, lanes, day_start_index)
+                        days_since_checkpoint = 0
+                current_day = event.day
+                for lane in lanes:
+                    lane.current_date = timeline.dates[event.day]
+                    lane.day_start_time = int(all_times[day_start_index])
+                    lane.risk_mgr.on_new_day(lane.current_date)
+            time_stats["检查新日期"] += clock() - new_day_start
+            
+            triggered = None
+            for lane in lanes:
+                lane_data = self._lane_bar_data(lane, lanes, current_data, bar_context, stock_codes)
+                
+                if event.kind == BAR:
+                    if scheduler.check_each_bar:
+                        # 触发器无法预先判断时逐个时间点判断，同一时间点只判断一次
+                        trigger_start = clock()
+                        if triggered is None:
+                            triggered = self.trigger.should_trigger(current_time, lane_data)
+                        time_stats["触发器检查"] += clock() - trigger_start
+                        if not triggered:
+                            continue
+                    self._handle_lane_bar(lane, lane_data, current_time, time_stats, daily_stats=False)
+                
+                elif event.kind == DAY_CLOSE:
+                    # 收盘估值：按当天最后一个时间点的价格估值并记录每日统计
+                    lane.day_data = lane_data
+                    record_start = clock()
+                    self.record_results(current_time, lane_data, None, daily_stats=True)
+                    time_stats["记录结果"] += clock() - record_start
+                
+                elif event.kind == PRE_MARKET:
+                    lane.day_data = lane_data
+                    if hasattr(self.strategy_module, 'khPreMarket'):
+                        pre_market_start = clock()
+                        self._run_pre_market(lane, lane_data, time_info, pre_market_time, stock_codes)
+                        time_stats["盘前回调"] += clock() - pre_market_start
+                
+                elif event.kind == POST_MARKET:
+                    if hasattr(self.strategy_module, 'khPostMarket'):
+                        post_market_start = clock()
+                        self._run_post_market(lane, time_info, post_market_time, stock_codes)
+                        time_stats["盘后回调"] += clock() - post_market_start
+            
+            # 累计总时间
+            time_stats["总时间"] += clock() - loop_start_time
+            if profiler.enabled:
+                profiler.end_bar(time_stats)
+        
+        return processed_events, total_events
+    
+    def _checkpoint_fingerprint(self, lanes: List[KhStrategyLane], stock_codes, period: str, all_times) -> Dict:
+        """断点快照的回测指纹：区间、股票池、数据周期、触发方式、策略源码、影响结果的配置与时间轴一致时
+        快照才可用于续跑（修改策略代码或交易成本、风控、撮合等设置后从头回测，不与旧快照的结果混在一起）"""
+        return {
+            'start_time': self.config.backtest_start,
+            'end_time': self.config.backtest_end,
+            'init_capital': self.config.config_dict["backtest"]["init_capital"],
+            'stock_codes': list(stock_codes),
+            'period': period,
+            'trigger': type(self.trigger).__name__,
+            'strategies': [lane.strategy_file for lane in lanes],
+            'strategy_digests': [file_digest(lane.strategy_file) for lane in lanes],
+            'config': result_config(self.config.config_dict),
+            'times': (len(all_times), all_times[0], all_times[-1]),
+        }
+    
+    def _save_checkpoint(self, store: KhCheckpointStore, name: str, fingerprint: Dict,
+                         lanes: List[KhStrategyLane], index: int):
+        """把各策略的账户、持仓、委托/成交、风控、回测记录以及触发器状态写入断点快照"""
+        start = time.time()
+        lane_states = []
+        for lane in lanes:
+            save_state = getattr(lane.strategy_module, 'khSaveState', None)
+            lane_states.append({
+                **self._account_state(lane),
+                'risk': {key: value for key, value in vars(lane.risk_mgr).items() if key != 'config'},
+                'current_date': lane.current_date,
+                'day_start_time': lane.day_start_time,
+                # 前一交易日最后一个时间点的行情（续跑后执行该日盘后回调时使用），账户等引用在回调时重新填入
+                'day_data': {key: value for key, value in (lane.day_data or {}).items()
+                             if not key.startswith('__') or key == '__current_time__'},
+                'strategy': save_state() if save_state is not None else None,
+            })
+        state = {
+            'index': index,
+            'trigger': {key: value for key, value in vars(self.trigger).items() if key != 'framework'},
+            'lanes': lane_states,
+        }
+        try:
+            size = store.save(name, fingerprint, state)
         except Exception as e:
-            error_msg = "回测运行异常: " + str(e)
-            logging.error(error_msg, exc_info=True)
-            # 调用错误回调函数
+            logging.error(f"保存回测断点失败: {str(e)}", exc_info=True)
+            return
+        logging.info(f"已保存回测断点: 第 {index} 个时间点，{size / 1024:.1f} KB，耗时 {time.time() - start:.3f} 秒")
+    
+    def _account_state(self, lane: KhStrategyLane) -> Dict:
+        """策略通道的账户、持仓、委托/成交与回测记录（断点快照与结果缓存共用）"""
+        trade_mgr = lane.trade_mgr
+        return {
+            'string_pool': trade_mgr.string_pool,
+            'assets': dict(trade_mgr.assets),
+            'positions': trade_mgr.positions,
+            'orders': trade_mgr.orders,
+            'trades': trade_mgr.trades,
+            'records': lane.backtest_records,
+        }
+    
+    def _apply_account_state(self, lane: KhStrategyLane, state: Dict):
+        """把 _account_state 保存的状态装回策略通道（资产字典与持仓簿原地更新）"""
+        trade_mgr = lane.trade_mgr
+        trade_mgr.string_pool = state['string_pool']
+        trade_mgr.orders = state['orders']
+        trade_mgr.trades = state['trades']
+        trade_mgr.assets.clear()
+        trade_mgr.assets.update(state['assets'])
+        vars(trade_mgr.positions).update(vars(state['positions']))
+        lane.backtest_records = state['records']
+    
+    def _restore_checkpoint(self, state: Dict, lanes: List[KhStrategyLane]) -> int:
+        """从断点快照恢复各策略状态，返回继续回测的时间点下标
+        
+        资产字典与持仓簿原地更新，策略在 init 中保存的引用仍然有效。
+        """
+        vars(self.trigger).update(state['trigger'])
+        for lane, lane_state in zip(lanes, state['lanes']):
+            self._apply_account_state(lane, lane_state)
+            vars(lane.risk_mgr).update(lane_state['risk'])
+            lane.current_date = lane_state['current_date']
+            lane.day_start_time = lane_state['day_start_time']
+            lane.day_data = lane_state['day_data']
+            load_state = getattr(lane.strategy_module, 'khLoadState', None)
+            if load_state is not None and lane_state['strategy'] is not None:
+                load_state(lane_state['strategy'])
+            elif load_state is None:
+                logging.warning(f"策略 {lane.name} 未实现 khSaveState/khLoadState，续跑时策略内部状态从 init 之后开始")
+        self._activate_lane(lanes[0])
+        return state['index']
+    
+    def _run_vectorized_backtest(self, historical_data: Dict, period: str):
+        """向量化回测：调用策略的 khSignals(panel) 得到目标持仓矩阵，再按矩阵模拟成交与记账
+        
+        panel 与 khPrecompute 相同（含 PRECOMPUTE_WARMUP 预热K线）。khSignals 返回：
+            - DataFrame：索引为时间（与行情 time 字段一致），列为股票代码；或
+            - {股票代码: 数组}：数组与 panel 中对应 DataFrame 逐行对齐
+        目标整体后移一根K线执行（第 i 根K线的目标在第 i+1 根K线成交），成交价取 SIGNALS_PRICE_FIELD
+        （默认 open）字段。目标的含义由 SIGNALS_TARGET 决定："weight"（占总资产比例，默认）或 "volume"（股数）。
+        成交、每日统计写入 self.backtest_records，结果文件与逐 bar 回测相同。
+        
+        Args:
+            historical_data: 已加载的历史数据 {股票代码: DataFrame}
+            period: 数据周期
+        """
+        start = time.time()
+        strategy = self.strategy_module
+        if self.trade_mgr.risk_mgr is not None or self.trade_mgr.matcher is not None:
+            message = "向量化回测不执行交易前风控与撮合模拟，委托按 成交价±滑点 全部成交"
+            logging.warning(message)
             if self.trader_callback:
-                self.trader_callback.gui.log_message(error_msg, "ERROR")
-                import traceback
-                self.trader_callback.gui.log_message(f"错误详情:\n{traceback.format_exc()}", "ERROR")
-            raise  # 重新抛出异常
+                self.trader_callback.gui.log_message(message, "WARNING")
+        
+        # 回测时间轴（只保留交易日）
+        close_frame = panel_matrix(historical_data, 'close')
+        times = []
+        dates = []
+        for t in close_frame.index:
+            ts = float(t)
+            dt = datetime.datetime.fromtimestamp(ts / 1000 if ts > 1e10 else ts)
+            date_str = dt.strftime("%Y-%m-%d")
+            if self.tools.is_trade_day(date_str):
+                times.append(t)
+                dates.append(dt)
+        if not times:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message("错误: 没有找到任何有效的时间点，无法进行回测", "ERROR")
+            return
+        codes = list(close_frame.columns)
+        close_frame = close_frame.reindex(times)
+        price_field = getattr(strategy, 'SIGNALS_PRICE_FIELD', 'open')
+        if not all(price_field in df.columns for df in historical_data.values()):
+            logging.warning(f"行情数据中没有 {price_field} 字段，向量化回测按收盘价成交")
+            price_field = 'close'
+        exec_frame = panel_matrix(historical_data, price_field).reindex(index=times, columns=codes)
+        
+        # 目标持仓矩阵
+        panel, _ = self._build_strategy_panel(historical_data, period)
+        try:
+            callback_start = self.profiler.clock()
+            raw_targets = strategy.khSignals(panel)
+            self.profiler.record_callback("khSignals", self.profiler.clock() - callback_start)
+        except Exception as e:
+            raise RuntimeError(f"策略 khSignals 执行失败: {str(e)}") from e
+        targets = self._align_vector_targets(raw_targets, panel, times, codes)
+        
+        engine = KhVectorBacktest(self.trade_mgr.cost_model, self.backtest_records['init_capital'],
+                                  getattr(strategy, 'SIGNALS_TARGET', 'weight'))
+        result = engine.run(codes, [dt.date() for dt in dates], exec_frame.to_numpy(dtype=np.float64),
+                            close_frame.to_numpy(dtype=np.float64), targets)
+        
+        # 成交记录
+        trades = result.trades
+        columns = {name: values for name, values in trades.items() if name != 'row'}
+        columns['datetime'] = np.array(dates, dtype='M8[us]')[trades['row']]
+        self.backtest_records['trades'].extend_columns(columns)
+        
+        # 每日统计
+        init_capital = self.backtest_records['init_capital']
+        benchmark_code = self.config.config_dict["backtest"]["benchmark"]
+        prev_asset = init_capital
+        for day in result.daily:
+            current_date = day['date']
+            total_asset = day['total_asset']
+            benchmark_close = None
+            if self.benchmark_series is not None:
+                benchmark_close = self.benchmark_series.close_on(current_date.strftime("%Y%m%d"), benchmark_code)
+            positions_snapshot = {}
+            for code, (volume, price, avg_price) in day['positions'].items():
+                positions_snapshot[code] = {
+                    'volume': volume,
+                    'price': price,
+                    'avg_price': avg_price,
+                    'market_value': price * volume,
+                    'profit': (price - avg_price) * volume,
+                    'profit_ratio': (price - avg_price) / avg_price if avg_price > 0 else 0.0
+                }
+            self.backtest_records['daily_stats'].append({
+                'date': current_date,
+                'total_asset': total_asset,
+                'cash': day['cash'],
+                'market_value': day['market_value'],
+                'daily_return': (total_asset - prev_asset) / prev_asset if prev_asset != 0 else 0,
+                'benchmark_close': benchmark_close,
+                'positions': positions_snapshot
+            })
+            if benchmark_close is not None:
+                self.backtest_records['benchmark_data'].append({'date': current_date, 'close': benchmark_close})
+            prev_asset = total_asset
+        
+        # 回测结束时的账户状态
+        positions = self.trade_mgr.positions
+        positions.clear()
+        for i in np.nonzero(result.volumes > 0)[0]:
+            price = result.last_prices[i] if result.last_prices[i] > 0 else result.avg_prices[i]
+            positions[codes[i]] = {
+                "account_id": self.config.account_id,
+                "stock_code": codes[i],
+                "volume": int(result.volumes[i]),
+                "can_use_volume": int(result.volumes[i]),
+                "open_price": float(result.avg_prices[i]),
+                "avg_price": float(result.avg_prices[i]),
+                "current_price": float(price),
+                "market_value": float(price * result.volumes[i]),
+            }
+        market_value = result.daily[-1]['market_value'] if result.daily else 0.0
+        self.trade_mgr.assets.update({
+            'cash': result.cash,
+            'market_value': market_value,
+            'total_asset': result.cash + market_value
+        })
+        
+        message = (f"向量化回测完成: {len(times)}个时间点 × {len(codes)}只股票，成交 {result.trade_count} 笔，"
+                   f"耗时 {time.time() - start:.2f} 秒")
+        logging.info(message)
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(message, "INFO")
+    
+    def _align_vector_targets(self, raw_targets, panel: Dict, times: List, codes: List[str]) -> np.ndarray:
+        """把 khSignals 的返回值对齐到回测时间轴，并整体后移一根K线（时间 × 股票，无目标为 NaN）"""
+        if isinstance(raw_targets, pd.DataFrame):
+            frame = raw_targets
+        else:
+            columns = {}
+            for code, values in (raw_targets or {}).items():
+                df = panel.get(code)
+                values = np.asarray(values, dtype=np.float64)
+                if df is None or 'time' not in df.columns or values.ndim != 1 or len(values) != len(df):
+                    logging.warning(f"khSignals 返回的 {code} 目标与 panel 数据无法对齐，已忽略")
+                    continue
+                series = pd.Series(values, index=df['time'].to_numpy())
+                columns[code] = series[~series.index.duplicated(keep='last')]
+            frame = pd.DataFrame(columns)
+        unknown = [code for code in frame.columns if code not in codes]
+        if unknown:
+            logging.warning(f"khSignals 返回了不在股票池中的代码: {unknown[:10]}")
+        # 在完整时间轴（含预热K线）上后移一根K线，再截取回测区间
+        panel_times = {t for df in panel.values() if 'time' in df.columns for t in df['time'].to_numpy()}
+        panel_times = sorted(panel_times.union(frame.index))
+        frame = frame.reindex(index=panel_times, columns=codes).astype(np.float64).shift(1)
+        return frame.reindex(times).to_numpy(dtype=np.float64)
+    
+    def _lane_dir_name(self, lane: KhStrategyLane) -> str:
+        """策略通道的回测结果目录名（策略名_开始日期_结束日期）"""
+        return f"{lane.name}_{self.config.backtest_start}_{self.config.backtest_end}"
+    
+    def _finish_lanes(self, lanes: List[KhStrategyLane], backtest_dir, backtest_dir_name):
+        """保存各策略通道的回测结果：其它策略先写入各自目录，主策略最后保存并通知界面"""
+        for lane in lanes[1:]:
+            self._activate_lane(lane)
+            lane_dir_name = self._lane_dir_name(lane)
+            self._finish_backtest(os.path.join("backtest_results", lane_dir_name), lane_dir_name,
+                                  notify=False, strategy_file=lane.strategy_file)
+        self._activate_lane(lanes[0])
+        self._finish_backtest(backtest_dir, backtest_dir_name)
+    
+    def _notify_backtest_finished(self, backtest_dir):
+        """通知界面回测完成并显示回测结果"""
+        if self.trader_callback:
+            # 先停止策略并更新状态
+            self.is_running = False
+            self.trader_callback.gui.on_strategy_finished()
+            
+            # 显示100%进度
+            self.trader_callback.gui.log_message("回测进度: 100.00%", "INFO")
+            
+            # 然后再显示回测结果
+            self.trader_callback.gui.log_message("回测完成", "INFO")
+            QMetaObject.invokeMethod(
+                self.trader_callback.gui, 
+                "show_backtest_result", 
+                Qt.QueuedConnection,
+                Q_ARG(str, backtest_dir)
+            )
+    
+    def _finish_backtest(self, backtest_dir, backtest_dir_name, notify=True, strategy_file=None):
+        """回测结束：通知界面显示结果，并把交易记录、每日统计、基准与配置信息写入回测目录
+        
+        Args:
+            notify: 是否通知界面回测完成（多策略回测中只有主策略通知）
+            strategy_file: 写入 config.csv 的策略文件路径，默认取配置中的主策略
+        """
+        if strategy_file is None:
+            strategy_file = self.config.config_dict.get("strategy_file", "")
+        
+        # 回测完成后发送信号
+        if notify:
+            self._notify_backtest_finished(backtest_dir)
+            
+        # 在回测完成后保存回测记录
+        try:
+            # 获取策略文件名（不含路径和扩展名）
+            strategy_name = os.path.splitext(os.path.basename(strategy_file))[0] if strategy_file else "unknown"
+            
+            # 生成回测时间戳
+            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            
+            # 创建当前回测的子目录（包含策略名）
+            backtest_dir = os.path.join(
+                "backtest_results",
+                backtest_dir_name
+            )
+
+            # 如果目录已存在，先删除
+            if os.path.exists(backtest_dir):
+                shutil.rmtree(backtest_dir)
+
+            # 创建新目录
+            os.makedirs(backtest_dir)
+
+            # 保存交易记录
+            trades_df = self.backtest_records['trades'].to_dataframe()
+            if len(trades_df) > 0:
+                trades_df.to_csv(os.path.join(backtest_dir, "trades.csv"), index=False, encoding='utf-8-sig')
+            else:
+                # 创建一个包含列名但没有数据的空DataFrame
+                empty_trades_df = pd.DataFrame(columns=[
+                    'datetime', 'code', 'action', 'price', 'volume', 'amount',
+                    'commission', 'stamp_tax', 'transfer_fee', 'flow_fee',
+                    'total_asset', 'cash', 'market_value'
+                ])
+                empty_trades_df.to_csv(os.path.join(backtest_dir, "trades.csv"), index=False, encoding='utf-8-sig')
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message("回测期间没有产生交易记录", "WARNING")
+
+            # 保存每日统计数据
+            daily_stats_df = pd.DataFrame(self.backtest_records['daily_stats'])
+            if len(daily_stats_df) > 0:
+                daily_stats_df.to_csv(os.path.join(backtest_dir, "daily_stats.csv"), index=False, encoding='utf-8-sig')
+            else:
+                # 创建一个包含列名但没有数据的空DataFrame
+                empty_stats_df = pd.DataFrame(columns=[
+                    'date', 'total_asset', 'cash', 'market_value', 
+                    'daily_return', 'benchmark_close', 'positions'
+                ])
+                empty_stats_df.to_csv(os.path.join(backtest_dir, "daily_stats.csv"), index=False, encoding='utf-8-sig')
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message("回测期间没有产生每日统计数据", "WARNING")
+            
+            # 保存基准指数数据（直接使用回测开始时加载的基准序列）
+            self._save_benchmark_files(backtest_dir, daily_stats_df)
+            
+            # 保存回测配置信息
+            config_info = {
+                'start_time': self.backtest_records['start_time'],
+                'end_time': self.backtest_records['end_time'],
+                'init_capital': self.backtest_records['init_capital'],
+                'benchmark': self.config.config_dict["backtest"]["benchmark"],
+                'strategy_file': strategy_file,  # 策略文件路径
+                'actual_start_time': datetime.datetime.fromtimestamp(self.start_time).strftime("%Y-%m-%d %H:%M:%S") if self.start_time else "",
+                'actual_end_time': datetime.datetime.fromtimestamp(self.end_time).strftime("%Y-%m-%d %H:%M:%S") if self.end_time else "",
+                'total_runtime_seconds': self.total_runtime,
+                'total_runtime_formatted': self._format_runtime(self.total_runtime)
+            }
+            pd.DataFrame([config_info]).to_csv(os.path.join(backtest_dir, "config.csv"), index=False, encoding='utf-8-sig')
+            
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"回测记录已保存到目录: {backtest_dir}", 
+                    "INFO"
+                )
+                # 记录回测总耗时
+                self.trader_callback.gui.log_message(
+                    f"回测总耗时: {self._format_runtime(self.total_runtime)}", 
+                    "INFO"
+                )
+            
+        except Exception as e:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"保存回测记录时出错: {str(e)}", "ERROR")
+            logging.error(f"保存回测记录时出错: {str(e)}", exc_info=True)
 
-    def record_results(self, timestamp, data, signals):
+    def record_results(self, timestamp, data, signals, daily_stats: Optional[bool] = None):
         """记录回测结果
         
         Args:
             timestamp: 当前时间戳
             data: 当前市场数据
             signals: 交易信号列表
+            daily_stats: 是否记录每日统计；None 时判断当前是否为当天最后一个时间点（事件调度模式由收盘估值事件指定）
         """
         try:
             # 获取当前时间信息
@@ -2230,51 +3020,18 @@ class KhQuantFramework:
                     logging.warning(f"检查交易日失败: {str(e)}")
                     is_trading_day = True  # 出错默认为交易日
                     
-            # 3. 持仓更新优化 - 预先获取并缓存持仓列表
+            # 3. 持仓更新优化 - 获取数组化持仓簿
             positions = self.trade_mgr.positions
-            position_codes = list(positions.keys())
             
             # 4. 非交易日处理优化
             if not is_trading_day:
                 # 非交易日情况下，不更新持仓市值
                 # 只记录每日统计数据，使用前一个交易日的市值数据
-                total_market_value = 0.0
-                for code, position in positions.items():
-                    # 使用已记录的市值，不从当天数据获取
-                    if 'market_value' in position and position['market_value'] > 0:
-                        total_market_value += position['market_value']
+                total_market_value = positions.total_market_value()
             else:
-                # 5. 交易日市值计算优化 - 批量获取价格并一次性更新
-                # 预先创建价格字典并批量填充
-                prices = {}
-                
-                # 一次性从数据中提取所有价格
-                for code in position_codes:
-                    # 使用条件短路避免不必要的检查
-                    if code in data and 'close' in data[code]:
-                        prices[code] = data[code]['close']
-                    elif code in positions and 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                        prices[code] = positions[code]['current_price']
-                    elif code in positions and 'avg_price' in positions[code]:
-                        prices[code] = positions[code]['avg_price']
-                
-                # 一次性计算所有持仓的市值和盈亏
-                total_market_value = 0.0
-                for code in position_codes:
-                    if code in prices:
-                        position = positions[code]
-                        current_price = prices[code]
-                        volume = position['volume']
-                        avg_price = position['avg_price']
-                        
-                        # 计算市值和盈亏
-                        market_value = current_price * volume
-                        position['market_value'] = market_value
-                        position['current_price'] = current_price
-                        position['profit'] = (current_price - avg_price) * volume
-                        position['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price != 0 else 0
-                        
-                        total_market_value += market_value
+                # 5. 交易日市值计算优化 - 按当前价格行对全部持仓做一次向量化估值
+                # 无报价的持仓沿用当前价（>0），否则使用持仓均价
+                total_market_value = positions.mark_to_market(self._current_price_row(data))
             
             # 6. 资产更新优化
             assets = self.trade_mgr.assets
@@ -2288,9 +3045,11 @@ class KhQuantFramework:
             # 更新资产信息
             assets['market_value'] = total_market_value
             assets['total_asset'] = assets['cash'] + total_market_value
+            self.risk_mgr.on_equity(assets['total_asset'], total_market_value)
             
-            # 只在资产变化显著时触发回调，减少不必要的回调
-            if abs(assets['total_asset'] - old_total_asset) > 0.01 and self.trader_callback:
+            # 只在资产变化显著时触发回调，减少不必要的回调（多策略回测时只推送主策略的资产）
+            if (abs(assets['total_asset'] - old_total_asset) > 0.01 and self.trader_callback
+                    and self.trade_mgr.callback is self.trader_callback):
                 self.trader_callback.on_stock_asset(SimpleNamespace(**assets))
             
             # 7. 交易信号处理优化
@@ -2304,63 +3063,39 @@ class KhQuantFramework:
                 cash = assets['cash']
                 market_value = assets['market_value']
                 
-                # 使用列表推导式批量处理信号
-                self.backtest_records['trades'].extend([
-                    {
+                # 直接读取 process_signals 计算好的成本明细，不再重复计算各项费用
+                trade_records = self.backtest_records['trades']
+                for signal in signals:
+                    if signal.get('risk_rejected') or signal.get('unfilled'):
+                        continue  # 被风控拒绝或撮合未成交的信号没有成交
+                    price = signal.get('actual_price', signal['price'])
+                    cost = signal.get('cost_breakdown')
+                    if cost is None:
+                        cost = trade_mgr.calculate_cost_breakdown(
+                            price, signal['volume'], signal['action'], signal['code'], apply_slippage=False)
+                    trade_records.append({
                         'datetime': current_time,
                         'code': signal['code'],
                         'action': signal['action'],
-                        'price': signal.get('actual_price', signal['price']),
+                        'price': price,
                         'volume': signal['volume'],
-                        'amount': signal.get('actual_price', signal['price']) * signal['volume'],
-                        'commission': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'stamp_tax': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['action'] == 'sell' else
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action'])
-                        ),
-                        'transfer_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal and signal['code'].startswith("sh.") else
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume'])
-                        ),
-                        'flow_fee': (
-                            signal.get('trade_cost', 0) * (trade_mgr.calculate_flow_fee() /
-                            (trade_mgr.calculate_commission(signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_stamp_tax(signal.get('actual_price', signal['price']), signal['volume'], signal['action']) +
-                            trade_mgr.calculate_transfer_fee(signal['code'], signal.get('actual_price', signal['price']), signal['volume']) +
-                            trade_mgr.calculate_flow_fee()))
-                            if 'trade_cost' in signal else
-                            trade_mgr.calculate_flow_fee()
-                        ),
+                        'amount': price * signal['volume'],
+                        'commission': cost.commission,
+                        'stamp_tax': cost.stamp_tax,
+                        'transfer_fee': cost.transfer_fee,
+                        'flow_fee': cost.flow_fee,
                         'total_asset': total_asset,
                         'cash': cash,
                         'market_value': market_value
-                    }
-                    for signal in signals
-                ])
+                    })
             
             # 8. 最后时间点判断优化
             # 使用函数字典替代if-else判断
             is_last_time_point = False
             
-            if isinstance(self.trigger, CustomTimeTrigger):
+            if daily_stats is not None:
+                is_last_time_point = daily_stats
+            elif isinstance(self.trigger, CustomTimeTrigger):
                 # 对于自定义时间触发，使用缓存优化
                 trigger_seconds = self.trigger.trigger_seconds
                 if trigger_seconds:
@@ -2452,6 +3187,142 @@ class KhQuantFramework:
                 self.trader_callback.gui.log_message(f"记录回测结果时出错: {str(e)}", "ERROR")
             logging.error(f"记录回测结果时出错: {str(e)}", exc_info=True)
     
+    def _get_benchmark_codes(self):
+        """主基准（backtest.benchmark）在前，其后为 backtest.benchmarks 中配置的对比基准（去重）"""
+        backtest_config = self.config.config_dict.get("backtest", {})
+        codes = [backtest_config.get("benchmark")] + list(backtest_config.get("benchmarks", []) or [])
+        return [code for i, code in enumerate(codes) if code and code not in codes[:i]]
+    
+    def _load_benchmark_series(self):
+        """一次请求加载全部基准指数在回测区间内的日线收盘价
+        
+        Returns:
+            KhBenchmarkSeries: 加载失败时返回 None，每日统计回退为使用触发数据中的价格
+        """
+        benchmark_codes = self._get_benchmark_codes()
+        if not benchmark_codes:
+            return None
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(f"开始获取基准指数 {', '.join(benchmark_codes)} 的每日数据", "INFO")
+        try:
+            for code in benchmark_codes:
+                # 先下载数据确保可用
+                self.profiler.call(
+                    "xtdata.download_history_data", xtdata.download_history_data,
+                    stock_code=code,
+                    period="1d",
+                    start_time=self.config.backtest_start,
+                    end_time=self.config.backtest_end,
+                )
+            benchmark_data = self.profiler.call(
+                "xtdata.get_market_data", xtdata.get_market_data,
+                field_list=['close'],
+                stock_list=benchmark_codes,
+                period='1d',
+                start_time=self.config.backtest_start,
+                end_time=self.config.backtest_end,
+            )
+            close_frame = benchmark_data.get('close') if isinstance(benchmark_data, dict) else None
+            if not isinstance(close_frame, pd.DataFrame) or close_frame.empty:
+                if self.trader_callback:
+                    self.trader_callback.gui.log_message(f"基准指数 {benchmark_codes[0]} 数据获取失败", "WARNING")
+                return None
+            series = KhBenchmarkSeries.from_market_data(close_frame, benchmark_codes)
+            missing = [code for code in benchmark_codes if code not in series]
+            if missing and self.trader_callback:
+                self.trader_callback.gui.log_message(f"基准指数 {', '.join(missing)} 收盘价数据为空", "WARNING")
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(
+                    f"已加载 {len(series.codes)} 个基准指数，共 {len(series)} 个交易日", "INFO")
+            return series
+        except Exception as e:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"获取基准指数数据时出错: {str(e)}", "ERROR")
+            logging.error(f"获取基准指数数据时出错: {str(e)}", exc_info=True)
+            return None
+    
+    def _save_benchmark_files(self, backtest_dir, daily_stats_df):
+        """保存 benchmark.csv（主基准），配置了多个基准时另存 benchmarks.csv（策略与各基准的累计收益对比）"""
+        series = self.benchmark_series
+        benchmark_code = self.config.config_dict["backtest"]["benchmark"]
+        if series is None or benchmark_code not in series:
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(f"基准指数 {benchmark_code} 收盘价数据为空", "WARNING")
+            return
+        
+        benchmark_file = os.path.join(backtest_dir, "benchmark.csv")
+        df = series.to_frame(benchmark_code)
+        df.to_csv(benchmark_file, index=False)
+        if self.trader_callback:
+            self.trader_callback.gui.log_message(
+                f"基准指数数据已保存到 {benchmark_file}, 共 {len(df)} 条记录",
+                "INFO"
+            )
+        
+        if len(series.codes) > 1 and len(daily_stats_df) > 0:
+            relative_df = series.relative_performance(daily_stats_df['date'], daily_stats_df['total_asset'])
+            relative_df.to_csv(os.path.join(backtest_dir, "benchmarks.csv"), index=False, encoding='utf-8-sig')
+    
+    def _preload_daily_price_panel(self, stock_codes):
+        """一次请求加载股票池在回测区间内的日线收盘价与前收盘价（日期 × 股票）
+        
+        Returns:
+            KhDailyPricePanel: 列按持仓簿编号对齐；加载失败时返回 None，每日估值回退为按日请求
+        """
+        if not stock_codes:
+            return None
+        try:
+            start = time.time()
+            daily_data = self.profiler.call(
+                "xtdata.get_market_data", xtdata.get_market_data,
+                field_list=['close', 'preClose'],
+                stock_list=list(stock_codes),
+                period='1d',
+                start_time=str(self.config.backtest_start)[:8],
+                end_time=str(self.config.backtest_end)[:8],
+                # 与回测数据保持一致的复权方式，避免“下单用复权价、估值用未复权价”的不一致
+                dividend_type=self.config.config_dict["data"].get("dividend_type", "none")
+            )
+            if not isinstance(daily_data, dict) or not isinstance(daily_data.get('close'), pd.DataFrame):
+                return None
+            # xtdata 返回 {字段: DataFrame(行=股票, 列=日期)}，转置为 日期 × 股票 的矩阵
+            close_frame = daily_data['close']
+            codes = [code for code in stock_codes if code in close_frame.index]
+            if not codes or len(close_frame.columns) == 0:
+                return None
+            dates = [str(column)[:8] for column in close_frame.columns]
+            close = close_frame.loc[codes].to_numpy(dtype=np.float64).T
+            pre_close = None
+            pre_close_frame = daily_data.get('preClose')
+            if isinstance(pre_close_frame, pd.DataFrame) and len(pre_close_frame.columns) == len(dates):
+                pre_close = pre_close_frame.reindex(codes).to_numpy(dtype=np.float64).T
+            
+            panel = KhDailyPricePanel(dates, self.trade_mgr.positions.stock_ids(codes), close, pre_close)
+            message = f"日线价格面板预加载完成: {len(dates)}个交易日 × {len(codes)}只股票，耗时 {time.time() - start:.2f} 秒"
+            logging.info(message)
+            if self.trader_callback:
+                self.trader_callback.gui.log_message(message, "INFO")
+            return panel
+        except Exception as e:
+            logging.warning(f"预加载日线价格面板失败，将按日获取收盘价: {str(e)}")
+            return None
+    
+    def _current_price_row(self, data):
+        """获取当前时间点按持仓簿编号排列的收盘价行
+        
+        回测主循环构造数据时已填充 self._bar_prices；其它情况下按持仓从数据中提取，
+        无报价的位置为 NaN。
+        """
+        bar_prices = getattr(self, '_bar_prices', None)
+        if bar_prices is not None:
+            return bar_prices
+        positions = self.trade_mgr.positions
+        prices = positions.price_row()
+        for code in positions:
+            if code in data and 'close' in data[code]:
+                prices[positions.stock_id(code)] = float(data[code]['close'])
+        return prices
+    
     def _record_daily_stats(self, current_date, current_time, data):
         """记录每日统计数据（从record_results中分离出来的功能）
         
@@ -2475,14 +3346,21 @@ class KhQuantFramework:
         # 重新计算一天结束时的市值
         positions = self.trade_mgr.positions
         position_codes = list(positions.keys())
-        day_end_market_value = 0.0
         
         # 转换日期为YYYYMMDD格式，用于获取日线数据
         yyyymmdd_date = date_str.replace('-', '') if '-' in date_str else date_str
         
+        # 日线收盘价优先从预加载的价格面板中取，面板未覆盖的持仓再按日请求
+        panel = getattr(self, 'daily_price_panel', None)
+        panel_has_date = panel is not None and yyyymmdd_date in panel
+        uncovered_codes = [
+            code for code in position_codes
+            if not panel_has_date or not panel.covers(positions.stock_id(code))
+        ]
+        
         # 批量获取收盘价
         daily_prices = {}
-        if position_codes:
+        if uncovered_codes:
             # 检查缓存中是否已有当日数据
             cache_date_key = f"daily_prices_{yyyymmdd_date}"
             if cache_date_key in self.daily_price_cache:
@@ -2493,9 +3371,10 @@ class KhQuantFramework:
             else:
                 try:
                     # 一次性获取所有持仓股票的日线数据
-                    daily_data = xtdata.get_market_data(
+                    daily_data = self.profiler.call(
+                        "xtdata.get_market_data", xtdata.get_market_data,
                         field_list=['close'],
-                        stock_list=position_codes,
+                        stock_list=uncovered_codes,
                         period='1d',
                         start_time=yyyymmdd_date,
                         end_time=yyyymmdd_date,
@@ -2509,10 +3388,10 @@ class KhQuantFramework:
                         # 检查close_data的类型
                         if isinstance(close_data, pd.DataFrame):
                             # 使用向量化操作处理DataFrame
-                            if any(code in close_data.index for code in position_codes):
+                            if any(code in close_data.index for code in uncovered_codes):
                                 latest_date = close_data.columns[-1]
                                 # 使用向量化操作获取所有股票的价格
-                                valid_codes = [code for code in position_codes if code in close_data.index]
+                                valid_codes = [code for code in uncovered_codes if code in close_data.index]
                                 daily_prices.update({
                                     code: close_data.loc[code, latest_date]
                                     for code in valid_codes
@@ -2524,58 +3403,27 @@ class KhQuantFramework:
                 except Exception as e:
                     logging.error(f"获取日线数据失败: {e}")
         
-        # 批量计算持仓市值
-        for code in position_codes:
-            # 优先使用日线收盘价
-            if code in daily_prices and daily_prices[code] > 0:
-                current_price = daily_prices[code]
-            # 备选方案：使用触发数据中的价格
-            elif code in data and 'close' in data[code]:
-                current_price = data[code]['close']
-            # 备选方案：使用持仓记录的价格
-            elif 'current_price' in positions[code] and positions[code]['current_price'] > 0:
-                current_price = positions[code]['current_price']
-            # 最后备选：使用持仓均价
-            else:
-                current_price = positions[code]['avg_price']
-            
-            # 计算市值
-            volume = positions[code]['volume']
-            market_value = current_price * volume
-            day_end_market_value += market_value
-            
-            # 更新持仓信息
-            positions[code]['current_price'] = current_price
-            positions[code]['market_value'] = market_value
-            
-            # 计算盈亏
-            avg_price = positions[code]['avg_price']
-            positions[code]['profit'] = (current_price - avg_price) * volume
-            positions[code]['profit_ratio'] = (current_price - avg_price) / avg_price if avg_price > 0 else 0
+        # 批量计算持仓市值：优先使用日线收盘价，其次使用触发数据中的价格，
+        # 都没有时沿用持仓当前价（>0）或持仓均价
+        prices = self._current_price_row(data).copy()
+        if panel_has_date:
+            panel.apply_close(prices, yyyymmdd_date)
+        for code, price in daily_prices.items():
+            if price > 0:
+                prices[positions.stock_id(code)] = price
+        day_end_market_value = positions.mark_to_market(prices)
         
         # 计算总资产
         total_asset = cash + day_end_market_value
         
-        # 获取基准指数收盘价 - 使用缓存优化
+        # 获取基准指数收盘价：优先从预加载的基准序列按日期取值
         benchmark_code = self.config.config_dict["backtest"]["benchmark"]
         benchmark_close = None
-        
-        # 使用缓存避免重复获取基准数据
-        cache_key = f"benchmark_{yyyymmdd_date}_{benchmark_code}"
-        if cache_key in self._cached_benchmark_close:
-            benchmark_close = self._cached_benchmark_close[cache_key]
-        else:
-            try:
-                # 备选：使用触发数据中的价格
-                if benchmark_code in data and 'close' in data[benchmark_code]:
-                    benchmark_close = data[benchmark_code]['close']
-                    # 缓存结果
-                    self._cached_benchmark_close[cache_key] = benchmark_close
-            except Exception as e:
-                logging.error(f"获取基准指数数据失败: {e}")
-                # 备选方案
-                if benchmark_code in data and 'close' in data[benchmark_code]:
-                    benchmark_close = data[benchmark_code]['close']
+        if self.benchmark_series is not None:
+            benchmark_close = self.benchmark_series.close_on(yyyymmdd_date, benchmark_code)
+        if benchmark_close is None and benchmark_code in data and 'close' in data[benchmark_code]:
+            # 备选：使用触发数据中的价格
+            benchmark_close = data[benchmark_code]['close']
         
         # 计算当日收益率
         daily_stats = self.backtest_records['daily_stats']
@@ -0,0 +1,373 @@
+# coding: utf-8
+"""
+列式委托/成交账本
+
+回测中每一笔委托、成交原本都保存为一个包含十几个键的字典，高换手的tick策略会产生数十万笔成交，
+内存占用非常可观。这里改用按需扩容的 NumPy 结构化数组按列保存，字符串字段（股票代码、备注等）
+统一驻留到字符串池中只保存整数编号。
+
+对外提供与原字典兼容的接口：
+    - KhLedger: 以委托编号/成交编号为键的可变映射（orders/trades），取值返回记录视图
+    - KhRecordTable: 只追加的记录表（回测交易记录），可直接导出为 DataFrame 写入 trades.csv
+记录视图 KhRecord 实现了 Mapping 接口，可直接用于 SimpleNamespace(**record) 或 dict(record)。
+"""
+import sys
+from collections.abc import Mapping, MutableMapping
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# 字段类型：'str' 表示驻留到字符串池的字符串，'datetime' 表示时间，其余为 NumPy 数据类型
+STR = 'str'
+DATETIME = 'datetime'
+
+# 委托记录字段（与回测委托字典的键一致，order_sysid 由 order_id 推导，不单独保存）
+ORDER_FIELDS: List[Tuple[str, str]] = [
+    ("account_type", "i4"),
+    ("account_id", STR),
+    ("stock_code", STR),
+    ("order_id", "i8"),
+    ("order_time", "i8"),
+    ("order_type", "i4"),
+    ("order_volume", "i8"),
+    ("price_type", "i4"),
+    ("price", "f8"),
+    ("traded_volume", "i8"),
+    ("traded_price", "f8"),
+    ("order_status", "i4"),
+    ("status_msg", STR),
+    ("strategy_name", STR),
+    ("order_remark", STR),
+    ("direction", "i4"),
+    ("offset_flag", "i4"),
+]
+
+# 成交记录字段（traded_id、order_sysid 由 order_id 推导）
+TRADE_FIELDS: List[Tuple[str, str]] = [
+    ("account_type", "i4"),
+    ("account_id", STR),
+    ("stock_code", STR),
+    ("order_type", "i4"),
+    ("traded_time", "i8"),
+    ("traded_price", "f8"),
+    ("traded_volume", "i8"),
+    ("traded_amount", "f8"),
+    ("commission", "f8"),
+    ("stamp_tax", "f8"),
+    ("transfer_fee", "f8"),
+    ("flow_fee", "f8"),
+    ("trade_cost", "f8"),
+    ("order_id", "i8"),
+    ("strategy_name", STR),
+    ("order_remark", STR),
+    ("direction", "i4"),
+    ("offset_flag", "i4"),
+]
+
+# 回测交易记录字段（即 trades.csv 的列）
+TRADE_RECORD_FIELDS: List[Tuple[str, str]] = [
+    ("datetime", DATETIME),
+    ("code", STR),
+    ("action", STR),
+    ("price", "f8"),
+    ("volume", "i8"),
+    ("amount", "f8"),
+    ("commission", "f8"),
+    ("stamp_tax", "f8"),
+    ("transfer_fee", "f8"),
+    ("flow_fee", "f8"),
+    ("total_asset", "f8"),
+    ("cash", "f8"),
+    ("market_value", "f8"),
+]
+
+
+def _order_sysid(record) -> str:
+    return str(record["order_id"])
+
+
+def _traded_id(record) -> str:
+    return f"T{record['order_id']}"
+
+
+# 推导字段使用模块级函数（而非 lambda），账本可以被 pickle 序列化
+ORDER_DERIVED: Dict[str, Callable] = {
+    "order_sysid": _order_sysid,
+}
+
+TRADE_DERIVED: Dict[str, Callable] = {
+    "traded_id": _traded_id,
+    "order_sysid": _order_sysid,
+}
+
+
+class KhStringPool:
+    """字符串驻留池：相同字符串只保存一份，列中保存其整数编号"""
+
+    def __init__(self):
+        self._index: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def intern(self, value) -> int:
+        value = "" if value is None else str(value)
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            value = sys.intern(value)
+            self._index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def lookup(self, idx: int) -> str:
+        return self.values[idx]
+
+    def decode(self, ids: np.ndarray) -> np.ndarray:
+        """批量把编号还原为字符串（object 数组）"""
+        return np.asarray(self.values, dtype=object)[ids] if len(ids) else np.array([], dtype=object)
+
+
+class KhRecord(Mapping):
+    """账本中单条记录的只读映射视图（按需从列中取值，不复制数据）"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: "KhRecordTable", row: int):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._table._get(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._table._set(self._row, key, value)
+
+    def __iter__(self):
+        return iter(self._table.field_names)
+
+    def __len__(self):
+        return len(self._table.field_names)
+
+    def __contains__(self, key):
+        return key in self._table._field_set
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class KhRecordTable:
+    """只追加的列式记录表
+
+    Args:
+        fields: [(字段名, 类型)]，类型为 'str'、'datetime' 或 NumPy 数据类型字符串
+        capacity: 初始容量，写满后按倍数扩容
+        derived: {字段名: 函数(record)}，由其它字段推导的只读字段
+        pool: 字符串池，多个表可共享同一个池
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, str]], capacity: int = 1024,
+                 derived: Optional[Dict[str, Callable]] = None,
+                 pool: Optional[KhStringPool] = None):
+        self.pool = pool if pool is not None else KhStringPool()
+        self._str_fields = frozenset(name for name, kind in fields if kind == STR)
+        self._datetime_fields = frozenset(name for name, kind in fields if kind == DATETIME)
+        self._stored_fields = [name for name, _ in fields]
+        self._derived = dict(derived or {})
+        self.field_names = tuple(self._stored_fields) + tuple(
+            name for name in self._derived if name not in self._stored_fields)
+        self._field_set = frozenset(self.field_names)
+        storage = {STR: "i4", DATETIME: "M8[us]"}
+        self._dtype = np.dtype([(name, storage.get(kind, kind)) for name, kind in fields])
+        self._data = np.zeros(max(int(capacity), 1), dtype=self._dtype)
+        self._size = 0
+
+    # ---- 写入 ----
+    def _grow(self, required: int):
+        capacity = len(self._data)
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+        data = np.zeros(capacity, dtype=self._dtype)
+        data[:self._size] = self._data[:self._size]
+        self._data = data
+
+    def _encode(self, name, value):
+        if name in self._str_fields:
+            return self.pool.intern(value)
+        if name in self._datetime_fields:
+            if value is None or value == "":
+                return np.datetime64("NaT")
+            return pd.Timestamp(value).to_datetime64()
+        return 0 if value is None else value
+
+    def append(self, record) -> int:
+        """追加一条记录（字典或带属性的对象），返回行号"""
+        row = self._size
+        self._grow(row + 1)
+        target = self._data[row]
+        is_mapping = isinstance(record, Mapping)
+        for name in self._stored_fields:
+            value = record.get(name) if is_mapping else getattr(record, name, None)
+            target[name] = self._encode(name, value)
+        self._size = row + 1
+        return row
+
+    def extend(self, records: Iterable):
+        for record in records:
+            self.append(record)
+
+    def extend_columns(self, columns: Dict[str, Sequence]):
+        """按列批量追加记录（各列长度相同，缺少的字段补0/空）
+
+        字符串列中的重复值只驻留一次，时间列可以是 datetime64 数组或可被 pandas 解析的值。
+        """
+        lengths = {len(values) for values in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError(f"各列长度不一致: {sorted(lengths)}")
+        count = lengths.pop() if lengths else 0
+        if count == 0:
+            return
+        start = self._size
+        self._grow(start + count)
+        block = self._data[start:start + count]
+        block[...] = np.zeros(1, dtype=self._dtype)[0]
+        for name, values in columns.items():
+            if name not in self._dtype.names:
+                raise KeyError(name)
+            if name in self._str_fields:
+                unique, inverse = np.unique(np.asarray(values, dtype=object).astype(str), return_inverse=True)
+                ids = np.fromiter((self.pool.intern(value) for value in unique), dtype=np.int32, count=len(unique))
+                block[name] = ids[inverse]
+            elif name in self._datetime_fields:
+                block[name] = pd.to_datetime(values).to_numpy(dtype="M8[us]")
+            else:
+                block[name] = values
+        self._size = start + count
+
+    def clear(self):
+        self._size = 0
+
+    def __getstate__(self):
+        # 序列化（如回测断点快照）时只保存已写入的行，不保存预留容量
+        state = self.__dict__.copy()
+        state["_data"] = self._data[:max(self._size, 1)].copy()
+        return state
+
+    # ---- 读取 ----
+    def _get(self, row: int, key):
+        if key not in self._field_set:
+            raise KeyError(key)
+        if key in self._derived and key not in self._dtype.names:
+            return self._derived[key](KhRecord(self, row))
+        value = self._data[key][row]
+        if key in self._str_fields:
+            return self.pool.values[value]
+        return value.item()
+
+    def _set(self, row: int, key, value):
+        if key not in self._dtype.names:
+            raise KeyError(f"字段 {key} 不可修改")
+        self._data[key][row] = self._encode(key, value)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, row: int) -> KhRecord:
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return KhRecord(self, row)
+
+    def __iter__(self):
+        for row in range(self._size):
+            yield KhRecord(self, row)
+
+    def column(self, name: str) -> np.ndarray:
+        """返回某一列（字符串列还原为 object 数组，数值列为只读视图）"""
+        if name in self._derived and name not in self._dtype.names:
+            return np.array([self._get(row, name) for row in range(self._size)], dtype=object)
+        values = self._data[name][:self._size]
+        if name in self._str_fields:
+            return self.pool.decode(values)
+        values = values.view()
+        values.flags.writeable = False
+        return values
+
+    def to_dataframe(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        """直接按列导出为 DataFrame"""
+        columns = list(columns) if columns is not None else list(self._stored_fields)
+        return pd.DataFrame({name: self.column(name) for name in columns}, columns=columns)
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+
+class KhLedger(KhRecordTable, MutableMapping):
+    """以编号为键的列式账本，兼容原 orders/trades 字典的用法
+
+    ledger[key] = 记录 会追加（或覆盖已有键的）一行；ledger[key] 返回 KhRecord 视图。
+    """
+
+    def __init__(self, fields: Sequence[Tuple[str, str]], capacity: int = 1024,
+                 derived: Optional[Dict[str, Callable]] = None,
+                 pool: Optional[KhStringPool] = None):
+        super().__init__(fields, capacity, derived, pool)
+        self._rows: Dict[object, int] = {}
+        self._keys: List[object] = []
+
+    def __setitem__(self, key, record):
+        row = self._rows.get(key)
+        if row is None:
+            self._rows[key] = self.append(record)
+            self._keys.append(key)
+            return
+        is_mapping = isinstance(record, Mapping)
+        for name in self._stored_fields:
+            value = record.get(name) if is_mapping else getattr(record, name, None)
+            self._data[name][row] = self._encode(name, value)
+
+    def __getitem__(self, key) -> KhRecord:
+        return KhRecord(self, self._rows[key])
+
+    def __delitem__(self, key):
+        raise TypeError("账本记录只允许追加，不支持删除")
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def clear(self):
+        super().clear()
+        self._rows.clear()
+        self._keys.clear()
+
+    def records(self):
+        """按写入顺序遍历记录视图"""
+        for row in range(self._size):
+            yield KhRecord(self, row)
+
+
+def create_order_ledger(pool: Optional[KhStringPool] = None, capacity: int = 1024) -> KhLedger:
+    """创建回测委托账本"""
+    return KhLedger(ORDER_FIELDS, capacity, ORDER_DERIVED, pool)
+
+
+def create_trade_ledger(pool: Optional[KhStringPool] = None, capacity: int = 1024) -> KhLedger:
+    """创建回测成交账本"""
+    return KhLedger(TRADE_FIELDS, capacity, TRADE_DERIVED, pool)
+
+
+def create_trade_record_table(pool: Optional[KhStringPool] = None, capacity: int = 1024) -> KhRecordTable:
+    """创建回测交易记录表（trades.csv）"""
+    return KhRecordTable(TRADE_RECORD_FIELDS, capacity, pool=pool)
@@ -0,0 +1,242 @@
+# coding: utf-8
+"""
+回测撮合模拟器
+
+默认的回测下单假设委托按 委托价 ± 滑点 立即全部成交。启用撮合模拟（backtest.matching.enabled）后，
+按下单时刻的行情决定实际成交：
+    - 涨跌停：涨停且卖盘为空时买入不成交，跌停且买盘为空时卖出不成交（K线数据没有盘口，价格处于涨跌停即不成交）
+    - 盘口深度（tick 数据含 askPrice/bidPrice/askVol/bidVol 时）：限价内逐档吃单，成交价为所吃档位的加权均价
+    - 参与率：单次成交量不超过当前 tick/K线 成交量 × participation_rate
+    - 排队：未能立即成交的部分按委托价挂单，需等排在前面的同价位挂单成交完后才能成交
+未成交部分当即撤单（不跨 tick 挂单）。行情数据在回测开始时一次性转换为 NumPy 数组，
+每笔委托只需一次二分查找定位 tick 并对五档数组做向量运算。
+"""
+import logging
+import math
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+PRICE_EPS = 1e-6
+
+
+def price_limit_rate(stock_code: str) -> float:
+    """按板块返回涨跌停幅度：创业板/科创板 20%，北交所 30%，其余 10%"""
+    code = stock_code.split('.')[0]
+    if code.startswith(('300', '301', '688', '689')):
+        return 0.2
+    if stock_code.upper().endswith('.BJ') or code.startswith(('43', '83', '87', '92')):
+        return 0.3
+    return 0.1
+
+
+class KhFill:
+    """撮合结果：成交数量、成交均价（None 表示沿用委托价±滑点）与未全部成交的原因"""
+
+    __slots__ = ("volume", "price", "reason")
+
+    def __init__(self, volume: int, price: Optional[float] = None, reason: str = ""):
+        self.volume = volume
+        self.price = price
+        self.reason = reason
+
+    def __repr__(self):
+        return f"KhFill(volume={self.volume}, price={self.price}, reason={self.reason!r})"
+
+
+class _KhMarketArrays:
+    """单只股票的行情数组（按时间排序）"""
+
+    __slots__ = ("times", "last", "volume", "ask_px", "ask_vol", "bid_px", "bid_vol", "upper", "lower")
+
+    def __init__(self, times, last, volume, ask_px, ask_vol, bid_px, bid_vol, upper, lower):
+        self.times = times
+        self.last = last
+        self.volume = volume
+        self.ask_px = ask_px
+        self.ask_vol = ask_vol
+        self.bid_px = bid_px
+        self.bid_vol = bid_vol
+        self.upper = upper
+        self.lower = lower
+
+
+def _level_matrix(column: pd.Series) -> Optional[np.ndarray]:
+    """把每格为五档列表的列转换为 (行数, 档数) 矩阵，缺失档位补0"""
+    values = column.to_numpy()
+    if len(values) == 0:
+        return None
+    first = values[0]
+    if np.isscalar(first):
+        return np.asarray(values, dtype=np.float64).reshape(-1, 1)
+    try:
+        return np.array(values.tolist(), dtype=np.float64)
+    except ValueError:
+        depth = max(len(row) for row in values)
+        matrix = np.zeros((len(values), depth))
+        for i, row in enumerate(values):
+            matrix[i, :len(row)] = row
+        return matrix
+
+
+class KhMatchingSimulator:
+    """按行情数组撮合回测委托
+
+    Args:
+        config: KhConfig，读取 backtest.matching 配置：
+            enabled: 是否启用（默认 False）
+            participation_rate: 单次成交量占当前 tick/K线 成交量的上限，默认 0.25，0 表示不限制
+            queue: 是否模拟排队，默认 True
+            volume_unit: 行情中成交量/挂单量的单位（股），默认 100（手）
+            limit_rate: 涨跌停幅度，默认按板块自动判断
+    """
+
+    def __init__(self, config):
+        matching = config.config_dict.get("backtest", {}).get("matching", {}) or {}
+        self.enabled = bool(matching.get("enabled", False))
+        self.participation_rate = float(matching.get("participation_rate", 0.25))
+        self.queue = bool(matching.get("queue", True))
+        self.volume_unit = float(matching.get("volume_unit", 100))
+        self.limit_rate = matching.get("limit_rate")
+        self.lot_size = 100
+        self._markets: Dict[str, _KhMarketArrays] = {}
+
+    # ---- 行情预处理 ----
+    def load(self, historical_data: Dict[str, pd.DataFrame], period: str = "tick"):
+        """回测开始时把各股票的行情转换为数组"""
+        self._markets = {}
+        for code, df in historical_data.items():
+            try:
+                market = self._build_market(code, df, period)
+            except Exception as e:
+                logging.warning(f"撮合模拟器加载{code}行情失败，该股票按默认方式成交: {str(e)}")
+                continue
+            if market is not None:
+                self._markets[code] = market
+
+    def _build_market(self, code: str, df: pd.DataFrame, period: str) -> Optional[_KhMarketArrays]:
+        if 'time' not in df.columns or len(df) == 0:
+            return None
+        order = np.argsort(df['time'].to_numpy(), kind='stable')
+        df = df.iloc[order]
+        times = df['time'].to_numpy(dtype=np.int64)
+        price_field = 'lastPrice' if 'lastPrice' in df.columns else 'close'
+        last = df[price_field].to_numpy(dtype=np.float64) if price_field in df.columns else np.full(len(df), np.nan)
+
+        volume = None
+        if 'volume' in df.columns:
+            volume = df['volume'].to_numpy(dtype=np.float64)
+            if period == "tick":
+                # tick 成交量为当日累计值，差分得到每个 tick 的成交量，新交易日（累计值回落）取原值
+                delta = np.diff(volume, prepend=0.0)
+                volume = np.where(delta < 0, volume, delta)
+
+        ask_px = ask_vol = bid_px = bid_vol = None
+        if all(name in df.columns for name in ('askPrice', 'askVol', 'bidPrice', 'bidVol')):
+            ask_px = _level_matrix(df['askPrice'])
+            ask_vol = _level_matrix(df['askVol'])
+            bid_px = _level_matrix(df['bidPrice'])
+            bid_vol = _level_matrix(df['bidVol'])
+
+        pre_field = 'lastClose' if 'lastClose' in df.columns else 'preClose'
+        if pre_field in df.columns:
+            rate = float(self.limit_rate) if self.limit_rate is not None else price_limit_rate(code)
+            pre_close = df[pre_field].to_numpy(dtype=np.float64)
+            upper = np.round(pre_close * (1 + rate), 2)
+            lower = np.round(pre_close * (1 - rate), 2)
+        else:
+            upper = lower = None
+        return _KhMarketArrays(times, last, volume, ask_px, ask_vol, bid_px, bid_vol, upper, lower)
+
+    # ---- 撮合 ----
+    def _locate(self, market: _KhMarketArrays, timestamp) -> int:
+        """定位不晚于 timestamp 的最后一个 tick"""
+        ts = int(timestamp)
+        if market.times[-1] > 1e10 and ts < 1e10:
+            ts *= 1000
+        elif market.times[-1] < 1e10 and ts > 1e10:
+            ts //= 1000
+        return int(np.searchsorted(market.times, ts, side='right')) - 1
+
+    def match(self, signal: Dict) -> Optional[KhFill]:
+        """撮合一笔委托
+
+        Returns:
+            KhFill: 成交结果；该股票没有行情数组或无法定位时返回 None（按默认方式全部成交）
+        """
+        market = self._markets.get(signal["code"])
+        if market is None or "timestamp" not in signal:
+            return None
+        i = self._locate(market, signal["timestamp"])
+        if i < 0:
+            return None
+
+        is_buy = signal["action"] == "buy"
+        order_volume = int(signal["volume"])
+        limit_price = float(signal["price"])
+        unit = self.volume_unit
+
+        # 涨跌停：对手盘为空时无法成交
+        if market.upper is not None:
+            last = market.last[i]
+            if is_buy and last >= market.upper[i] - PRICE_EPS and not self._has_depth(market.ask_vol, i):
+                return KhFill(0, reason="涨停无卖盘")
+            if not is_buy and last <= market.lower[i] + PRICE_EPS and not self._has_depth(market.bid_vol, i):
+                return KhFill(0, reason="跌停无买盘")
+
+        # 参与率上限
+        cap = math.inf
+        if self.participation_rate > 0 and market.volume is not None:
+            cap = max(market.volume[i], 0.0) * unit * self.participation_rate
+
+        # 主动成交：限价内逐档吃单
+        price = None
+        if market.ask_px is not None:
+            if is_buy:
+                prices, volumes = market.ask_px[i], market.ask_vol[i] * unit
+                marketable = (prices > 0) & (volumes > 0) & (prices <= limit_price + PRICE_EPS)
+            else:
+                prices, volumes = market.bid_px[i], market.bid_vol[i] * unit
+                marketable = (prices > 0) & (volumes > 0) & (prices >= limit_price - PRICE_EPS)
+            prices, volumes = prices[marketable], volumes[marketable]
+            target = min(order_volume, cap)
+            taken = np.minimum(volumes, np.maximum(target - (np.cumsum(volumes) - volumes), 0.0))
+            active = float(taken.sum())
+        else:
+            # 无盘口数据：只受参与率限制，按委托价成交
+            active = min(order_volume, cap)
+
+        # 被动成交：剩余部分按委托价排队，排在前面的是同价位已有挂单
+        passive = 0.0
+        remaining = order_volume - active
+        if self.queue and remaining > 0 and market.bid_px is not None and math.isfinite(cap):
+            last = market.last[i]
+            touched = last <= limit_price + PRICE_EPS if is_buy else last >= limit_price - PRICE_EPS
+            if touched:
+                same_side_px = market.bid_px[i] if is_buy else market.ask_px[i]
+                same_side_vol = market.bid_vol[i] if is_buy else market.ask_vol[i]
+                at_price = np.abs(same_side_px - limit_price) < PRICE_EPS
+                queue_ahead = float(same_side_vol[at_price].sum()) * unit
+                passive = min(max(cap - active - queue_ahead, 0.0), remaining)
+
+        filled = active + passive
+        if filled < order_volume:
+            filled = math.floor(filled / self.lot_size) * self.lot_size
+        filled = int(filled)
+        if filled <= 0:
+            return KhFill(0, reason="盘口流动性不足" if market.ask_px is not None else "成交量不足")
+
+        if market.ask_px is not None:
+            # 按取整后的成交量计价：主动成交按档位顺序保留，不足的部分才是委托价上的被动成交，
+            # 取整时舍去的量不计入均价（不会把实际未成交的深档价格算进成交价）
+            kept = min(filled, active)
+            taken = np.minimum(volumes, np.maximum(kept - (np.cumsum(volumes) - volumes), 0.0))
+            price = (float(np.dot(taken, prices)) + (filled - kept) * limit_price) / filled
+        reason = "" if filled == order_volume else "部分成交，剩余撤单"
+        return KhFill(filled, price, reason)
+
+    @staticmethod
+    def _has_depth(volumes: Optional[np.ndarray], i: int) -> bool:
+        """对手盘是否有挂单（无盘口数据时按常规回测口径视为没有，即涨停不能买入、跌停不能卖出）"""
+        return volumes is not None and bool((volumes[i] > 0).any())
@@ -0,0 +1,351 @@
+# coding: utf-8
+"""
+回测绩效指标计算引擎（不依赖 Qt）
+
+对同一条日收益率序列，一次遍历即可得到多个窗口的滚动均值/标准差/协方差：
+先用全样本均值对序列做中心化，再计算前缀和，任意窗口的统计量都由两次前缀和相减得到，
+数值稳定性与 Welford 递推相当，结果与 pandas rolling(ddof=1) 一致。
+计算结果按回测目录缓存（内存 + 目录内的 metrics_cache.npz），结果文件未变化时直接复用。
+基准指数收盘价由 KhBenchmarkSeries 统一保存，回测中只加载一次。
+"""
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252  # 滚动指标年化天数（与结果窗口滚动夏普比率一致）
+CACHE_FILE_NAME = "metrics_cache.npz"
+CACHE_VERSION = 1
+
+_memory_cache: Dict[str, Tuple[tuple, Dict[str, np.ndarray]]] = {}
+
+
+def _date_key(date) -> str:
+    """把 '2024-01-02'、'20240102'、date/Timestamp 统一为 YYYYMMDD"""
+    if hasattr(date, 'strftime'):
+        return date.strftime('%Y%m%d')
+    return str(date).replace('-', '')[:8]
+
+
+class KhBenchmarkSeries:
+    """基准指数日线收盘价（交易日 × 基准代码）
+
+    回测开始时一次加载全部基准，每日统计按日期直接取值，回测结束时直接导出 benchmark.csv，
+    配置了多个基准时还可生成策略相对各基准的收益对比。
+
+    Args:
+        dates: 交易日列表（任意可被 _date_key 识别的日期格式）
+        codes: 基准代码列表，第一个为主基准
+        closes: 收盘价矩阵，形状为 (日期数, 基准数)，缺失为 NaN
+    """
+
+    def __init__(self, dates: Iterable, codes: Iterable[str], closes):
+        self.dates = [_date_key(date) for date in dates]
+        self.codes = list(codes)
+        self.closes = np.asarray(closes, dtype=np.float64).reshape(len(self.dates), len(self.codes))
+        self._date_index = {date: i for i, date in enumerate(self.dates)}
+        self._code_index = {code: i for i, code in enumerate(self.codes)}
+
+    @classmethod
+    def from_market_data(cls, close_frame: pd.DataFrame, codes: Iterable[str]) -> "KhBenchmarkSeries":
+        """由 xtdata.get_market_data 返回的收盘价表（行=代码，列=日期）构建"""
+        codes = [code for code in codes if code in close_frame.index]
+        dates = [str(column)[:8] for column in close_frame.columns]
+        order = np.argsort(dates, kind='stable')
+        closes = close_frame.loc[codes].to_numpy(dtype=np.float64).T[order]
+        return cls([dates[i] for i in order], codes, closes)
+
+    def __contains__(self, code) -> bool:
+        return code in self._code_index
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    @property
+    def primary(self) -> Optional[str]:
+        return self.codes[0] if self.codes else None
+
+    def close_on(self, date, code: Optional[str] = None) -> Optional[float]:
+        """某个交易日的收盘价，无数据时返回 None"""
+        row = self._date_index.get(_date_key(date))
+        col = self._code_index.get(code if code is not None else self.primary)
+        if row is None or col is None:
+            return None
+        value = self.closes[row, col]
+        return None if np.isnan(value) else float(value)
+
+    def to_frame(self, code: Optional[str] = None) -> pd.DataFrame:
+        """导出单个基准的 (date, close)，即 benchmark.csv 的格式"""
+        col = self._code_index[code if code is not None else self.primary]
+        values = self.closes[:, col]
+        valid = ~np.isnan(values)
+        dates = pd.to_datetime(pd.Index(self.dates)[valid], format='%Y%m%d')
+        return pd.DataFrame({'date': dates, 'close': values[valid]})
+
+    def relative_performance(self, dates: Iterable, total_asset) -> pd.DataFrame:
+        """策略与各基准的累计收益对比
+
+        Args:
+            dates: 每日统计的日期
+            total_asset: 与 dates 对齐的策略总资产
+
+        Returns:
+            DataFrame: date、strategy_return，以及每个基准的 {code}_close、{code}_return、{code}_excess
+            （收益均为相对首日的累计收益率，excess 为策略减基准）
+        """
+        keys = [_date_key(date) for date in dates]
+        assets = _as_float_array(total_asset)
+        result = {'date': pd.to_datetime(pd.Index(keys), format='%Y%m%d')}
+        if len(assets) == 0:
+            return pd.DataFrame(result)
+        strategy_return = assets / assets[0] - 1 if assets[0] else np.zeros(len(assets))
+        result['strategy_return'] = strategy_return
+        rows = np.array([self._date_index.get(key, -1) for key in keys], dtype=np.int64)
+        for code, col in self._code_index.items():
+            closes = np.where(rows >= 0, self.closes[rows, col], np.nan)
+            closes = pd.Series(closes).ffill().to_numpy()
+            first_valid = closes[~np.isnan(closes)]
+            base = first_valid[0] if len(first_valid) else np.nan
+            benchmark_return = closes / base - 1
+            result[f'{code}_close'] = closes
+            result[f'{code}_return'] = benchmark_return
+            result[f'{code}_excess'] = strategy_return - benchmark_return
+        return pd.DataFrame(result)
+
+
+def _as_float_array(values) -> np.ndarray:
+    if values is None:
+        return np.array([], dtype=np.float64)
+    if isinstance(values, pd.Series):
+        values = pd.to_numeric(values, errors='coerce').values
+    return np.asarray(values, dtype=np.float64)
+
+
+class _PrefixSums:
+    """中心化前缀和：支持 O(1) 查询任意窗口的和、平方和、有效数量"""
+
+    def __init__(self, values: np.ndarray, other: Optional[np.ndarray] = None):
+        self.n = len(values)
+        valid = ~np.isnan(values)
+        if other is not None:
+            valid &= ~np.isnan(other)
+        self.count = np.concatenate(([0], np.cumsum(valid)))
+
+        center = values[valid].mean() if valid.any() else 0.0
+        x = np.where(valid, values - center, 0.0)
+        self.sum_x = np.concatenate(([0.0], np.cumsum(x)))
+        self.sum_xx = np.concatenate(([0.0], np.cumsum(x * x)))
+        self.center = center
+
+        if other is not None:
+            center_y = other[valid].mean() if valid.any() else 0.0
+            y = np.where(valid, other - center_y, 0.0)
+            self.sum_y = np.concatenate(([0.0], np.cumsum(y)))
+            self.sum_yy = np.concatenate(([0.0], np.cumsum(y * y)))
+            self.sum_xy = np.concatenate(([0.0], np.cumsum(x * y)))
+
+    @staticmethod
+    def _window(prefix: np.ndarray, window: int) -> np.ndarray:
+        return prefix[window:] - prefix[:-window]
+
+    def _full(self, values: np.ndarray, window: int, complete: np.ndarray) -> np.ndarray:
+        out = np.full(self.n, np.nan)
+        values = np.where(complete, values, np.nan)
+        out[window - 1:] = values
+        return out
+
+    def mean_std(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """窗口均值与样本标准差（ddof=1），窗口内含 NaN 时结果为 NaN（与 pandas 一致）"""
+        if window <= 0 or window > self.n:
+            nan = np.full(self.n, np.nan)
+            return nan, nan.copy()
+        complete = self._window(self.count, window) == window
+        s = self._window(self.sum_x, window)
+        ss = self._window(self.sum_xx, window)
+        mean = s / window
+        with np.errstate(invalid='ignore', divide='ignore'):
+            var = (ss - s * mean) / (window - 1)
+        var = np.maximum(var, 0.0)
+        return (self._full(mean + self.center, window, complete),
+                self._full(np.sqrt(var), window, complete))
+
+    def cov_var(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """窗口协方差（ddof=1）与第二个序列的方差（ddof=0），与 np.cov/np.var 的组合口径一致"""
+        if window <= 1 or window > self.n:
+            nan = np.full(self.n, np.nan)
+            return nan, nan.copy()
+        complete = self._window(self.count, window) == window
+        sx = self._window(self.sum_x, window)
+        sy = self._window(self.sum_y, window)
+        sxy = self._window(self.sum_xy, window)
+        syy = self._window(self.sum_yy, window)
+        cov = (sxy - sx * sy / window) / (window - 1)
+        var_y = np.maximum((syy - sy * sy / window) / window, 0.0)
+        return self._full(cov, window, complete), self._full(var_y, window, complete)
+
+
+def rolling_mean_std(values, windows: Iterable[int]) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    """一次构建前缀和，返回多个窗口的 (滚动均值, 滚动标准差)"""
+    prefix = _PrefixSums(_as_float_array(values))
+    return {w: prefix.mean_std(w) for w in windows}
+
+
+def rolling_max_drawdown(total_asset, window: int) -> np.ndarray:
+    """滚动窗口内的最大回撤（百分比），第 i 个值对应以 i 结尾的窗口，前 window-1 个为 NaN"""
+    values = _as_float_array(total_asset)
+    out = np.full(len(values), np.nan)
+    if window <= 0 or len(values) < window:
+        return out
+    windows = np.lib.stride_tricks.sliding_window_view(values, window)
+    cummax = np.maximum.accumulate(windows, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = (cummax - windows) / cummax * 100
+    drawdown[~np.isfinite(drawdown)] = 0.0
+    out[window - 1:] = drawdown.max(axis=1)
+    return out
+
+
+def annualized_volatility(returns, n: Optional[int] = None, periods: int = 250) -> float:
+    """年化波动率 σp = √(periods/n·∑(rp - r̄p)²)，n 默认为有效数据点数量"""
+    values = _as_float_array(returns)
+    values = values[~np.isnan(values)]
+    if len(values) < 2:
+        return 0.0
+    n = n if n and n > 0 else len(values)
+    volatility = float(np.sqrt(periods / n * np.sum((values - values.mean()) ** 2)))
+    return volatility if np.isfinite(volatility) else 0.0
+
+
+def beta(strategy_returns, benchmark_returns) -> float:
+    """贝塔 = cov(策略, 基准) / var(基准)，协方差 ddof=1、方差 ddof=0（与结果窗口原口径一致）"""
+    x = _as_float_array(strategy_returns)
+    y = _as_float_array(benchmark_returns)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+    if len(x) < 10:
+        return 0.0
+    n = len(x)
+    xc, yc = x - x.mean(), y - y.mean()
+    variance = float(np.dot(yc, yc) / n)
+    if variance == 0:
+        return 0.0
+    result = float(np.dot(xc, yc) / (n - 1)) / variance
+    return result if np.isfinite(result) else 0.0
+
+
+def compute_rolling_metrics(returns, total_asset=None, benchmark_returns=None,
+                            windows: Iterable[int] = (30, 60), risk_free_rate: float = 0.03,
+                            periods: int = TRADING_DAYS_PER_YEAR) -> Dict[str, np.ndarray]:
+    """一次计算全部滚动指标
+
+    Returns:
+        dict: sharpe_{w}（无效值置0）、volatility_{w}（年化，百分比）、max_drawdown_{w}（百分比）、
+              beta_{w}（提供基准收益率时），数组长度均与 returns 相同
+    """
+    r = _as_float_array(returns)
+    windows = sorted({int(w) for w in windows if int(w) > 0})
+    prefix = _PrefixSums(r)
+    result: Dict[str, np.ndarray] = {}
+    daily_rf = risk_free_rate / periods
+    for w in windows:
+        mean, std = prefix.mean_std(w)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = (mean - daily_rf) * periods / (std * np.sqrt(periods))
+        sharpe[~np.isfinite(sharpe)] = 0.0
+        result[f'sharpe_{w}'] = sharpe
+        result[f'volatility_{w}'] = std * np.sqrt(periods) * 100
+        if total_asset is not None:
+            result[f'max_drawdown_{w}'] = rolling_max_drawdown(total_asset, w)
+
+    if benchmark_returns is not None:
+        b = _as_float_array(benchmark_returns)
+        if len(b) == len(r):
+            pair = _PrefixSums(r, b)
+            for w in windows:
+                cov, var_b = pair.cov_var(w)
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    result[f'beta_{w}'] = np.where(var_b > 0, cov / var_b, np.nan)
+    return result
+
+
+def _file_signature(path: str) -> tuple:
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (0, 0)
+
+
+def _cache_key(backtest_dir: str, windows, risk_free_rate: float) -> tuple:
+    return (
+        CACHE_VERSION,
+        _file_signature(os.path.join(backtest_dir, "daily_stats.csv")),
+        _file_signature(os.path.join(backtest_dir, "benchmark.csv")),
+        tuple(sorted(int(w) for w in windows)),
+        float(risk_free_rate),
+    )
+
+
+def _load_disk_cache(path: str, key: tuple) -> Optional[Dict[str, np.ndarray]]:
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if str(data['__key__']) != repr(key):
+                return None
+            return {name: data[name] for name in data.files if name != '__key__'}
+    except Exception:
+        return None
+
+
+def get_rolling_metrics(backtest_dir: str, daily_stats_df: Optional[pd.DataFrame] = None,
+                        benchmark_returns=None, windows: Iterable[int] = (30, 60),
+                        risk_free_rate: float = 0.03, persist: bool = True) -> Dict[str, np.ndarray]:
+    """获取回测目录的滚动指标，daily_stats.csv / benchmark.csv 未变化时直接返回缓存结果
+
+    Args:
+        backtest_dir: 回测结果目录
+        daily_stats_df: 已加载的每日统计数据，为 None 时从 daily_stats.csv 读取
+        benchmark_returns: 与 daily_stats_df 对齐的基准日收益率，用于滚动贝塔
+        windows: 滚动窗口列表
+        risk_free_rate: 年化无风险利率
+        persist: 是否把结果写入目录内的 metrics_cache.npz，供下次打开时复用
+    """
+    windows = tuple(windows)
+    directory = os.path.abspath(backtest_dir)
+    key = _cache_key(directory, windows, risk_free_rate)
+
+    cached = _memory_cache.get(directory)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    cache_path = os.path.join(directory, CACHE_FILE_NAME)
+    if persist and os.path.exists(cache_path):
+        metrics = _load_disk_cache(cache_path, key)
+        if metrics is not None:
+            _memory_cache[directory] = (key, metrics)
+            return metrics
+
+    if daily_stats_df is None:
+        daily_stats_df = pd.read_csv(os.path.join(directory, "daily_stats.csv"), encoding='utf-8-sig')
+    returns = daily_stats_df['daily_return'] if 'daily_return' in daily_stats_df.columns else None
+    if returns is None and 'total_asset' in daily_stats_df.columns:
+        returns = daily_stats_df['total_asset'].pct_change().fillna(0)
+    total_asset = daily_stats_df['total_asset'] if 'total_asset' in daily_stats_df.columns else None
+
+    metrics = compute_rolling_metrics(returns, total_asset, benchmark_returns, windows, risk_free_rate)
+    _memory_cache[directory] = (key, metrics)
+
+    if persist and os.path.isdir(directory):
+        try:
+            np.savez(cache_path, __key__=np.array(repr(key)), **metrics)
+        except OSError:
+            pass
+    return metrics
+
+
+def clear_cache(backtest_dir: Optional[str] = None):
+    """清除内存缓存（backtest_dir 为 None 时清除全部）"""
+    if backtest_dir is None:
+        _memory_cache.clear()
+    else:
+        _memory_cache.pop(os.path.abspath(backtest_dir), None)
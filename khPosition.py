@@ -0,0 +1,309 @@
+# coding: utf-8
+"""
+数组化持仓簿
+
+回测中每个 bar 都要对全部持仓按最新价重新估值（市值、浮动盈亏、盈亏比例）。原先持仓是
+{股票代码: 字典} 的嵌套字典，逐只股票、逐个字段在 Python 中计算，持仓数越多越慢。
+这里把持仓的数值字段按列保存为 NumPy 数组，以整数股票编号为下标：
+    - KhPositionBook: 持仓簿，兼容原持仓字典的用法（in / get / items / del 等）
+    - KhPositionView: 单只股票持仓的映射视图，读写直接作用于数组，可用于 dict(pos)、SimpleNamespace(**pos)
+    - KhDailyPricePanel: 按股票编号对齐的日线收盘价/前收盘价面板，用于每日收盘估值
+估值时由调用方按股票编号给出当前价格行，mark_to_market 一次向量化乘加完成全部持仓的估值。
+"""
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# 按列保存的数值字段（顺序即持仓视图的键顺序，与原持仓字典一致）
+POSITION_FIELDS = [
+    ("account_type", "i4"),
+    ("account_id", None),
+    ("stock_code", None),
+    ("volume", "i8"),
+    ("can_use_volume", "i8"),
+    ("open_price", "f8"),
+    ("market_value", "f8"),
+    ("frozen_volume", "i8"),
+    ("on_road_volume", "i8"),
+    ("yesterday_volume", "i8"),
+    ("avg_price", "f8"),
+    ("current_price", "f8"),
+    ("direction", "i4"),
+    ("profit", "f8"),
+    ("profit_ratio", "f8"),
+]
+
+ARRAY_FIELDS = tuple(name for name, kind in POSITION_FIELDS if kind is not None)
+FIELD_NAMES = tuple(name for name, _ in POSITION_FIELDS)
+
+
+class KhPositionView(Mapping):
+    """单只股票持仓的映射视图（不复制数据）"""
+
+    __slots__ = ("_book", "_sid")
+
+    def __init__(self, book: "KhPositionBook", sid: int):
+        self._book = book
+        self._sid = sid
+
+    def __getitem__(self, key):
+        return self._book._get(self._sid, key)
+
+    def __setitem__(self, key, value):
+        self._book._set(self._sid, key, value)
+
+    def __iter__(self):
+        yield from FIELD_NAMES
+        yield from self._book._extra[self._sid]
+
+    def __len__(self):
+        return len(FIELD_NAMES) + len(self._book._extra[self._sid])
+
+    def __contains__(self, key):
+        return key in self._book._field_set or key in self._book._extra[self._sid]
+
+    def copy(self) -> dict:
+        return dict(self)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class KhPositionBook(MutableMapping):
+    """以整数股票编号为下标的列式持仓簿
+
+    股票代码第一次出现时分配编号，编号在持仓簿生命周期内不变（清仓、clear 后仍保留），
+    因此调用方可以预先为股票池分配编号并按编号准备价格行。
+    持仓的遍历顺序与原字典一致：按建仓先后，清仓后再次建仓排到最后。
+
+    Args:
+        account_type: 新建持仓默认的账户类型
+        account_id: 新建持仓默认的资金账号
+        direction: 新建持仓默认的多空方向
+        capacity: 初始容量（股票数量），不足时按倍数扩容
+    """
+
+    def __init__(self, account_type: int = 0, account_id: str = "", direction: int = 0,
+                 capacity: int = 64):
+        self.account_type = account_type
+        self.account_id = account_id
+        self.direction = direction
+        self._field_set = frozenset(FIELD_NAMES)
+        self._ids: Dict[str, int] = {}
+        self.codes: List[str] = []
+        self._active: Dict[str, int] = {}  # 当前有持仓的股票 -> 编号（保持建仓顺序）
+        self._active_ids: Optional[np.ndarray] = None
+        self._extra: List[dict] = []  # 每只股票的非标准字段（如 account_id 或策略自行写入的键）
+        capacity = max(int(capacity), 1)
+        self._arrays: Dict[str, np.ndarray] = {
+            name: np.zeros(capacity, dtype=kind) for name, kind in POSITION_FIELDS if kind is not None
+        }
+
+    # ---- 股票编号 ----
+    @property
+    def capacity(self) -> int:
+        return len(self._arrays["volume"])
+
+    def _grow(self, required: int):
+        capacity = self.capacity
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+        for name, values in self._arrays.items():
+            grown = np.zeros(capacity, dtype=values.dtype)
+            grown[:len(values)] = values
+            self._arrays[name] = grown
+
+    def stock_id(self, code: str) -> int:
+        """返回股票编号，首次出现时分配"""
+        sid = self._ids.get(code)
+        if sid is None:
+            sid = len(self.codes)
+            self._grow(sid + 1)
+            self._ids[code] = sid
+            self.codes.append(code)
+            self._extra.append({})
+        return sid
+
+    def stock_ids(self, codes: Iterable[str]) -> np.ndarray:
+        return np.array([self.stock_id(code) for code in codes], dtype=np.int64)
+
+    def active_ids(self) -> np.ndarray:
+        """当前持仓的股票编号（按建仓顺序）"""
+        if self._active_ids is None:
+            self._active_ids = np.fromiter(self._active.values(), dtype=np.int64, count=len(self._active))
+        return self._active_ids
+
+    def price_row(self) -> np.ndarray:
+        """按股票编号排列的价格行（初始为 NaN，表示无报价）"""
+        return np.full(self.capacity, np.nan)
+
+    # ---- 字段读写 ----
+    def _get(self, sid: int, key):
+        values = self._arrays.get(key)
+        if values is not None:
+            return values[sid].item()
+        if key == "stock_code":
+            return self.codes[sid]
+        extra = self._extra[sid]
+        if key in extra:
+            return extra[key]
+        if key == "account_id":
+            return self.account_id
+        raise KeyError(key)
+
+    def _set(self, sid: int, key, value):
+        values = self._arrays.get(key)
+        if values is not None:
+            values[sid] = 0 if value is None else value
+        elif key != "stock_code":
+            self._extra[sid][key] = value
+
+    # ---- 映射接口 ----
+    def __getitem__(self, code) -> KhPositionView:
+        return KhPositionView(self, self._active[code])
+
+    def __setitem__(self, code, position):
+        """写入（或覆盖）一只股票的持仓，未给出的字段按默认值处理"""
+        sid = self.stock_id(code)
+        self._reset_row(sid)
+        self._arrays["account_type"][sid] = self.account_type
+        self._arrays["direction"][sid] = self.direction
+        for key, value in position.items():
+            self._set(sid, key, value)
+        if code not in self._active:
+            self._active[code] = sid
+            self._active_ids = None
+
+    def __delitem__(self, code):
+        sid = self._active.pop(code)
+        self._active_ids = None
+        self._reset_row(sid)
+
+    def _reset_row(self, sid: int):
+        for values in self._arrays.values():
+            values[sid] = 0
+        self._extra[sid].clear()
+
+    def __iter__(self):
+        return iter(self._active)
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, code):
+        return code in self._active
+
+    def clear(self):
+        """清空全部持仓（保留已分配的股票编号）"""
+        for sid in self._active.values():
+            self._reset_row(sid)
+        self._active.clear()
+        self._active_ids = None
+
+    def copy(self) -> Dict[str, dict]:
+        """导出为 {股票代码: 持仓字典} 的快照"""
+        return {code: dict(KhPositionView(self, sid)) for code, sid in self._active.items()}
+
+    def __repr__(self):
+        return repr(self.copy())
+
+    def volume_of(self, code) -> int:
+        """某只股票的持仓数量（无持仓为0）"""
+        sid = self._active.get(code)
+        return 0 if sid is None else int(self._arrays["volume"][sid])
+
+    def column(self, name: str) -> np.ndarray:
+        """当前持仓某一字段的数组（按建仓顺序）"""
+        return self._arrays[name][self.active_ids()]
+
+    # ---- 估值 ----
+    def mark_to_market(self, prices: np.ndarray) -> float:
+        """按价格行对全部持仓估值，更新 current_price/market_value/profit/profit_ratio
+
+        Args:
+            prices: 按股票编号排列的最新价，NaN 表示无报价，此时沿用持仓的当前价（>0）或持仓均价
+
+        Returns:
+            float: 持仓总市值
+        """
+        ids = self.active_ids()
+        if len(ids) == 0:
+            return 0.0
+        prices = np.asarray(prices, dtype=np.float64)
+        if len(prices) < self.capacity:
+            prices = np.concatenate((prices, np.full(self.capacity - len(prices), np.nan)))
+        arrays = self._arrays
+        price = prices[ids]
+        missing = np.isnan(price)
+        if missing.any():
+            last = arrays["current_price"][ids]
+            fallback = np.where(last > 0, last, arrays["avg_price"][ids])
+            price = np.where(missing, fallback, price)
+        volume = arrays["volume"][ids]
+        avg_price = arrays["avg_price"][ids]
+        market_value = price * volume
+        arrays["current_price"][ids] = price
+        arrays["market_value"][ids] = market_value
+        arrays["profit"][ids] = (price - avg_price) * volume
+        with np.errstate(divide="ignore", invalid="ignore"):
+            arrays["profit_ratio"][ids] = np.where(avg_price > 0, (price - avg_price) / avg_price, 0.0)
+        return float(market_value.sum())
+
+    def total_market_value(self) -> float:
+        """按已记录的市值汇总（不重新估值，只计正市值）"""
+        market_value = self.column("market_value")
+        return float(market_value[market_value > 0].sum())
+
+
+class KhDailyPricePanel:
+    """按持仓簿编号对齐的日线价格面板（日期 × 股票）
+
+    回测开始时一次性加载整个股票池、整个回测区间的日线收盘价与前收盘价，
+    每日收盘估值时按日期取一行直接写入价格行，不再逐日请求行情。
+
+    Args:
+        dates: 交易日列表（YYYYMMDD 字符串）
+        sids: 各列对应的持仓簿股票编号
+        close: 收盘价矩阵，形状为 (日期数, 股票数)，缺失为 NaN
+        pre_close: 前收盘价矩阵，形状同 close，可为 None
+    """
+
+    def __init__(self, dates: List[str], sids: np.ndarray, close: np.ndarray,
+                 pre_close: Optional[np.ndarray] = None):
+        self.dates = [str(date)[:8] for date in dates]
+        self._date_index = {date: i for i, date in enumerate(self.dates)}
+        self.sids = np.asarray(sids, dtype=np.int64)
+        self._sid_set = frozenset(self.sids.tolist())
+        self.close = np.asarray(close, dtype=np.float64)
+        self.pre_close = None if pre_close is None else np.asarray(pre_close, dtype=np.float64)
+
+    def __contains__(self, date) -> bool:
+        return str(date).replace('-', '')[:8] in self._date_index
+
+    def covers(self, sid: int) -> bool:
+        """面板中是否包含该股票"""
+        return sid in self._sid_set
+
+    def row_index(self, date) -> Optional[int]:
+        return self._date_index.get(str(date).replace('-', '')[:8])
+
+    def apply_close(self, prices: np.ndarray, date) -> bool:
+        """把当日有效（>0）的收盘价写入按编号排列的价格行，日期不在面板中时返回 False"""
+        row = self.row_index(date)
+        if row is None:
+            return False
+        values = self.close[row]
+        with np.errstate(invalid="ignore"):
+            valid = values > 0
+        prices[self.sids[valid]] = values[valid]
+        return True
+
+    def pre_close_row(self, date) -> Optional[np.ndarray]:
+        """当日各股票的前收盘价（列顺序与 sids 一致），无数据时返回 None"""
+        row = self.row_index(date)
+        if row is None or self.pre_close is None:
+            return None
+        return self.pre_close[row]
@@ -326,6 +326,27 @@ def khMA(stock_code: str, period: int, field: str = 'close', fre_step: str = '1d
     return round(prices.mean(), 2)
 
 
+_default_cost_model = None
+
+def _get_cost_model(data: Dict):
+    """获取成本模型：优先使用框架交易管理器上缓存的模型，否则使用默认交易成本设置"""
+    global _default_cost_model
+    framework = data.get("__framework__", None)
+    trade_mgr = getattr(framework, "trade_mgr", None)
+    if trade_mgr is not None:
+        return trade_mgr.cost_model
+    if framework is not None and hasattr(framework, "config"):
+        cache = getattr(framework, "_kh_cost_model", None)
+        if cache is None:
+            cache = KhTradeManager(framework.config).cost_model
+            framework._kh_cost_model = cache
+        return cache
+    if _default_cost_model is None:
+        logging.warning("未从数据字典中获取到框架对象或框架配置不可用，将使用默认交易成本设置")
+        config = SimpleNamespace(config_dict={"backtest": {"trade_cost": {}}})
+        _default_cost_model = KhTradeManager(config).cost_model
+    return _default_cost_model
+
 def calculate_max_buy_volume(data: Dict, stock_code: str, price: float, cash_ratio: float = 1.0) -> int:
     """
     计算最大可买入数量，考虑交易成本（包括滑点）
@@ -340,9 +361,6 @@ def calculate_max_buy_volume(data: Dict, stock_code: str, price: float, cash_rat
         int: 最大可买入股数(按手取整)
     """
     try:
-        # 导入交易管理类
-        from khTrade import KhTradeManager
-
         # 获取账户信息
         account_info = data.get("__account__", {})
         if not account_info:
@@ -363,58 +381,67 @@ def calculate_max_buy_volume(data: Dict, stock_code: str, price: float, cash_rat
         # 对价格进行四舍五入处理，保留2位小数（A股价格精度为分）
         price = round(price, 2)
 
-        # 获取框架对象
-        framework = data.get("__framework__", None)
-        
-        # 获取配置对象
-        if framework and hasattr(framework, 'config'):
-            config = framework.config
-        else:
-            logging.warning("未从数据字典中获取到框架对象或框架配置不可用，将使用默认交易成本设置")
-            config = SimpleNamespace(config_dict={"backtest": {"trade_cost": {}}})
-            
-        # 创建交易管理器实例（使用实际配置）
-        trade_manager = KhTradeManager(config)
-        
-        # 获取交易成本参数
-        commission_rate = trade_manager.commission_rate
-        transfer_fee_rate = 0.00001 if stock_code.startswith("sh.") else 0.0  # 沪市股票才有过户费
-        
-        # 估算最大股数 (向下取整到100的倍数)
-        # 使用更精确的初始估算方式
-        estimated_shares = math.floor(usable_cash / price / (1 + commission_rate + transfer_fee_rate))
-        shares = math.floor(estimated_shares / 100) * 100
-
-        # 如果估算股数小于100，则无法买入
+        # 使用框架缓存的成本模型，直接反解最大可买数量（已按手取整，包含最低佣金和滑点）
+        cost_model = _get_cost_model(data)
+        shares = cost_model.max_buy_volume(price, usable_cash, stock_code)
         if shares < 100:
             return 0
 
-        # 逐步减少股数，使用calculate_trade_cost精确计算成本
-        while shares >= 100:
-            # 使用calculate_trade_cost计算实际交易成本（包括滑点）
-            actual_price, trade_cost = trade_manager.calculate_trade_cost(
-                price=price,
-                volume=shares,
-                direction="buy",
-                stock_code=stock_code
-            )
-            
-            # 计算总花费（实际价格 * 数量 + 交易成本）
-            total_cost = actual_price * shares + trade_cost
+        actual_price = cost_model.buy_price(price)
+        total_cost = cost_model.buy_total(actual_price, shares, cost_model.transfer_fee_rate(stock_code))
+        logging.info(f"计算买入量: 股票={stock_code}, 原始价格={price:.2f}, 考虑滑点后价格={actual_price:.2f}, "
+                   f"可用现金={available_cash:.2f}, 使用比例={cash_ratio:.2f}, "
+                   f"计划买入={shares}, 成本={total_cost - actual_price * shares:.2f}, 总花费={total_cost:.2f}")
+        return int(shares) # 确保返回整数
 
-            if total_cost <= usable_cash:
-                logging.info(f"计算买入量: 股票={stock_code}, 原始价格={price:.2f}, 考虑滑点后价格={actual_price:.2f}, "
-                           f"可用现金={available_cash:.2f}, 使用比例={cash_ratio:.2f}, "
-                           f"计划买入={shares}, 成本={trade_cost:.2f}, 总花费={total_cost:.2f}")
-                return int(shares) # 确保返回整数
+    except Exception as e:
+        logging.error(f"计算最大可买入数量时出错: {str(e)}", exc_info=True)
+        return 0
 
-            shares -= 100 # 减少一手
+def calculate_max_buy_volumes(data: Dict, stock_codes: List[str], prices, cash_ratio: float = 1.0,
+                              weights=None) -> Dict[str, int]:
+    """
+    批量计算多只股票的最大可买入数量（向量化），适用于等权或按权重分配资金的建仓
 
-        return 0 # 循环结束仍未找到合适的买入量
+    Args:
+        data: 策略接收的数据对象，包含账户信息 __account__ 和框架信息 __framework__
+        stock_codes: 股票代码列表
+        prices: 与 stock_codes 对应的价格（列表、数组或 {代码: 价格} 字典）
+        cash_ratio: 使用可用资金的比例，默认为1.0
+        weights: 各股票的资金权重，默认等权；权重会归一化
+
+    Returns:
+        Dict[str, int]: {股票代码: 最大可买股数(按手取整)}，每只股票只使用分配给它的资金
+    """
+    try:
+        stock_codes = list(stock_codes)
+        if not stock_codes:
+            return {}
+        account_info = data.get("__account__", {})
+        if not account_info:
+            logging.warning("无法获取账户信息，无法计算最大买入量")
+            return {code: 0 for code in stock_codes}
+
+        if isinstance(prices, dict):
+            prices = [prices.get(code, 0.0) for code in stock_codes]
+        prices = np.round(np.asarray(prices, dtype=np.float64), 2)
+
+        if weights is None:
+            weights = np.full(len(stock_codes), 1.0 / len(stock_codes))
+        else:
+            if isinstance(weights, dict):
+                weights = [weights.get(code, 0.0) for code in stock_codes]
+            weights = np.asarray(weights, dtype=np.float64)
+            total_weight = weights.sum()
+            weights = weights / total_weight if total_weight > 0 else np.zeros(len(stock_codes))
+
+        budgets = account_info.get("cash", 0.0) * cash_ratio * weights
+        volumes = _get_cost_model(data).max_buy_volumes(prices, budgets, stock_codes)
+        return {code: int(volume) for code, volume in zip(stock_codes, volumes)}
 
     except Exception as e:
-        logging.error(f"计算最大可买入数量时出错: {str(e)}", exc_info=True)
-        return 0
+        logging.error(f"批量计算最大可买入数量时出错: {str(e)}", exc_info=True)
+        return {code: 0 for code in stock_codes}
 
 def generate_signal(data: Dict, stock_code: str, price: float, ratio: float, action: str, reason: str = "") -> List[Dict]:
     """
@@ -520,6 +547,117 @@ def generate_signal(data: Dict, stock_code: str, price: float, ratio: float, act
 
     return signals
 
+def _current_prices(data: Dict, stock_codes: List[str], field: str = "close") -> np.ndarray:
+    """从策略数据中读取一批股票的当前价格，取不到时为0"""
+    prices = np.zeros(len(stock_codes), dtype=np.float64)
+    for i, code in enumerate(stock_codes):
+        stock_data = data.get(code)
+        if stock_data is None:
+            continue
+        try:
+            value = stock_data[field]
+            if hasattr(value, 'iloc'):
+                value = value.iloc[-1]
+            elif hasattr(value, '__len__') and not isinstance(value, str):
+                value = value[-1]
+            value = float(value)
+            if np.isfinite(value):
+                prices[i] = value
+        except (KeyError, IndexError, TypeError, ValueError):
+            continue
+    return prices
+
+def compute_target_orders(data: Dict, target_volumes: Dict[str, float], prices=None,
+                          reason: str = "", lot_size: int = 100) -> List[Dict]:
+    """
+    目标持仓差分引擎：一次性比较当前持仓与目标持仓，生成全部调仓信号
+
+    规则：
+        1. 目标数量按手向下取整；清仓（目标为0）时卖出全部可用持仓（包括零股）；
+        2. 卖出数量不超过可用持仓，卖出信号排在买入信号之前；
+        3. 买入资金 = 可用资金 + 卖出预计回笼资金（扣除卖出成本），按成本模型计算的买入总花费
+           超出预算时，先按比例缩减各买入数量，再从金额最大的买入逐手削减直至满足预算。
+
+    Args:
+        data: 策略数据字典（包含 __account__、__positions__ 与 __framework__）
+        target_volumes: {股票代码: 目标持仓股数}
+        prices: 可选，{股票代码: 价格}，默认使用当前 close 价格
+        reason: 信号原因，默认自动生成
+        lot_size: 每手股数，默认100
+
+    Returns:
+        List[Dict]: 交易信号列表（先卖后买）
+    """
+    codes = list(target_volumes.keys())
+    if not codes:
+        return []
+
+    if prices is None:
+        price_arr = _current_prices(data, codes)
+    else:
+        price_arr = np.array([prices.get(code, 0.0) for code in codes], dtype=np.float64)
+    price_arr = np.round(price_arr, 2)
+
+    positions = data.get("__positions__", {}) or {}
+    current = np.array([positions.get(code, {}).get("volume", 0) for code in codes], dtype=np.int64)
+    available = np.array([positions.get(code, {}).get("can_use_volume", positions.get(code, {}).get("volume", 0))
+                          for code in codes], dtype=np.int64)
+    targets = np.maximum(np.asarray([target_volumes[code] for code in codes], dtype=np.float64), 0)
+    targets = (np.floor(targets / lot_size) * lot_size).astype(np.int64)
+
+    valid = price_arr > 0
+    for code in np.asarray(codes, dtype=object)[~valid]:
+        logging.warning(f"无法获取股票 {code} 的价格信息，跳过目标持仓调整")
+
+    diff = targets - current
+    # 卖出：清仓时卖出全部可用持仓，否则按手取整
+    sell = np.where(diff < 0, -diff, 0)
+    sell = np.where(targets == 0, sell, (sell // lot_size) * lot_size)
+    sell = np.where(valid, np.minimum(sell, available), 0)
+    # 买入：按手取整
+    buy = np.where(valid & (diff > 0), (diff // lot_size) * lot_size, 0)
+
+    cost_model = _get_cost_model(data)
+    sell_costs = cost_model.trade_costs(price_arr, sell, np.zeros(len(codes), dtype=bool), codes)
+    proceeds = float(np.sum(sell_costs["actual_price"] * sell - sell_costs["total"]))
+    budget = data.get("__account__", {}).get("cash", 0.0) + proceeds
+
+    def buy_totals(volumes):
+        costs = cost_model.trade_costs(price_arr, volumes, np.ones(len(codes), dtype=bool), codes)
+        return costs["actual_price"] * volumes + costs["total"]
+
+    totals = buy_totals(buy)
+    required = float(totals.sum())
+    if required > budget and required > 0:
+        # 先按比例缩减，再逐手削减金额最大的买入
+        scale = max(budget, 0.0) / required
+        buy = (np.floor(buy * scale / lot_size) * lot_size).astype(np.int64)
+        totals = buy_totals(buy)
+        while totals.sum() > budget and buy.any():
+            largest = int(np.argmax(np.where(buy > 0, totals, -1.0)))
+            buy[largest] -= lot_size
+            totals = buy_totals(buy)
+        logging.info(f"目标持仓买入资金不足: 需要={required:.2f}, 可用={budget:.2f}, 已按比例缩减买入数量")
+
+    timestamp = data.get("__current_time__", {}).get("timestamp")
+    signals = []
+    for action, volumes in (("sell", sell), ("buy", buy)):
+        for i in np.nonzero(volumes > 0)[0]:
+            code = codes[i]
+            signal = {
+                "code": code,
+                "action": action,
+                "price": float(price_arr[i]),
+                "volume": int(volumes[i]),
+                "reason": reason or f"目标持仓调整 {code}: {int(current[i])} -> {int(targets[i])}股"
+            }
+            if timestamp:
+                signal["timestamp"] = timestamp
+            signals.append(signal)
+    if signals:
+        logging.info(f"生成目标持仓调仓信号 {len(signals)} 个")
+    return signals
+
 def read_stock_csv(file_path):
     """
     读取股票CSV文件，支持多种编码格式，并进行错误处理。
@@ -1988,6 +2126,47 @@ def khHistory(symbol_list, fields, bar_count, fre_step, current_time=None, skip_
     return result
 
 
+def downcast_frame(df: pd.DataFrame, precision: str = "float32", exclude=("time", "amount")) -> pd.DataFrame:
+    """
+    将行情DataFrame转换为紧凑数据类型，用于大规模分钟级/因子研究时降低内存占用
+    
+    参数:
+        df: 行情数据DataFrame
+        precision: 目标精度，"float32"时转换，"float64"时原样返回
+        exclude: 不转换的列。time为毫秒时间戳必须保持int64；amount数值量级大，float32会损失到元级精度
+    
+    返回:
+        DataFrame: 浮点列转为float32，整数列在取值范围允许时转为int32（如成交量），其余列不变
+    
+    说明:
+        float32约有7位有效数字，两位小数的价格在99999.99以内（共7位有效数字）可以精确到分，
+        更大的价格会损失分位精度；MyTT 指标函数直接以 float32 输入计算（DMI/MFI/ASI/TAN 先还原三位小数价格），
+        由此产生的指标误差见 benchmarks/mytt_bench.py 中的 FLOAT32_TOLERANCE。
+    """
+    if precision != "float32" or not isinstance(df, pd.DataFrame) or df.empty:
+        return df
+    
+    converted = {}
+    int32_info = np.iinfo(np.int32)
+    for col in df.columns:
+        if col in exclude:
+            continue
+        dtype = df[col].dtype
+        if dtype == np.float64:
+            converted[col] = df[col].astype(np.float32)
+        elif dtype == np.int64:
+            values = df[col].values
+            if values.min() >= int32_info.min and values.max() <= int32_info.max:
+                converted[col] = df[col].astype(np.int32)
+    
+    if not converted:
+        return df
+    result = df.copy(deep=False)
+    for col, values in converted.items():
+        result[col] = values
+    return result
+
+
 def test_khHistory():
     """测试khHistory函数的各种参数组合"""
     print("开始测试khHistory函数...")
@@ -18,28 +18,140 @@ from typing import Dict, List, Optional, Union, Tuple, Any
 import numpy as np
 import pandas as pd
 
-# ===== 量化库 =====
-from xtquant import xtdata
-try:
-    from xtquant.xttrader import XtQuantTrader, XtQuantTraderCallback
-except ImportError:
-    # 如果没有交易模块，提供占位符
-    XtQuantTrader = None
-    XtQuantTraderCallback = None
-
-# ===== 项目内部工具 =====
-import khQTTools as _khq
-from khQTTools import (
-    generate_signal, calculate_max_buy_volume, KhQuTools, khMA,
-    # 新增的独立函数，可以直接使用，无需实例化类
-    is_trade_time, is_trade_day, get_trade_days_count
-)
-# 同时将 khQTTools 的其他常用工具函数暴露出来（如 khHistory 等）
-from khQTTools import *
-
-# ===== 指标库（MyTT） =====
-import MyTT as _mytt
-from MyTT import *  # 暴露 MA/RSI 等指标函数
+# ===== 延迟导入 =====
+# xtquant、khQTTools（连带 khTrade、holidays、Qt）与 MyTT 的导入开销占本模块导入时间的大部分，
+# 而进程池参数扫描、子进程回测的每个工作进程都要重新导入一次。这些名字先绑定为 _KhLazy 占位对象，
+# 第一次被调用或访问属性时才导入所属模块，并把本模块中的同名变量替换为真实对象，
+# 因此 from khQuantImport import * 不会触发导入，策略中的 RSI(...)、xtdata.get_market_data(...) 用法不变。
+# 新增公共名字时需同步登记到 _LAZY_EXPORTS（benchmarks/import_bench.py --check 会检查遗漏）。
+import time
+import math
+import csv
+import glob
+import ast
+import functools
+import importlib
+from types import SimpleNamespace
+from datetime import datetime  # 与原先 from khQTTools import * 的结果一致：datetime 为类而非模块
+
+_LAZY_EXPORTS = {
+    # 量化库
+    'xtquant.xtdata': ('xtdata',),
+    'xtquant.xttrader': ('XtQuantTrader', 'XtQuantTraderCallback'),
+    # 项目内部工具（含 khQTTools 顺带导出的名字）
+    'khQTTools': (
+        'generate_signal', 'calculate_max_buy_volume', 'calculate_max_buy_volumes', 'KhQuTools', 'khMA',
+        'compute_target_orders', 'is_trade_time', 'is_trade_day', 'get_trade_days_count',
+        'khHistory', 'tools', 'StockListUpdateThread', 'calculate_intraday_features',
+        'calculate_next_day_return', 'downcast_frame', 'download_and_store_data', 'get_and_save_stock_list',
+        'get_available_sectors', 'get_stock_list', 'get_stock_names', 'is_subprocess', 'process_row',
+        'read_stock_csv', 'save_stock_list_to_csv', 'supplement_history_data', 'test_khHistory',
+        'KhTradeManager', 'holidays', 'QThread', 'pyqtSignal',
+    ),
+    # 向量化回测工具（khSignals 中对齐 时间 × 股票 矩阵）
+    'khVector': ('panel_matrix',),
+    # 指标库（MyTT，同名时覆盖 khQTTools）
+    'MyTT': (
+        'ABS', 'ASI', 'ATR', 'AVEDEV', 'BARSLAST', 'BARSLASTCOUNT', 'BARSSINCEN', 'BBI', 'BETWEEN', 'BIAS',
+        'BOLL', 'BRAR', 'CCI', 'CONST', 'COS', 'COUNT', 'CR', 'CROSS', 'DFMA', 'DIFF', 'DMA', 'DMI', 'DPO',
+        'DSMA', 'EMA', 'EMV', 'EVERY', 'EXIST', 'EXPMA', 'FILTER', 'FORCAST', 'HHV', 'HHVBARS', 'IF', 'KDJ',
+        'KTN', 'LAST', 'LLV', 'LLVBARS', 'LN', 'LONGCROSS', 'LOWRANGE', 'MA', 'MACD', 'MASS', 'MAX', 'MFI',
+        'MIN', 'MTM', 'OBV', 'POW', 'PSY', 'RD', 'REF', 'RET', 'ROC', 'RSI', 'SAR', 'SIN', 'SLOPE', 'SMA',
+        'SQRT', 'STD', 'SUM', 'SUMBARSFAST', 'TAN', 'TAQ', 'TDX_SAR', 'TOPRANGE', 'TRIX', 'VALUEWHEN', 'VR',
+        'WMA', 'WR', 'XSII',
+    ),
+}
+
+# 可缺失的模块：导入失败时对应名字解析为 None（如没有交易模块时的 XtQuantTrader）
+_OPTIONAL_MODULES = frozenset({'xtquant.xttrader'})
+
+_MISSING = object()
+
+
+def _resolve(module_name: str, name: str):
+    """导入模块并取出名字，同时把本模块中的同名占位对象替换为真实对象"""
+    try:
+        module = importlib.import_module(module_name)
+    except ImportError:
+        if module_name not in _OPTIONAL_MODULES:
+            raise
+        value = None
+    else:
+        value = module if module_name.endswith('.' + name) else getattr(module, name)
+    if isinstance(globals().get(name), _KhLazy):
+        globals()[name] = value
+    return value
+
+
+class _KhLazy:
+    """延迟导入的占位对象：第一次调用或访问属性时导入真实对象，之后直接转发
+
+    转发 调用 / 属性读写 / __class__ / isinstance / 继承（__mro_entries__），函数、类、模块、实例均可透明使用。
+    """
+
+    __slots__ = ('_kh_module', '_kh_name', '_kh_target')
+
+    def __init__(self, module_name: str, name: str):
+        object.__setattr__(self, '_kh_module', module_name)
+        object.__setattr__(self, '_kh_name', name)
+        object.__setattr__(self, '_kh_target', _MISSING)
+
+    def _kh_load(self):
+        target = self._kh_target
+        if target is _MISSING:
+            target = _resolve(self._kh_module, self._kh_name)
+            object.__setattr__(self, '_kh_target', target)
+        return target
+
+    def __call__(self, *args, **kwargs):
+        return self._kh_load()(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self._kh_load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._kh_load(), attr, value)
+
+    def __bool__(self):
+        return bool(self._kh_load())
+
+    @property
+    def __class__(self):
+        return type(self._kh_load())
+
+    def __instancecheck__(self, instance):
+        return isinstance(instance, self._kh_load())
+
+    def __subclasscheck__(self, subclass):
+        return issubclass(subclass, self._kh_load())
+
+    def __mro_entries__(self, bases):
+        return (self._kh_load(),)
+
+    def __repr__(self):
+        if self._kh_target is _MISSING:
+            return f"<延迟导入 {self._kh_module}.{self._kh_name}>"
+        return repr(self._kh_target)
+
+
+_LAZY_NAMES: Dict[str, str] = {}
+for _module_name, _names in _LAZY_EXPORTS.items():
+    for _name in _names:
+        _LAZY_NAMES[_name] = _module_name
+        globals()[_name] = _KhLazy(_module_name, _name)
+del _module_name, _names, _name
+
+
+def __getattr__(name: str):
+    """PEP 562：khQuantImport.<名字> 访问未登记的名字时，依次到 MyTT、khQTTools 中查找"""
+    if name.startswith('__'):
+        raise AttributeError(name)
+    for module_name in ('MyTT', 'khQTTools'):
+        value = getattr(importlib.import_module(module_name), name, _MISSING)
+        if value is not _MISSING:
+            globals()[name] = value
+            return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ===== 时间标准化类 =====
 class TimeInfo:
@@ -281,6 +393,18 @@ def parse_context(data: Dict) -> StrategyContext:
     """解析策略数据为上下文对象"""
     return StrategyContext(data)
 
+# 同一个 bar 内不变、可按 bar 缓存的 khGet 键
+_BAR_STATIC_KEYS = frozenset([
+    "date", "date_str", "time", "time_str", "datetime", "datetime_str", "date_num", "timestamp", "datetime_obj",
+    "first_stock", "stocks",
+])
+
+
+def _bar_context(data):
+    """回测框架传入的逐 bar 上下文（khContext.KhBarContext），没有时返回 None"""
+    return data.get("__bar__") if type(data) is dict else None
+
+
 def khGet(data: Dict, key: str) -> Any:
     """通用的数据获取函数
     
@@ -303,6 +427,15 @@ def khGet(data: Dict, key: str) -> Any:
     Returns:
         Any: 对应的数据值
     """
+    bar = _bar_context(data)
+    if bar is not None and key in _BAR_STATIC_KEYS:
+        value = bar.cached(key, lambda: _khGet(data, key))
+        return value.copy() if key == "stocks" else value
+    return _khGet(data, key)
+
+
+def _khGet(data: Dict, key: str) -> Any:
+    """khGet 的通用解析实现"""
     # 时间相关
     if key in ["date", "date_str", "time", "time_str", "datetime", "datetime_str", "date_num", "timestamp", "datetime_obj"]:
         time_info = TimeInfo(data)
@@ -354,6 +487,16 @@ def khPrice(data: Dict, stock_code: str, field: str = 'close') -> float:
     Returns:
         float: 股票价格，如果获取失败返回0.0
     """
+    # 快速路径：回测框架提供逐 bar 上下文时直接按下标取值
+    bar = _bar_context(data)
+    if bar is not None:
+        price = bar.price(stock_code, field)
+        if price is not None:
+            if price != price:
+                logging.warning(f"股票 {stock_code} 的 {field} 价格数据无效: {price}")
+                return 0.0
+            return price
+    
     try:
         stocks = StockDataParser(data)
         price = stocks.get_price(stock_code, field)
@@ -416,6 +559,10 @@ def khHas(data: Dict, stock_code: str) -> bool:
     Returns:
         bool: 是否持有该股票
     """
+    bar = _bar_context(data)
+    if bar is not None and bar.positions is not None and data.get("__positions__") is bar.positions:
+        return bar.has_position(stock_code)
+    
     try:
         positions = PositionParser(data)
         return positions.has(stock_code)
@@ -479,6 +626,121 @@ def khSell(data: Dict, stock_code: str, ratio: float = 1.0, volume: Optional[int
         logging.error(f"生成卖出信号时出错: {str(e)}")
         return {}
 
+def _portfolio_value(data: Dict, prices: Optional[Dict[str, float]] = None) -> float:
+    """按当前价格估算账户总资产（现金 + 持仓市值）"""
+    account = data.get("__account__", {})
+    total = account.get("cash", 0.0)
+    for code, position in (data.get("__positions__", {}) or {}).items():
+        price = prices.get(code, 0.0) if prices else 0.0
+        if price <= 0:
+            price = khPrice(data, code) if code in data else 0.0
+        if price <= 0:
+            price = position.get("current_price", position.get("avg_price", 0.0))
+        total += position.get("volume", 0) * price
+    return total
+
+def order_target_volume(data: Dict, stock_code: str, volume: int, price: Optional[float] = None,
+                        reason: str = "") -> List[Dict]:
+    """调整持仓到目标股数
+    
+    Args:
+        data: 策略数据字典
+        stock_code: 股票代码
+        volume: 目标持仓股数（按手向下取整，0表示清仓）
+        price: 委托价格，默认使用当前收盘价
+        reason: 交易原因
+        
+    Returns:
+        List[Dict]: 交易信号列表（已持有目标数量时为空）
+    """
+    try:
+        prices = {stock_code: price} if price else None
+        return compute_target_orders(data, {stock_code: volume}, prices, reason)
+    except Exception as e:
+        logging.error(f"生成目标持仓信号时出错: {str(e)}")
+        return []
+
+def order_target_value(data: Dict, stock_code: str, value: float, price: Optional[float] = None,
+                       reason: str = "") -> List[Dict]:
+    """调整持仓到目标市值
+    
+    Args:
+        data: 策略数据字典
+        stock_code: 股票代码
+        value: 目标持仓市值（元）
+        price: 委托价格，默认使用当前收盘价
+        reason: 交易原因
+        
+    Returns:
+        List[Dict]: 交易信号列表
+    """
+    try:
+        current_price = price or khPrice(data, stock_code)
+        if current_price <= 0:
+            logging.warning(f"无法获取股票 {stock_code} 的价格信息，跳过目标市值调整")
+            return []
+        return order_target_volume(data, stock_code, value / current_price, current_price, reason)
+    except Exception as e:
+        logging.error(f"生成目标市值信号时出错: {str(e)}")
+        return []
+
+def order_target_percent(data: Dict, stock_code: str, percent: float, price: Optional[float] = None,
+                         reason: str = "") -> List[Dict]:
+    """调整持仓到占总资产的目标比例
+    
+    Args:
+        data: 策略数据字典
+        stock_code: 股票代码
+        percent: 目标仓位比例，如0.1表示占总资产10%
+        price: 委托价格，默认使用当前收盘价
+        reason: 交易原因
+        
+    Returns:
+        List[Dict]: 交易信号列表
+    """
+    try:
+        prices = {stock_code: price} if price else None
+        return order_target_value(data, stock_code, _portfolio_value(data, prices) * percent, price, reason)
+    except Exception as e:
+        logging.error(f"生成目标比例信号时出错: {str(e)}")
+        return []
+
+def rebalance_to(data: Dict, weights: Dict[str, float], prices: Optional[Dict[str, float]] = None,
+                 cash_buffer: float = 0.0, reason: str = "") -> List[Dict]:
+    """组合调仓：把整个账户调整到目标权重
+    
+    未出现在 weights 中的现有持仓会被清仓；所有股票的目标股数一次性向量化计算，
+    并统一进行成本感知的资金预算（先卖后买）。
+    
+    Args:
+        data: 策略数据字典
+        weights: {股票代码: 目标权重}，权重为占总资产的比例，合计不应超过1
+        prices: 可选，{股票代码: 价格}，默认使用当前收盘价
+        cash_buffer: 预留现金比例，如0.02表示只用98%的总资产建仓
+        reason: 交易原因
+        
+    Returns:
+        List[Dict]: 交易信号列表（先卖后买）
+    """
+    try:
+        codes = list(weights.keys())
+        codes += [code for code in (data.get("__positions__", {}) or {}) if code not in weights]
+        prices = dict(prices or {})
+        for code in codes:
+            if prices.get(code, 0) <= 0:
+                prices[code] = khPrice(data, code)
+        price_arr = np.array([prices.get(code, 0.0) for code in codes], dtype=np.float64)
+        weight_arr = np.array([weights.get(code, 0.0) for code in codes], dtype=np.float64)
+        
+        investable = _portfolio_value(data, prices) * (1 - cash_buffer)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            target_arr = np.where(price_arr > 0, investable * weight_arr / price_arr, 0.0)
+        targets = dict(zip(codes, target_arr))
+        return compute_target_orders(data, targets, prices, reason or "组合调仓")
+    except Exception as e:
+        logging.error(f"生成组合调仓信号时出错: {str(e)}")
+        return []
+
 def get_default_risk_params() -> Dict:
     """获取默认的风控参数"""
     return {
@@ -503,7 +765,7 @@ __all__ = [
     'xtdata', 'XtQuantTrader', 'XtQuantTraderCallback',
     
     # 内部工具
-    'generate_signal', 'calculate_max_buy_volume', 'KhQuTools',
+    'generate_signal', 'calculate_max_buy_volume', 'calculate_max_buy_volumes', 'KhQuTools',
     
     # 时间工具函数 - 可直接使用，无需实例化类
     'is_trade_time', 'is_trade_day', 'get_trade_days_count',
@@ -512,10 +774,11 @@ __all__ = [
     'TimeInfo', 'StockDataParser', 'PositionParser', 'StockPoolParser',
     'StrategyContext', 'parse_context', 'khGet', 'khPrice', 'khHas',
     'khBuy', 'khSell', 'get_default_risk_params',
+    'order_target_volume', 'order_target_value', 'order_target_percent', 'rebalance_to',
     # 指标函数（MyTT）与项目内均线
     'MA', 'RSI', 'khMA'
 ] 
 
-# 自动并入 khQTTools 与 MyTT 的所有公共符号，便于 from khQuantImport import * 统一入口
-__all__ += [name for name in dir(_khq) if not name.startswith('_') and name not in __all__]
-__all__ += [name for name in dir(_mytt) if not name.startswith('_') and name not in __all__]
\ No newline at end of file
+# 延迟导入的 khQTTools 与 MyTT 公共符号同样并入，from khQuantImport import * 仍是统一入口（不会触发导入）
+__all__ += [name for name in _LAZY_NAMES if name not in __all__]
+__all__ += ['time', 'math', 'csv', 'glob', 'ast', 'functools', 'SimpleNamespace']
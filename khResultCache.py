@@ -0,0 +1,160 @@
+# coding: utf-8
+"""
+回测结果缓存
+
+策略、配置与数据都没有变化时重新回测，结果必然与上一次相同，却仍要重跑整个回测循环并重写结果目录。
+启用结果缓存后，回测在数据加载完成后计算缓存键：
+    - 策略：各策略文件源码的哈希（多策略回测时包含全部策略）
+    - 配置：.kh 中影响回测结果的字段（account/backtest/data/risk/market_callback/run_mode），
+      不含 system 等与结果无关的设置，也不含 backtest.checkpoint、backtest.result_cache 与 backtest.profile
+    - 数据：已加载行情（各股票各字段的数组内容）与基准指数收盘价的哈希
+    - 引擎：框架各回测模块源码的哈希，框架升级后旧缓存自动失效
+命中时直接把缓存的结果文件复制到回测目录，并把缓存的回测记录与期末账户（state.pkl）装回框架，
+run_headless 的调用方（滚动窗口回测、基准测试等）读到的结果与实际回测一致；未命中时正常回测，完成后写入缓存。
+缓存按内容寻址保存在 <dir>/<键>/ 下，超过 max_entries 条时删除最早写入的条目。
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 影响回测结果的配置节
+RESULT_CONFIG_SECTIONS = ("run_mode", "account", "backtest", "data", "risk", "market_callback")
+# backtest 节中与结果无关的键
+IGNORED_BACKTEST_KEYS = ("checkpoint", "result_cache", "profile")
+# 参与缓存键计算的框架模块
+ENGINE_MODULES = ("khFrame.py", "khTrade.py", "khPosition.py", "khLedger.py", "khRisk.py", "khMatch.py",
+                  "khMetrics.py", "khContext.py", "khVector.py", "khEvents.py", "khCheckpoint.py",
+                  "khQTTools.py", "khQuantImport.py", "MyTT.py")
+
+_ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _update_with_frame(digest, df: pd.DataFrame):
+    digest.update(repr((list(map(str, df.columns)), len(df))).encode("utf-8"))
+    for name in df.columns:
+        values = df[name].to_numpy()
+        if values.dtype.kind in "biufcmM":
+            digest.update(str(values.dtype).encode("utf-8"))
+            digest.update(np.ascontiguousarray(values).tobytes())
+        else:
+            digest.update(repr(values.tolist()).encode("utf-8"))
+
+
+def data_fingerprint(historical_data: Dict[str, pd.DataFrame], benchmark_series=None) -> str:
+    """已加载行情与基准收盘价的内容哈希"""
+    digest = hashlib.blake2b(digest_size=16)
+    for code in sorted(historical_data):
+        digest.update(code.encode("utf-8"))
+        _update_with_frame(digest, historical_data[code])
+    if benchmark_series is not None:
+        digest.update(repr((benchmark_series.dates, benchmark_series.codes)).encode("utf-8"))
+        digest.update(np.ascontiguousarray(benchmark_series.closes).tobytes())
+    return digest.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """文件内容的哈希，文件不存在时返回固定值"""
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    except OSError:
+        digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def result_config(config_dict: Dict) -> Dict:
+    """配置中影响回测结果的部分"""
+    relevant = {key: config_dict[key] for key in RESULT_CONFIG_SECTIONS if key in config_dict}
+    if isinstance(relevant.get("backtest"), dict):
+        relevant["backtest"] = {key: value for key, value in relevant["backtest"].items()
+                                if key not in IGNORED_BACKTEST_KEYS}
+    return relevant
+
+
+class KhResultCache:
+    """按内容寻址的回测结果缓存
+
+    配置（backtest.result_cache）：
+        enabled: 是否启用，默认 False
+        dir: 缓存目录，默认 backtest_results/.cache
+        max_entries: 最多保留的缓存条目数，默认 32
+    """
+
+    def __init__(self, config):
+        settings = config.config_dict.get("backtest", {}).get("result_cache", {}) or {}
+        self.enabled = bool(settings.get("enabled", False))
+        self.directory = settings.get("dir") or os.path.join("backtest_results", ".cache")
+        self.max_entries = max(int(settings.get("max_entries", 32) or 32), 1)
+
+    def key(self, strategy_files: Iterable[str], config_dict: Dict, data_hash: str) -> str:
+        """由策略源码、相关配置、数据指纹与引擎源码计算缓存键"""
+        components = {
+            "strategies": [file_digest(path) for path in strategy_files],
+            "config": result_config(config_dict),
+            "data": data_hash,
+            "engine": [file_digest(os.path.join(_ROOT, name)) for name in ENGINE_MODULES],
+        }
+        payload = json.dumps(components, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def restore(self, key: str, result_dirs: List[str]) -> Optional[List[Dict[str, Any]]]:
+        """命中时把缓存的结果复制到各结果目录，返回各结果目录对应的回测状态；未命中时返回 None"""
+        entry = self._entry(key)
+        parts = [os.path.join(entry, str(i)) for i in range(len(result_dirs))]
+        state_path = os.path.join(entry, "state.pkl")
+        if not all(os.path.isdir(part) for part in parts) or not os.path.exists(state_path):
+            return None
+        try:
+            with open(state_path, "rb") as f:
+                states = pickle.load(f)
+            if len(states) != len(result_dirs):
+                return None
+            for part, result_dir in zip(parts, result_dirs):
+                if os.path.exists(result_dir):
+                    shutil.rmtree(result_dir)
+                shutil.copytree(part, result_dir)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+            logging.warning(f"读取回测结果缓存失败: {entry}: {e}")
+            return None
+        return states
+
+    def store(self, key: str, result_dirs: List[str], states: List[Dict[str, Any]]):
+        """把各结果目录及其回测状态写入缓存（先写临时目录再改名，避免留下不完整的条目）"""
+        entry = self._entry(key)
+        tmp_entry = f"{entry}.tmp{os.getpid()}"
+        try:
+            if os.path.exists(tmp_entry):
+                shutil.rmtree(tmp_entry)
+            for i, result_dir in enumerate(result_dirs):
+                shutil.copytree(result_dir, os.path.join(tmp_entry, str(i)))
+            with open(os.path.join(tmp_entry, "state.pkl"), "wb") as f:
+                pickle.dump(states, f, protocol=pickle.HIGHEST_PROTOCOL)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.replace(tmp_entry, entry)
+        except (OSError, pickle.PicklingError) as e:
+            logging.warning(f"写入回测结果缓存失败: {entry}: {e}")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return
+        self._evict()
+
+    def _evict(self):
+        """超过条目上限时删除最早写入的缓存"""
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                   if ".tmp" not in name and os.path.isdir(os.path.join(self.directory, name))]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self.max_entries]:
+            shutil.rmtree(path, ignore_errors=True)
@@ -1,51 +1,186 @@
 # coding: utf-8
-from typing import Dict
+from typing import Dict, List, Optional
+
+
+class KhRiskDecision:
+    """单个交易信号的风控结果"""
+
+    __slots__ = ("signal", "accepted", "reason")
+
+    def __init__(self, signal: Dict, accepted: bool, reason: str = ""):
+        self.signal = signal
+        self.accepted = accepted
+        self.reason = reason
+
+    def __repr__(self):
+        status = "通过" if self.accepted else f"拒绝({self.reason})"
+        return f"KhRiskDecision({self.signal.get('code')} {self.signal.get('action')} {self.signal.get('volume')}: {status})"
+
 
 class KhRiskManager:
-    """风险管理类"""
-    
+    """风险管理类
+
+    交易前风控：对每一批交易信号逐个给出通过/拒绝结果及原因。风控状态增量维护，
+    每笔成交、每次估值只做 O(1) 的更新，检查时不再遍历持仓：
+        - 总仓位：最近一次估值的持仓市值 + 之后成交的增减额，占总资产比例不超过 position_limit
+        - 单票权重：单只股票持仓市值占总资产比例不超过 single_limit
+        - 当日委托数：每个交易日通过风控的委托达到 order_limit 笔后拒绝新的买入（卖出照常计数但不受限，
+          避免达到上限后无法止损、减仓）；交易日在盘前回调之前由框架调用 on_new_day 切换
+        - 回撤止损：总资产自最高点的回撤达到 loss_limit 后拒绝新的买入（卖出不受限）
+    配置项 risk.enabled 为 False（默认）时不做任何拦截。
+    """
+
     def __init__(self, config):
         self.config = config
-        
+
         # 风控参数
-        self.position_limit = config.position_limit  # 持仓限制
-        self.order_limit = config.order_limit  # 委托限制
-        self.loss_limit = config.loss_limit  # 止损限制
-        
+        self.enabled = getattr(config, "risk_enabled", False)  # 是否启用交易前风控
+        self.position_limit = config.position_limit  # 持仓限制（总仓位占总资产比例）
+        self.single_limit = getattr(config, "single_limit", 1.0)  # 单票持仓占总资产比例上限
+        self.order_limit = config.order_limit  # 委托限制（每日委托笔数）
+        self.loss_limit = config.loss_limit  # 止损限制（自最高点的回撤比例）
+
+        self.reset(getattr(config, "init_capital", 0.0))
+
+    def reset(self, init_capital: float = 0.0):
+        """重置风控状态（每次回测/运行开始时调用）"""
+        self.equity = float(init_capital or 0.0)  # 总资产
+        self.peak_equity = self.equity  # 总资产最高点
+        self.gross_exposure = 0.0  # 总持仓市值
+        self._volumes: Dict[str, int] = {}  # 各股票持仓数量
+        self._prices: Dict[str, float] = {}  # 各股票最近价格（成交价或信号价）
+        self.trade_date = None  # 当前交易日
+        self.orders_today = 0  # 当日已通过风控的委托笔数
+        self.rejected_count = 0  # 累计拒绝的信号数量
+
+    # ---- 状态更新（均为 O(1)） ----
+    def on_new_day(self, date):
+        """切换交易日时清零当日委托计数"""
+        if date != self.trade_date:
+            self.trade_date = date
+            self.orders_today = 0
+
+    def on_fill(self, code: str, action: str, volume: int, price: float):
+        """成交后更新单票持仓与总仓位"""
+        amount = price * volume
+        if action == "buy":
+            self._volumes[code] = self._volumes.get(code, 0) + volume
+            self.gross_exposure += amount
+        else:
+            remaining = self._volumes.get(code, 0) - volume
+            if remaining > 0:
+                self._volumes[code] = remaining
+            else:
+                self._volumes.pop(code, None)
+            self.gross_exposure = max(self.gross_exposure - amount, 0.0)
+        self._prices[code] = price
+
+    def on_equity(self, total_asset: float, market_value: Optional[float] = None):
+        """估值后更新总资产、最高点，以及按最新价估算的总持仓市值"""
+        self.equity = float(total_asset)
+        if self.equity > self.peak_equity:
+            self.peak_equity = self.equity
+        if market_value is not None:
+            self.gross_exposure = float(market_value)
+
+    @property
+    def drawdown(self) -> float:
+        """总资产自最高点的回撤比例"""
+        if self.peak_equity <= 0:
+            return 0.0
+        return max(1.0 - self.equity / self.peak_equity, 0.0)
+
+    # ---- 检查 ----
     def check_risk(self, data: Dict) -> bool:
-        """风控检查
-        
+        """风控检查（每个时间点调用，更新交易日；逐笔信号的检查见 check_signals）
+
         Args:
             data: 行情数据
-            
+
         Returns:
             bool: 是否通过风控
         """
-        # 检查持仓限制
-        if not self._check_position():
-            return False
-            
-        # 检查委托限制    
-        if not self._check_order():
-            return False
-            
-        # 检查止损限制
-        if not self._check_loss(data):
-            return False
-            
-        return True
-        
-    def _check_position(self) -> bool:
-        """检查持仓限制"""
-        # 实现持仓检查逻辑
-        return True
-        
-    def _check_order(self) -> bool:
-        """检查委托限制"""
-        # 实现委托检查逻辑
+        if not self.enabled:
+            return True
+        date = data.get("__current_time__", {}).get("date")
+        if date:
+            self.on_new_day(date)
         return True
-        
-    def _check_loss(self, data: Dict) -> bool:
-        """检查止损限制"""
-        # 实现止损检查逻辑
-        return True 
\ No newline at end of file
+
+    def check_signals(self, signals: List[Dict]) -> List[KhRiskDecision]:
+        """逐个检查一批交易信号
+
+        同一批内已通过的信号会计入后续信号的检查（仓位、单票权重、委托笔数）。
+
+        Args:
+            signals: 交易信号列表
+
+        Returns:
+            List[KhRiskDecision]: 与 signals 一一对应的检查结果
+        """
+        if not self.enabled:
+            return [KhRiskDecision(signal, True) for signal in signals]
+
+        decisions = []
+        pending_orders = 0
+        pending_exposure = 0.0
+        pending_volumes: Dict[str, int] = {}
+        for signal in signals:
+            code = signal.get("code")
+            volume = signal.get("volume", 0)
+            price = signal.get("actual_price", signal.get("price", 0.0))
+            is_buy = signal.get("action") == "buy"
+
+            # 卖出降低风险，不受当日委托数与回撤止损限制
+            reason = self._check_order(pending_orders) if is_buy else ""
+            if not reason and is_buy:
+                reason = self._check_loss()
+            if not reason and is_buy:
+                reason = self._check_position(code, volume, price, pending_exposure,
+                                              pending_volumes.get(code, 0))
+            if reason:
+                self.rejected_count += 1
+                decisions.append(KhRiskDecision(signal, False, reason))
+                continue
+
+            pending_orders += 1
+            amount = price * volume
+            if is_buy:
+                pending_exposure += amount
+                pending_volumes[code] = pending_volumes.get(code, 0) + volume
+            else:
+                pending_exposure -= amount
+                pending_volumes[code] = pending_volumes.get(code, 0) - volume
+            decisions.append(KhRiskDecision(signal, True))
+
+        self.orders_today += pending_orders
+        return decisions
+
+    def _check_position(self, code: str, volume: int, price: float,
+                        pending_exposure: float = 0.0, pending_volume: int = 0) -> str:
+        """检查持仓限制，返回拒绝原因（通过时为空字符串）"""
+        if self.equity <= 0:
+            return "总资产为0"
+        amount = price * volume
+        exposure = (self.gross_exposure + pending_exposure + amount) / self.equity
+        if exposure > self.position_limit:
+            return f"总仓位{exposure:.2%}超过上限{self.position_limit:.2%}"
+        if self.single_limit < 1.0:
+            held = self._volumes.get(code, 0) + pending_volume
+            weight = (held + volume) * price / self.equity
+            if weight > self.single_limit:
+                return f"单票权重{weight:.2%}超过上限{self.single_limit:.2%}"
+        return ""
+
+    def _check_order(self, pending_orders: int = 0) -> str:
+        """检查委托限制，返回拒绝原因（通过时为空字符串）"""
+        if self.order_limit and self.orders_today + pending_orders >= self.order_limit:
+            return f"当日委托数已达上限{self.order_limit}笔"
+        return ""
+
+    def _check_loss(self) -> str:
+        """检查止损限制，返回拒绝原因（通过时为空字符串）"""
+        drawdown = self.drawdown
+        if self.loss_limit and drawdown >= self.loss_limit:
+            return f"回撤{drawdown:.2%}达到止损线{self.loss_limit:.2%}，暂停买入"
+        return ""
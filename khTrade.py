@@ -1,10 +1,232 @@
 # coding: utf-8
 from typing import Dict, List, Optional
 import datetime
+import math
 from types import SimpleNamespace
 
+import numpy as np
+
 from xtquant.xttrader import XtQuantTraderCallback
 from xtquant import xtconstant
+from khLedger import KhStringPool, create_order_ledger, create_trade_ledger
+from khPosition import KhPositionBook
+
+class CostBreakdown:
+    """单笔成交的交易成本明细（每笔成交只计算一次，随信号/委托/成交记录传递）"""
+
+    __slots__ = ("price", "actual_price", "volume", "direction",
+                 "commission", "stamp_tax", "transfer_fee", "flow_fee")
+
+    def __init__(self, price, actual_price, volume, direction,
+                 commission=0.0, stamp_tax=0.0, transfer_fee=0.0, flow_fee=0.0):
+        self.price = price  # 委托价格
+        self.actual_price = actual_price  # 考虑滑点后的成交价格
+        self.volume = volume
+        self.direction = direction  # 'buy' 或 'sell'
+        self.commission = commission  # 佣金
+        self.stamp_tax = stamp_tax  # 印花税
+        self.transfer_fee = transfer_fee  # 过户费
+        self.flow_fee = flow_fee  # 流量费
+
+    @property
+    def total(self):
+        """总交易成本"""
+        return self.commission + self.stamp_tax + self.transfer_fee + self.flow_fee
+
+    @property
+    def amount(self):
+        """成交金额（不含费用）"""
+        return self.actual_price * self.volume
+
+    def to_dict(self):
+        return {
+            "commission": self.commission,
+            "stamp_tax": self.stamp_tax,
+            "transfer_fee": self.transfer_fee,
+            "flow_fee": self.flow_fee,
+            "total_cost": self.total,
+        }
+
+    def __repr__(self):
+        return (f"CostBreakdown(price={self.actual_price}, volume={self.volume}, direction={self.direction}, "
+                f"commission={self.commission:.2f}, stamp_tax={self.stamp_tax:.2f}, "
+                f"transfer_fee={self.transfer_fee:.2f}, flow_fee={self.flow_fee:.2f})")
+
+
+class KhCostModel:
+    """交易成本模型（只含参数，不依赖交易状态），支持按资金反解最大可买数量
+    
+    买入总花费 f(v) = a·v + max(a·v·佣金率, 最低佣金) + a·v·过户费率 + 流量费，其中 a 为滑点后的成交价。
+    f(v) 单调递增，且等于两个线性函数的较大者，因此最大可买数量为两条直线各自反解结果的较小值，
+    再按手取整并用逐笔成本公式校验一次，保证与 calculate_trade_cost 的结果完全一致。
+    """
+
+    __slots__ = ("min_commission", "commission_rate", "stamp_tax_rate", "flow_fee",
+                 "slippage_type", "tick_offset", "slippage_ratio", "lot_size")
+
+    TRANSFER_FEE_RATE = 0.00001  # 过户费率（仅沪市股票）
+
+    def __init__(self, min_commission=5.0, commission_rate=0.0003, stamp_tax_rate=0.001, flow_fee=0.1,
+                 slippage=None, lot_size=100):
+        slippage = slippage or {"type": "ratio", "ratio": 0.001}
+        self.min_commission = min_commission
+        self.commission_rate = commission_rate
+        self.stamp_tax_rate = stamp_tax_rate
+        self.flow_fee = flow_fee
+        self.slippage_type = slippage.get("type", "ratio")
+        self.tick_offset = slippage.get("tick_size", 0.01) * slippage.get("tick_count", 2)
+        self.slippage_ratio = slippage.get("ratio", 0.001) / 2  # 双边滑点，单边取一半
+        self.lot_size = lot_size
+
+    @classmethod
+    def from_trade_manager(cls, trade_mgr):
+        return cls(trade_mgr.min_commission, trade_mgr.commission_rate, trade_mgr.stamp_tax_rate,
+                   trade_mgr.flow_fee, trade_mgr.slippage)
+
+    def buy_price(self, price):
+        """买入滑点后的价格（与 KhTradeManager.calculate_slippage 一致）"""
+        if self.slippage_type == "tick":
+            return round(price + self.tick_offset, 2)
+        if self.slippage_type == "ratio":
+            return round(price * (1 + self.slippage_ratio), 2)
+        return round(price, 2)
+
+    def transfer_fee_rate(self, stock_code):
+        return self.TRANSFER_FEE_RATE if stock_code.startswith("sh.") else 0.0
+
+    def buy_total(self, actual_price, volume, transfer_fee_rate=0.0):
+        """按滑点后价格计算买入总花费（成交金额 + 全部费用）"""
+        if volume <= 0:
+            return 0.0
+        amount = actual_price * volume
+        commission = amount * self.commission_rate
+        if commission < self.min_commission:
+            commission = self.min_commission
+        # 与 calculate_trade_cost 相同的加法顺序：成交金额 + (佣金 + 印花税 + 过户费 + 流量费)
+        return amount + (commission + 0.0 + amount * transfer_fee_rate + self.flow_fee)
+
+    def max_buy_volume(self, price, cash, stock_code=""):
+        """资金 cash 下按手取整的最大可买数量
+        
+        Args:
+            price: 委托价格（未计滑点）
+            cash: 可用资金
+            stock_code: 股票代码（决定是否收取过户费）
+            
+        Returns:
+            int: 最大可买股数，不足一手返回0
+        """
+        if price <= 0 or cash <= 0:
+            return 0
+        lot = self.lot_size
+        actual_price = self.buy_price(price)
+        if actual_price <= 0:
+            return 0
+        tf = self.transfer_fee_rate(stock_code)
+        # 佣金取最低佣金时的上限，与按比例收取佣金时的上限，取两者较小值
+        v_min = (cash - self.min_commission - self.flow_fee) / (actual_price * (1 + tf))
+        v_rate = (cash - self.flow_fee) / (actual_price * (1 + self.commission_rate + tf))
+        lots = max(int(math.floor(min(v_min, v_rate) / lot)), 0)
+        # 浮点误差校验：与逐笔成本公式对齐
+        while lots > 0 and self.buy_total(actual_price, lots * lot, tf) > cash:
+            lots -= 1
+        while self.buy_total(actual_price, (lots + 1) * lot, tf) <= cash:
+            lots += 1
+        return lots * lot
+
+    def slipped_prices(self, prices, is_buy):
+        """向量化计算滑点后的价格（与 KhTradeManager.calculate_slippage 逐笔结果一致）"""
+        prices = np.asarray(prices, dtype=np.float64)
+        if self.slippage_type == "tick":
+            raw = np.where(is_buy, prices + self.tick_offset, prices - self.tick_offset)
+        elif self.slippage_type == "ratio":
+            raw = np.where(is_buy, prices * (1 + self.slippage_ratio), prices * (1 - self.slippage_ratio))
+        else:
+            raw = prices
+        actual = np.round(raw, 2)
+        # np.round 先乘100再取整，恰好落在半分附近时可能与内置 round 不同，这些少数价格逐个修正
+        scaled = raw * 100
+        for i in np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0]:
+            actual[i] = round(float(raw[i]), 2)
+        return actual
+
+    def trade_costs(self, prices, volumes, is_buy, stock_codes):
+        """向量化计算一批成交的滑点价格和各项费用
+        
+        Args:
+            prices: 委托价格数组
+            volumes: 委托数量数组
+            is_buy: 是否买入的布尔数组
+            stock_codes: 股票代码列表
+            
+        Returns:
+            dict: actual_price/commission/stamp_tax/transfer_fee/flow_fee/total 数组，
+                  与逐笔调用 KhTradeManager.calculate_cost_breakdown 的结果一致
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        volumes = np.asarray(volumes, dtype=np.int64)
+        is_buy = np.asarray(is_buy, dtype=bool)
+        
+        traded = volumes > 0
+        actual_price = np.where(traded, self.slipped_prices(prices, is_buy), prices)
+        amount = actual_price * volumes
+        
+        commission = np.where(traded, np.maximum(amount * self.commission_rate, self.min_commission), 0.0)
+        stamp_tax = np.where(traded & ~is_buy, amount * self.stamp_tax_rate, 0.0)
+        is_sh = np.fromiter((code.startswith("sh.") for code in stock_codes), dtype=bool, count=len(stock_codes))
+        transfer_fee = np.where(traded & is_sh, amount * self.TRANSFER_FEE_RATE, 0.0)
+        flow_fee = np.where(traded, float(self.flow_fee), 0.0)
+        
+        return {
+            "actual_price": actual_price,
+            "commission": commission,
+            "stamp_tax": stamp_tax,
+            "transfer_fee": transfer_fee,
+            "flow_fee": flow_fee,
+            "total": commission + stamp_tax + transfer_fee + flow_fee,
+        }
+
+    def max_buy_volumes(self, prices, cash, stock_codes):
+        """向量化计算多只股票各自资金预算下的最大可买数量
+        
+        Args:
+            prices: 委托价格数组
+            cash: 每只股票的资金预算（数组或标量）
+            stock_codes: 股票代码列表
+            
+        Returns:
+            np.ndarray: 每只股票的最大可买股数（int64，按手取整）
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        cash = np.broadcast_to(np.asarray(cash, dtype=np.float64), prices.shape)
+        lot = self.lot_size
+        
+        actual = self.slipped_prices(prices, np.ones(len(prices), dtype=bool))
+        
+        tf = np.fromiter((self.transfer_fee_rate(code) for code in stock_codes), dtype=np.float64, count=len(stock_codes))
+        valid = (prices > 0) & (actual > 0) & (cash > 0)
+        safe_actual = np.where(valid, actual, 1.0)
+        v_min = (cash - self.min_commission - self.flow_fee) / (safe_actual * (1 + tf))
+        v_rate = (cash - self.flow_fee) / (safe_actual * (1 + self.commission_rate + tf))
+        lots = np.floor(np.minimum(v_min, v_rate) / lot)
+        lots = np.where(valid & (lots > 0), lots, 0).astype(np.int64)
+        
+        def totals(n_lots):
+            amount = safe_actual * (n_lots * lot)
+            commission = np.maximum(amount * self.commission_rate, self.min_commission)
+            return amount + (commission + 0.0 + amount * tf + self.flow_fee)
+        
+        # 浮点误差校验（通常不需要调整，最多移动一手）
+        over = (lots > 0) & (totals(lots) > cash)
+        while over.any():
+            lots[over] -= 1
+            over = (lots > 0) & (totals(lots) > cash)
+        under = valid & (totals(lots + 1) <= cash)
+        while under.any():
+            lots[under] += 1
+            under = valid & (totals(lots + 1) <= cash)
+        return lots * lot
+
 
 class KhTradeManager:
     """交易管理类"""
@@ -12,10 +234,15 @@ class KhTradeManager:
     def __init__(self, config, callback=None):
         self.config = config
         self.callback = callback  # 保存回调对象
-        self.orders = {}  # 订单管理
+        self.string_pool = KhStringPool()  # 股票代码等字符串驻留池，委托和成交账本共享
+        self.orders = create_order_ledger(self.string_pool)  # 订单管理（列式账本）
         self.assets = {}  # 资产管理
-        self.trades = {}  # 成交管理
-        self.positions = {}  # 持仓管理
+        self.trades = create_trade_ledger(self.string_pool)  # 成交管理（列式账本）
+        # 持仓管理（数组化持仓簿，兼容原持仓字典的用法）
+        self.risk_mgr = None  # 交易前风控（KhRiskManager，由框架在启用风控时设置）
+        self.matcher = None  # 回测撮合模拟器（KhMatchingSimulator，由框架在启用撮合模拟时设置）
+        self.positions = KhPositionBook(xtconstant.SECURITY_ACCOUNT, self.config.account_id,
+                                        xtconstant.DIRECTION_FLAG_LONG)
         
         # 获取交易成本配置
         trade_cost = self.config.config_dict.get("backtest", {}).get("trade_cost", {})
@@ -35,6 +262,20 @@ class KhTradeManager:
             "tick_count": 2,  # 默认跳数为2，即买入时上浮0.02元，卖出时下调0.02元
             "ratio": 0.001  # 默认滑点比例0.1%
         })
+        
+        # 批量下单阈值：回测中单次信号数量达到该值时走向量化批量撮合（默认 0 关闭，批量时成交顺序改为先卖后买）
+        self.batch_order_threshold = self.config.config_dict.get("backtest", {}).get("batch_order_threshold", 0)
+
+    @property
+    def cost_model(self) -> KhCostModel:
+        """当前交易成本参数对应的成本模型（参数未变化时复用同一实例）"""
+        key = (self.min_commission, self.commission_rate, self.stamp_tax_rate, self.flow_fee,
+               tuple(sorted(self.slippage.items())))
+        cached = getattr(self, "_cost_model_cache", None)
+        if cached is None or cached[0] != key:
+            cached = (key, KhCostModel.from_trade_manager(self))
+            self._cost_model_cache = cached
+        return cached[1]
 
     def init(self):
         """初始化交易管理"""
@@ -131,42 +372,50 @@ class KhTradeManager:
         """计算流量费（每笔交易固定收取）"""
         return self.flow_fee
 
-    def calculate_trade_cost(self, price, volume, direction, stock_code):
+    def calculate_cost_breakdown(self, price, volume, direction, stock_code, apply_slippage=True):
         """
-        计算交易成本
+        计算交易成本明细
         
         Args:
             price: float, 交易价格
             volume: int, 交易数量
             direction: str, 交易方向 'buy' 或 'sell'
             stock_code: str, 股票代码
+            apply_slippage: bool, 是否对价格计算滑点（price 已是成交价时传 False）
             
         Returns:
-            tuple: (实际成交价格, 总交易成本)
+            CostBreakdown: 成交价格及各项费用
         """
         # 如果数量为0，不产生交易成本
         if volume <= 0:
-            return price, 0.0
+            return CostBreakdown(price, price, volume, direction)
             
         # 计算滑点后的价格
-        actual_price = self.calculate_slippage(price, direction)
-        
-        # 计算佣金
-        commission = self.calculate_commission(actual_price, volume)
-        
-        # 计算印花税（只收取卖出印花税）
-        stamp_tax = self.calculate_stamp_tax(actual_price, volume, direction)
-        
-        # 计算过户费（沪市股票）
-        transfer_fee = self.calculate_transfer_fee(stock_code, actual_price, volume)
+        actual_price = self.calculate_slippage(price, direction) if apply_slippage else price
         
-        # 计算流量费（每笔交易固定收取）
-        flow_fee = self.calculate_flow_fee()
-        
-        # 总交易成本
-        total_cost = commission + stamp_tax + transfer_fee + flow_fee
+        return CostBreakdown(
+            price, actual_price, volume, direction,
+            commission=self.calculate_commission(actual_price, volume),  # 佣金
+            stamp_tax=self.calculate_stamp_tax(actual_price, volume, direction),  # 印花税（只收取卖出印花税）
+            transfer_fee=self.calculate_transfer_fee(stock_code, actual_price, volume),  # 过户费（沪市股票）
+            flow_fee=self.calculate_flow_fee()  # 流量费（每笔交易固定收取）
+        )
+
+    def calculate_trade_cost(self, price, volume, direction, stock_code):
+        """
+        计算交易成本
         
-        return actual_price, total_cost
+        Args:
+            price: float, 交易价格
+            volume: int, 交易数量
+            direction: str, 交易方向 'buy' 或 'sell'
+            stock_code: str, 股票代码
+            
+        Returns:
+            tuple: (实际成交价格, 总交易成本)
+        """
+        cost = self.calculate_cost_breakdown(price, volume, direction, stock_code)
+        return cost.actual_price, cost.total
 
     def process_signals(self, signals: List[Dict]):
         """处理交易信号
@@ -186,7 +435,21 @@ class KhTradeManager:
                 "order_time": str, # 可选，委托时间，格式"HH:MM:SS"
                 "remark": str      # 可选，备注信息
             }
+            
+            启用风控（risk.enabled）时先逐个检查信号，被拒绝的信号不下单，拒绝原因写入 signal["risk_rejected"]。
+            回测模式下信号数量达到 backtest.batch_order_threshold 时改用 process_signals_batch 批量处理
+            （启用撮合模拟时始终逐笔撮合）。
         """
+        if self.risk_mgr is not None and self.risk_mgr.enabled:
+            signals = self._apply_risk_checks(signals)
+            if not signals:
+                return
+        
+        if (self.config.run_mode not in ("live", "simulate") and self.matcher is None and self.batch_order_threshold
+                and 0 < self.batch_order_threshold <= len(signals)):
+            self.process_signals_batch(signals)
+            return
+            
         for signal in signals:
             # 跳过数量为0的交易信号
             if signal["volume"] <= 0:
@@ -196,9 +459,9 @@ class KhTradeManager:
                     self.callback.gui.log_message(error_msg, "WARNING")
                 continue
                 
-            # 计算交易成本
+            # 计算交易成本（每笔只计算一次，明细随信号传递给下单和回测记录）
             direction = "buy" if signal["action"].lower() == "buy" else "sell"
-            actual_price, trade_cost = self.calculate_trade_cost(
+            cost = self.calculate_cost_breakdown(
                 signal["price"],
                 signal["volume"],
                 direction,
@@ -206,12 +469,192 @@ class KhTradeManager:
             )
             
             # 添加交易成本信息
-            signal["trade_cost"] = trade_cost
-            signal["actual_price"] = actual_price
+            signal["cost_breakdown"] = cost
+            signal["trade_cost"] = cost.total
+            signal["actual_price"] = cost.actual_price
             
             # 执行下单
             self.place_order(signal)
             
+    def _apply_risk_checks(self, signals: List[Dict]) -> List[Dict]:
+        """交易前风控：返回通过的信号，被拒绝的信号记录原因到 signal["risk_rejected"]"""
+        accepted = []
+        for decision in self.risk_mgr.check_signals(signals):
+            if decision.accepted:
+                accepted.append(decision.signal)
+                continue
+            signal = decision.signal
+            signal["risk_rejected"] = decision.reason
+            error_msg = f"风控拒绝 - 股票: {signal.get('code')}, 方向: {signal.get('action')}, 数量: {signal.get('volume')}, 原因: {decision.reason}"
+            print(f"[WARNING] {error_msg}")
+            if self.callback:
+                self.callback.gui.log_message(error_msg, "WARNING")
+        return accepted
+    
+    def calculate_cost_breakdown_batch(self, prices, volumes, is_buy, codes):
+        """向量化计算一批成交的滑点价格和各项费用
+        
+        Args:
+            prices: 委托价格数组
+            volumes: 委托数量数组
+            is_buy: 是否买入的布尔数组
+            codes: 股票代码列表
+            
+        Returns:
+            dict: actual_price/commission/stamp_tax/transfer_fee/flow_fee/total 数组，
+                  与逐笔调用 calculate_cost_breakdown 的结果一致
+        """
+        return self.cost_model.trade_costs(prices, volumes, is_buy, codes)
+
+    def process_signals_batch(self, signals: List[Dict]):
+        """批量处理交易信号（回测模式，适用于大规模组合调仓）
+        
+        与逐笔处理的区别：
+            1. 滑点和交易成本向量化计算；
+            2. 先执行全部卖出，再按优先级（signal["priority"]，越大越先，相同时保持原顺序）依次满足买入，
+               资金不足的买入被拒绝后继续尝试后续信号；
+            3. 不逐笔打印持仓、不逐笔推送GUI回调，整批只触发一次 on_batch_trade 汇总回调
+               （回调对象未实现 on_batch_trade 时退回逐笔回调）。
+        
+        Args:
+            signals: 交易信号列表，格式同 process_signals
+        """
+        try:
+            valid = []
+            skipped = []
+            for signal in signals:
+                if signal["volume"] <= 0:
+                    skipped.append(signal)
+                else:
+                    valid.append(signal)
+            if skipped:
+                error_msg = f"交易数量为0或负数，忽略 {len(skipped)} 个交易信号"
+                print(f"[WARNING] {error_msg}")
+                if self.callback:
+                    self.callback.gui.log_message(error_msg, "WARNING")
+            if not valid:
+                return
+            
+            codes = [signal["code"] for signal in valid]
+            is_buy = np.fromiter((signal["action"].lower() == "buy" for signal in valid), dtype=bool, count=len(valid))
+            volumes = np.fromiter((signal["volume"] for signal in valid), dtype=np.int64, count=len(valid))
+            prices = np.fromiter((signal["price"] for signal in valid), dtype=np.float64, count=len(valid))
+            costs = self.calculate_cost_breakdown_batch(prices, volumes, is_buy, codes)
+            actual_prices = costs["actual_price"]
+            totals = costs["total"]
+            amounts = actual_prices * volumes
+            
+            # 成本明细随信号传递给回测记录
+            for i, signal in enumerate(valid):
+                cost = CostBreakdown(
+                    signal["price"], float(actual_prices[i]), signal["volume"], "buy" if is_buy[i] else "sell",
+                    commission=float(costs["commission"][i]),
+                    stamp_tax=float(costs["stamp_tax"][i]),
+                    transfer_fee=float(costs["transfer_fee"][i]),
+                    flow_fee=float(costs["flow_fee"][i])
+                )
+                signal["cost_breakdown"] = cost
+                signal["trade_cost"] = cost.total
+                signal["actual_price"] = cost.actual_price
+            
+            # 执行顺序：先卖后买，买入按优先级排序（稳定排序，保持原有顺序）
+            sell_idx = np.nonzero(~is_buy)[0]
+            buy_idx = np.nonzero(is_buy)[0]
+            if len(buy_idx):
+                priority = np.fromiter((valid[i].get("priority", 0) for i in buy_idx), dtype=np.float64, count=len(buy_idx))
+                buy_idx = buy_idx[np.argsort(-priority, kind="stable")]
+            
+            orders, trades, errors = [], [], []
+            changed_positions = {}
+            cash = self.assets["cash"]
+            
+            for i in sell_idx:
+                signal = valid[i]
+                code = signal["code"]
+                volume = signal["volume"]
+                available_volume = self.positions.get(code, {}).get('can_use_volume', 0)
+                if available_volume < volume:
+                    errors.append(SimpleNamespace(
+                        stock_code=code,
+                        error_id=-2, # 自定义错误代码，表示持仓不足
+                        error_msg=f"可用持仓不足 - 需要: {volume}股, 可用: {available_volume}股",
+                        order_remark=signal.get("remark", "持仓不足")
+                    ))
+                    continue
+                # 卖出：增加现金 (增加的是成交金额减去交易成本)
+                cash += amounts[i] - totals[i]
+                order, trade = self._record_fill(signal, len(self.orders) + 1, float(actual_prices[i]), signal["cost_breakdown"])
+                orders.append(order)
+                trades.append(trade)
+                position = self._apply_position_fill(code, "sell", float(actual_prices[i]), volume)
+                if position is not None:
+                    changed_positions[code] = position.copy()
+            
+            # 按优先级依次检查资金，资金不足的买入被拒绝
+            required_cash = amounts + totals
+            for i in buy_idx:
+                signal = valid[i]
+                if cash < required_cash[i]:
+                    errors.append(SimpleNamespace(
+                        stock_code=signal["code"],
+                        error_id=-1, # 自定义错误代码，表示资金不足
+                        error_msg=(
+                            f"资金不足 - "
+                            f"所需资金: {required_cash[i]:.2f} (含成本:{totals[i]:.2f}) | "
+                            f"可用资金: {cash:.2f}"
+                        ),
+                        order_remark=signal.get("remark", "资金不足")
+                    ))
+                    continue
+                cash -= required_cash[i]
+                order, trade = self._record_fill(signal, len(self.orders) + 1, float(actual_prices[i]), signal["cost_breakdown"])
+                orders.append(order)
+                trades.append(trade)
+                position = self._apply_position_fill(signal["code"], "buy", float(actual_prices[i]), signal["volume"])
+                if position is not None:
+                    changed_positions[signal["code"]] = position.copy()
+            
+            self.assets["cash"] = float(cash)
+            
+            total_cost = float(sum(trade["trade_cost"] for trade in trades))
+            print(f"回测批量下单完成: 信号 {len(signals)} 个, 成交 {len(trades)} 笔, 拒绝 {len(errors)} 笔, "
+                  f"交易成本: {total_cost:.2f}, 当前资产 (现金): {self.assets['cash']:.2f}")
+            
+            if not self.callback:
+                return
+            
+            batch_callback = getattr(self.callback, "on_batch_trade", None)
+            if batch_callback is not None:
+                batch_callback(SimpleNamespace(
+                    orders=[SimpleNamespace(**order) for order in orders],
+                    trades=[SimpleNamespace(**trade) for trade in trades],
+                    positions=[SimpleNamespace(**position) for position in changed_positions.values()],
+                    errors=errors,
+                    total_cost=total_cost,
+                    cash=self.assets["cash"]
+                ))
+                return
+            
+            # 回调对象不支持批量回调时逐笔推送
+            for error in errors:
+                self.callback.gui.log_message(error.error_msg, "ERROR")
+                self.callback.on_order_error(error)
+            for position in changed_positions.values():
+                self.callback.on_stock_position(SimpleNamespace(**position))
+            for order, trade in zip(orders, trades):
+                self.callback.on_stock_order(SimpleNamespace(**order))
+                self.callback.on_stock_trade(SimpleNamespace(**trade))
+                
+        except Exception as e:
+            print(f"回测批量下单异常: {str(e)}")
+            if self.callback:
+                self.callback.on_order_error(SimpleNamespace(
+                    stock_code="",
+                    error_id=-99, # 通用错误代码
+                    error_msg=f"批量下单执行异常: {str(e)}",
+                    order_remark=""
+                ))
+            
     def place_order(self, signal: Dict):
         """下单
         
@@ -245,13 +688,51 @@ class KhTradeManager:
             # 生成订单ID
             order_id = len(self.orders) + 1
             
-            # -- 提前计算交易成本和实际价格 --
-            actual_price, trade_cost = self.calculate_trade_cost(
-                signal["price"],
-                signal["volume"],
-                signal["action"],
-                signal["code"]
-            )
+            # -- 交易成本和实际价格：优先使用 process_signals 已计算的明细 --
+            cost = signal.get("cost_breakdown")
+            if cost is None:
+                cost = self.calculate_cost_breakdown(
+                    signal["price"],
+                    signal["volume"],
+                    signal["action"],
+                    signal["code"]
+                )
+                signal["cost_breakdown"] = cost
+            actual_price, trade_cost = cost.actual_price, cost.total
+            
+            # -- 撮合模拟：按下单时刻的行情决定成交数量和成交价，未成交部分撤单 --
+            if self.matcher is not None:
+                fill = self.matcher.match(signal)
+                if fill is not None and fill.volume <= 0:
+                    error_msg = f"委托未成交 - 股票: {signal['code']}, 方向: {signal['action']}, 数量: {signal['volume']}, 原因: {fill.reason}"
+                    print(f"[WARNING] {error_msg}")
+                    signal["unfilled"] = fill.reason
+                    if self.callback:
+                        self.callback.gui.log_message(error_msg, "WARNING")
+                        self.callback.on_order_error(SimpleNamespace(
+                            stock_code=signal["code"],
+                            error_id=-3, # 自定义错误代码，表示撮合未成交
+                            error_msg=error_msg,
+                            order_remark=signal.get("remark", fill.reason)
+                        ))
+                    return
+                if fill is not None and (fill.volume != signal["volume"] or fill.price is not None):
+                    # 盘口成交价已体现冲击成本，不再叠加滑点
+                    signal["order_volume"] = signal["volume"]
+                    signal["volume"] = fill.volume
+                    if fill.reason:
+                        print(f"[WARNING] {signal['code']} {fill.reason}: 委托 {signal['order_volume']}股, 成交 {fill.volume}股")
+                    cost = self.calculate_cost_breakdown(
+                        fill.price if fill.price is not None else signal["price"],
+                        fill.volume,
+                        signal["action"],
+                        signal["code"],
+                        apply_slippage=fill.price is None
+                    )
+                    signal["cost_breakdown"] = cost
+                    signal["trade_cost"] = cost.total
+                    signal["actual_price"] = cost.actual_price
+                    actual_price, trade_cost = cost.actual_price, cost.total
             
             # 计算买入所需的总资金（包括交易成本）
             if signal["action"] == "buy":
@@ -299,52 +780,8 @@ class KhTradeManager:
             
             # -- 资金/持仓检查通过后，继续执行交易 --
             
-            # 创建委托订单 (使用原始信号价格作为委托价)
-            order = {
-                "account_type": xtconstant.SECURITY_ACCOUNT,
-                "account_id": self.config.account_id,
-                "stock_code": signal["code"],
-                "order_id": order_id,
-                "order_sysid": str(order_id),  # 模拟柜台编号
-                "order_time": signal.get("timestamp", int(datetime.datetime.now().timestamp())), # 使用回测时间戳
-                "order_type": xtconstant.STOCK_BUY if signal["action"] == "buy" else xtconstant.STOCK_SELL,
-                "order_volume": signal["volume"],
-                "price_type": xtconstant.FIX_PRICE,  # 默认限价单
-                "price": round(signal["price"], 2), # 委托价格使用信号中的价格，保留两位小数
-                "traded_volume": signal["volume"],  # 回测假设全部成交
-                "traded_price": round(actual_price, 2), # 成交价格使用计算出的实际价格，保留两位小数
-                "order_status": xtconstant.ORDER_SUCCEEDED,  # 回测假设立即成交
-                "status_msg": signal.get("reason", "策略交易"),
-                "strategy_name": signal.get("strategy_name", "backtest"),
-                "order_remark": signal.get("remark", ""),
-                "direction": xtconstant.DIRECTION_FLAG_LONG,  # 股票默认多头
-                "offset_flag": xtconstant.OFFSET_FLAG_OPEN if signal["action"] == "buy" else xtconstant.OFFSET_FLAG_CLOSE
-            }
-            
-            # 更新委托字典
-            self.orders[order_id] = order
-            
-            # 创建成交记录
-            trade = {
-                "account_type": xtconstant.SECURITY_ACCOUNT,
-                "account_id": self.config.account_id,
-                "stock_code": signal["code"],
-                "order_type": order["order_type"],
-                "traded_id": f"T{order_id}",
-                "traded_time": order["order_time"],  # 使用相同的时间戳
-                "traded_price": round(actual_price, 2),  # 使用考虑了滑点的实际价格，保留两位小数
-                "traded_volume": signal["volume"],
-                "traded_amount": round(actual_price * signal["volume"], 2),  # 使用实际价格计算成交金额，保留两位小数
-                "order_id": order_id,
-                "order_sysid": order["order_sysid"],
-                "strategy_name": order["strategy_name"],
-                "order_remark": order["order_remark"],
-                "direction": order["direction"],
-                "offset_flag": order["offset_flag"]
-            }
-            
-            # 更新成交字典
-            self.trades[trade["traded_id"]] = trade
+            # 创建委托订单和成交记录并写入账本
+            order, trade = self._record_fill(signal, order_id, actual_price, cost)
             
             # 更新资产
             if signal["action"] == "buy":
@@ -354,41 +791,10 @@ class KhTradeManager:
                 # self.assets["frozen_cash"] += actual_price * signal["volume"]
                 # self.assets["market_value"] += actual_price * signal["volume"] # 市值更新在record_results中处理
                 
-                # 更新或创建持仓
-                if signal["code"] not in self.positions:
-                    self.positions[signal["code"]] = {
-                        "account_type": xtconstant.SECURITY_ACCOUNT,
-                        "account_id": self.config.account_id,
-                        "stock_code": signal["code"],
-                        "volume": signal["volume"],
-                        "can_use_volume": signal["volume"], # 买入当天不可卖
-                        "open_price": round(actual_price, 2), # 记录开仓时的实际成交价，保留两位小数
-                        "market_value": round(actual_price * signal["volume"], 2), # 初始市值，保留两位小数
-                        "frozen_volume": 0,
-                        "on_road_volume": 0,
-                        "yesterday_volume": 0,
-                        "avg_price": round(actual_price, 2), # 初始持仓均价，保留两位小数
-                        "current_price": round(actual_price, 2), # 当前价格，保留两位小数
-                        "direction": xtconstant.DIRECTION_FLAG_LONG
-                    }
-                    # 新建仓位时触发持仓变动回调
-                    if self.callback:
-                        self.callback.on_stock_position(SimpleNamespace(**self.positions[signal["code"]]))
-                else:
-                    pos = self.positions[signal["code"]]
-                    old_volume = pos["volume"]
-                    # 计算新的持仓均价
-                    total_cost_value = pos["avg_price"] * pos["volume"] + actual_price * signal["volume"] # 注意：这里用的是成交金额，不是包含费用的成本
-                    total_volume = pos["volume"] + signal["volume"]
-                    pos["avg_price"] = round(total_cost_value / total_volume if total_volume > 0 else 0, 2) # 保留两位小数
-                    pos["volume"] += signal["volume"]
-                    pos["can_use_volume"] += signal["volume"] # 买入当天不可卖，T+1才可用
-                    pos["market_value"] = round(pos["volume"] * actual_price, 2) # 更新市值，保留两位小数
-                    pos["current_price"] = round(actual_price, 2) # 更新当前价，保留两位小数
-                    
-                    # 持仓数量变化时触发回调
-                    if pos["volume"] != old_volume and self.callback:
-                        self.callback.on_stock_position(SimpleNamespace(**pos))
+                # 更新或创建持仓，持仓数量变化时触发回调
+                position = self._apply_position_fill(signal["code"], "buy", actual_price, signal["volume"])
+                if position is not None and self.callback:
+                    self.callback.on_stock_position(SimpleNamespace(**position))
                     
             else:  # sell
                 # 卖出：增加现金 (增加的是成交金额减去交易成本)
@@ -396,30 +802,10 @@ class KhTradeManager:
                 self.assets["cash"] += cash_increase
                 # self.assets["market_value"] -= actual_price * signal["volume"] # 市值更新在record_results中处理
                 
-                # 更新持仓
-                pos = self.positions[signal["code"]]
-                old_volume = pos["volume"]
-                pos["volume"] -= signal["volume"]
-                pos["can_use_volume"] -= signal["volume"] # 可用数量减少
-                # pos["market_value"] = pos["volume"] * actual_price # 更新市值
-                pos["current_price"] = round(actual_price, 2) # 更新当前价，保留两位小数
-                
-                # 持仓数量变化时触发回调
-                if pos["volume"] != old_volume and self.callback:
-                     # 如果持仓清零，也需要触发回调
-                    if pos["volume"] == 0:
-                         # 创建一个代表已清仓状态的持仓对象
-                        cleared_position = pos.copy()
-                        cleared_position['volume'] = 0
-                        cleared_position['can_use_volume'] = 0
-                        cleared_position['market_value'] = 0
-                        self.callback.on_stock_position(SimpleNamespace(**cleared_position))
-                    else:
-                        self.callback.on_stock_position(SimpleNamespace(**pos))
-
-                # 如果持仓为0，删除持仓记录
-                if pos["volume"] == 0:
-                    del self.positions[signal["code"]]
+                # 更新持仓（清仓时推送数量为0的持仓并删除记录）
+                position = self._apply_position_fill(signal["code"], "sell", actual_price, signal["volume"])
+                if position is not None and self.callback:
+                    self.callback.on_stock_position(SimpleNamespace(**position))
             
             # 更新总资产 (总资产 = 现金 + 持仓市值)
             # 持仓市值会在 record_results 中根据最新价格更新，这里暂时不计算以避免重复
@@ -428,11 +814,6 @@ class KhTradeManager:
             
             # 输出交易成本信息到GUI日志
             if self.callback:
-                commission = self.calculate_commission(actual_price, signal["volume"])
-                stamp_tax = self.calculate_stamp_tax(actual_price, signal["volume"], signal["action"])
-                transfer_fee = self.calculate_transfer_fee(signal["code"], actual_price, signal["volume"])
-                flow_fee = self.calculate_flow_fee()
-                
                 cost_msg = (
                     f"交易成本 - "
                     f"股票代码: {signal['code']} | "
@@ -440,10 +821,10 @@ class KhTradeManager:
                     f"成交数量: {signal['volume']} | "
                     f"成交价格: {actual_price:.2f} | "
                     f"交易金额: {actual_price * signal['volume']:.2f} | "
-                    f"佣金: {commission:.2f} | "
-                    f"印花税: {stamp_tax:.2f} | "
-                    f"过户费: {transfer_fee:.2f} | "
-                    f"流量费: {flow_fee:.2f} | "
+                    f"佣金: {cost.commission:.2f} | "
+                    f"印花税: {cost.stamp_tax:.2f} | "
+                    f"过户费: {cost.transfer_fee:.2f} | "
+                    f"流量费: {cost.flow_fee:.2f} | "
                     f"总成本: {trade_cost:.2f}"
                 )
                 self.callback.gui.log_message(cost_msg, "TRADE")
@@ -471,6 +852,131 @@ class KhTradeManager:
                     order_remark=signal.get("remark", "")
                 ))
         
+    def _record_fill(self, signal: Dict, order_id: int, actual_price: float, cost: CostBreakdown):
+        """生成回测委托和成交记录并写入账本
+        
+        Returns:
+            tuple: (委托字典, 成交字典)
+        """
+        is_buy = signal["action"] == "buy"
+        
+        # 创建委托订单 (使用原始信号价格作为委托价)
+        order = {
+            "account_type": xtconstant.SECURITY_ACCOUNT,
+            "account_id": self.config.account_id,
+            "stock_code": signal["code"],
+            "order_id": order_id,
+            "order_sysid": str(order_id),  # 模拟柜台编号
+            "order_time": signal.get("timestamp", int(datetime.datetime.now().timestamp())), # 使用回测时间戳
+            "order_type": xtconstant.STOCK_BUY if is_buy else xtconstant.STOCK_SELL,
+            "order_volume": signal.get("order_volume", signal["volume"]),  # 撮合模拟部分成交时为原委托数量
+            "price_type": xtconstant.FIX_PRICE,  # 默认限价单
+            "price": round(signal["price"], 2), # 委托价格使用信号中的价格，保留两位小数
+            "traded_volume": signal["volume"],  # 回测假设全部成交
+            "traded_price": round(actual_price, 2), # 成交价格使用计算出的实际价格，保留两位小数
+            "order_status": xtconstant.ORDER_SUCCEEDED if "order_volume" not in signal else xtconstant.ORDER_PART_CANCEL,  # 回测假设立即成交，部分成交时剩余撤单
+            "status_msg": signal.get("reason", "策略交易"),
+            "strategy_name": signal.get("strategy_name", "backtest"),
+            "order_remark": signal.get("remark", ""),
+            "direction": xtconstant.DIRECTION_FLAG_LONG,  # 股票默认多头
+            "offset_flag": xtconstant.OFFSET_FLAG_OPEN if is_buy else xtconstant.OFFSET_FLAG_CLOSE
+        }
+        
+        # 更新委托账本
+        self.orders[order_id] = order
+        
+        # 创建成交记录
+        trade = {
+            "account_type": xtconstant.SECURITY_ACCOUNT,
+            "account_id": self.config.account_id,
+            "stock_code": signal["code"],
+            "order_type": order["order_type"],
+            "traded_id": f"T{order_id}",
+            "traded_time": order["order_time"],  # 使用相同的时间戳
+            "traded_price": round(actual_price, 2),  # 使用考虑了滑点的实际价格，保留两位小数
+            "traded_volume": signal["volume"],
+            "traded_amount": round(actual_price * signal["volume"], 2),  # 使用实际价格计算成交金额，保留两位小数
+            "commission": cost.commission,  # 佣金
+            "stamp_tax": cost.stamp_tax,  # 印花税
+            "transfer_fee": cost.transfer_fee,  # 过户费
+            "flow_fee": cost.flow_fee,  # 流量费
+            "trade_cost": cost.total,  # 总交易成本
+            "order_id": order_id,
+            "order_sysid": order["order_sysid"],
+            "strategy_name": order["strategy_name"],
+            "order_remark": order["order_remark"],
+            "direction": order["direction"],
+            "offset_flag": order["offset_flag"]
+        }
+        
+        # 更新成交账本
+        self.trades[trade["traded_id"]] = trade
+        
+        # 增量更新风控状态
+        if self.risk_mgr is not None:
+            self.risk_mgr.on_fill(signal["code"], signal["action"], signal["volume"], actual_price)
+        return order, trade
+
+    def _apply_position_fill(self, code: str, action: str, actual_price: float, volume: int):
+        """按成交更新持仓
+        
+        Returns:
+            dict: 需要推送的持仓（清仓时为数量置0的副本），持仓数量未变化时返回 None
+        """
+        if action == "buy":
+            if code not in self.positions:
+                self.positions[code] = {
+                    "account_type": xtconstant.SECURITY_ACCOUNT,
+                    "account_id": self.config.account_id,
+                    "stock_code": code,
+                    "volume": volume,
+                    "can_use_volume": volume, # 买入当天不可卖
+                    "open_price": round(actual_price, 2), # 记录开仓时的实际成交价，保留两位小数
+                    "market_value": round(actual_price * volume, 2), # 初始市值，保留两位小数
+                    "frozen_volume": 0,
+                    "on_road_volume": 0,
+                    "yesterday_volume": 0,
+                    "avg_price": round(actual_price, 2), # 初始持仓均价，保留两位小数
+                    "current_price": round(actual_price, 2), # 当前价格，保留两位小数
+                    "direction": xtconstant.DIRECTION_FLAG_LONG
+                }
+                # 新建仓位时触发持仓变动回调
+                return self.positions[code]
+            
+            pos = self.positions[code]
+            old_volume = pos["volume"]
+            # 计算新的持仓均价
+            total_cost_value = pos["avg_price"] * pos["volume"] + actual_price * volume # 注意：这里用的是成交金额，不是包含费用的成本
+            total_volume = pos["volume"] + volume
+            pos["avg_price"] = round(total_cost_value / total_volume if total_volume > 0 else 0, 2) # 保留两位小数
+            pos["volume"] += volume
+            pos["can_use_volume"] += volume # 买入当天不可卖，T+1才可用
+            pos["market_value"] = round(pos["volume"] * actual_price, 2) # 更新市值，保留两位小数
+            pos["current_price"] = round(actual_price, 2) # 更新当前价，保留两位小数
+            return pos if pos["volume"] != old_volume else None
+        
+        # sell
+        pos = self.positions[code]
+        old_volume = pos["volume"]
+        pos["volume"] -= volume
+        pos["can_use_volume"] -= volume # 可用数量减少
+        pos["current_price"] = round(actual_price, 2) # 更新当前价，保留两位小数
+        
+        changed = None
+        if pos["volume"] != old_volume:
+            changed = pos
+            if pos["volume"] == 0:
+                # 创建一个代表已清仓状态的持仓对象
+                changed = pos.copy()
+                changed['volume'] = 0
+                changed['can_use_volume'] = 0
+                changed['market_value'] = 0
+        
+        # 如果持仓为0，删除持仓记录
+        if pos["volume"] == 0:
+            del self.positions[code]
+        return changed
+
     def update_dic(self, signal: Dict):
         """更新数据字典"""
         # 更新资产、委托、成交和持仓数据字典
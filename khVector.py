@@ -0,0 +1,262 @@
+# coding: utf-8
+"""
+向量化回测
+
+逐 bar 的 khHandlebar(data) 合约下，即使是纯指标交叉策略，每根K线、每只股票都要经过一次 Python 调用。
+策略可以改为定义 khSignals(panel)：对整个回测区间的行情一次性用 NumPy/MyTT 计算出
+目标持仓矩阵（时间 × 股票），框架再在该矩阵上按时间顺序模拟成交与记账：
+    - 成本：沿用 KhCostModel（佣金/最低佣金、印花税、过户费、流量费、滑点），与逐 bar 回测一致
+    - 交易规则：买入按手取整；清仓时卖出全部可卖持仓；T+1，当日买入的股票当日不可卖出
+    - 资金：先卖后买；买入资金不足时按比例缩减，仍不足的按股票顺序放弃
+    - 停牌：成交价无效（NaN 或 <=0）的股票当根K线不交易，目标保留到复牌后执行，估值沿用最近的有效收盘价
+每根K线只对全部股票做一次数组运算，成交笔数再多也不逐笔构造委托/成交字典。
+"""
+from typing import Dict, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+TARGET_WEIGHT = "weight"  # 目标持仓为占总资产的比例
+TARGET_VOLUME = "volume"  # 目标持仓为股数
+
+
+def panel_matrix(panel: Dict[str, pd.DataFrame], field: str = "close",
+                 time_field: str = "time") -> pd.DataFrame:
+    """把 {股票代码: DataFrame} 的某一字段对齐为 时间 × 股票 的矩阵（缺失为 NaN）
+
+    khSignals 中可直接对返回的 DataFrame 整列计算指标，再按同样的索引与列返回目标持仓。
+    """
+    columns = {}
+    for code, df in panel.items():
+        if field not in df.columns or time_field not in df.columns:
+            continue
+        series = pd.Series(df[field].to_numpy(dtype=np.float64), index=df[time_field].to_numpy())
+        columns[code] = series[~series.index.duplicated(keep="last")]
+    if not columns:
+        return pd.DataFrame()
+    return pd.DataFrame(columns).sort_index()
+
+
+class KhVectorResult:
+    """向量化回测结果
+
+    trades: 成交明细列（row/code/action/price/volume/amount/各项费用/total_asset/cash/market_value），
+            row 为成交所在的时间下标，列可直接写入交易记录表
+    daily: 每个交易日收盘后的账户统计（date/row/total_asset/cash/market_value 以及各股票持仓）
+    volumes / avg_prices / last_prices / cash: 回测结束时的持仓、均价、最新价与现金
+    """
+
+    __slots__ = ("trades", "daily", "volumes", "avg_prices", "last_prices", "cash")
+
+    def __init__(self, trades: Dict[str, np.ndarray], daily: List[Dict], volumes: np.ndarray,
+                 avg_prices: np.ndarray, last_prices: np.ndarray, cash: float):
+        self.trades = trades
+        self.daily = daily
+        self.volumes = volumes
+        self.avg_prices = avg_prices
+        self.last_prices = last_prices
+        self.cash = cash
+
+    @property
+    def trade_count(self) -> int:
+        return len(self.trades["row"])
+
+
+class KhVectorBacktest:
+    """在目标持仓矩阵上模拟成交与记账
+
+    Args:
+        cost_model: KhCostModel 交易成本模型
+        init_capital: 初始资金
+        target_type: 目标持仓的含义，"weight"（占总资产比例，默认）或 "volume"（股数）
+    """
+
+    def __init__(self, cost_model, init_capital: float, target_type: str = TARGET_WEIGHT):
+        if target_type not in (TARGET_WEIGHT, TARGET_VOLUME):
+            raise ValueError(f"未知的目标持仓类型: {target_type}")
+        self.cost_model = cost_model
+        self.init_capital = float(init_capital)
+        self.target_type = target_type
+        self.lot_size = cost_model.lot_size
+
+    def run(self, codes: Sequence[str], dates: Sequence, exec_prices: np.ndarray,
+            close_prices: np.ndarray, targets: np.ndarray) -> KhVectorResult:
+        """按时间顺序模拟
+
+        Args:
+            codes: 股票代码（矩阵的列）
+            dates: 每一行所属的交易日（相邻行日期变化即为换日，用于 T+1 与每日统计）
+            exec_prices: 成交价矩阵（时间 × 股票，未计滑点），无效值表示当根K线不能交易
+            close_prices: 估值用的收盘价矩阵
+            targets: 目标持仓矩阵，NaN 表示没有新的目标（保持现有持仓或继续等待尚未执行的目标）
+
+        Returns:
+            KhVectorResult
+        """
+        codes = list(codes)
+        n_rows, n_codes = targets.shape
+        lot = self.lot_size
+        cost_model = self.cost_model
+
+        cash = self.init_capital
+        volumes = np.zeros(n_codes, dtype=np.int64)
+        sellable = np.zeros(n_codes, dtype=np.int64)
+        avg_prices = np.zeros(n_codes)
+        last_prices = np.full(n_codes, np.nan)
+        pending = np.full(n_codes, np.nan)
+        code_array = np.asarray(codes, dtype=object)
+
+        trade_cols: Dict[str, List[np.ndarray]] = {name: [] for name in (
+            "row", "code_index", "is_buy", "price", "volume", "commission", "stamp_tax", "transfer_fee", "flow_fee")}
+        asset_rows: List[tuple] = []  # 有成交的时间点: (行号, 总资产, 现金, 持仓市值)
+        daily: List[Dict] = []
+
+        current_date = None
+        for row in range(n_rows):
+            date = dates[row]
+            if date != current_date:
+                current_date = date
+                sellable[:] = volumes  # T+1：换日后全部持仓可卖
+
+            price = np.round(exec_prices[row], 2)
+            with np.errstate(invalid="ignore"):
+                tradable = np.isfinite(price) & (price > 0)
+            # 新的目标覆盖待执行目标；停牌等不能交易的股票保留目标，复牌后再执行
+            target = targets[row]
+            given = ~np.isnan(target)
+            pending[given] = target[given]
+            active = tradable & ~np.isnan(pending)
+
+            close = close_prices[row]
+            with np.errstate(invalid="ignore"):
+                valid_close = np.isfinite(close) & (close > 0)
+            mark = np.where(tradable, price, last_prices)
+
+            traded = False
+            if active.any():
+                target_volumes = self._target_volumes(pending, price, active, volumes, mark, cash)
+                pending[active] = np.nan
+
+                # 卖出：清仓卖出全部可卖持仓，其余按手取整，且不超过可卖数量
+                with np.errstate(invalid="ignore"):
+                    sell = np.where(active & (target_volumes < volumes), volumes - target_volumes, 0)
+                sell = np.minimum(sell, sellable)
+                partial = (sell > 0) & (sell < volumes)
+                sell[partial] = (sell[partial] // lot) * lot
+                idx = np.nonzero(sell > 0)[0]
+                if len(idx):
+                    vol = sell[idx]
+                    costs = cost_model.trade_costs(price[idx], vol, np.zeros(len(idx), dtype=bool), code_array[idx])
+                    cash += float(np.sum(costs["actual_price"] * vol - costs["total"]))
+                    volumes[idx] -= vol
+                    sellable[idx] -= vol
+                    avg_prices[volumes == 0] = 0.0
+                    self._collect(trade_cols, row, idx, False, vol, costs)
+                    traded = True
+
+                # 买入：按手取整，资金不足时按比例缩减
+                with np.errstate(invalid="ignore"):
+                    buy = np.where(active & (target_volumes > volumes), target_volumes - volumes, 0)
+                buy = (buy // lot) * lot
+                idx = np.nonzero(buy > 0)[0]
+                if len(idx):
+                    vol = buy[idx]
+                    costs = cost_model.trade_costs(price[idx], vol, np.ones(len(idx), dtype=bool), code_array[idx])
+                    required = costs["actual_price"] * vol + costs["total"]
+                    if required.sum() > cash:
+                        scale = max(cash, 0.0) / required.sum()
+                        vol = (np.floor(vol * scale / lot) * lot).astype(np.int64)
+                        keep = vol > 0
+                        idx, vol = idx[keep], vol[keep]
+                        costs = cost_model.trade_costs(price[idx], vol, np.ones(len(idx), dtype=bool), code_array[idx])
+                        required = costs["actual_price"] * vol + costs["total"]
+                        keep = np.cumsum(required) <= cash  # 最低佣金等固定费用可能仍略超出
+                        if not keep.all():
+                            idx, vol = idx[keep], vol[keep]
+                            costs = {name: values[keep] for name, values in costs.items()}
+                            required = required[keep]
+                    if len(idx):
+                        cash -= float(required.sum())
+                        actual = costs["actual_price"]
+                        total_volume = volumes[idx] + vol
+                        avg_prices[idx] = np.round((avg_prices[idx] * volumes[idx] + actual * vol) / total_volume, 2)
+                        volumes[idx] = total_volume
+                        self._collect(trade_cols, row, idx, True, vol, costs)
+                        traded = True
+
+            # 估值：有效收盘价优先，否则沿用最近价格
+            last_prices = np.where(valid_close, close, mark)
+            valued = np.where(np.isnan(last_prices), avg_prices, last_prices)
+            market_value = float(np.dot(volumes, valued))
+            total_asset = cash + market_value
+            if traded:
+                asset_rows.append((row, total_asset, cash, market_value))
+
+            if row == n_rows - 1 or dates[row + 1] != date:
+                held = np.nonzero(volumes > 0)[0]
+                daily.append({
+                    "date": date,
+                    "row": row,
+                    "total_asset": total_asset,
+                    "cash": cash,
+                    "market_value": market_value,
+                    "positions": {
+                        codes[i]: (int(volumes[i]), float(valued[i]), float(avg_prices[i])) for i in held
+                    },
+                })
+
+        trades = self._finish_trades(trade_cols, asset_rows, code_array)
+        return KhVectorResult(trades, daily, volumes, avg_prices, last_prices, cash)
+
+    def _target_volumes(self, target: np.ndarray, price: np.ndarray, active: np.ndarray,
+                        volumes: np.ndarray, mark: np.ndarray, cash: float) -> np.ndarray:
+        """把目标持仓换算为目标股数（未生效的位置为当前持仓）"""
+        if self.target_type == TARGET_VOLUME:
+            wanted = np.where(active, target, volumes)
+        else:
+            equity = cash + float(np.dot(volumes, np.where(np.isnan(mark), 0.0, mark)))
+            safe_price = np.where(active, price, 1.0)
+            wanted = np.where(active, np.maximum(target, 0.0) * equity / safe_price, volumes)
+        wanted = np.where(np.isfinite(wanted), np.maximum(wanted, 0.0), volumes)
+        lot = self.lot_size
+        # 目标不是整手时向下取整；目标为0表示清仓
+        return np.where(active, np.floor(wanted / lot) * lot, volumes).astype(np.int64)
+
+    @staticmethod
+    def _collect(trade_cols, row, idx, is_buy, volumes, costs):
+        trade_cols["row"].append(np.full(len(idx), row, dtype=np.int64))
+        trade_cols["code_index"].append(idx)
+        trade_cols["is_buy"].append(np.full(len(idx), is_buy))
+        trade_cols["price"].append(costs["actual_price"])
+        trade_cols["volume"].append(volumes)
+        for name in ("commission", "stamp_tax", "transfer_fee", "flow_fee"):
+            trade_cols[name].append(costs[name])
+
+    @staticmethod
+    def _finish_trades(trade_cols, asset_rows, code_array) -> Dict[str, np.ndarray]:
+        def joined(parts, dtype):
+            return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+        rows = joined(trade_cols["row"], np.int64)
+        # 每笔成交记录其所在时间点成交完成后的账户资产
+        assets = np.asarray(asset_rows, dtype=np.float64).reshape(-1, 4)
+        assets = assets[np.searchsorted(assets[:, 0], rows)] if len(rows) else np.empty((0, 4))
+        code_index = joined(trade_cols["code_index"], np.int64)
+        is_buy = joined(trade_cols["is_buy"], bool)
+        price = joined(trade_cols["price"], np.float64)
+        volume = joined(trade_cols["volume"], np.int64)
+        return {
+            "row": rows,
+            "code": code_array[code_index] if len(code_index) else np.empty(0, dtype=object),
+            "action": np.where(is_buy, "buy", "sell").astype(object),
+            "price": price,
+            "volume": volume,
+            "amount": price * volume,
+            "commission": joined(trade_cols["commission"], np.float64),
+            "stamp_tax": joined(trade_cols["stamp_tax"], np.float64),
+            "transfer_fee": joined(trade_cols["transfer_fee"], np.float64),
+            "flow_fee": joined(trade_cols["flow_fee"], np.float64),
+            "total_asset": assets[:, 1],
+            "cash": assets[:, 2],
+            "market_value": assets[:, 3],
+        }
@@ -0,0 +1,420 @@
+# coding: utf-8
+"""
+滚动窗口（walk-forward）回测
+
+把一段较长的日期区间按交易日切分为多个 训练窗口 + 测试窗口，每个测试窗口独立回测（样本外），
+再把各测试窗口的资金曲线首尾相接，得到整体的样本外资金曲线与指标：
+    - 数据只加载一次：主进程通过 xtdata 读取整个区间（含首个窗口之前的 PRECOMPUTE_WARMUP 预热K线）的行情，
+      按股票、字段写入 .npy 文件组成的内存映射行情仓库（KhMemmapStore）
+    - 各窗口在独立的工作进程中并行回测，框架通过 data_store 从仓库读取行情，
+      多个进程以只读内存映射共享同一份页缓存，不再各自经 xtdata 加载
+    - 预热：测试窗口之前的训练窗口就在仓库中，khPrecompute/khSignals 的预热K线直接从仓库截取，
+      指标在每个窗口的第一根K线上就已是完整值，不需要为每个窗口额外加载数据
+    - 策略可选实现 khTrain(panel)：在测试窗口回测之前用训练窗口的行情（{股票代码: DataFrame}）拟合参数
+
+用法:
+    python khWalkForward.py 配置.kh 策略.py --train 120 --test 20 --workers 4
+    python khWalkForward.py 配置.kh 策略.py --train 250 --test 60 --step 20 --start 20200101 --end 20241231
+
+结果保存在 backtest_results/walkforward_<策略名>_<开始日期>_<结束日期>/：
+    equity.csv（拼接后的样本外资金曲线）、windows.csv（各窗口区间与指标）、summary.json（整体指标）。
+各窗口的完整回测结果仍保存在 backtest_results/<策略名>_<测试开始>_<测试结束>/。
+"""
+import argparse
+import datetime
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from khMetrics import annualized_volatility
+from khQTTools import is_trade_day
+
+STORE_META = "meta.json"
+INDEX_COLUMN = "__index__"  # 保存行情 DataFrame 原索引的列名
+
+
+def _bound_ms(text: str, end: bool = False) -> Optional[int]:
+    """把 xtdata 风格的时间字符串（YYYYMMDD 或 YYYYMMDDHHMMSS）转换为毫秒时间戳，空字符串返回 None"""
+    text = str(text or "")
+    if not text:
+        return None
+    if len(text) == 8:
+        dt = datetime.datetime.strptime(text, "%Y%m%d")
+        if end:
+            return int((dt + datetime.timedelta(days=1)).timestamp() * 1000) - 1
+        return int(dt.timestamp() * 1000)
+    dt = datetime.datetime.strptime(text[:14], "%Y%m%d%H%M%S")
+    return int(dt.timestamp() * 1000) + (999 if end else 0)
+
+
+class KhMemmapStore:
+    """内存映射行情仓库
+
+    每只股票的每个字段保存为一个 .npy 文件，数值列以只读内存映射方式打开，按时间二分截取；
+    对外提供与 xtdata.get_market_data_ex 相同签名的读取接口，可直接设为 KhQuantFramework.data_store。
+    仓库中没有请求的股票、周期、复权方式或字段时返回 None，由框架回退到 xtdata。
+
+    Args:
+        directory: 仓库目录（由 KhMemmapStore.build 生成）
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        with open(os.path.join(directory, STORE_META), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.period = meta["period"]
+        self.dividend_type = meta["dividend_type"]
+        self.codes: Dict[str, Dict] = meta["codes"]
+        self._arrays: Dict[str, Dict[str, np.ndarray]] = {}
+
+    @classmethod
+    def build(cls, directory: str, data: Dict[str, pd.DataFrame], period: str,
+              dividend_type: str) -> "KhMemmapStore":
+        """把 {股票代码: DataFrame} 写入仓库目录"""
+        os.makedirs(directory, exist_ok=True)
+        codes = {}
+        for code, df in data.items():
+            code_dir = os.path.join(directory, code)
+            os.makedirs(code_dir, exist_ok=True)
+            columns = []
+            items = [(name, df[name].to_numpy()) for name in df.columns]
+            if not isinstance(df.index, pd.RangeIndex):
+                items.append((INDEX_COLUMN, df.index.to_numpy()))
+            for name, values in items:
+                mapped = values.dtype != object
+                np.save(os.path.join(code_dir, f"{name}.npy"), values, allow_pickle=not mapped)
+                columns.append([str(name), mapped])
+            codes[code] = {"length": len(df), "columns": columns}
+        with open(os.path.join(directory, STORE_META), "w", encoding="utf-8") as f:
+            json.dump({"period": period, "dividend_type": dividend_type, "codes": codes}, f, ensure_ascii=False)
+        return cls(directory)
+
+    def _columns(self, code: str) -> Dict[str, np.ndarray]:
+        arrays = self._arrays.get(code)
+        if arrays is None:
+            arrays = {}
+            for name, mapped in self.codes[code]["columns"]:
+                path = os.path.join(self.directory, code, f"{name}.npy")
+                arrays[name] = np.load(path, mmap_mode="r") if mapped else np.load(path, allow_pickle=True)
+            self._arrays[code] = arrays
+        return arrays
+
+    def frame(self, code: str, fields: Optional[List[str]] = None, start_ms: Optional[int] = None,
+              end_ms: Optional[int] = None, count: int = -1) -> Optional[pd.DataFrame]:
+        """截取某只股票 [start_ms, end_ms] 内的行情（count > 0 时只取最后 count 行），字段缺失时返回 None"""
+        if code not in self.codes:
+            return None
+        arrays = self._columns(code)
+        fields = [name for name in arrays if name != INDEX_COLUMN] if fields is None else list(fields)
+        if any(name not in arrays for name in fields) or "time" not in arrays:
+            return None
+        times = arrays["time"]
+        # 行情时间为毫秒时间戳；个别数据源为秒级时按秒比较
+        scale = 1 if len(times) and float(times[-1]) > 1e10 else 1000
+        lo = 0 if start_ms is None else int(np.searchsorted(times, start_ms // scale, side="left"))
+        hi = len(times) if end_ms is None else int(np.searchsorted(times, end_ms // scale, side="right"))
+        if count is not None and count > 0:
+            lo = max(lo, hi - count)
+        index = arrays[INDEX_COLUMN][lo:hi] if INDEX_COLUMN in arrays else None
+        return pd.DataFrame({name: np.array(arrays[name][lo:hi]) for name in fields}, index=index)
+
+    def get_market_data_ex(self, field_list=None, stock_list=None, period="1d", start_time="", end_time="",
+                           count=-1, dividend_type="none", fill_data=True, **kwargs) -> Optional[Dict[str, pd.DataFrame]]:
+        """与 xtdata.get_market_data_ex 相同的调用方式，仓库无法满足请求时返回 None"""
+        if period != self.period or dividend_type != self.dividend_type:
+            return None
+        start_ms, end_ms = _bound_ms(start_time), _bound_ms(end_time, end=True)
+        result = {}
+        for code in stock_list or []:
+            df = self.frame(code, field_list or None, start_ms, end_ms, count)
+            if df is None:
+                return None
+            result[code] = df
+        return result
+
+    def panel(self, codes: List[str], start: str, end: str) -> Dict[str, pd.DataFrame]:
+        """某一日期区间内各股票的全部字段（khTrain 使用）"""
+        panel = {}
+        for code in codes:
+            df = self.frame(code, None, _bound_ms(start), _bound_ms(end, end=True))
+            if df is not None:
+                panel[code] = df
+        return panel
+
+
+def trade_days(start: str, end: str) -> List[str]:
+    """[start, end] 内的交易日（YYYYMMDD）"""
+    day = datetime.datetime.strptime(start, "%Y%m%d").date()
+    last = datetime.datetime.strptime(end, "%Y%m%d").date()
+    days = []
+    while day <= last:
+        if is_trade_day(day.strftime("%Y-%m-%d")):
+            days.append(day.strftime("%Y%m%d"))
+        day += datetime.timedelta(days=1)
+    return days
+
+
+def split_windows(days: List[str], train: int, test: int, step: Optional[int] = None) -> List[Dict]:
+    """按交易日切分窗口：每个窗口为 train 个交易日的训练区间 + 紧随其后的 test 个交易日的测试区间，
+    相邻窗口起点相隔 step 个交易日（默认等于 test，即测试区间首尾相接）；最后一个测试区间可以不足 test 天"""
+    step = step or test
+    if train < 0 or test <= 0 or step <= 0:
+        raise ValueError("训练窗口须 >= 0，测试窗口与步长须 > 0")
+    windows = []
+    start = 0
+    while start + train < len(days):
+        test_end = min(start + train + test, len(days))
+        windows.append({
+            "index": len(windows),
+            "train_start": days[start] if train > 0 else days[start + train],
+            "train_end": days[start + train - 1] if train > 0 else days[start + train],
+            "test_start": days[start + train],
+            "test_end": days[test_end - 1],
+        })
+        if test_end == len(days):
+            break
+        start += step
+    return windows
+
+
+def performance_metrics(equity, periods: int = 250) -> Dict[str, float]:
+    """由资金曲线（首个元素为期初资金）计算总收益、年化收益、最大回撤、年化波动率与夏普比率"""
+    equity = np.asarray(equity, dtype=np.float64)
+    if len(equity) < 2 or equity[0] <= 0:
+        return {"total_return": 0.0, "annual_return": 0.0, "max_drawdown": 0.0, "volatility": 0.0, "sharpe": 0.0}
+    returns = equity[1:] / equity[:-1] - 1
+    total_return = float(equity[-1] / equity[0] - 1)
+    annual_return = float((1 + total_return) ** (periods / len(returns)) - 1) if total_return > -1 else -1.0
+    drawdown = 1 - equity / np.maximum.accumulate(equity)
+    std = float(np.std(returns, ddof=1)) if len(returns) > 1 else 0.0
+    return {
+        "total_return": total_return,
+        "annual_return": annual_return,
+        "max_drawdown": float(drawdown.max()),
+        "volatility": annualized_volatility(returns, periods=periods),
+        "sharpe": float(np.mean(returns) / std * np.sqrt(periods)) if std > 0 else 0.0,
+    }
+
+
+def _run_window(task: Dict) -> Dict:
+    """工作进程：回测一个测试窗口，返回每日总资产"""
+    from khFrame import KhQuantFramework
+
+    start = time.time()
+    store = KhMemmapStore(task["store_dir"])
+    framework = KhQuantFramework(task["config_path"], task["strategy_file"], extra_strategies=[])
+    framework.data_store = store
+
+    def prepare(fw):
+        train = getattr(fw.strategy_module, "khTrain", None)
+        if train is not None and task["train_start"] < task["test_start"]:
+            train(store.panel(fw.get_stock_list(), task["train_start"], task["train_end"]))
+
+    framework.run_headless(prepare)
+    daily_stats = framework.backtest_records.get("daily_stats", [])
+    return {
+        "index": task["index"],
+        "dates": [str(day["date"])[:10] for day in daily_stats],
+        "total_asset": [float(day["total_asset"]) for day in daily_stats],
+        "trades": len(framework.backtest_records.get("trades", [])),
+        "elapsed_s": time.time() - start,
+    }
+
+
+def stitch_equity(windows: List[Dict], results: List[Dict], init_capital: float) -> pd.DataFrame:
+    """按时间顺序拼接各测试窗口的资金曲线
+
+    每个窗口以期初资金独立回测，拼接时使用窗口内的逐日收益率连乘；测试区间重叠（step < test）时，
+    已被前一窗口覆盖的日期不重复计入。
+    """
+    rows = []
+    equity = float(init_capital)
+    last_date = ""
+    for window, result in zip(windows, results):
+        previous = float(init_capital)
+        for date, asset in zip(result["dates"], result["total_asset"]):
+            daily_return = asset / previous - 1 if previous else 0.0
+            previous = asset
+            if date <= last_date:
+                continue
+            equity *= 1 + daily_return
+            last_date = date
+            rows.append({"date": date, "window": window["index"], "daily_return": daily_return,
+                         "window_total_asset": asset, "equity": equity})
+    return pd.DataFrame(rows, columns=["date", "window", "daily_return", "window_total_asset", "equity"])
+
+
+class KhWalkForwardRunner:
+    """滚动窗口回测
+
+    Args:
+        config_path: .kh 配置文件（股票池、周期、交易成本等；回测区间默认取其中的 start_time/end_time）
+        strategy_file: 策略文件
+        train_days: 训练窗口交易日数
+        test_days: 测试窗口交易日数
+        step_days: 相邻窗口起点间隔的交易日数，默认等于 test_days
+        workers: 并行工作进程数，默认 CPU 核数与窗口数中的较小值；1 表示在当前进程内依次回测
+        start / end: 覆盖配置中的整体区间（YYYYMMDD）
+        output_dir: 结果目录，默认 backtest_results/walkforward_<策略名>_<开始日期>_<结束日期>
+        keep_store: 回测完成后是否保留内存映射行情仓库
+    """
+
+    def __init__(self, config_path: str, strategy_file: str, train_days: int, test_days: int,
+                 step_days: Optional[int] = None, workers: Optional[int] = None, start: Optional[str] = None,
+                 end: Optional[str] = None, output_dir: Optional[str] = None, keep_store: bool = False):
+        with open(config_path, "r", encoding="utf-8") as f:
+            self.config_dict = json.load(f)
+        self.config_path = config_path
+        self.strategy_file = os.path.abspath(strategy_file)
+        self.train_days = int(train_days)
+        self.test_days = int(test_days)
+        self.step_days = int(step_days) if step_days else None
+        self.workers = workers
+        backtest = self.config_dict.setdefault("backtest", {})
+        self.start = start or backtest.get("start_time", "")
+        self.end = end or backtest.get("end_time", "")
+        self.strategy_name = os.path.splitext(os.path.basename(strategy_file))[0]
+        self.output_dir = output_dir or os.path.join(
+            "backtest_results", f"walkforward_{self.strategy_name}_{self.start}_{self.end}")
+        self.keep_store = keep_store
+
+    def _write_config(self, path: str, start: str, end: str) -> str:
+        config = json.loads(json.dumps(self.config_dict))
+        config["backtest"]["start_time"] = start
+        config["backtest"]["end_time"] = end
+        config["backtest"].pop("extra_strategies", None)
+        # 窗口结果直接从框架的回测记录读取：不使用结果缓存与断点续跑，每个窗口都完整回测
+        config["backtest"].pop("result_cache", None)
+        config["backtest"].pop("checkpoint", None)
+        config["strategy_file"] = self.strategy_file
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(config, f, ensure_ascii=False, indent=4)
+        return path
+
+    def build_store(self, store_dir: str, start: str, end: str) -> KhMemmapStore:
+        """通过 xtdata 一次性加载整个区间（及首个窗口之前的预热K线）的行情，写入内存映射仓库"""
+        from khFrame import KhQuantFramework
+
+        config_path = self._write_config(os.path.join(self.output_dir, "full.kh"), start, end)
+        framework = KhQuantFramework(config_path, self.strategy_file, extra_strategies=[])
+        period = framework._resolve_load_period(framework.trigger.get_data_period())
+        field_list = framework._market_field_list()
+        dividend_type = framework.config.config_dict["data"]["dividend_type"]
+        warmup = int(getattr(framework.strategy_module, "PRECOMPUTE_WARMUP", 0) or 0)
+        data = {}
+        for code in framework.get_stock_list():
+            loaded = framework._get_market_data_ex(
+                field_list=field_list, stock_list=[code], period=period, start_time=start, end_time=end,
+                dividend_type=dividend_type, fill_data=True)
+            if not loaded or code not in loaded or len(loaded[code]) == 0:
+                logging.warning(f"滚动窗口回测: {code} 没有行情数据，已跳过")
+                continue
+            df = loaded[code]
+            if warmup > 0 and "time" in df.columns:
+                df = framework._load_precompute_warmup(code, df, period, warmup)
+            data[code] = df
+        return KhMemmapStore.build(store_dir, data, period, dividend_type)
+
+    def run(self) -> Dict:
+        """执行滚动窗口回测，返回汇总报告（同时写入结果目录）"""
+        start_clock = time.time()
+        windows = split_windows(trade_days(self.start, self.end), self.train_days, self.test_days, self.step_days)
+        if not windows:
+            raise ValueError(f"区间 {self.start}-{self.end} 的交易日不足一个训练窗口加测试窗口")
+        os.makedirs(os.path.join(self.output_dir, "configs"), exist_ok=True)
+        print(f"滚动窗口回测: {len(windows)} 个窗口（训练 {self.train_days} 天 / 测试 {self.test_days} 天）")
+
+        store_dir = os.path.join(self.output_dir, "store")
+        load_start = time.time()
+        self.build_store(store_dir, windows[0]["train_start"], windows[-1]["test_end"])
+        load_time = time.time() - load_start
+        print(f"行情仓库构建完成，耗时 {load_time:.2f} 秒")
+
+        tasks = []
+        for window in windows:
+            config_path = self._write_config(
+                os.path.join(self.output_dir, "configs", f"window_{window['index']:03d}.kh"),
+                window["test_start"], window["test_end"])
+            tasks.append(dict(window, config_path=os.path.abspath(config_path), strategy_file=self.strategy_file,
+                              store_dir=os.path.abspath(store_dir)))
+
+        workers = self.workers or min(len(tasks), os.cpu_count() or 1)
+        if workers <= 1:
+            results = [_run_window(task) for task in tasks]
+        else:
+            # spawn 启动方式与界面程序一致，避免 fork 带入 Qt 等不可复制的状态
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(_run_window, tasks))
+
+        init_capital = float(self.config_dict["backtest"].get("init_capital", 1000000))
+        equity_df = stitch_equity(windows, results, init_capital)
+        equity_df.to_csv(os.path.join(self.output_dir, "equity.csv"), index=False, encoding="utf-8-sig")
+
+        window_rows = []
+        for window, result in zip(windows, results):
+            row = {key: window[key] for key in ("index", "train_start", "train_end", "test_start", "test_end")}
+            row.update(performance_metrics([init_capital] + result["total_asset"]))
+            row["trades"] = result["trades"]
+            row["elapsed_s"] = result["elapsed_s"]
+            window_rows.append(row)
+        pd.DataFrame(window_rows).to_csv(os.path.join(self.output_dir, "windows.csv"), index=False,
+                                         encoding="utf-8-sig")
+
+        summary = {
+            "meta": {
+                "strategy_file": self.strategy_file,
+                "start": self.start,
+                "end": self.end,
+                "train_days": self.train_days,
+                "test_days": self.test_days,
+                "step_days": self.step_days or self.test_days,
+                "workers": workers,
+                "windows": len(windows),
+                "data_load_s": load_time,
+                "elapsed_s": time.time() - start_clock,
+            },
+            "out_of_sample": performance_metrics([init_capital] + equity_df["equity"].tolist()),
+            "windows": window_rows,
+        }
+        with open(os.path.join(self.output_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        if not self.keep_store:
+            shutil.rmtree(store_dir, ignore_errors=True)
+        return summary
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="滚动窗口（walk-forward）回测")
+    parser.add_argument("config", help=".kh 配置文件")
+    parser.add_argument("strategy", help="策略文件")
+    parser.add_argument("--train", type=int, required=True, help="训练窗口交易日数")
+    parser.add_argument("--test", type=int, required=True, help="测试窗口交易日数")
+    parser.add_argument("--step", type=int, help="相邻窗口起点间隔的交易日数（默认等于测试窗口）")
+    parser.add_argument("--workers", type=int, help="并行工作进程数")
+    parser.add_argument("--start", help="整体开始日期 YYYYMMDD（默认取配置）")
+    parser.add_argument("--end", help="整体结束日期 YYYYMMDD（默认取配置）")
+    parser.add_argument("--output", help="结果目录")
+    parser.add_argument("--keep-store", action="store_true", help="保留内存映射行情仓库")
+    args = parser.parse_args(argv)
+
+    runner = KhWalkForwardRunner(args.config, args.strategy, args.train, args.test, args.step, args.workers,
+                                 args.start, args.end, args.output, args.keep_store)
+    summary = runner.run()
+    oos = summary["out_of_sample"]
+    print(f"样本外: 总收益 {oos['total_return']:.2%}，年化 {oos['annual_return']:.2%}，"
+          f"最大回撤 {oos['max_drawdown']:.2%}，夏普 {oos['sharpe']:.2f}")
+    print(f"结果已保存: {runner.output_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())